@@ -0,0 +1,54 @@
+-- Migration: Append-only credits ledger support for the billing service
+-- Keyset pagination reads each organization's transactions newest first, and
+-- appends update the balance and insert the entry in one locked statement so
+-- concurrent deductions cannot overdraw.
+
+-- Serves reverse-chronological pages (optionally filtered by type)
+CREATE INDEX IF NOT EXISTS "credit_transactions_balance_created_idx"
+  ON "credit_transactions" ("credit_balance_id", "created_at" DESC, "id" DESC);
+CREATE INDEX IF NOT EXISTS "credit_transactions_balance_type_created_idx"
+  ON "credit_transactions" ("credit_balance_id", "type", "created_at" DESC, "id" DESC);
+
+-- Applies p_amount to the organization's balance and records the entry.
+-- With p_floor, returns no row (and changes nothing) if the balance would
+-- drop below it.
+CREATE OR REPLACE FUNCTION append_credit_transaction(
+  p_organization_id text,
+  p_type            "CreditTransactionType",
+  p_amount          numeric,
+  p_description     text,
+  p_metadata        jsonb DEFAULT '{}'::jsonb,
+  p_floor           numeric DEFAULT NULL
+) RETURNS SETOF "credit_transactions"
+  LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_balance_id text;
+  v_balance    numeric;
+BEGIN
+  INSERT INTO "credit_balances" ("id", "organization_id", "balance", "updated_at")
+  VALUES (gen_random_uuid()::text, p_organization_id, 0, now())
+  ON CONFLICT ("organization_id") DO NOTHING;
+
+  SELECT "id", "balance" INTO v_balance_id, v_balance
+  FROM "credit_balances"
+  WHERE "organization_id" = p_organization_id
+  FOR UPDATE;
+
+  IF p_floor IS NOT NULL AND v_balance + p_amount < p_floor THEN
+    RETURN;
+  END IF;
+
+  UPDATE "credit_balances"
+  SET "balance" = v_balance + p_amount, "updated_at" = now()
+  WHERE "id" = v_balance_id;
+
+  RETURN QUERY
+  INSERT INTO "credit_transactions"
+    ("id", "credit_balance_id", "type", "amount", "balance_after", "description", "metadata")
+  VALUES
+    (gen_random_uuid()::text, v_balance_id, p_type, p_amount, v_balance + p_amount,
+     p_description, COALESCE(p_metadata, '{}'::jsonb))
+  RETURNING *;
+END;
+$$;
@@ -0,0 +1,169 @@
+-- Migration: Credit reservations (holds) for the billing service
+-- A hold sets credits aside until it is settled with the actual cost,
+-- released, or expires. Every function locks the organization's
+-- credit_balances row, so the available-balance check and its writes are
+-- atomic per organization. Expired holds simply stop counting; they are
+-- deleted the next time the organization reserves.
+
+CREATE TABLE IF NOT EXISTS "credit_holds" (
+  "id"                TEXT NOT NULL,
+  "credit_balance_id" TEXT NOT NULL,
+  "amount"            DECIMAL(10,4) NOT NULL,
+  "description"       TEXT,
+  "metadata"          JSONB NOT NULL DEFAULT '{}',
+  "expires_at"        TIMESTAMP(3) NOT NULL,
+  "created_at"        TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+  CONSTRAINT "credit_holds_pkey" PRIMARY KEY ("id"),
+  CONSTRAINT "credit_holds_credit_balance_id_fkey" FOREIGN KEY ("credit_balance_id")
+    REFERENCES "credit_balances"("id") ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS "credit_holds_credit_balance_id_expires_at_idx"
+  ON "credit_holds" ("credit_balance_id", "expires_at");
+
+-- Locks (creating if needed) an organization's balance row
+CREATE OR REPLACE FUNCTION lock_credit_balance(p_organization_id text)
+  RETURNS "credit_balances"
+  LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_row "credit_balances";
+BEGIN
+  INSERT INTO "credit_balances" ("id", "organization_id", "balance", "updated_at")
+  VALUES (gen_random_uuid()::text, p_organization_id, 0, now())
+  ON CONFLICT ("organization_id") DO NOTHING;
+
+  SELECT * INTO v_row FROM "credit_balances"
+  WHERE "organization_id" = p_organization_id
+  FOR UPDATE;
+  RETURN v_row;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION active_credit_holds(p_balance_id text) RETURNS numeric
+  LANGUAGE sql STABLE
+AS $$
+  SELECT COALESCE(SUM("amount"), 0) FROM "credit_holds"
+  WHERE "credit_balance_id" = p_balance_id AND "expires_at" > now()
+$$;
+
+-- Records a ledger entry; with p_floor, nothing is written (no row returned)
+-- if the available balance (balance less active holds) would drop below it.
+CREATE OR REPLACE FUNCTION append_credit_transaction(
+  p_organization_id text,
+  p_type            "CreditTransactionType",
+  p_amount          numeric,
+  p_description     text,
+  p_metadata        jsonb DEFAULT '{}'::jsonb,
+  p_floor           numeric DEFAULT NULL
+) RETURNS SETOF "credit_transactions"
+  LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_balance "credit_balances";
+BEGIN
+  v_balance := lock_credit_balance(p_organization_id);
+
+  IF p_floor IS NOT NULL
+     AND v_balance."balance" - active_credit_holds(v_balance."id") + p_amount < p_floor THEN
+    RETURN;
+  END IF;
+
+  UPDATE "credit_balances"
+  SET "balance" = v_balance."balance" + p_amount, "updated_at" = now()
+  WHERE "id" = v_balance."id";
+
+  RETURN QUERY
+  INSERT INTO "credit_transactions"
+    ("id", "credit_balance_id", "type", "amount", "balance_after", "description", "metadata")
+  VALUES
+    (gen_random_uuid()::text, v_balance."id", p_type, p_amount,
+     v_balance."balance" + p_amount, p_description, COALESCE(p_metadata, '{}'::jsonb))
+  RETURNING *;
+END;
+$$;
+
+-- Holds p_amount if the available balance covers it; no row otherwise
+CREATE OR REPLACE FUNCTION reserve_credits(
+  p_organization_id text,
+  p_amount          numeric,
+  p_ttl_seconds     integer,
+  p_description     text,
+  p_metadata        jsonb DEFAULT '{}'::jsonb
+) RETURNS SETOF "credit_holds"
+  LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_balance "credit_balances";
+BEGIN
+  v_balance := lock_credit_balance(p_organization_id);
+
+  DELETE FROM "credit_holds"
+  WHERE "credit_balance_id" = v_balance."id" AND "expires_at" <= now();
+
+  IF v_balance."balance" - active_credit_holds(v_balance."id") < p_amount THEN
+    RETURN;
+  END IF;
+
+  RETURN QUERY
+  INSERT INTO "credit_holds"
+    ("id", "credit_balance_id", "amount", "description", "metadata", "expires_at")
+  VALUES
+    (gen_random_uuid()::text, v_balance."id", p_amount, p_description,
+     COALESCE(p_metadata, '{}'::jsonb), now() + make_interval(secs => p_ttl_seconds))
+  RETURNING *;
+END;
+$$;
+
+-- Removes an active hold and charges p_amount as USAGE; no row if the hold
+-- is unknown or expired
+CREATE OR REPLACE FUNCTION settle_credit_hold(
+  p_organization_id text,
+  p_hold_id         text,
+  p_amount          numeric,
+  p_description     text,
+  p_metadata        jsonb DEFAULT '{}'::jsonb
+) RETURNS SETOF "credit_transactions"
+  LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_balance "credit_balances";
+BEGIN
+  v_balance := lock_credit_balance(p_organization_id);
+
+  DELETE FROM "credit_holds"
+  WHERE "id" = p_hold_id
+    AND "credit_balance_id" = v_balance."id"
+    AND "expires_at" > now();
+  IF NOT FOUND THEN
+    RETURN;
+  END IF;
+
+  RETURN QUERY
+  SELECT * FROM append_credit_transaction(
+    p_organization_id, 'USAGE', -p_amount, p_description, p_metadata, NULL
+  );
+END;
+$$;
+
+-- Removes an active hold without charging; no row if unknown or expired
+CREATE OR REPLACE FUNCTION release_credit_hold(
+  p_organization_id text,
+  p_hold_id         text
+) RETURNS SETOF "credit_holds"
+  LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_balance "credit_balances";
+BEGIN
+  v_balance := lock_credit_balance(p_organization_id);
+
+  RETURN QUERY
+  DELETE FROM "credit_holds"
+  WHERE "id" = p_hold_id
+    AND "credit_balance_id" = v_balance."id"
+    AND "expires_at" > now()
+  RETURNING *;
+END;
+$$;
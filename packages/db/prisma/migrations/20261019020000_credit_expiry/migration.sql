@@ -0,0 +1,192 @@
+-- Migration: Bonus credit expiry and point-in-time balances for the billing
+-- service. Grants record expires_at; when a grant expires, what is left of it
+-- is forfeited as an EXPIRATION entry whose related_id is the grant.
+-- Spending draws on unexpired grants earliest expiry first, so each debit
+-- counts against one grant only; credit_grant_lots tracks what each grant
+-- has left, kept up to date by a trigger on every ledger insert.
+-- Point-in-time balances read the balance_after of the last entry at or
+-- before the moment, served by credit_transactions_balance_created_idx.
+
+-- Grants still waiting to expire
+CREATE INDEX IF NOT EXISTS "credit_transactions_expires_at_idx"
+  ON "credit_transactions" ("expires_at")
+  WHERE "expires_at" IS NOT NULL;
+-- The EXPIRATION entry of a grant (at most one)
+CREATE UNIQUE INDEX IF NOT EXISTS "credit_transactions_expiration_related_idx"
+  ON "credit_transactions" ("related_id")
+  WHERE "type" = 'EXPIRATION';
+
+-- What is left of each expiring grant. Derived from credit_transactions
+-- (which stay append-only); rows are dropped when their grant expires.
+CREATE TABLE IF NOT EXISTS "credit_grant_lots" (
+  "grant_id"          TEXT NOT NULL,
+  "credit_balance_id" TEXT NOT NULL,
+  "remaining"         DECIMAL(10,4) NOT NULL,
+  "expires_at"        TIMESTAMP(3) NOT NULL,
+
+  CONSTRAINT "credit_grant_lots_pkey" PRIMARY KEY ("grant_id"),
+  CONSTRAINT "credit_grant_lots_credit_balance_id_fkey" FOREIGN KEY ("credit_balance_id")
+    REFERENCES "credit_balances"("id") ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS "credit_grant_lots_credit_balance_id_expires_at_idx"
+  ON "credit_grant_lots" ("credit_balance_id", "expires_at");
+
+-- Opens a lot for each expiring grant, and draws each debit (other than an
+-- expiration) from the balance's unexpired lots, earliest expiry first.
+-- Every writer of credit_transactions holds the balance row lock, so lots
+-- of one balance are never updated concurrently.
+CREATE OR REPLACE FUNCTION track_credit_grant_lots()
+  RETURNS trigger
+  LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_lot   "credit_grant_lots";
+  v_left  numeric := -NEW."amount";
+  v_taken numeric;
+BEGIN
+  IF NEW."amount" > 0 AND NEW."expires_at" IS NOT NULL THEN
+    INSERT INTO "credit_grant_lots"
+      ("grant_id", "credit_balance_id", "remaining", "expires_at")
+    VALUES (NEW."id", NEW."credit_balance_id", NEW."amount", NEW."expires_at");
+  ELSIF NEW."amount" < 0 AND NEW."type" <> 'EXPIRATION' THEN
+    FOR v_lot IN
+      SELECT * FROM "credit_grant_lots"
+      WHERE "credit_balance_id" = NEW."credit_balance_id"
+        AND "expires_at" >= NEW."created_at"
+        AND "remaining" > 0
+      ORDER BY "expires_at", "grant_id"
+    LOOP
+      EXIT WHEN v_left <= 0;
+      v_taken := LEAST(v_lot."remaining", v_left);
+      UPDATE "credit_grant_lots"
+      SET "remaining" = "remaining" - v_taken
+      WHERE "grant_id" = v_lot."grant_id";
+      v_left := v_left - v_taken;
+    END LOOP;
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS "credit_transactions_grant_lots" ON "credit_transactions";
+CREATE TRIGGER "credit_transactions_grant_lots"
+  AFTER INSERT ON "credit_transactions"
+  FOR EACH ROW EXECUTE FUNCTION track_credit_grant_lots();
+
+-- append_credit_transaction gains p_expires_at
+DROP FUNCTION IF EXISTS append_credit_transaction(
+  text, "CreditTransactionType", numeric, text, jsonb, numeric
+);
+
+CREATE OR REPLACE FUNCTION append_credit_transaction(
+  p_organization_id text,
+  p_type            "CreditTransactionType",
+  p_amount          numeric,
+  p_description     text,
+  p_metadata        jsonb DEFAULT '{}'::jsonb,
+  p_floor           numeric DEFAULT NULL,
+  p_expires_at      timestamptz DEFAULT NULL
+) RETURNS SETOF "credit_transactions"
+  LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_balance "credit_balances";
+BEGIN
+  v_balance := lock_credit_balance(p_organization_id);
+
+  IF p_floor IS NOT NULL
+     AND v_balance."balance" - active_credit_holds(v_balance."id") + p_amount < p_floor THEN
+    RETURN;
+  END IF;
+
+  UPDATE "credit_balances"
+  SET "balance" = v_balance."balance" + p_amount, "updated_at" = now()
+  WHERE "id" = v_balance."id";
+
+  RETURN QUERY
+  INSERT INTO "credit_transactions"
+    ("id", "credit_balance_id", "type", "amount", "balance_after", "description",
+     "metadata", "expires_at")
+  VALUES
+    (gen_random_uuid()::text, v_balance."id", p_type, p_amount,
+     v_balance."balance" + p_amount, p_description, COALESCE(p_metadata, '{}'::jsonb),
+     p_expires_at AT TIME ZONE 'UTC')
+  RETURNING *;
+END;
+$$;
+
+-- Forfeits what is left of each due grant (its lot), capped at the
+-- available balance. Grants already expired, not yet due, or with nothing
+-- left are skipped, so repeated and concurrent calls are safe.
+CREATE OR REPLACE FUNCTION expire_credit_grants(p_grant_ids text[])
+  RETURNS SETOF "credit_transactions"
+  LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_grant   "credit_transactions";
+  v_balance "credit_balances";
+  v_left    numeric;
+  v_forfeit numeric;
+BEGIN
+  FOR v_grant IN
+    SELECT * FROM "credit_transactions"
+    WHERE "id" = ANY(p_grant_ids)
+      AND "expires_at" IS NOT NULL
+      AND "expires_at" <= now() AT TIME ZONE 'UTC'
+    ORDER BY "credit_balance_id"
+  LOOP
+    SELECT * INTO v_balance FROM "credit_balances"
+    WHERE "id" = v_grant."credit_balance_id"
+    FOR UPDATE;
+
+    CONTINUE WHEN EXISTS (
+      SELECT 1 FROM "credit_transactions"
+      WHERE "related_id" = v_grant."id" AND "type" = 'EXPIRATION'
+    );
+
+    DELETE FROM "credit_grant_lots"
+    WHERE "grant_id" = v_grant."id"
+    RETURNING "remaining" INTO v_left;
+
+    v_forfeit := LEAST(
+      COALESCE(v_left, 0),
+      v_balance."balance" - active_credit_holds(v_balance."id")
+    );
+    CONTINUE WHEN v_forfeit <= 0;
+
+    UPDATE "credit_balances"
+    SET "balance" = v_balance."balance" - v_forfeit, "updated_at" = now()
+    WHERE "id" = v_balance."id";
+
+    RETURN QUERY
+    INSERT INTO "credit_transactions"
+      ("id", "credit_balance_id", "type", "amount", "balance_after", "description",
+       "metadata", "related_id")
+    VALUES
+      (gen_random_uuid()::text, v_balance."id", 'EXPIRATION', -v_forfeit,
+       v_balance."balance" - v_forfeit,
+       'Expired: ' || COALESCE(v_grant."description", ''),
+       jsonb_build_object('grant_id', v_grant."id"), v_grant."id")
+    RETURNING *;
+  END LOOP;
+END;
+$$;
+
+-- Grants without an EXPIRATION entry, for rebuilding the scheduler on start.
+-- Grants overdue by more than a week (nothing was left to forfeit) are
+-- not reloaded.
+CREATE OR REPLACE FUNCTION pending_credit_expirations()
+  RETURNS TABLE (organization_id text, grant_id text, expires_at timestamp)
+  LANGUAGE sql STABLE
+AS $$
+  SELECT b."organization_id", t."id", t."expires_at"
+  FROM "credit_transactions" t
+  JOIN "credit_balances" b ON b."id" = t."credit_balance_id"
+  WHERE t."expires_at" IS NOT NULL
+    AND t."expires_at" > (now() AT TIME ZONE 'UTC') - interval '7 days'
+    AND NOT EXISTS (
+      SELECT 1 FROM "credit_transactions" e
+      WHERE e."related_id" = t."id" AND e."type" = 'EXPIRATION'
+    )
+$$;
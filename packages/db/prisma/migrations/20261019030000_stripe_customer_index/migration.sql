@@ -0,0 +1,106 @@
+-- Migration: Organization -> Stripe customer index for the billing service
+-- stripe_customers is written when billing creates a customer and by
+-- customer.* webhooks, so looking up an organization's customer is a unique
+-- index read instead of a Stripe Search call. organization_id and stripe_id
+-- are both unique, and webhooks may arrive out of order, so every write
+-- carries a version (the event's created time, or the time of the API call)
+-- and goes through one upsert that drops writes older than the rows they
+-- would replace. Deleted customers leave a tombstone, so a late
+-- customer.created / customer.updated cannot map them again.
+
+ALTER TABLE "stripe_customers"
+  ADD COLUMN IF NOT EXISTS "version" BIGINT NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS "stripe_customer_tombstones" (
+  "stripe_id"  TEXT NOT NULL,
+  "version"    BIGINT NOT NULL,
+  "deleted_at" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+  CONSTRAINT "stripe_customer_tombstones_pkey" PRIMARY KEY ("stripe_id")
+);
+
+-- Maps p_organization_id to p_stripe_id, replacing whatever either of them
+-- was mapped to before, unless one of those mappings is newer than
+-- p_version or the customer was deleted. Returns whether it was written.
+CREATE OR REPLACE FUNCTION upsert_stripe_customer(
+  p_organization_id text,
+  p_stripe_id       text,
+  p_email           text DEFAULT NULL,
+  p_name            text DEFAULT NULL,
+  p_version         bigint DEFAULT 0
+) RETURNS boolean
+  LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_count integer;
+BEGIN
+  -- Serializes writes and the deletion for one customer
+  PERFORM pg_advisory_xact_lock(hashtext('stripe_customer:' || p_stripe_id));
+
+  IF EXISTS (
+    SELECT 1 FROM "stripe_customer_tombstones" WHERE "stripe_id" = p_stripe_id
+  ) THEN
+    RETURN false;
+  END IF;
+
+  -- Lock both rows the write would replace before comparing versions
+  PERFORM 1 FROM "stripe_customers"
+  WHERE "stripe_id" = p_stripe_id OR "organization_id" = p_organization_id
+  FOR UPDATE;
+
+  IF EXISTS (
+    SELECT 1 FROM "stripe_customers"
+    WHERE ("stripe_id" = p_stripe_id OR "organization_id" = p_organization_id)
+      AND "version" > p_version
+  ) THEN
+    RETURN false;
+  END IF;
+
+  -- A customer moved to another organization
+  DELETE FROM "stripe_customers"
+  WHERE "stripe_id" = p_stripe_id AND "organization_id" <> p_organization_id;
+
+  INSERT INTO "stripe_customers" AS c
+    ("id", "organization_id", "stripe_id", "email", "name", "version", "updated_at")
+  VALUES
+    (gen_random_uuid()::text, p_organization_id, p_stripe_id, p_email, p_name,
+     p_version, now())
+  ON CONFLICT ("organization_id") DO UPDATE
+  SET "stripe_id"  = EXCLUDED."stripe_id",
+      "email"      = EXCLUDED."email",
+      "name"       = EXCLUDED."name",
+      "version"    = EXCLUDED."version",
+      "updated_at" = now()
+  -- A row inserted concurrently for the organization (by another customer)
+  WHERE EXCLUDED."version" >= c."version";
+
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+  RETURN v_count > 0;
+END;
+$$;
+
+-- Unmaps a deleted customer and records its tombstone. Returns the
+-- organization it was mapped to, or NULL.
+CREATE OR REPLACE FUNCTION delete_stripe_customer(
+  p_stripe_id text,
+  p_version   bigint
+) RETURNS text
+  LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_organization_id text;
+BEGIN
+  PERFORM pg_advisory_xact_lock(hashtext('stripe_customer:' || p_stripe_id));
+
+  INSERT INTO "stripe_customer_tombstones" AS t ("stripe_id", "version")
+  VALUES (p_stripe_id, p_version)
+  ON CONFLICT ("stripe_id") DO UPDATE
+  SET "version" = GREATEST(t."version", EXCLUDED."version");
+
+  DELETE FROM "stripe_customers"
+  WHERE "stripe_id" = p_stripe_id
+  RETURNING "organization_id" INTO v_organization_id;
+
+  RETURN v_organization_id;
+END;
+$$;
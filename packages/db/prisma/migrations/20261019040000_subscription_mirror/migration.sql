@@ -0,0 +1,95 @@
+-- Migration: Local Stripe subscription mirror for the billing service
+-- One row per organization with its most recently created subscription, fed
+-- by customer.subscription.* / invoice.* webhooks and periodic
+-- reconciliation. Stripe delivers webhooks out of order, so every write
+-- carries a version and the upsert drops writes older than the row.
+
+CREATE TABLE IF NOT EXISTS "stripe_subscriptions" (
+  "organization_id"       TEXT NOT NULL,
+  "subscription_id"       TEXT NOT NULL,
+  "customer_id"           TEXT NOT NULL,
+  "item_id"               TEXT,
+  "price_id"              TEXT,
+  "status"                VARCHAR(32) NOT NULL,
+  "current_period_start"  BIGINT,
+  "current_period_end"    BIGINT,
+  "cancel_at_period_end"  BOOLEAN NOT NULL DEFAULT false,
+  "canceled_at"           BIGINT,
+  "trial_end"             BIGINT,
+  "created"               BIGINT NOT NULL,
+  "version"               BIGINT NOT NULL,
+  "latest_invoice_id"     TEXT,
+  "latest_invoice_status" VARCHAR(32),
+  "invoice_version"       BIGINT NOT NULL DEFAULT 0,
+  "updated_at"            TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+  CONSTRAINT "stripe_subscriptions_pkey" PRIMARY KEY ("organization_id")
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS "stripe_subscriptions_subscription_id_key"
+  ON "stripe_subscriptions" ("subscription_id");
+CREATE INDEX IF NOT EXISTS "stripe_subscriptions_customer_id_idx"
+  ON "stripe_subscriptions" ("customer_id");
+
+-- Applies a batch of mirrored subscriptions (a JSON array of rows). A write
+-- replaces the row when it is for the same subscription and not older
+-- (version), or for a subscription created no earlier (created). Returns
+-- how many rows were written.
+CREATE OR REPLACE FUNCTION mirror_stripe_subscriptions(p_rows jsonb)
+  RETURNS integer
+  LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_row     jsonb;
+  v_count   integer;
+  v_applied integer := 0;
+BEGIN
+  FOR v_row IN SELECT * FROM jsonb_array_elements(p_rows) LOOP
+    -- A subscription moved to another organization
+    DELETE FROM "stripe_subscriptions"
+    WHERE "subscription_id" = v_row->>'subscription_id'
+      AND "organization_id" <> v_row->>'organization_id';
+
+    INSERT INTO "stripe_subscriptions" AS s
+      ("organization_id", "subscription_id", "customer_id", "item_id", "price_id",
+       "status", "current_period_start", "current_period_end",
+       "cancel_at_period_end", "canceled_at", "trial_end", "created", "version",
+       "updated_at")
+    VALUES
+      (v_row->>'organization_id', v_row->>'subscription_id', v_row->>'customer_id',
+       v_row->>'item_id', v_row->>'price_id', v_row->>'status',
+       (v_row->>'current_period_start')::bigint, (v_row->>'current_period_end')::bigint,
+       COALESCE((v_row->>'cancel_at_period_end')::boolean, false),
+       (v_row->>'canceled_at')::bigint, (v_row->>'trial_end')::bigint,
+       (v_row->>'created')::bigint, (v_row->>'version')::bigint, now())
+    ON CONFLICT ("organization_id") DO UPDATE
+    SET "subscription_id"      = EXCLUDED."subscription_id",
+        "customer_id"          = EXCLUDED."customer_id",
+        "item_id"              = EXCLUDED."item_id",
+        "price_id"             = EXCLUDED."price_id",
+        "status"               = EXCLUDED."status",
+        "current_period_start" = EXCLUDED."current_period_start",
+        "current_period_end"   = EXCLUDED."current_period_end",
+        "cancel_at_period_end" = EXCLUDED."cancel_at_period_end",
+        "canceled_at"          = EXCLUDED."canceled_at",
+        "trial_end"            = EXCLUDED."trial_end",
+        "created"              = EXCLUDED."created",
+        "version"              = EXCLUDED."version",
+        -- Invoice fields belong to the subscription they were recorded for
+        "latest_invoice_id"     = CASE WHEN s."subscription_id" = EXCLUDED."subscription_id"
+                                       THEN s."latest_invoice_id" END,
+        "latest_invoice_status" = CASE WHEN s."subscription_id" = EXCLUDED."subscription_id"
+                                       THEN s."latest_invoice_status" END,
+        "invoice_version"       = CASE WHEN s."subscription_id" = EXCLUDED."subscription_id"
+                                       THEN s."invoice_version" ELSE 0 END,
+        "updated_at"           = now()
+    WHERE CASE WHEN s."subscription_id" = EXCLUDED."subscription_id"
+               THEN EXCLUDED."version" >= s."version"
+               ELSE EXCLUDED."created" >= s."created" END;
+
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    v_applied := v_applied + v_count;
+  END LOOP;
+  RETURN v_applied;
+END;
+$$;
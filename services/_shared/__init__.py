@@ -1,10 +1,14 @@
 """Shared infrastructure for Nebutra Python microservices."""
 
+from .app import create_app
 from .env import require_env, get_env, BaseServiceSettings
 from .middleware import RequestLoggingMiddleware, HealthCheckFilter
 from .resilience import retry, CircuitBreaker, timeout
+from .responses import FastJSONResponse
 
 __all__ = [
+    # app.py
+    "create_app",
     # env.py
     "require_env",
     "get_env",
@@ -16,4 +20,6 @@ __all__ = [
     "retry",
     "CircuitBreaker",
     "timeout",
+    # responses.py
+    "FastJSONResponse",
 ]
@@ -0,0 +1,93 @@
+"""Standard FastAPI app factory for all Python microservices.
+
+Every service wires the same pieces — OpenTelemetry, request logging, the
+catch-all error handler, the shared health routes and the debug routes.
+``create_app`` does that in one place so service entry points only declare
+what is specific to them.
+
+Usage (in each service's main.py):
+    from _shared.app import create_app
+
+    app = create_app(
+        title="Nebutra AI Service",
+        description="AI-powered generation, embedding, and translation service",
+        service_name="ai-service",
+    )
+    app.include_router(routes_generate.router, prefix="/api/v1/generate")
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+from .compression import CompressionMiddleware
+from .debug import router as debug_router
+from .errors import generic_exception_handler
+from .health import router as health_router
+from .launcher import WorkerMetricsMiddleware
+from .lifecycle import DrainMiddleware, wrap_lifespan
+from .memory import install_gc_tracker
+from .middleware import RequestLoggingMiddleware
+from .otel import instrument_app
+from .responses import FastJSONResponse
+
+
+def create_app(
+    *,
+    title: str,
+    description: str,
+    service_name: str,
+    version: str = "0.1.0",
+    lifespan: Any = None,
+    include_health: bool = True,
+    include_debug: bool = True,
+    fast_json: bool = True,
+    compression: bool = True,
+) -> FastAPI:
+    """
+    Build a FastAPI app with the shared middleware stack.
+
+    Args:
+        title: OpenAPI title.
+        description: OpenAPI description.
+        service_name: OpenTelemetry service name (e.g. "billing-service").
+        version: Service version reported in OpenAPI.
+        lifespan: Optional lifespan context manager. It is wrapped so that
+            shutdown drains in-flight requests and background tasks first
+            (see lifecycle.py).
+        include_health: Mount the shared /health, /ready, /livez, /readyz routes.
+            Disable for services that expose their own dependency-aware probes.
+        include_debug: Mount the token-protected /debug routes (profiler,
+            memory snapshots).
+            They stay disabled until DEBUG_API_TOKEN is set.
+        fast_json: Render responses with FastJSONResponse (orjson) instead of
+            the stdlib-based JSONResponse.
+        compression: Compress responses per Accept-Encoding (gzip, plus
+            zstd / brotli when installed).
+    """
+    app = FastAPI(
+        title=title,
+        description=description,
+        version=version,
+        lifespan=wrap_lifespan(lifespan),
+        default_response_class=FastJSONResponse if fast_json else JSONResponse,
+    )
+
+    install_gc_tracker()
+    instrument_app(app, service_name=service_name)
+    if compression:
+        app.add_middleware(CompressionMiddleware)  # innermost: sees the raw body
+    app.add_middleware(RequestLoggingMiddleware)
+    app.add_middleware(WorkerMetricsMiddleware)
+    app.add_middleware(DrainMiddleware)  # outermost: reject before any other work
+    app.add_exception_handler(Exception, generic_exception_handler)
+
+    if include_health:
+        app.include_router(health_router)
+    if include_debug:
+        app.include_router(debug_router)
+
+    return app
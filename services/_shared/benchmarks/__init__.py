@@ -0,0 +1 @@
+"""Micro-benchmarks for shared infrastructure (run with ``python -m``)."""
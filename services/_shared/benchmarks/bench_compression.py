@@ -0,0 +1,71 @@
+"""
+Response compression benchmark.
+
+For each representative service payload (rendered the way FastJSONResponse
+renders it) and each available encoding/level, reports compressed size,
+bytes saved, and the CPU time to compress one response.
+
+Usage (from services/):
+    python -m _shared.benchmarks.bench_compression
+    python -m _shared.benchmarks.bench_compression --levels gzip:1,6,9 zstd:1,3 br:1,4
+"""
+
+from __future__ import annotations
+
+import argparse
+import timeit
+from functools import partial
+
+from _shared.benchmarks.payloads import PAYLOADS
+from _shared.compression import DEFAULT_LEVELS, available_encodings, compress
+from _shared.responses import dumps
+
+
+def _best_us(fn, repeat: int) -> float:
+    """Best-of-``repeat`` time per call in microseconds."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+
+def _parse_levels(specs: list[str] | None) -> list[tuple[str, int]]:
+    available = available_encodings()
+    if not specs:
+        return [(enc, DEFAULT_LEVELS[enc]) for enc in available]
+    result = []
+    for spec in specs:
+        encoding, _, levels = spec.partition(":")
+        if encoding not in available:
+            print(f"skipping {encoding}: not installed")
+            continue
+        result.extend((encoding, int(level)) for level in levels.split(","))
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--levels", nargs="*", help="encoding:level[,level] (default: middleware levels)")
+    args = parser.parse_args()
+
+    variants = _parse_levels(args.levels)
+    print(f"encodings: {', '.join(available_encodings())}")
+    header = f"{'payload':<36} {'enc':<8} {'raw':>9} {'encoded':>9} {'saved':>7} {'cpu':>9} {'MB/s':>7}"
+    print(header)
+    print("-" * len(header))
+
+    for name, build in PAYLOADS.items():
+        body = dumps(build())
+        for encoding, level in variants:
+            encoded = compress(body, encoding, level)
+            t_us = _best_us(partial(compress, body, encoding, level), args.repeat)
+            print(
+                f"{name:<36} {f'{encoding}-{level}':<8} "
+                f"{len(body) / 1024:>7.1f}KB {len(encoded) / 1024:>7.1f}KB "
+                f"{1 - len(encoded) / len(body):>6.0%} "
+                f"{t_us:>7.0f}µs {len(body) / t_us:>7.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
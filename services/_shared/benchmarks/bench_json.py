@@ -0,0 +1,65 @@
+"""
+JSON response encoding benchmark.
+
+Compares, per representative service payload:
+  stdlib     — FastAPI default: jsonable_encoder + JSONResponse (stdlib json)
+  encoder+fast — jsonable_encoder + FastJSONResponse (default_response_class only)
+  fast       — FastJSONResponse returned directly (no jsonable_encoder pass)
+
+Usage (from services/):
+    python -m _shared.benchmarks.bench_json
+    python -m _shared.benchmarks.bench_json --repeat 7
+"""
+
+from __future__ import annotations
+
+import argparse
+import timeit
+from collections.abc import Callable
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+from _shared.benchmarks.payloads import PAYLOADS
+from _shared.responses import FastJSONResponse, orjson
+
+
+def _best_us(fn: Callable[[], Any], repeat: int) -> float:
+    """Best-of-``repeat`` time per call in microseconds."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    stdlib = JSONResponse.render
+    fast = FastJSONResponse.render
+    dummy = object.__new__(FastJSONResponse)  # render() doesn't touch self
+
+    print(f"encoder: {'orjson ' + orjson.__version__ if orjson else 'stdlib fallback'}")
+    header = f"{'payload':<40} {'size':>9} {'stdlib':>10} {'enc+fast':>10} {'fast':>10} {'speedup':>8}"
+    print(header)
+    print("-" * len(header))
+
+    for name, build in PAYLOADS.items():
+        payload = build()
+        body = fast(dummy, payload)
+
+        t_stdlib = _best_us(lambda p=payload: stdlib(dummy, jsonable_encoder(p)), args.repeat)
+        t_enc_fast = _best_us(lambda p=payload: fast(dummy, jsonable_encoder(p)), args.repeat)
+        t_fast = _best_us(lambda p=payload: fast(dummy, p), args.repeat)
+
+        print(
+            f"{name:<40} {len(body) / 1024:>7.1f}KB "
+            f"{t_stdlib:>8.0f}µs {t_enc_fast:>8.0f}µs {t_fast:>8.0f}µs "
+            f"{t_stdlib / t_fast:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
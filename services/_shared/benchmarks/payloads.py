@@ -0,0 +1,194 @@
+"""
+Representative response payloads for each service.
+
+Shapes mirror what the routes actually return (field names, nesting, value
+types) so benchmark numbers transfer to production traffic. Sizes default to
+the upper end of what clients request.
+"""
+
+from __future__ import annotations
+
+import random
+import uuid
+from collections.abc import Callable
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+_rng = random.Random(42)  # deterministic payloads → comparable runs
+
+_NOW = datetime(2026, 1, 15, 12, 0, tzinfo=UTC)
+
+_LOREM = (
+    "Nebutra ships AI-native workflows for modern SaaS teams. "
+    "Build, launch and iterate with integrated billing, analytics and content. "
+)
+
+
+def _text(words: int) -> str:
+    base = _LOREM.split()
+    return " ".join(_rng.choice(base) for _ in range(words))
+
+
+def producthunt_posts(n: int = 50) -> dict[str, Any]:
+    """third-party: GET /api/v1/producthunt/posts (first=50)."""
+    posts = []
+    for i in range(n):
+        slug = f"product-{i}"
+        posts.append(
+            {
+                "id": str(400000 + i),
+                "name": f"Product {i}",
+                "slug": slug,
+                "tagline": _text(10),
+                "description": _text(60),
+                "url": f"https://www.producthunt.com/posts/{slug}",
+                "website": f"https://{slug}.example.com",
+                "votes_count": _rng.randint(0, 5000),
+                "comments_count": _rng.randint(0, 400),
+                "reviews_count": _rng.randint(0, 100),
+                "reviews_rating": round(_rng.uniform(3, 5), 2),
+                "featured_at": (_NOW - timedelta(hours=i)).isoformat(),
+                "created_at": (_NOW - timedelta(hours=i, minutes=5)).isoformat(),
+                "thumbnail": {"type": "image", "url": f"https://ph-files.imgix.net/{uuid.UUID(int=i)}.png"},
+                "media": [
+                    {"type": "image", "url": f"https://ph-files.imgix.net/{uuid.UUID(int=i * 10 + j)}.png"}
+                    for j in range(3)
+                ],
+                "topics": [
+                    {"id": str(j), "name": f"Topic {j}", "slug": f"topic-{j}"}
+                    for j in range(3)
+                ],
+                "makers": [
+                    {"id": str(j), "name": f"Maker {j}", "username": f"maker{j}"}
+                    for j in range(2)
+                ],
+                "product_hunt_url": f"https://www.producthunt.com/posts/{slug}",
+            }
+        )
+    return {
+        "posts": posts,
+        "page_info": {"hasNextPage": True, "endCursor": "MjA="},
+        "total_count": 5000,
+        "cached": True,
+        "cached_at": _NOW.isoformat(),
+    }
+
+
+def content_feed(n: int = 20) -> dict[str, Any]:
+    """content: GET /api/v1/feed (FeedResponse)."""
+    return {
+        "items": [
+            {
+                "id": f"post_{i}",
+                "title": _text(8),
+                "body": _text(40)[:200] + "...",
+                "author_id": f"user_{i % 7}",
+                "created_at": (_NOW - timedelta(minutes=i)).isoformat(),
+            }
+            for i in range(n)
+        ],
+        "next_cursor": f"post_{n - 1}",
+        "has_more": True,
+    }
+
+
+def content_posts(n: int = 200) -> list[dict[str, Any]]:
+    """content: raw posts_db rows (datetime values, not yet encoded)."""
+    return [
+        {
+            "id": f"post_{i}",
+            "organization_id": "org_1",
+            "author_id": f"user_{i % 7}",
+            "title": _text(8),
+            "body": _text(120),
+            "status": "published",
+            "created_at": _NOW - timedelta(minutes=i),
+            "updated_at": _NOW - timedelta(minutes=i // 2),
+        }
+        for i in range(n)
+    ]
+
+
+def ai_embedding(dimensions: int = 1536) -> dict[str, Any]:
+    """ai: POST /api/v1/embed (text-embedding-3-small)."""
+    return {
+        "embedding": [_rng.uniform(-0.1, 0.1) for _ in range(dimensions)],
+        "model": "text-embedding-3-small",
+        "dimensions": dimensions,
+    }
+
+
+def billing_usage_summary() -> dict[str, Any]:
+    """billing: GET /api/v1/usage/{organization_id} (GetUsageResponse)."""
+    period_start = _NOW.replace(day=1, hour=0, minute=0)
+    return {
+        "organization_id": "org_1",
+        "period_start": period_start,
+        "period_end": period_start + timedelta(days=31),
+        "usage": [
+            {
+                "type": usage_type,
+                "current": _rng.randint(0, 200000),
+                "limit": 100000,
+                "percentage": round(_rng.uniform(0, 100), 2),
+                "overage": _rng.randint(0, 5000),
+                "overage_cost": round(_rng.uniform(0, 5), 4),
+            }
+            for usage_type in ("AI_TOKEN", "API_CALL", "STORAGE", "BANDWIDTH", "COMPUTE")
+        ],
+        "total_cost": 12.34,
+    }
+
+
+def billing_transactions(n: int = 100) -> dict[str, Any]:
+    """billing: GET /api/v1/credits/{organization_id}/transactions."""
+    return {
+        "organization_id": "org_1",
+        "transactions": [
+            {
+                "id": str(uuid.UUID(int=i)),
+                "type": "USAGE",
+                "credits": -_rng.randint(1, 50),
+                "balance_after": 10000 - i * 10,
+                "description": "AI generation",
+                "created_at": _NOW - timedelta(seconds=i * 30),
+                "metadata": {"model": "gpt-5.2", "request_id": str(uuid.UUID(int=i + 1))},
+            }
+            for i in range(n)
+        ],
+        "total_count": 100000,
+    }
+
+
+def ecommerce_orders(n: int = 20) -> dict[str, Any]:
+    """ecommerce: GET /api/v1/orders."""
+    return {
+        "orders": [
+            {
+                "id": f"order_{i}",
+                "org_id": "org_1",
+                "user_id": f"user_{i % 5}",
+                "status": "pending",
+                "items": [
+                    {"product_id": f"prod_{j}", "quantity": j + 1, "price": 19.99}
+                    for j in range(5)
+                ],
+                "total": 299.85,
+                "created_at": (_NOW - timedelta(hours=i)).isoformat(),
+            }
+            for i in range(n)
+        ],
+        "total": n,
+    }
+
+
+PAYLOADS: dict[str, Callable[[], Any]] = {
+    "third-party: producthunt posts (50)": producthunt_posts,
+    "content: feed (20)": content_feed,
+    "content: posts (200, datetime)": content_posts,
+    "ai: embedding (1536)": ai_embedding,
+    "ai: embedding (3072)": lambda: ai_embedding(3072),
+    "billing: usage summary": billing_usage_summary,
+    "billing: transactions (100)": billing_transactions,
+    "ecommerce: orders (20)": ecommerce_orders,
+}
@@ -0,0 +1,316 @@
+"""
+Response compression middleware for Python microservices.
+
+Pure ASGI middleware (no BaseHTTPMiddleware buffering) that negotiates the
+best encoding from ``Accept-Encoding``:
+
+  zstd  — if the ``zstandard`` package is installed
+  br    — if the ``brotli`` package is installed
+  gzip  — always (stdlib zlib)
+
+Complete bodies (the normal JSON case) are compressed in one shot once they
+exceed ``minimum_size``, in a worker thread when they are large. Streaming
+responses — anything sent as more than one body message, including SSE — are
+compressed incrementally: every chunk is flushed as soon as it is
+compressed, so events reach the client without waiting for the stream to
+end.
+
+Usage:
+    from _shared.compression import CompressionMiddleware
+
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+
+``create_app`` installs it by default. Benchmark per service payload:
+    python -m _shared.benchmarks.bench_compression
+"""
+
+from __future__ import annotations
+
+import asyncio
+import zlib
+from collections.abc import Iterable
+from typing import Any
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional accelerator
+    zstandard = None  # type: ignore[assignment]
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional accelerator
+    brotli = None  # type: ignore[assignment]
+
+# Bodies smaller than this aren't worth the CPU or the extra header bytes
+DEFAULT_MINIMUM_SIZE = 1024
+
+# Media types that compress well; images, archives and the like are skipped
+DEFAULT_CONTENT_TYPES = (
+    "application/json",
+    "application/problem+json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "text/",
+)
+
+# Server preference, best first
+DEFAULT_ENCODINGS = ("zstd", "br", "gzip")
+
+# Levels chosen for cluster-internal JSON: most of the ratio for little CPU.
+# gzip-1 keeps 85-95% of gzip-6's savings on our payloads at a third of the
+# cost (see bench_compression).
+DEFAULT_LEVELS = {"zstd": 3, "br": 4, "gzip": 1}
+
+# Complete bodies at least this large are compressed in a worker thread
+# (zlib, zstandard and brotli release the GIL) instead of on the event loop
+DEFAULT_OFFLOAD_SIZE = 64 * 1024
+
+
+# ── Compressors ───────────────────────────────────────────────────────────────
+
+
+class _GzipStream:
+    def __init__(self, level: int) -> None:
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 → gzip framing
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._obj.flush(zlib.Z_FINISH)
+
+
+class _ZstdStream:
+    def __init__(self, level: int) -> None:
+        self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data) + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+class _BrotliStream:
+    def __init__(self, level: int) -> None:
+        self._obj = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.process(data) + self._obj.flush()
+
+    def finish(self) -> bytes:
+        return self._obj.finish()
+
+
+def available_encodings() -> tuple[str, ...]:
+    """Encodings this process can produce, in server preference order."""
+    return tuple(
+        enc
+        for enc in DEFAULT_ENCODINGS
+        if enc == "gzip" or (enc == "zstd" and zstandard) or (enc == "br" and brotli)
+    )
+
+
+def compress(data: bytes, encoding: str, level: int | None = None) -> bytes:
+    """One-shot compression of a complete body."""
+    level = DEFAULT_LEVELS[encoding] if level is None else level
+    if encoding == "gzip":
+        obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return obj.compress(data) + obj.flush()
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def stream_compressor(encoding: str, level: int | None = None) -> Any:
+    """Incremental compressor with ``compress(chunk)`` (flushed) and ``finish()``."""
+    level = DEFAULT_LEVELS[encoding] if level is None else level
+    if encoding == "gzip":
+        return _GzipStream(level)
+    if encoding == "zstd":
+        return _ZstdStream(level)
+    if encoding == "br":
+        return _BrotliStream(level)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def negotiate(accept_encoding: str, supported: Iterable[str]) -> str | None:
+    """
+    Pick the server-preferred encoding the client accepts.
+
+    Honours q-values (``q=0`` refuses) and ``*``. Returns None when only
+    identity is acceptable.
+    """
+    accepted: dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip()] = q
+
+    wildcard = accepted.get("*")
+    for encoding in supported:
+        q = accepted.get(encoding, wildcard)
+        if q is not None and q > 0:
+            return encoding
+    return None
+
+
+# ── Middleware ────────────────────────────────────────────────────────────────
+
+
+class CompressionMiddleware:
+    """
+    Compress responses according to ``Accept-Encoding``.
+
+    Args:
+        minimum_size: Complete bodies below this many bytes are sent as-is.
+        content_types: Allowed media types; entries ending in "/" match a
+            whole family (``"text/"``).
+        encodings: Encodings to offer, in preference order. Ones whose
+            library isn't installed are dropped.
+        levels: Per-encoding compression level overrides.
+        offload_size: Complete bodies at least this large are compressed
+            in a worker thread so the event loop keeps serving.
+    """
+
+    def __init__(
+        self,
+        app: Any,
+        minimum_size: int = DEFAULT_MINIMUM_SIZE,
+        content_types: Iterable[str] = DEFAULT_CONTENT_TYPES,
+        encodings: Iterable[str] = DEFAULT_ENCODINGS,
+        levels: dict[str, int] | None = None,
+        offload_size: int = DEFAULT_OFFLOAD_SIZE,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.content_types = tuple(content_types)
+        available = available_encodings()
+        self.encodings = tuple(enc for enc in encodings if enc in available)
+        self.levels = {**DEFAULT_LEVELS, **(levels or {})}
+        self.offload_size = offload_size
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept = ""
+        for key, value in scope["headers"]:
+            if key == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        encoding = negotiate(accept, self.encodings) if accept else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        await _CompressedResponse(self, encoding, send).run(scope, receive)
+
+    def _compressible(self, headers: list[tuple[bytes, bytes]]) -> bool:
+        content_type = b""
+        for key, value in headers:
+            if key == b"content-encoding":
+                return False  # already encoded by the route
+            if key == b"cache-control" and b"no-transform" in value:
+                return False
+            if key == b"content-type":
+                content_type = value
+        media_type = content_type.split(b";", 1)[0].strip().decode("latin-1").lower()
+        return any(
+            media_type.startswith(allowed) if allowed.endswith("/") else media_type == allowed
+            for allowed in self.content_types
+        )
+
+
+class _CompressedResponse:
+    """Per-request state: holds the start message until the body shape is known."""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Any) -> None:
+        self.mw = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start: dict | None = None
+        self.active = False  # compressing this response
+        self.stream: Any = None  # incremental compressor once streaming
+
+    async def run(self, scope: dict, receive: Any) -> None:
+        await self.mw.app(scope, receive, self.wrapped_send)
+
+    async def wrapped_send(self, message: dict) -> None:
+        if message["type"] == "http.response.start":
+            headers = list(message.get("headers", []))
+            self.start = {**message, "headers": headers}
+            status = message["status"]
+            self.active = status not in (204, 304) and status >= 200 and self.mw._compressible(headers)
+            if not self.active:
+                await self.send(message)
+                self.start = None
+            return
+
+        if message["type"] != "http.response.body" or not self.active:
+            await self.send(message)
+            return
+
+        body: bytes = message.get("body", b"")
+        more_body: bool = message.get("more_body", False)
+
+        if self.stream is None and not more_body:
+            # Complete body in one message — the common JSON case
+            if len(body) < self.mw.minimum_size:
+                await self._send_start(encoded=False)
+                await self.send(message)
+                return
+            level = self.mw.levels[self.encoding]
+            if len(body) >= self.mw.offload_size:
+                compressed = await asyncio.to_thread(compress, body, self.encoding, level)
+            else:
+                compressed = compress(body, self.encoding, level)
+            await self._send_start(encoded=True, content_length=len(compressed))
+            await self.send({"type": "http.response.body", "body": compressed})
+            return
+
+        if self.stream is None:
+            # First chunk of a streaming response: no length, flush per chunk
+            self.stream = stream_compressor(self.encoding, self.mw.levels[self.encoding])
+            await self._send_start(encoded=True, content_length=None)
+
+        chunk = self.stream.compress(body) if body else b""
+        if not more_body:
+            chunk += self.stream.finish()
+        if chunk or not more_body:
+            await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    async def _send_start(self, encoded: bool, content_length: int | None = None) -> None:
+        start = self.start
+        self.start = None
+        if encoded:
+            headers = [
+                (k, v) for k, v in start["headers"] if k not in (b"content-length", b"content-encoding")
+            ]
+            headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+            if content_length is not None:
+                headers.append((b"content-length", str(content_length).encode("latin-1")))
+            start["headers"] = headers
+        _add_vary(start["headers"])
+        await self.send(start)
+
+
+def _add_vary(headers: list[tuple[bytes, bytes]]) -> None:
+    for i, (key, value) in enumerate(headers):
+        if key == b"vary":
+            if b"accept-encoding" not in value.lower():
+                headers[i] = (key, value + b", Accept-Encoding")
+            return
+    headers.append((b"vary", b"Accept-Encoding"))
@@ -0,0 +1,177 @@
+"""Authenticated debug endpoints for all Python microservices.
+
+Routes live under /debug and are hidden from the OpenAPI schema. They are
+disabled (404) unless ``DEBUG_API_TOKEN`` is set, and every request must send
+the same value in the ``X-Debug-Token`` header (or as a Bearer token, for
+Prometheus scrapes).
+
+    GET  /debug/profile?seconds=10            — CPU profile as collapsed stacks
+    GET  /debug/memory                        — RSS, GC pauses, store sizes
+    GET  /debug/memory/metrics                — same, Prometheus text format
+    POST /debug/memory/tracing/start|stop     — toggle tracemalloc
+    POST /debug/memory/snapshots              — take a labelled snapshot
+    GET  /debug/memory/snapshots/{label}      — top allocation sites
+    GET  /debug/memory/snapshots/{old}/diff/{new}
+    GET  /debug/workers                       — per-worker request counters
+    GET  /debug/lifecycle                     — drain state and last drain report
+
+Grab a flamegraph from a hot pod:
+    kubectl port-forward pod/billing-xyz 8005 &
+    curl -H "X-Debug-Token: $DEBUG_API_TOKEN" \\
+        "localhost:8005/debug/profile?seconds=15" > cpu.folded
+    flamegraph.pl cpu.folded > cpu.svg   # or drop into speedscope.app
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hmac
+import os
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from . import launcher, memory
+from .lifecycle import lifecycle
+from .profiler import ProfilerBusy, profile
+
+DEBUG_TOKEN_ENV = "DEBUG_API_TOKEN"
+
+
+async def require_debug_token(
+    x_debug_token: str | None = Header(default=None),
+    authorization: str | None = Header(default=None),
+) -> None:
+    """Reject requests unless they carry the configured debug token."""
+    expected = os.environ.get(DEBUG_TOKEN_ENV)
+    if not expected:
+        # Debug surface is off entirely when no token is configured
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = x_debug_token
+    if token is None and authorization and authorization.startswith("Bearer "):
+        token = authorization[len("Bearer "):]
+    if not token or not hmac.compare_digest(token, expected):
+        raise HTTPException(status_code=401, detail="Invalid debug token")
+
+
+router = APIRouter(
+    prefix="/debug",
+    tags=["debug"],
+    include_in_schema=False,
+    dependencies=[Depends(require_debug_token)],
+)
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def cpu_profile(
+    seconds: float = Query(10.0, gt=0, le=120, description="Sampling duration"),
+    interval_ms: float = Query(10.0, ge=1, le=1000, description="Sampling interval"),
+    idle: bool = Query(False, description="Include samples of parked threads"),
+) -> PlainTextResponse:
+    """
+    Sample every thread's stack (event loop included) for ``seconds``.
+
+    Returns collapsed stacks (``frame;frame;frame count``), ready for
+    flamegraph.pl / speedscope. Returns 409 if a profile is already running.
+    """
+    try:
+        collapsed = await profile(
+            seconds=seconds,
+            interval=interval_ms / 1000,
+            include_idle=idle,
+        )
+    except ProfilerBusy as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from None
+    return PlainTextResponse(collapsed)
+
+
+@router.get("/memory")
+async def memory_report() -> dict:
+    """RSS, GC pause stats, tracemalloc status and registered store sizes."""
+    return await asyncio.to_thread(memory.memory_report)
+
+
+@router.get("/memory/metrics", response_class=PlainTextResponse)
+async def memory_metrics() -> PlainTextResponse:
+    """RSS / GC pause / store gauges in Prometheus exposition format."""
+    text = await asyncio.to_thread(memory.prometheus_metrics)
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+
+@router.post("/memory/tracing/start")
+async def start_tracing(
+    frames: int = Query(1, ge=1, le=64, description="Traceback depth per allocation"),
+) -> dict:
+    """Start tracemalloc. Adds CPU and memory overhead until stopped."""
+    memory.start_tracing(frames)
+    return memory.tracing_status()
+
+
+@router.post("/memory/tracing/stop")
+async def stop_tracing() -> dict:
+    """Stop tracemalloc and discard stored snapshots."""
+    memory.stop_tracing()
+    return memory.tracing_status()
+
+
+@router.post("/memory/snapshots")
+async def take_snapshot(
+    label: str | None = Query(None, max_length=64),
+    limit: int = Query(20, ge=1, le=200),
+) -> dict:
+    """Take a tracemalloc snapshot; returns its label and top allocation sites."""
+    try:
+        label = await asyncio.to_thread(memory.take_snapshot, label)
+    except memory.TracingNotStarted as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from None
+    top = await asyncio.to_thread(memory.top_allocations, label, limit)
+    return {"label": label, "top": top}
+
+
+@router.get("/memory/snapshots/{label}")
+async def snapshot_top(
+    label: str,
+    limit: int = Query(20, ge=1, le=200),
+    key_type: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+) -> dict:
+    """Top allocation sites in a stored snapshot."""
+    try:
+        top = await asyncio.to_thread(memory.top_allocations, label, limit, key_type)
+    except memory.SnapshotNotFound:
+        raise HTTPException(status_code=404, detail=f"Unknown snapshot {label}") from None
+    return {"label": label, "top": top}
+
+
+@router.get("/memory/snapshots/{old_label}/diff/{new_label}")
+async def snapshot_diff(
+    old_label: str,
+    new_label: str,
+    limit: int = Query(20, ge=1, le=200),
+    key_type: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+) -> dict:
+    """Allocation sites with the largest growth between two snapshots."""
+    try:
+        diff = await asyncio.to_thread(
+            memory.diff_snapshots, old_label, new_label, limit, key_type
+        )
+    except memory.SnapshotNotFound as exc:
+        raise HTTPException(status_code=404, detail=f"Unknown snapshot {exc}") from None
+    return {"old": old_label, "new": new_label, "diff": diff}
+
+
+@router.get("/workers")
+async def workers() -> dict:
+    """Request counters of every worker in this pod (when run by the launcher)."""
+    return launcher.worker_stats()
+
+
+@router.get("/lifecycle")
+async def lifecycle_state() -> dict:
+    """Lifecycle state, in-flight work and the last drain report."""
+    report = lifecycle.last_report
+    return {
+        "state": lifecycle.state,
+        "in_flight": lifecycle.in_flight,
+        "pending_tasks": lifecycle.pending_tasks,
+        "last_drain": report.to_dict() if report else None,
+    }
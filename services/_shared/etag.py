@@ -0,0 +1,177 @@
+"""
+ETag / conditional GET support for cacheable read endpoints.
+
+Routes declare a cheap *version* for what they are about to return — a
+cache timestamp, a per-tenant change counter, a content hash computed once
+at import. The ETag is derived from the cache key and that version, so:
+
+  - a matching ``If-None-Match`` gets a 304 without building or
+    serializing the body at all, and
+  - a miss reuses the last serialized body for the same key and version,
+    so hot representations are encoded once per change, not per request.
+
+ETags are weak (``W/"…"``): bodies for the same version are semantically
+equivalent but may differ in bookkeeping fields such as ``cached: true``.
+
+Usage:
+    from _shared.etag import cached_json_response, VersionCounter
+
+    feed_versions = VersionCounter()
+
+    @router.get("/")
+    async def get_feed(request: Request, x_organization_id: str = Header(...)):
+        return await cached_json_response(
+            request,
+            key=f"feed:{x_organization_id}",
+            version=feed_versions.current(x_organization_id),
+            build=lambda: build_feed(x_organization_id),
+        )
+
+    # …and on every write:
+    feed_versions.bump(organization_id)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import inspect
+import threading
+import uuid
+from collections import OrderedDict, defaultdict
+from collections.abc import Callable
+from typing import Any
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from .memory import register_store
+from .responses import dumps
+
+# Representation cache bounds (per process)
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+DEFAULT_CACHE_CONTROL = "no-cache"  # always revalidate; 304s keep it cheap
+
+
+def content_hash(body: bytes) -> str:
+    """Short stable hash of a body — a version for static content."""
+    return hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+def make_etag(key: str, version: str) -> str:
+    digest = hashlib.blake2b(f"{key}\0{version}".encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Weak comparison against an ``If-None-Match`` header value."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(",")
+    )
+
+
+class VersionCounter:
+    """
+    In-process change counters, one per key (e.g. per organization).
+
+    Versions include a per-process boot id, so a restarted process never
+    reuses an ETag issued by its predecessor for different data.
+    """
+
+    def __init__(self) -> None:
+        self._boot = uuid.uuid4().hex[:8]
+        self._versions: defaultdict[str, int] = defaultdict(int)
+
+    def bump(self, key: str) -> None:
+        self._versions[key] += 1
+
+    def current(self, key: str) -> str:
+        return f"{self._boot}.{self._versions.get(key, 0)}"
+
+
+class RepresentationCache:
+    """LRU of serialized bodies keyed by cache key, valid for one version."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, tuple[str, bytes]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, version: str) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, version: str, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[1])
+            self._entries[key] = (version, body)
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+representations = RepresentationCache()
+register_store("etag.representations", lambda: representations._entries)
+
+
+async def cached_json_response(
+    request: Request,
+    *,
+    key: str,
+    version: str,
+    build: Callable[[], Any] | Any,
+    cache: RepresentationCache | None = representations,
+    cache_control: str = DEFAULT_CACHE_CONTROL,
+) -> Response:
+    """
+    JSON response with an ETag derived from ``key`` and ``version``.
+
+    Args:
+        request: Incoming request (for ``If-None-Match``).
+        key: Identifies the representation — include everything that shapes
+            the body (tenant, query params).
+        version: Changes whenever the body would change.
+        build: The content, or a (sync or async) callable producing it. Only
+            called when neither a 304 nor a cached body can be served.
+        cache: Representation cache; None disables body reuse.
+    """
+    etag = make_etag(key, version)
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    body = cache.get(key, version) if cache is not None else None
+    if body is None:
+        content = build() if callable(build) else build
+        if inspect.isawaitable(content):
+            content = await content
+        body = dumps(content)
+        if cache is not None:
+            cache.put(key, version, body)
+
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -19,6 +19,8 @@ from typing import Any
 from fastapi import APIRouter
 from fastapi.responses import JSONResponse
 
+from .lifecycle import lifecycle
+
 logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["health"])
@@ -122,7 +124,11 @@ async def readiness() -> JSONResponse:
     Runs dependency checks (database, redis) in parallel.
     Returns 200 only if all configured dependencies are reachable.
     Kubernetes removes the pod from the Service endpoint slice if this fails.
+    Returns 503 without checking dependencies once shutdown has started.
     """
+    if lifecycle.is_draining:
+        return JSONResponse({"status": "not_ready", "reason": "draining"}, status_code=503)
+
     dependencies, all_healthy = await _run_dependency_checks()
 
     status_code = 200 if all_healthy else 503
@@ -144,6 +150,9 @@ async def livez() -> JSONResponse:
 @router.get("/readyz")
 async def readyz() -> JSONResponse:
     """Kubernetes /readyz convention alias for readiness probe."""
+    if lifecycle.is_draining:
+        return JSONResponse({"status": "not_ready", "reason": "draining"}, status_code=503)
+
     dependencies, all_healthy = await _run_dependency_checks()
 
     status_code = 200 if all_healthy else 503
@@ -0,0 +1,462 @@
+"""
+Prefork launcher for Python microservices.
+
+Runs a service as a supervisor process plus N uvicorn workers sharing one
+listening socket:
+
+  - Worker count follows the container's CPU quota (cgroup v2 ``cpu.max`` or
+    v1 ``cpu.cfs_quota_us``), not the host's core count. ``WEB_CONCURRENCY``
+    overrides it.
+  - uvloop and httptools are used when installed (``uvicorn[standard]``),
+    falling back to asyncio and h11.
+  - Workers are recycled after ``max_requests`` (plus per-worker jitter so
+    they don't all restart at once) and respawned when they exit. SIGHUP
+    restarts workers one at a time; SIGTERM / SIGINT stop them gracefully.
+  - Each worker counts requests, 5xx responses, in-flight requests and
+    latency into its own slot of a shared-memory array, so any worker can
+    report totals for the whole pod (see /debug/workers).
+
+Usage (in a service's main.py):
+    if __name__ == "__main__":
+        from _shared.launcher import run
+
+        run("app.main:app", host=settings.HOST, port=settings.PORT, reload=settings.DEBUG)
+
+Or from the shell:
+    python -m _shared.launcher app.main:app --port 8005 --max-requests 50000
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import logging
+import math
+import multiprocessing
+import os
+import random
+import signal
+import time
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger("uvicorn.error")
+
+# Fields of one worker slot in the shared counter array (int64 each)
+FIELDS = ("pid", "started_at", "restarts", "requests", "errors", "in_flight", "latency_us")
+_FIELD_INDEX = {name: i for i, name in enumerate(FIELDS)}
+
+# Supervisor poll interval — upper bound on signal-to-action latency
+_POLL_INTERVAL = 0.5
+
+# A worker that dies sooner than this after starting is respawned with backoff
+_MIN_UPTIME = 1.0
+_MAX_BACKOFF = 10.0
+
+_spawn = multiprocessing.get_context("spawn")
+
+
+# ── Sizing and implementation choice ─────────────────────────────────────────
+
+
+def cgroup_cpu_limit() -> float | None:
+    """CPU quota of the current cgroup in cores, or None if unlimited."""
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        quota_us = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read_text())
+        period_us = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read_text())
+        if quota_us > 0 and period_us > 0:
+            return quota_us / period_us
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def default_workers() -> int:
+    """
+    Worker count for this container.
+
+    ``WEB_CONCURRENCY`` wins if set. Otherwise one worker per whole core of
+    CPU quota (rounded down, minimum 1) — running more workers than the
+    quota allows only gets the pod throttled.
+    """
+    env = os.environ.get("WEB_CONCURRENCY")
+    if env:
+        return max(1, int(env))
+
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, max(1, math.floor(limit)))
+    return cpus
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def pick_loop() -> str:
+    return "uvloop" if _installed("uvloop") else "asyncio"
+
+
+def pick_http() -> str:
+    return "httptools" if _installed("httptools") else "h11"
+
+
+# ── Shared counters ──────────────────────────────────────────────────────────
+
+
+class SharedCounters:
+    """
+    Per-worker int64 counters in a shared-memory array.
+
+    Each worker writes only to its own slot, so no locking is needed; readers
+    may see a slot mid-update, which is fine for metrics.
+    """
+
+    def __init__(self, array: Any, slots: int, slot: int | None = None) -> None:
+        self._array = array
+        self.slots = slots
+        self.slot = slot
+
+    @classmethod
+    def create(cls, slots: int) -> SharedCounters:
+        return cls(_spawn.RawArray("q", slots * len(FIELDS)), slots)
+
+    def for_slot(self, slot: int) -> SharedCounters:
+        return SharedCounters(self._array, self.slots, slot)
+
+    def add(self, field: str, amount: int = 1, slot: int | None = None) -> None:
+        slot = self.slot if slot is None else slot
+        self._array[slot * len(FIELDS) + _FIELD_INDEX[field]] += amount
+
+    def set(self, field: str, value: int, slot: int | None = None) -> None:
+        slot = self.slot if slot is None else slot
+        self._array[slot * len(FIELDS) + _FIELD_INDEX[field]] = value
+
+    def read(self) -> list[dict[str, int]]:
+        """Snapshot of every slot."""
+        width = len(FIELDS)
+        values = self._array[:]
+        return [
+            {"slot": slot, **dict(zip(FIELDS, values[slot * width:(slot + 1) * width], strict=True))}
+            for slot in range(self.slots)
+        ]
+
+
+# Counters for the current worker process; None when not run by the launcher
+_worker_counters: SharedCounters | None = None
+
+
+def worker_counters() -> SharedCounters | None:
+    return _worker_counters
+
+
+def worker_stats() -> dict[str, Any]:
+    """Per-worker and pod-wide request counters (for /debug/workers)."""
+    counters = _worker_counters
+    if counters is None:
+        return {"supervised": False, "pid": os.getpid()}
+
+    workers = counters.read()
+    totals = {
+        name: sum(w[name] for w in workers)
+        for name in ("restarts", "requests", "errors", "in_flight", "latency_us")
+    }
+    totals["mean_latency_ms"] = (
+        round(totals["latency_us"] / totals["requests"] / 1000, 3) if totals["requests"] else None
+    )
+    return {
+        "supervised": True,
+        "pid": os.getpid(),
+        "slot": counters.slot,
+        "workers": workers,
+        "totals": totals,
+    }
+
+
+class WorkerMetricsMiddleware:
+    """
+    Pure ASGI middleware feeding this worker's shared counters.
+
+    A no-op (one attribute lookup) when the process wasn't started by the
+    launcher.
+    """
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        counters = _worker_counters
+        if counters is None or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500  # if the app raises before starting a response
+
+        async def send_wrapper(message: dict) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        counters.add("in_flight")
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            counters.add("in_flight", -1)
+            counters.add("requests")
+            counters.add("latency_us", int((time.perf_counter() - start) * 1_000_000))
+            if status >= 500:
+                counters.add("errors")
+
+
+# ── Worker process ───────────────────────────────────────────────────────────
+
+
+def _worker_main(config: Any, sockets: list, counters: SharedCounters, max_requests: int | None) -> None:
+    """Entry point of a spawned worker."""
+    global _worker_counters
+    import uvicorn
+
+    _worker_counters = counters
+    counters.set("pid", os.getpid())
+    counters.set("started_at", int(time.time()))
+    counters.set("in_flight", 0)  # a killed predecessor may have left requests counted
+
+    config.configure_logging()
+    config.limit_max_requests = max_requests
+    uvicorn.Server(config).run(sockets=sockets)
+
+
+# ── Supervisor ───────────────────────────────────────────────────────────────
+
+
+class Supervisor:
+    """Spawns, monitors and recycles uvicorn workers on a shared socket."""
+
+    def __init__(
+        self,
+        config: Any,
+        workers: int,
+        max_requests: int | None = None,
+        max_requests_jitter: int = 0,
+        graceful_timeout: float = 30.0,
+    ) -> None:
+        self.config = config
+        self.workers = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.counters = SharedCounters.create(workers)
+        self._procs: list[Any] = [None] * workers
+        self._started: list[float] = [0.0] * workers
+        self._not_before: list[float] = [0.0] * workers
+        self._backoff: list[float] = [0.0] * workers
+        self._sockets: list = []
+        self._should_exit = False
+        self._reload_requested = False
+
+    # Signal handlers only set flags; the poll loop acts on them
+    def _handle_exit(self, signum: int, frame: Any) -> None:
+        self._should_exit = True
+
+    def _handle_hup(self, signum: int, frame: Any) -> None:
+        self._reload_requested = True
+
+    def _spawn_worker(self, slot: int) -> None:
+        max_requests = self.max_requests
+        if max_requests and self.max_requests_jitter:
+            max_requests += random.randint(0, self.max_requests_jitter)
+        proc = _spawn.Process(
+            target=_worker_main,
+            name=f"worker-{slot}",
+            args=(self.config, self._sockets, self.counters.for_slot(slot), max_requests),
+        )
+        proc.start()
+        self._procs[slot] = proc
+        self._started[slot] = time.monotonic()
+        logger.info("Started worker %d [pid %d]", slot, proc.pid)
+
+    def _stop_worker(self, slot: int) -> None:
+        proc = self._procs[slot]
+        if proc is None:
+            return
+        proc.terminate()  # SIGTERM — uvicorn finishes in-flight requests
+        proc.join(self.graceful_timeout)
+        if proc.is_alive():
+            logger.warning("Worker %d [pid %d] did not stop in time; killing", slot, proc.pid)
+            proc.kill()
+            proc.join()
+
+    def _reap(self) -> None:
+        now = time.monotonic()
+        for slot, proc in enumerate(self._procs):
+            if proc is not None and proc.is_alive():
+                continue
+            if proc is not None:
+                uptime = now - self._started[slot]
+                if proc.exitcode == 0:
+                    logger.info("Worker %d [pid %d] exited (recycled)", slot, proc.pid)
+                else:
+                    logger.warning("Worker %d [pid %d] died with exit code %s", slot, proc.pid, proc.exitcode)
+                if uptime < _MIN_UPTIME:
+                    self._backoff[slot] = min(max(self._backoff[slot] * 2, 0.5), _MAX_BACKOFF)
+                    self._not_before[slot] = now + self._backoff[slot]
+                else:
+                    self._backoff[slot] = 0.0
+                proc.close()
+                self._procs[slot] = None
+                self.counters.add("restarts", slot=slot)
+            if now >= self._not_before[slot]:
+                self._spawn_worker(slot)
+
+    def _rolling_restart(self) -> None:
+        logger.info("Rolling restart of %d workers", self.workers)
+        for slot in range(self.workers):
+            if self._should_exit:
+                return
+            self._stop_worker(slot)
+            self._spawn_worker(slot)
+            self.counters.add("restarts", slot=slot)
+
+    def run(self) -> None:
+        self._sockets = [self.config.bind_socket()]
+        signal.signal(signal.SIGTERM, self._handle_exit)
+        signal.signal(signal.SIGINT, self._handle_exit)
+        signal.signal(signal.SIGHUP, self._handle_hup)
+
+        logger.info(
+            "Supervisor [pid %d] starting %d workers (loop=%s, http=%s)",
+            os.getpid(),
+            self.workers,
+            self.config.loop,
+            self.config.http,
+        )
+        for slot in range(self.workers):
+            self._spawn_worker(slot)
+
+        try:
+            while not self._should_exit:
+                time.sleep(_POLL_INTERVAL)
+                if self._reload_requested:
+                    self._reload_requested = False
+                    self._rolling_restart()
+                else:
+                    self._reap()
+        finally:
+            logger.info("Stopping workers")
+            for proc in self._procs:
+                if proc is not None and proc.is_alive():
+                    proc.terminate()
+            deadline = time.monotonic() + self.graceful_timeout
+            for slot, proc in enumerate(self._procs):
+                if proc is None:
+                    continue
+                proc.join(max(0.0, deadline - time.monotonic()))
+                if proc.is_alive():
+                    logger.warning("Worker %d [pid %d] did not stop in time; killing", slot, proc.pid)
+                    proc.kill()
+                    proc.join()
+            for sock in self._sockets:
+                sock.close()
+
+
+# ── Entry point ──────────────────────────────────────────────────────────────
+
+
+def _env_int(name: str) -> int | None:
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+def run(
+    app: str,
+    *,
+    host: str = "0.0.0.0",
+    port: int = 8000,
+    workers: int | None = None,
+    reload: bool = False,
+    max_requests: int | None = None,
+    max_requests_jitter: int | None = None,
+    graceful_timeout: float = 30.0,
+    **uvicorn_kwargs: Any,
+) -> None:
+    """
+    Serve ``app`` (an import string such as "app.main:app").
+
+    Args:
+        workers: Worker processes; defaults to ``default_workers()``.
+        reload: Development mode — single process with auto-reload, no
+            supervisor.
+        max_requests: Recycle a worker after this many requests
+            (env ``MAX_REQUESTS``). None disables recycling.
+        max_requests_jitter: Random extra requests per worker
+            (env ``MAX_REQUESTS_JITTER``; default 10% of max_requests).
+        graceful_timeout: Seconds a stopping worker gets to finish in-flight
+            requests before it is killed.
+        **uvicorn_kwargs: Passed through to ``uvicorn.Config``.
+    """
+    import uvicorn
+
+    uvicorn_kwargs.setdefault("loop", pick_loop())
+    uvicorn_kwargs.setdefault("http", pick_http())
+
+    if reload:
+        uvicorn.run(app, host=host, port=port, reload=True, **uvicorn_kwargs)
+        return
+
+    if max_requests is None:
+        max_requests = _env_int("MAX_REQUESTS")
+    if max_requests_jitter is None:
+        max_requests_jitter = _env_int("MAX_REQUESTS_JITTER")
+    if max_requests_jitter is None:
+        max_requests_jitter = max_requests // 10 if max_requests else 0
+
+    config = uvicorn.Config(
+        app,
+        host=host,
+        port=port,
+        timeout_graceful_shutdown=graceful_timeout,
+        **uvicorn_kwargs,
+    )
+    Supervisor(
+        config,
+        workers=workers or default_workers(),
+        max_requests=max_requests,
+        max_requests_jitter=max_requests_jitter,
+        graceful_timeout=graceful_timeout,
+    ).run()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("app", help='ASGI app import string, e.g. "app.main:app"')
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-requests", type=int, default=None)
+    parser.add_argument("--max-requests-jitter", type=int, default=None)
+    parser.add_argument("--graceful-timeout", type=float, default=30.0)
+    parser.add_argument("--reload", action="store_true")
+    args = parser.parse_args()
+
+    run(
+        args.app,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        reload=args.reload,
+        max_requests=args.max_requests,
+        max_requests_jitter=args.max_requests_jitter,
+        graceful_timeout=args.graceful_timeout,
+    )
+
+
+if __name__ == "__main__":
+    main()
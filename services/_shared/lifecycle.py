@@ -0,0 +1,348 @@
+"""
+Graceful shutdown for Python microservices.
+
+On SIGTERM (or SIGINT) the service:
+  1. flips readiness to not-ready (/ready, /readyz return 503),
+  2. after ``DRAIN_READINESS_DELAY_SECONDS`` stops accepting new requests
+     (503 + ``Connection: close``) so load balancers have time to notice,
+  3. waits for in-flight requests and tracked background tasks, up to
+     ``DRAIN_TIMEOUT_SECONDS``; whatever is still running is cancelled,
+  4. runs shutdown hooks (buffer flushes and the like),
+  5. hands the signal to uvicorn, which closes connections and exits.
+
+A second signal skips the wait. The same drain also runs when the server
+stops for any other reason (e.g. worker recycling), just before the
+service's own lifespan shutdown. Each drain logs — and keeps — a report of
+how much work was drained versus abandoned.
+
+``create_app`` wires all of this; services only register their work:
+
+Usage:
+    from _shared.lifecycle import lifecycle
+
+    # Fire-and-forget work that must finish before the process exits
+    lifecycle.spawn(process_webhook(event), name="webhook")
+
+    # Flush buffered state on shutdown
+    lifecycle.add_shutdown_hook(usage_buffer.flush, name="usage-buffer")
+"""
+
+from __future__ import annotations
+
+import asyncio
+import inspect
+import logging
+import os
+import signal
+import threading
+import time
+from collections.abc import Awaitable, Callable, Coroutine
+from contextlib import asynccontextmanager, nullcontext
+from dataclasses import asdict, dataclass
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# Probe paths answered even while draining — liveness must stay green, and
+# readiness reports its own 503
+PROBE_PATHS = frozenset({"/health", "/livez", "/ready", "/readyz"})
+
+DRAIN_TIMEOUT_ENV = "DRAIN_TIMEOUT_SECONDS"
+READINESS_DELAY_ENV = "DRAIN_READINESS_DELAY_SECONDS"
+HOOK_TIMEOUT_ENV = "SHUTDOWN_HOOK_TIMEOUT_SECONDS"
+
+_DRAIN_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+@dataclass
+class DrainReport:
+    requests_drained: int = 0
+    requests_abandoned: int = 0
+    tasks_drained: int = 0
+    tasks_abandoned: int = 0
+    hooks_completed: int = 0
+    hooks_failed: int = 0
+    duration_s: float = 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+class Lifecycle:
+    """
+    Process-wide lifecycle state: readiness, in-flight requests, background
+    tasks and shutdown hooks.
+    """
+
+    def __init__(self) -> None:
+        self.state = "starting"  # starting → ready → draining → stopped
+        self.rejecting = False
+        self.in_flight = 0
+        self.last_report: DrainReport | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self._hooks: list[tuple[str, Callable[[], Any]]] = []
+        self._idle: asyncio.Event | None = None
+        self._drain_task: asyncio.Task | None = None
+        self._signal_task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._previous_handlers: dict[int, Any] = {}
+
+    @property
+    def is_ready(self) -> bool:
+        return self.state == "ready"
+
+    @property
+    def is_draining(self) -> bool:
+        return self.state in ("draining", "stopped")
+
+    def mark_ready(self) -> None:
+        if self.state == "starting":
+            self.state = "ready"
+
+    def reset(self) -> None:
+        """
+        Start a new serving cycle after an earlier drain (the same app served
+        again in one process, e.g. successive ``TestClient`` blocks).
+
+        Hooks and tasks belonged to the previous cycle; its lifespan
+        registers them again.
+        """
+        self.state = "starting"
+        self.rejecting = False
+        self.in_flight = 0
+        self._tasks = set()
+        self._hooks = []
+        self._idle = None
+        self._drain_task = None
+        self._signal_task = None
+        self._loop = None
+
+    # ── Work tracking ────────────────────────────────────────────────────────
+
+    def request_started(self) -> None:
+        self.in_flight += 1
+        if self._idle is not None:
+            self._idle.clear()
+
+    def request_finished(self) -> None:
+        self.in_flight -= 1
+        if self.in_flight == 0 and self._idle is not None:
+            self._idle.set()
+
+    def track(self, task: asyncio.Task) -> asyncio.Task:
+        """Wait for ``task`` on shutdown (cancel it if the deadline passes)."""
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def spawn(self, coro: Coroutine[Any, Any, Any], name: str | None = None) -> asyncio.Task:
+        """Start a background task that shutdown will wait for."""
+        return self.track(asyncio.create_task(coro, name=name))
+
+    def add_shutdown_hook(self, hook: Callable[[], Awaitable[Any] | Any], name: str | None = None) -> None:
+        """Register a sync or async callable to run during drain, after tasks."""
+        self._hooks.append((name or getattr(hook, "__qualname__", repr(hook)), hook))
+
+    @property
+    def pending_tasks(self) -> int:
+        return len(self._tasks)
+
+    # ── Drain ────────────────────────────────────────────────────────────────
+
+    async def drain(
+        self,
+        timeout: float | None = None,
+        readiness_delay: float = 0.0,
+        hook_timeout: float | None = None,
+    ) -> DrainReport:
+        """
+        Drain in-flight requests and background tasks, then run shutdown hooks.
+
+        Concurrent calls share one drain.
+
+        Args:
+            timeout: Seconds to wait for requests and tasks
+                (default ``DRAIN_TIMEOUT_SECONDS`` or 20).
+            readiness_delay: Seconds to keep accepting requests after
+                readiness flips, so the load balancer can deregister the pod.
+            hook_timeout: Seconds each shutdown hook may take
+                (default ``SHUTDOWN_HOOK_TIMEOUT_SECONDS`` or 5).
+        """
+        if self._drain_task is None:
+            self._drain_task = asyncio.ensure_future(
+                self._drain(
+                    _env_float(DRAIN_TIMEOUT_ENV, 20.0) if timeout is None else timeout,
+                    readiness_delay,
+                    _env_float(HOOK_TIMEOUT_ENV, 5.0) if hook_timeout is None else hook_timeout,
+                )
+            )
+        return await asyncio.shield(self._drain_task)
+
+    async def _drain(self, timeout: float, readiness_delay: float, hook_timeout: float) -> DrainReport:
+        report = DrainReport()
+        started = time.perf_counter()
+        self.state = "draining"
+        tasks = set(self._tasks)
+        logger.info("Draining: readiness off, %d in-flight, %d tasks", self.in_flight, len(tasks))
+
+        if readiness_delay > 0:
+            await asyncio.sleep(readiness_delay)
+        self.rejecting = True
+        deadline = time.perf_counter() + timeout
+
+        # 1. In-flight requests — no new ones are admitted from here on
+        requests_at_start = self.in_flight
+        if self.in_flight > 0:
+            self._idle = asyncio.Event()
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except TimeoutError:
+                pass
+        report.requests_abandoned = max(self.in_flight, 0)
+        report.requests_drained = requests_at_start - report.requests_abandoned
+
+        # 2. Background tasks (including any spawned by the requests above)
+        tasks |= self._tasks
+        if tasks:
+            remaining = max(deadline - time.perf_counter(), 0.0)
+            done, pending = await asyncio.wait(tasks, timeout=remaining)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending, timeout=1.0)
+            report.tasks_drained = len(done)
+            report.tasks_abandoned = len(pending)
+
+        # 3. Shutdown hooks, in registration order
+        for name, hook in self._hooks:
+            try:
+                result = hook()
+                if inspect.isawaitable(result):
+                    await asyncio.wait_for(result, hook_timeout)
+                report.hooks_completed += 1
+            except Exception:
+                logger.exception("Shutdown hook %s failed", name)
+                report.hooks_failed += 1
+
+        report.duration_s = round(time.perf_counter() - started, 3)
+        self.state = "stopped"
+        self.last_report = report
+        logger.info("Drain complete: %s", report.to_dict())
+        return report
+
+    # ── Signals ──────────────────────────────────────────────────────────────
+
+    def install_signal_handlers(self) -> None:
+        """
+        Chain in front of the current SIGTERM / SIGINT handlers.
+
+        Call from the event loop thread after the server has installed its own
+        handlers (i.e. during lifespan startup): the server's handler then runs
+        once the drain finishes. Python only delivers signals to the main
+        thread, so off it (e.g. ``TestClient`` runs the app in a portal
+        thread) nothing is installed and drain runs on lifespan shutdown only.
+        """
+        if threading.current_thread() is not threading.main_thread():
+            logger.debug("Not on the main thread: shutdown signals not handled")
+            return
+        self._loop = asyncio.get_running_loop()
+        for sig in _DRAIN_SIGNALS:
+            previous = signal.getsignal(sig)
+            if previous == self._handle_signal:
+                continue
+            self._previous_handlers[sig] = previous
+            signal.signal(sig, self._handle_signal)
+
+    def _handle_signal(self, signum: int, frame: Any) -> None:
+        if self._drain_task is not None or self._loop is None:
+            # Second signal (or no loop): stop waiting and shut down now
+            self._forward(signum, frame)
+            return
+        self.state = "draining"
+        self._loop.call_soon_threadsafe(self._start_signal_drain, signum, frame)
+
+    def _start_signal_drain(self, signum: int, frame: Any) -> None:
+        async def drain_then_forward() -> None:
+            try:
+                await self.drain(readiness_delay=_env_float(READINESS_DELAY_ENV, 0.0))
+            finally:
+                self._forward(signum, frame)
+
+        # Held so the task is not garbage-collected mid-drain
+        self._signal_task = asyncio.ensure_future(drain_then_forward())
+
+    def _forward(self, signum: int, frame: Any) -> None:
+        previous = self._previous_handlers.get(signum)
+        if callable(previous):
+            previous(signum, frame)
+        elif previous == signal.SIG_DFL:
+            signal.signal(signum, signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+
+
+lifecycle = Lifecycle()
+
+
+class DrainMiddleware:
+    """
+    Pure ASGI middleware counting in-flight requests and rejecting new ones
+    with 503 once draining has started. Probe paths are always served.
+    """
+
+    def __init__(self, app: Any, state: Lifecycle = lifecycle) -> None:
+        self.app = app
+        self.state = state
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or scope["path"] in PROBE_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        if self.state.rejecting:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 503,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"connection", b"close"),
+                        (b"retry-after", b"1"),
+                    ],
+                }
+            )
+            await send({"type": "http.response.body", "body": b'{"detail":"Service is shutting down"}'})
+            return
+
+        self.state.request_started()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.state.request_finished()
+
+
+def wrap_lifespan(lifespan: Callable[[Any], Any] | None) -> Callable[[Any], Any]:
+    """
+    Wrap a FastAPI lifespan so readiness, signal handling and drain are managed.
+
+    Drain runs before the wrapped lifespan's shutdown, so hooks and tasks can
+    still use the clients it closes.
+    """
+
+    @asynccontextmanager
+    async def managed(app: Any):
+        if lifecycle.state != "starting":
+            lifecycle.reset()
+        lifecycle.install_signal_handlers()
+        async with lifespan(app) if lifespan is not None else nullcontext() as state:
+            lifecycle.mark_ready()
+            try:
+                yield state
+            finally:
+                await lifecycle.drain()
+
+    return managed
@@ -0,0 +1,398 @@
+"""
+Memory instrumentation for Python microservices.
+
+Provides:
+  - register_store()      — track the size of long-lived in-memory structures
+  - tracemalloc helpers   — start/stop tracing, labelled snapshots, top
+                            allocation sites and snapshot diffs
+  - rss_bytes()           — current resident set size
+  - GC pause tracking     — per-generation collection count and pause times
+  - prometheus_metrics()  — RSS / GC / store gauges in exposition format
+
+Usage:
+    from _shared.memory import register_store
+
+    posts_db: dict[str, dict] = {}
+    register_store("content.posts_db", posts_db)
+
+    # Stores that are rebuilt or swapped can register a getter instead
+    register_store("billing.ledger", lambda: ledger.entries)
+
+Inspection is served by the token-protected /debug/memory routes
+(see _shared/debug.py).
+"""
+
+from __future__ import annotations
+
+import gc
+import itertools
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any
+
+# Containers larger than this are sized from a sample and extrapolated
+SIZE_SAMPLE = 1000
+
+# Labelled snapshots kept in memory (oldest evicted first)
+MAX_SNAPSHOTS = 8
+
+# Frames excluded from snapshot statistics — allocation noise from the
+# instrumentation itself
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+# ── Store registry ────────────────────────────────────────────────────────────
+
+_stores: dict[str, Any] = {}
+
+
+def register_store(name: str, store: Any) -> None:
+    """
+    Register a long-lived structure (or a zero-arg getter returning one).
+
+    Re-registering a name replaces the previous entry.
+    """
+    _stores[name] = store
+
+
+def unregister_store(name: str) -> None:
+    _stores.pop(name, None)
+
+
+def _deep_sizeof(obj: Any, seen: set[int]) -> int:
+    """Recursive size of ``obj`` in bytes, counting shared objects once."""
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+        return size
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += _deep_sizeof(key, seen) + _deep_sizeof(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += _deep_sizeof(item, seen)
+    else:
+        if hasattr(obj, "__dict__"):
+            size += _deep_sizeof(vars(obj), seen)
+        for slot in getattr(type(obj), "__slots__", ()):
+            if hasattr(obj, slot):
+                size += _deep_sizeof(getattr(obj, slot), seen)
+    return size
+
+
+def estimate_size(obj: Any, sample: int = SIZE_SAMPLE) -> tuple[int, bool]:
+    """
+    Estimate the deep size of a container in bytes.
+
+    Containers with more than ``sample`` entries are sized from their first
+    ``sample`` entries and extrapolated, keeping the cost bounded for stores
+    with millions of rows.
+
+    Returns:
+        (bytes, estimated) — ``estimated`` is True when extrapolated.
+    """
+    if isinstance(obj, dict):
+        items: Any = obj.items()
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        items = obj
+    else:
+        return _deep_sizeof(obj, set()), False
+
+    count = len(obj)
+    if count <= sample:
+        return _deep_sizeof(obj, set()), False
+
+    seen: set[int] = {id(obj)}
+    sampled = sum(_deep_sizeof(item, seen) for item in itertools.islice(items, sample))
+    return sys.getsizeof(obj) + sampled * count // sample, True
+
+
+def store_sizes() -> dict[str, dict[str, Any]]:
+    """Entry counts and deep-size estimates for every registered store."""
+    result: dict[str, dict[str, Any]] = {}
+    for name, store in list(_stores.items()):
+        try:
+            obj = store() if callable(store) else store
+            size, estimated = estimate_size(obj)
+            result[name] = {
+                "type": type(obj).__name__,
+                "entries": len(obj) if hasattr(obj, "__len__") else None,
+                "bytes": size,
+                "estimated": estimated,
+            }
+        # A broken getter must not break the endpoint
+        except Exception as exc:  # noqa: BLE001
+            result[name] = {"error": str(exc)[:120]}
+    return result
+
+
+# ── tracemalloc snapshots ─────────────────────────────────────────────────────
+
+_snapshots: OrderedDict[str, tracemalloc.Snapshot] = OrderedDict()
+_snapshot_lock = threading.Lock()
+_snapshot_seq = itertools.count(1)
+
+
+class TracingNotStarted(RuntimeError):
+    """Raised when a snapshot is requested while tracemalloc is not tracing."""
+
+
+class SnapshotNotFound(KeyError):
+    """Raised when a snapshot label is unknown (or was evicted)."""
+
+
+def start_tracing(nframes: int = 1) -> None:
+    """Start tracemalloc. Tracing costs CPU and memory — stop it when done."""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(nframes)
+
+
+def stop_tracing() -> None:
+    """Stop tracemalloc and drop all stored snapshots."""
+    tracemalloc.stop()
+    with _snapshot_lock:
+        _snapshots.clear()
+
+
+def take_snapshot(label: str | None = None) -> str:
+    """
+    Take a tracemalloc snapshot and store it under ``label``.
+
+    Returns:
+        The snapshot label (generated as ``snap-N`` when not given).
+
+    Raises:
+        TracingNotStarted: If tracemalloc is not tracing.
+    """
+    if not tracemalloc.is_tracing():
+        raise TracingNotStarted("tracemalloc is not tracing; start it first")
+
+    snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+    label = label or f"snap-{next(_snapshot_seq)}"
+    with _snapshot_lock:
+        _snapshots.pop(label, None)
+        _snapshots[label] = snapshot
+        while len(_snapshots) > MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    return label
+
+
+def list_snapshots() -> list[str]:
+    with _snapshot_lock:
+        return list(_snapshots)
+
+
+def _get_snapshot(label: str) -> tracemalloc.Snapshot:
+    with _snapshot_lock:
+        snapshot = _snapshots.get(label)
+    if snapshot is None:
+        raise SnapshotNotFound(label)
+    return snapshot
+
+
+def _format_site(traceback: tracemalloc.Traceback) -> str:
+    frame = traceback[0]
+    return f"{frame.filename}:{frame.lineno}"
+
+
+def top_allocations(
+    label: str, limit: int = 20, key_type: str = "lineno"
+) -> list[dict[str, Any]]:
+    """Largest allocation sites in a stored snapshot."""
+    stats = _get_snapshot(label).statistics(key_type)
+    return [
+        {"site": _format_site(stat.traceback), "bytes": stat.size, "count": stat.count}
+        for stat in stats[:limit]
+    ]
+
+
+def diff_snapshots(
+    old_label: str, new_label: str, limit: int = 20, key_type: str = "lineno"
+) -> list[dict[str, Any]]:
+    """Allocation sites that grew (or shrank) most between two snapshots."""
+    stats = _get_snapshot(new_label).compare_to(_get_snapshot(old_label), key_type)
+    return [
+        {
+            "site": _format_site(stat.traceback),
+            "bytes": stat.size,
+            "bytes_diff": stat.size_diff,
+            "count": stat.count,
+            "count_diff": stat.count_diff,
+        }
+        for stat in stats[:limit]
+    ]
+
+
+def tracing_status() -> dict[str, Any]:
+    if not tracemalloc.is_tracing():
+        return {"tracing": False}
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "tracing": True,
+        "frames": tracemalloc.get_traceback_limit(),
+        "traced_bytes": current,
+        "traced_peak_bytes": peak,
+        "overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+        "snapshots": list_snapshots(),
+    }
+
+
+# ── RSS ───────────────────────────────────────────────────────────────────────
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes() -> int:
+    """Current resident set size (falls back to peak RSS off Linux)."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+# ── GC pauses ─────────────────────────────────────────────────────────────────
+
+
+@dataclass
+class GCGenerationStats:
+    collections: int = 0
+    pause_seconds_total: float = 0.0
+    pause_seconds_max: float = 0.0
+    collected: int = 0
+    uncollectable: int = 0
+
+
+class GCPauseTracker:
+    """
+    Measures stop-the-world GC pauses via ``gc.callbacks``.
+
+    Costs two perf_counter() calls per collection, so it is safe to leave
+    installed in production.
+    """
+
+    def __init__(self) -> None:
+        self.generations = [GCGenerationStats() for _ in range(3)]
+        self._started_at: float | None = None
+        self._installed = False
+
+    @property
+    def installed(self) -> bool:
+        return self._installed
+
+    def install(self) -> None:
+        if not self._installed:
+            gc.callbacks.append(self._callback)
+            self._installed = True
+
+    def uninstall(self) -> None:
+        if self._installed:
+            gc.callbacks.remove(self._callback)
+            self._installed = False
+
+    def _callback(self, phase: str, info: dict[str, int]) -> None:
+        if phase == "start":
+            self._started_at = time.perf_counter()
+            return
+        if self._started_at is None:
+            return
+        pause = time.perf_counter() - self._started_at
+        self._started_at = None
+        stats = self.generations[info.get("generation", 0)]
+        stats.collections += 1
+        stats.pause_seconds_total += pause
+        stats.pause_seconds_max = max(stats.pause_seconds_max, pause)
+        stats.collected += info.get("collected", 0)
+        stats.uncollectable += info.get("uncollectable", 0)
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        return {str(gen): asdict(stats) for gen, stats in enumerate(self.generations)}
+
+
+gc_tracker = GCPauseTracker()
+
+
+def install_gc_tracker() -> None:
+    """Start recording GC pauses (idempotent)."""
+    gc_tracker.install()
+
+
+# ── Reporting ─────────────────────────────────────────────────────────────────
+
+
+def memory_report() -> dict[str, Any]:
+    """Everything the /debug/memory endpoint returns."""
+    return {
+        "rss_bytes": rss_bytes(),
+        "gc": {
+            "tracked": gc_tracker.installed,
+            "counts": gc.get_count(),
+            "thresholds": gc.get_threshold(),
+            "generations": gc_tracker.snapshot(),
+        },
+        "tracemalloc": tracing_status(),
+        "stores": store_sizes(),
+    }
+
+
+def prometheus_metrics() -> str:
+    """RSS, GC pause and store-size gauges in Prometheus exposition format."""
+    lines = [
+        "# HELP process_resident_memory_bytes Resident memory size in bytes.",
+        "# TYPE process_resident_memory_bytes gauge",
+        f"process_resident_memory_bytes {rss_bytes()}",
+        "# HELP python_gc_collections_total Completed collections per generation.",
+        "# TYPE python_gc_collections_total counter",
+    ]
+    generations = gc_tracker.snapshot()
+    for gen, stats in generations.items():
+        lines.append(f'python_gc_collections_total{{generation="{gen}"}} {stats["collections"]}')
+    lines += [
+        "# HELP python_gc_pause_seconds_total Total time spent in GC pauses.",
+        "# TYPE python_gc_pause_seconds_total counter",
+    ]
+    for gen, stats in generations.items():
+        lines.append(
+            f'python_gc_pause_seconds_total{{generation="{gen}"}} {stats["pause_seconds_total"]:.6f}'
+        )
+    lines += [
+        "# HELP python_gc_pause_seconds_max Longest GC pause since start.",
+        "# TYPE python_gc_pause_seconds_max gauge",
+    ]
+    for gen, stats in generations.items():
+        lines.append(
+            f'python_gc_pause_seconds_max{{generation="{gen}"}} {stats["pause_seconds_max"]:.6f}'
+        )
+    sizes = store_sizes()
+    if sizes:
+        lines += [
+            "# HELP inmemory_store_entries Entries in registered in-memory stores.",
+            "# TYPE inmemory_store_entries gauge",
+        ]
+        for name, info in sizes.items():
+            if info.get("entries") is not None:
+                lines.append(f'inmemory_store_entries{{store="{name}"}} {info["entries"]}')
+        lines += [
+            "# HELP inmemory_store_bytes Estimated deep size of registered stores.",
+            "# TYPE inmemory_store_bytes gauge",
+        ]
+        for name, info in sizes.items():
+            if "bytes" in info:
+                lines.append(f'inmemory_store_bytes{{store="{name}"}} {info["bytes"]}')
+    return "\n".join(lines) + "\n"
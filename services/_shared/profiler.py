@@ -0,0 +1,223 @@
+"""
+On-demand statistical CPU profiler.
+
+Samples the Python stack of every thread (including the one running the
+asyncio event loop) at a fixed interval and aggregates the samples into
+collapsed stacks — the ``frame;frame;frame count`` format consumed by
+flamegraph.pl, speedscope and inferno.
+
+Nothing runs until a profile is requested: the sampler is a short-lived
+daemon thread, so idle overhead is zero. Only one profile may run per
+process at a time.
+
+Like any in-process sampler, the sampler thread needs the GIL to read
+stacks, so code that yields more often than the GIL switch interval (5 ms)
+is attributed to the loop's non-blocking ``select`` poll rather than to the
+short callbacks between polls. Anything hot enough to matter shows up.
+
+Usage:
+    from _shared.profiler import profile
+
+    collapsed = await profile(seconds=10)          # str, one stack per line
+    Path("cpu.folded").write_text(collapsed)
+    # flamegraph.pl cpu.folded > cpu.svg
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from types import CodeType, FrameType
+
+# Stack depth cap — protects against pathological recursion blowing up labels
+MAX_DEPTH = 128
+
+# Leaf frames that mean "this thread is parked, not burning CPU"
+_IDLE_LEAVES = frozenset(
+    {
+        ("selectors.py", "select"),  # asyncio loop waiting on I/O
+        ("threading.py", "wait"),
+        ("queue.py", "get"),
+        ("thread.py", "_worker"),  # idle ThreadPoolExecutor worker
+    }
+)
+
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    """Raised when a profile is requested while another one is running."""
+
+
+class StackSampler:
+    """
+    Samples all thread stacks via ``sys._current_frames()``.
+
+    Args:
+        interval: Seconds between samples (0.01 = 100 Hz).
+        include_idle: Keep samples whose leaf frame is a known blocking wait
+            (selector poll, Condition.wait, queue get). Off by default so the
+            output shows where CPU goes rather than where threads sleep.
+        loop_thread_id: Thread ident running the asyncio event loop; its
+            stacks are rooted under ``event-loop`` instead of the thread name.
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.01,
+        include_idle: bool = False,
+        loop_thread_id: int | None = None,
+    ) -> None:
+        self.interval = interval
+        self.include_idle = include_idle
+        self.loop_thread_id = loop_thread_id
+        self.samples = 0
+        self._labels: dict[CodeType, str] = {}
+        self._thread_names: dict[int, str] = {}
+
+    def run(self, duration: float) -> Counter[str]:
+        """Sample for ``duration`` seconds on the calling thread (blocking)."""
+        own_id = threading.get_ident()
+        counts: Counter[str] = Counter()
+        deadline = time.perf_counter() + duration
+        next_tick = time.perf_counter()
+
+        while True:
+            frames = sys._current_frames()
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                stack = self._collapse(thread_id, frame)
+                if stack is not None:
+                    counts[stack] += 1
+            del frames  # drop frame references promptly
+            self.samples += 1
+
+            # Drift-corrected sleep so the effective rate matches `interval`
+            next_tick += self.interval
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            if next_tick > now:
+                time.sleep(min(next_tick - now, deadline - now))
+            else:
+                next_tick = now
+
+        return counts
+
+    def _collapse(self, thread_id: int, frame: FrameType) -> str | None:
+        if not self.include_idle and _is_idle(frame):
+            return None
+
+        labels: list[str] = []
+        current: FrameType | None = frame
+        while current is not None and len(labels) < MAX_DEPTH:
+            labels.append(self._label(current.f_code))
+            current = current.f_back
+        labels.append(self._thread_label(thread_id))
+        labels.reverse()  # root first
+        return ";".join(labels)
+
+    def _label(self, code: CodeType) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_qualname} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _thread_label(self, thread_id: int) -> str:
+        if thread_id == self.loop_thread_id:
+            return "event-loop"
+        name = self._thread_names.get(thread_id)
+        if name is None:
+            self._thread_names = {t.ident: t.name for t in threading.enumerate() if t.ident}
+            name = self._thread_names.get(thread_id, f"thread-{thread_id}")
+        return name
+
+
+def _is_idle(frame: FrameType) -> bool:
+    code = frame.f_code
+    if (os.path.basename(code.co_filename), code.co_name) not in _IDLE_LEAVES:
+        return False
+    if code.co_name == "select":
+        # A busy event loop polls with timeout=0 between callbacks; only a
+        # blocking poll means the loop is actually idle.
+        timeout = frame.f_locals.get("timeout")
+        return timeout is None or timeout != 0
+    return True
+
+
+def _short_path(filename: str) -> str:
+    """Trim site-packages / stdlib prefixes so labels stay readable."""
+    for marker in ("site-packages/", "dist-packages/"):
+        idx = filename.rfind(marker)
+        if idx != -1:
+            return filename[idx + len(marker):]
+    for path in sorted(sys.path, key=len, reverse=True):
+        if path and filename.startswith(path + os.sep):
+            return filename[len(path) + 1:]
+    return filename
+
+
+def format_collapsed(counts: Counter[str]) -> str:
+    """Render samples as collapsed stacks, heaviest first."""
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+async def profile(
+    seconds: float,
+    interval: float = 0.01,
+    include_idle: bool = False,
+) -> str:
+    """
+    Profile all threads for ``seconds`` and return collapsed stacks.
+
+    Must be awaited from the event loop thread (any request handler); that
+    thread is labelled ``event-loop`` in the output.
+
+    Raises:
+        ProfilerBusy: If another profile is already running in this process.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running in this process")
+
+    loop = asyncio.get_running_loop()
+    done: asyncio.Future[Counter[str]] = loop.create_future()
+    sampler = StackSampler(
+        interval=interval,
+        include_idle=include_idle,
+        loop_thread_id=threading.get_ident(),
+    )
+
+    def _run() -> None:
+        try:
+            result = sampler.run(seconds)
+        # Surface sampler crashes to the caller instead of leaving it waiting
+        except BaseException as exc:  # noqa: BLE001
+            loop.call_soon_threadsafe(_set_exception, done, exc)
+        else:
+            loop.call_soon_threadsafe(_set_result, done, result)
+        finally:
+            _profile_lock.release()
+
+    try:
+        threading.Thread(target=_run, name="stack-sampler", daemon=True).start()
+    except BaseException:
+        _profile_lock.release()
+        raise
+
+    return format_collapsed(await done)
+
+
+def _set_result(future: asyncio.Future, result: Counter[str]) -> None:
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future: asyncio.Future, exc: BaseException) -> None:
+    if not future.done():
+        future.set_exception(exc)
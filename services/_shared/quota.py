@@ -0,0 +1,242 @@
+"""
+Client-side quota enforcement with billing leases.
+
+Instead of asking billing before every billable call, a service reserves a
+chunk of quota (a *lease*) per organization and usage type, spends it
+locally, and hands back whatever is left when the lease expires or the
+process shuts down. The hot path is a dict lookup and a subtraction — no
+network. Leases are topped up in the background before they run dry.
+
+Accounting: billing counts a grant as used the moment it is issued, so the
+sum of all leases never exceeds the plan limit and nothing is over-admitted.
+The price is quota parked in outstanding leases — at most ``lease_size``
+per holder per (organization, type) — which other holders cannot use until
+it is released. A holder that dies without releasing keeps its grant counted
+as used, so size leases well below plan limits.
+
+Usage:
+    from _shared.lifecycle import lifecycle
+    from _shared.quota import QuotaClient
+
+    quota = QuotaClient()  # BILLING_SERVICE_URL
+    lifecycle.add_shutdown_hook(quota.close, name="quota-leases")
+
+    # Async: waits for a lease only when none is held (first call, or limit near)
+    if not await quota.consume(org_id, "API_CALL"):
+        raise HTTPException(status_code=429, detail="Usage limit reached")
+
+    # Sync: never touches the network; False also when no lease is held yet
+    allowed = quota.try_consume(org_id, "AI_TOKEN", tokens)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+import httpx
+
+from .lifecycle import lifecycle
+
+logger = logging.getLogger(__name__)
+
+BILLING_URL_ENV = "BILLING_SERVICE_URL"
+DEFAULT_BILLING_URL = "http://billing:8005"
+LEASES_PATH = "/api/v1/usage/leases"
+
+DEFAULT_LEASE_SIZE = 500
+DEFAULT_LEASE_TTL = 30  # seconds
+# Start a background refill when less than this fraction of a lease is left
+DEFAULT_REFILL_AT = 0.2
+# Stop spending a lease this long before billing considers it expired
+EXPIRY_MARGIN = 2.0
+# After an empty grant or a billing error, wait this long before asking again
+RETRY_AFTER = 5.0
+
+
+@dataclass
+class _Lease:
+    lease_id: str
+    granted: int
+    deadline: float  # time.monotonic()
+    used: int = 0
+
+    @property
+    def remaining(self) -> int:
+        return self.granted - self.used
+
+
+@dataclass
+class _Bucket:
+    leases: deque[_Lease] = field(default_factory=deque)
+    refill: asyncio.Task | None = None
+    retry_at: float = 0.0  # no refills before this (limit reached / billing down)
+    failed: bool = False  # last refill failed (as opposed to an empty grant)
+
+
+class QuotaClient:
+    """
+    Local quota enforcement backed by billing leases.
+
+    Args:
+        base_url: Billing service URL (default ``BILLING_SERVICE_URL``).
+        lease_size: Units requested per lease.
+        lease_ttl: Seconds a lease may be spent before it is released.
+        refill_at: Refill in the background below this fraction of a lease.
+        fail_open: Admit calls when billing is unreachable and no lease is
+            held. Off by default: an outage then blocks billable calls.
+        http: Client to use instead of creating one (tests, shared pools).
+    """
+
+    def __init__(
+        self,
+        base_url: str | None = None,
+        lease_size: int = DEFAULT_LEASE_SIZE,
+        lease_ttl: int = DEFAULT_LEASE_TTL,
+        refill_at: float = DEFAULT_REFILL_AT,
+        fail_open: bool = False,
+        timeout: float = 2.0,
+        http: httpx.AsyncClient | None = None,
+    ) -> None:
+        self.lease_size = lease_size
+        self.lease_ttl = lease_ttl
+        self.refill_below = max(1, int(lease_size * refill_at))
+        self.fail_open = fail_open
+        self._owns_http = http is None
+        self._http = http or httpx.AsyncClient(
+            base_url=base_url or os.environ.get(BILLING_URL_ENV, DEFAULT_BILLING_URL),
+            timeout=timeout,
+        )
+        self._buckets: dict[tuple[str, str], _Bucket] = {}
+
+    # ── Hot path ─────────────────────────────────────────────────────────────
+
+    def try_consume(self, organization_id: str, usage_type: str, quantity: int = 1) -> bool:
+        """Spend ``quantity`` from held leases. Never waits on the network."""
+        bucket = self._bucket(organization_id, usage_type)
+        available = self._available(organization_id, usage_type, bucket)
+
+        if available < quantity:
+            self._schedule_refill(organization_id, usage_type, bucket, quantity)
+            return False
+
+        left = quantity
+        while left:
+            lease = bucket.leases[0]
+            spend = min(left, lease.remaining)
+            lease.used += spend
+            left -= spend
+            if lease.remaining == 0:
+                # Fully spent: nothing to give back, billing lets it expire
+                bucket.leases.popleft()
+
+        if available - quantity < self.refill_below:
+            self._schedule_refill(organization_id, usage_type, bucket, quantity)
+        return True
+
+    async def consume(self, organization_id: str, usage_type: str, quantity: int = 1) -> bool:
+        """
+        Spend ``quantity``, waiting for a lease if none covers it.
+
+        Returns False when the organization's limit is reached (or billing is
+        unreachable and ``fail_open`` is off).
+        """
+        if self.try_consume(organization_id, usage_type, quantity):
+            return True
+        bucket = self._bucket(organization_id, usage_type)
+        if bucket.refill is not None:
+            await asyncio.shield(bucket.refill)
+        if self.try_consume(organization_id, usage_type, quantity):
+            return True
+        return self.fail_open and bucket.failed
+
+    def available(self, organization_id: str, usage_type: str) -> int:
+        """Units spendable locally right now."""
+        return self._available(organization_id, usage_type, self._bucket(organization_id, usage_type))
+
+    # ── Leases ───────────────────────────────────────────────────────────────
+
+    def _bucket(self, organization_id: str, usage_type: str) -> _Bucket:
+        key = (organization_id, usage_type)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket()
+        return bucket
+
+    def _available(self, organization_id: str, usage_type: str, bucket: _Bucket) -> int:
+        now = time.monotonic()
+        while bucket.leases and bucket.leases[0].deadline <= now:
+            self._release_later(organization_id, bucket.leases.popleft())
+        return sum(lease.remaining for lease in bucket.leases)
+
+    def _schedule_refill(self, organization_id: str, usage_type: str, bucket: _Bucket, need: int) -> None:
+        if bucket.refill is not None or time.monotonic() < bucket.retry_at:
+            return
+        bucket.refill = asyncio.ensure_future(self._refill(organization_id, usage_type, bucket, need))
+
+    async def _refill(self, organization_id: str, usage_type: str, bucket: _Bucket, need: int) -> None:
+        try:
+            response = await self._http.post(
+                LEASES_PATH,
+                json={
+                    "organization_id": organization_id,
+                    "type": usage_type,
+                    "quantity": max(self.lease_size, need),
+                    "ttl_seconds": self.lease_ttl,
+                },
+            )
+            response.raise_for_status()
+            data = response.json()
+        except (httpx.HTTPError, ValueError) as exc:
+            logger.warning("Quota lease for %s/%s failed: %s", organization_id, usage_type, exc)
+            bucket.failed = True
+            bucket.retry_at = time.monotonic() + RETRY_AFTER
+            return
+        finally:
+            bucket.refill = None
+
+        bucket.failed = False
+        if data["granted"] <= 0:
+            # Limit reached: don't ask again on every call
+            bucket.retry_at = time.monotonic() + RETRY_AFTER
+            return
+        bucket.leases.append(
+            _Lease(
+                lease_id=data["lease_id"],
+                granted=data["granted"],
+                deadline=time.monotonic() + self.lease_ttl - EXPIRY_MARGIN,
+            )
+        )
+
+    def _release_later(self, organization_id: str, lease: _Lease) -> None:
+        lifecycle.spawn(self._release(organization_id, lease), name="quota-release")
+
+    async def _release(self, organization_id: str, lease: _Lease) -> None:
+        try:
+            response = await self._http.post(
+                f"{LEASES_PATH}/{lease.lease_id}/release",
+                json={"organization_id": organization_id, "used": lease.used},
+            )
+            response.raise_for_status()
+        except httpx.HTTPError as exc:
+            # The whole grant stays counted as used; nothing is over-admitted
+            logger.warning("Releasing quota lease %s failed: %s", lease.lease_id, exc)
+
+    async def close(self) -> None:
+        """Give back every unspent lease. Register as a shutdown hook."""
+        for bucket in self._buckets.values():
+            if bucket.refill is not None:
+                bucket.refill.cancel()
+        releases = [
+            self._release(organization_id, lease)
+            for (organization_id, _), bucket in self._buckets.items()
+            for lease in bucket.leases
+        ]
+        self._buckets.clear()
+        await asyncio.gather(*releases)
+        if self._owns_http:
+            await self._http.aclose()
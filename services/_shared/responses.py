@@ -0,0 +1,94 @@
+"""Fast JSON responses for all Python microservices.
+
+FastAPI's default ``JSONResponse`` renders with the stdlib ``json`` module.
+``FastJSONResponse`` renders with orjson when it is installed (and falls back
+to a compact stdlib encoder when it isn't), handling the types our payloads
+actually contain: datetime/date/time, UUID, Enum, Decimal, dataclasses,
+pydantic models and numpy arrays.
+
+Usage:
+    from _shared.responses import FastJSONResponse
+
+    # App-wide (create_app() does this by default)
+    app = FastAPI(default_response_class=FastJSONResponse)
+
+    # Per-route: returning the response directly also skips FastAPI's
+    # jsonable_encoder pass, which dominates for large untyped payloads.
+    @router.get("/posts")
+    async def list_posts():
+        return FastJSONResponse(await service.get_posts())
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import datetime
+import decimal
+import enum
+import json
+import uuid
+from typing import Any
+
+from starlette.responses import JSONResponse
+
+try:
+    import orjson  # type: ignore[import]
+except ImportError:  # pragma: no cover - orjson is in every service's requirements
+    orjson = None  # type: ignore[assignment]
+
+_ORJSON_OPTIONS = (
+    orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY if orjson is not None else 0
+)
+
+
+def _default(obj: Any) -> Any:
+    """
+    Fallback encoder for types neither orjson nor json handle natively.
+
+    Mirrors FastAPI's jsonable_encoder output so switching the response class
+    doesn't change any wire format.
+    """
+    # pydantic v2 models (validated response bodies, nested models in dicts)
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, decimal.Decimal):
+        # Same rule as jsonable_encoder: integral decimals stay ints
+        return int(obj) if obj.as_tuple().exponent >= 0 else float(obj)  # type: ignore[operator]
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, bytes):
+        return obj.decode()
+    if isinstance(obj, datetime.timedelta):
+        return obj.total_seconds()
+    # Types orjson serializes natively — only reached on the stdlib fallback
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, enum.Enum):
+        return obj.value
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if hasattr(obj, "tolist"):  # numpy arrays / scalars
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize ``content`` to compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+    return json.dumps(
+        content,
+        default=_default,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson (stdlib fallback)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,63 @@
+"""
+Request coalescing ("single flight") for expensive async loads.
+
+When many coroutines miss a cache for the same key at once, only the first
+one runs the load; the rest await its result instead of repeating the call.
+That turns a burst of N identical misses into one call to the slow,
+rate-limited or expensive thing behind the cache.
+
+The load runs in its own task, so a caller that is cancelled (a client
+disconnect) does not cancel it for everyone else. Exceptions are shared
+with every waiter and nothing is cached: the next call after a finished
+flight starts a new one.
+
+Usage:
+    from _shared.singleflight import SingleFlight
+
+    _lookups = SingleFlight()
+
+    async def get_customer(org_id: str) -> dict | None:
+        if (hit := cache.get(org_id)) is not None:
+            return hit
+        return await _lookups.do(org_id, lambda: search_customer(org_id))
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one in-flight load."""
+
+    def __init__(self) -> None:
+        self._flights: dict[Hashable, asyncio.Task[Any]] = {}
+        self.started = 0  # loads actually run
+        self.coalesced = 0  # calls that joined a load already in flight
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Return `await fn()`, sharing one call among concurrent callers of `key`."""
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._flights[key] = task
+            task.add_done_callback(lambda _: self._forget(key, task))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task[Any]) -> None:
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        # Retrieve the exception, so a load whose callers all left is not
+        # reported as "never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._flights)
@@ -0,0 +1,266 @@
+"""
+Import-time and cold-start measurement for Python microservices.
+
+Provides:
+  - import_profile()      — per-module import cost of a service entry point,
+                            parsed from ``python -X importtime``
+  - measure_cold_start()  — wall time from interpreter launch to the first
+                            successful response, in a fresh process
+
+Both run the service in a subprocess so results are not skewed by modules
+already imported by the caller.
+
+Usage (from services/):
+    python -m _shared.startup ai billing           # report per service
+    python -m _shared.startup ai --top 40 --path /health
+
+    # In a test
+    from _shared.startup import measure_cold_start
+    result = measure_cold_start(SERVICE_DIR, path="/health")
+    assert result.first_response_s < 2.0
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+SERVICES_ROOT = Path(__file__).resolve().parent.parent
+
+# Runs inside the child process: import the app, optionally run its lifespan
+# startup, then serve one request through the ASGI interface (no sockets).
+_COLD_START_SCRIPT = """
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+module_name, attr = sys.argv[1].split(":")
+app = getattr(__import__(module_name, fromlist=[attr]), attr)
+t_import = time.perf_counter()
+
+import httpx
+
+async def first_response():
+    async def request():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://cold") as c:
+            return await c.get(sys.argv[2])
+    if sys.argv[3] == "1":
+        async with app.router.lifespan_context(app):
+            return await request()
+    return await request()
+
+response = asyncio.run(first_response())
+t_response = time.perf_counter()
+print(json.dumps({
+    "import_s": t_import - t0,
+    "first_response_s": t_response - t0,
+    "status_code": response.status_code,
+    "loaded": [m for m in json.loads(sys.argv[4]) if m in sys.modules],
+}))
+"""
+
+
+# ── Import-time profile ───────────────────────────────────────────────────────
+
+
+@dataclass
+class ImportEntry:
+    """One line of ``-X importtime`` output."""
+
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+@dataclass
+class ImportProfile:
+    service: str
+    total_us: int
+    entries: list[ImportEntry] = field(default_factory=list)
+
+    def top(self, limit: int = 20, max_depth: int = 1) -> list[ImportEntry]:
+        """
+        Most expensive imports by cumulative time.
+
+        ``max_depth=1`` lists the entry point's direct imports — the ones a
+        lazy import would remove — without double counting their children.
+        """
+        entries = [e for e in self.entries if e.depth <= max_depth]
+        return sorted(entries, key=lambda e: e.cumulative_us, reverse=True)[:limit]
+
+    def slowest_self(self, limit: int = 20) -> list[ImportEntry]:
+        """Modules whose own top-level code is slowest, at any depth."""
+        return sorted(self.entries, key=lambda e: e.self_us, reverse=True)[:limit]
+
+
+def _child_env(service_dir: Path) -> dict[str, str]:
+    env = dict(os.environ)
+    # Service code imports its own packages (app, services, utils) and _shared
+    paths = [str(service_dir), str(SERVICES_ROOT)]
+    if env.get("PYTHONPATH"):
+        paths.append(env["PYTHONPATH"])
+    env["PYTHONPATH"] = os.pathsep.join(paths)
+    # Keep telemetry exporters from dialing out during measurement
+    env.pop("OTEL_EXPORTER_OTLP_ENDPOINT", None)
+    return env
+
+
+def parse_importtime(stderr: str) -> list[ImportEntry]:
+    """Parse ``import time: self [us] | cumulative | imported package`` lines."""
+    entries: list[ImportEntry] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # header line
+        name = parts[2].rstrip()
+        stripped = name.lstrip()
+        entries.append(
+            ImportEntry(
+                module=stripped,
+                self_us=int(parts[0]),
+                cumulative_us=int(parts[1]),
+                depth=(len(name) - len(stripped) - 1) // 2,
+            )
+        )
+    return entries
+
+
+def import_profile(
+    service_dir: str | Path, module: str = "app.main", timeout: float = 60.0
+) -> ImportProfile:
+    """
+    Profile the import of ``module`` in a fresh interpreter.
+
+    Raises:
+        RuntimeError: If the import fails.
+    """
+    service_dir = Path(service_dir).resolve()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=service_dir,
+        env=_child_env(service_dir),
+        capture_output=True,
+        text=True,
+        timeout=timeout,
+        check=False,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed in {service_dir.name}:\n{proc.stderr[-2000:]}")
+
+    entries = parse_importtime(proc.stderr)
+    # Interpreter startup (site, encodings) is listed too; only count the module
+    total = max(
+        (e.cumulative_us for e in entries if e.depth == 0 and module.startswith(e.module)),
+        default=0,
+    )
+    return ImportProfile(service=service_dir.name, total_us=total, entries=entries)
+
+
+# ── Cold start ────────────────────────────────────────────────────────────────
+
+
+@dataclass
+class ColdStart:
+    """Timings from interpreter launch, in seconds."""
+
+    process_s: float  # spawn → child exit, measured by the parent
+    import_s: float  # app module import, measured in the child
+    first_response_s: float  # app import start → first response received
+    status_code: int
+    loaded: list[str]  # subset of ``watch_modules`` imported by then
+
+
+def measure_cold_start(
+    service_dir: str | Path,
+    app: str = "app.main:app",
+    path: str = "/health",
+    run_lifespan: bool = False,
+    watch_modules: list[str] | None = None,
+    timeout: float = 60.0,
+) -> ColdStart:
+    """
+    Start the service in a fresh interpreter and time its first response.
+
+    Args:
+        service_dir: Service directory (e.g. services/ai).
+        app: ``module:attribute`` of the ASGI app.
+        path: Path requested once the app is imported.
+        run_lifespan: Run the app's lifespan startup before the request.
+            Off by default — lifespans usually connect to real backends.
+        watch_modules: Module names to report as loaded or not, e.g. to
+            assert that a heavy SDK stays off the startup path.
+
+    Raises:
+        RuntimeError: If the child process fails.
+    """
+    service_dir = Path(service_dir).resolve()
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            _COLD_START_SCRIPT,
+            app,
+            path,
+            "1" if run_lifespan else "0",
+            json.dumps(watch_modules or []),
+        ],
+        cwd=service_dir,
+        env=_child_env(service_dir),
+        capture_output=True,
+        text=True,
+        timeout=timeout,
+        check=False,
+    )
+    elapsed = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(f"cold start of {service_dir.name} failed:\n{proc.stderr[-2000:]}")
+
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    return ColdStart(process_s=elapsed, **result)
+
+
+# ── CLI ───────────────────────────────────────────────────────────────────────
+
+
+def _print_report(service: str, top: int, path: str) -> None:
+    service_dir = SERVICES_ROOT / service
+    profile = import_profile(service_dir)
+    print(f"\n== {service}: import app.main {profile.total_us / 1000:.0f} ms ==")
+    print(f"{'module':<50} {'self ms':>9} {'cumul ms':>9}")
+    for entry in profile.top(top):
+        print(f"{entry.module:<50} {entry.self_us / 1000:>9.1f} {entry.cumulative_us / 1000:>9.1f}")
+
+    try:
+        cold = measure_cold_start(service_dir, path=path)
+    except RuntimeError as exc:
+        print(f"cold start: failed ({str(exc).splitlines()[0]})")
+        return
+    print(
+        f"cold start: process {cold.process_s * 1000:.0f} ms, "
+        f"import {cold.import_s * 1000:.0f} ms, "
+        f"first response {cold.first_response_s * 1000:.0f} ms (GET {path} → {cold.status_code})"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("services", nargs="+", help="Service directory names, e.g. ai billing")
+    parser.add_argument("--top", type=int, default=20, help="Top-level imports to list")
+    parser.add_argument("--path", default="/health", help="Path for the first request")
+    args = parser.parse_args()
+
+    for service in args.services:
+        _print_report(service, args.top, args.path)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,4 @@
-import os
-
-from openai import AsyncOpenAI
-
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from utils.openai_client import get_openai_client
 
 
 async def create_embedding(
@@ -11,7 +7,7 @@ async def create_embedding(
 ) -> dict:
     """Create text embedding using OpenAI API"""
 
-    response = await client.embeddings.create(
+    response = await get_openai_client().embeddings.create(
         model=model,
         input=text,
     )
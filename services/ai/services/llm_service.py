@@ -1,8 +1,4 @@
-import os
-
-from openai import AsyncOpenAI
-
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from utils.openai_client import get_openai_client
 
 
 async def generate_text(
@@ -13,7 +9,7 @@ async def generate_text(
 ) -> dict:
     """Generate text using OpenAI API"""
 
-    response = await client.chat.completions.create(
+    response = await get_openai_client().chat.completions.create(
         model=model,
         messages=[{"role": "user", "content": prompt}],
         max_tokens=max_tokens,
@@ -1,8 +1,4 @@
-import os
-
-from openai import AsyncOpenAI
-
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from utils.openai_client import get_openai_client
 
 LANGUAGE_NAMES = {
     "en": "English",
@@ -31,7 +27,7 @@ Only output the translation, nothing else.
 Text to translate:
 {text}"""
 
-    response = await client.chat.completions.create(
+    response = await get_openai_client().chat.completions.create(
         model="gpt-5.2",
         messages=[{"role": "user", "content": prompt}],
         temperature=0.3,
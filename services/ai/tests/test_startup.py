@@ -0,0 +1,34 @@
+"""Cold-start budget for the ai-service.
+
+Starts the service in a fresh interpreter and fails if the time from app
+import to the first /health response regresses past the budget. Heavy SDKs
+must stay off the startup path — they are built on first use.
+"""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+from _shared.startup import measure_cold_start
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+
+# Generous for CI runners; override locally to tighten
+STARTUP_BUDGET_SECONDS = float(os.getenv("AI_STARTUP_BUDGET_SECONDS", "3.0"))
+
+
+def test_first_response_within_budget():
+    result = measure_cold_start(SERVICE_DIR, path="/health")
+
+    assert result.status_code == 200
+    assert result.first_response_s < STARTUP_BUDGET_SECONDS, (
+        f"cold start took {result.first_response_s:.2f}s "
+        f"(import {result.import_s:.2f}s), budget {STARTUP_BUDGET_SECONDS:.2f}s"
+    )
+
+
+def test_openai_sdk_not_imported_at_startup():
+    result = measure_cold_start(SERVICE_DIR, path="/health", watch_modules=["openai"])
+
+    assert result.loaded == []
@@ -0,0 +1,32 @@
+"""
+OpenAI Client
+
+Shared AsyncOpenAI client, built on first use.
+
+Constructing the client imports the openai SDK and its httpx transport, so
+doing it lazily keeps it off the service's import path. One client is shared
+by the generate, embed and translate services so they reuse one connection
+pool.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+_client: AsyncOpenAI | None = None
+
+
+def get_openai_client() -> AsyncOpenAI:
+    """Get the shared AsyncOpenAI client singleton"""
+    global _client
+
+    if _client is None:
+        from openai import AsyncOpenAI
+
+        _client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+    return _client
@@ -1,6 +1,7 @@
 # API v1 module
 from . import (
     routes_billing,
+    routes_config,
     routes_credits,
     routes_subscriptions,
     routes_usage,
@@ -9,6 +10,7 @@ from . import (
 
 __all__ = [
     "routes_billing",
+    "routes_config",
     "routes_credits",
     "routes_subscriptions",
     "routes_usage",
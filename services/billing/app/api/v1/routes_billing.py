@@ -4,9 +4,11 @@ Billing Routes
 Customer management, checkout sessions, and billing portal.
 """
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel, EmailStr
 
+from _shared.etag import cached_json_response, content_hash
+from _shared.responses import dumps
 from services.stripe_service import StripeService
 
 router = APIRouter()
@@ -52,6 +54,57 @@ class GetPricingResponse(BaseModel):
     plans: list[dict]
 
 
+PRICING_PLANS: list[dict] = [
+    {
+        "id": "FREE",
+        "name": "Free",
+        "description": "Get started with basic features",
+        "price_monthly": 0,
+        "price_yearly": 0,
+        "features": [
+            "1,000 AI tokens/month",
+            "100 API calls/day",
+            "Basic support",
+            "1 team member",
+        ],
+    },
+    {
+        "id": "PRO",
+        "name": "Pro",
+        "description": "For growing teams and businesses",
+        "price_monthly": 29,
+        "price_yearly": 279,
+        "features": [
+            "100,000 AI tokens/month",
+            "10,000 API calls/day",
+            "Priority support",
+            "10 team members",
+            "Advanced analytics",
+            "Custom integrations",
+        ],
+    },
+    {
+        "id": "ENTERPRISE",
+        "name": "Enterprise",
+        "description": "For large organizations",
+        "price_monthly": None,  # Custom pricing
+        "price_yearly": None,
+        "features": [
+            "Unlimited AI tokens",
+            "Unlimited API calls",
+            "24/7 dedicated support",
+            "Unlimited team members",
+            "Custom SLA",
+            "On-premise deployment",
+            "White-label options",
+        ],
+    },
+]
+
+# Plans are static per deploy, so their content hash is the ETag version
+PRICING_VERSION = content_hash(dumps({"plans": PRICING_PLANS}))
+
+
 # Dependencies
 def get_stripe_service() -> StripeService:
     return StripeService()
@@ -136,52 +189,11 @@ async def create_billing_portal(
 
 
 @router.get("/pricing", response_model=GetPricingResponse)
-async def get_pricing():
-    """Get available pricing plans"""
-    plans = [
-        {
-            "id": "FREE",
-            "name": "Free",
-            "description": "Get started with basic features",
-            "price_monthly": 0,
-            "price_yearly": 0,
-            "features": [
-                "1,000 AI tokens/month",
-                "100 API calls/day",
-                "Basic support",
-                "1 team member",
-            ],
-        },
-        {
-            "id": "PRO",
-            "name": "Pro",
-            "description": "For growing teams and businesses",
-            "price_monthly": 29,
-            "price_yearly": 279,
-            "features": [
-                "100,000 AI tokens/month",
-                "10,000 API calls/day",
-                "Priority support",
-                "10 team members",
-                "Advanced analytics",
-                "Custom integrations",
-            ],
-        },
-        {
-            "id": "ENTERPRISE",
-            "name": "Enterprise",
-            "description": "For large organizations",
-            "price_monthly": None,  # Custom pricing
-            "price_yearly": None,
-            "features": [
-                "Unlimited AI tokens",
-                "Unlimited API calls",
-                "24/7 dedicated support",
-                "Unlimited team members",
-                "Custom SLA",
-                "On-premise deployment",
-                "White-label options",
-            ],
-        },
-    ]
-    return GetPricingResponse(plans=plans)
+async def get_pricing(request: Request):
+    """Get available pricing plans (conditional: 304 on matching If-None-Match)"""
+    return await cached_json_response(
+        request,
+        key="billing:pricing",
+        version=PRICING_VERSION,
+        build=lambda: GetPricingResponse(plans=PRICING_PLANS),
+    )
@@ -0,0 +1,77 @@
+"""
+Config Routes
+
+Resolved plan configuration (plan, features, limits, overrides).
+"""
+
+from dataclasses import asdict
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import BaseModel, Field
+
+from _shared.etag import cached_json_response
+from services.plan_config_service import PlanConfigService, get_plan_config_service
+
+router = APIRouter()
+
+# Upper bound on organizations per /batch call
+MAX_BATCH_ORGANIZATIONS = 5_000
+
+
+# Request/Response Models
+class BatchConfigRequest(BaseModel):
+    organization_ids: list[str] = Field(
+        min_length=1, max_length=MAX_BATCH_ORGANIZATIONS
+    )
+
+
+class BatchConfigResponse(BaseModel):
+    configs: dict[str, dict]  # organization → resolved config
+
+
+# Routes
+@router.get("/{organization_id}")
+async def get_config(
+    organization_id: str,
+    request: Request,
+    service: PlanConfigService = Depends(get_plan_config_service),
+):
+    """
+    Get an organization's resolved plan configuration.
+
+    Conditional: 304 on a matching If-None-Match. The ETag follows the
+    cache generation, so it changes whenever the config may have.
+    """
+
+    async def build() -> dict:
+        return asdict(await service.get_config(organization_id))
+
+    try:
+        return await cached_json_response(
+            request,
+            key=f"billing:config:{organization_id}",
+            version=await service.config_version(),
+            build=build,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
+@router.post("/batch", response_model=BatchConfigResponse)
+async def get_configs(
+    request: BatchConfigRequest,
+    service: PlanConfigService = Depends(get_plan_config_service),
+):
+    """
+    Resolve the configuration of many organizations at once.
+
+    For batch jobs (metering, digests, overage runs); costs about the same
+    number of cache and database round trips as a single organization.
+    """
+    try:
+        configs = await service.get_configs(request.organization_ids)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    return BatchConfigResponse(
+        configs={org: asdict(config) for org, config in configs.items()}
+    )
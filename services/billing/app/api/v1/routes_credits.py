@@ -7,13 +7,15 @@ Credit balance, transactions, and purchases.
 from datetime import datetime
 from enum import StrEnum
 
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel, Field
 
-from services.credits_service import CreditsService
+from services.credits_service import RESERVATION_DEFAULT_TTL, CreditsService
 
 router = APIRouter()
 
+MAX_TRANSACTIONS_PAGE = 500
+
 
 # Enums
 class CreditTransactionType(StrEnum):
@@ -29,10 +31,18 @@ class CreditTransactionType(StrEnum):
 class GetBalanceResponse(BaseModel):
     organization_id: str
     balance: int
+    held: int = 0  # set aside by open reservations
+    available: int
     dollar_value: float
     last_updated: datetime
 
 
+class BalanceAtResponse(BaseModel):
+    organization_id: str
+    at: datetime
+    balance: int
+
+
 class PurchaseCreditsRequest(BaseModel):
     organization_id: str
     amount_dollars: float
@@ -75,6 +85,34 @@ class GetTransactionsResponse(BaseModel):
     organization_id: str
     transactions: list[CreditTransaction]
     total_count: int
+    next_cursor: str | None = None  # pass as `cursor` for the next page
+
+
+class ReserveCreditsRequest(BaseModel):
+    organization_id: str
+    credits: int = Field(gt=0)  # estimated cost
+    reason: str
+    ttl_seconds: int = RESERVATION_DEFAULT_TTL
+    metadata: dict | None = None
+
+
+class ReservationResponse(BaseModel):
+    reservation_id: str
+    organization_id: str
+    credits: int
+    expires_at: datetime
+    available: int
+
+
+class SettleReservationRequest(BaseModel):
+    organization_id: str
+    credits: int = Field(ge=0)  # actual cost
+    reason: str | None = None
+    metadata: dict | None = None
+
+
+class ReleaseReservationRequest(BaseModel):
+    organization_id: str
 
 
 class RefundCreditsRequest(BaseModel):
@@ -93,7 +131,7 @@ class AddBonusRequest(BaseModel):
 
 # Dependencies
 def get_credits_service() -> CreditsService:
-    return CreditsService()
+    return CreditsService.get_instance()
 
 
 # Routes
@@ -110,6 +148,19 @@ async def get_credit_balance(
         raise HTTPException(status_code=400, detail=str(e)) from e
 
 
+@router.get("/{organization_id}/balance/at", response_model=BalanceAtResponse)
+async def get_credit_balance_at(
+    organization_id: str,
+    timestamp: datetime,
+    service: CreditsService = Depends(get_credits_service),
+):
+    """Get the balance an organization had at a past moment"""
+    try:
+        return await service.get_balance_at(organization_id, timestamp)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
 @router.post("/purchase", response_model=PurchaseCreditsResponse)
 async def purchase_credits(
     request: PurchaseCreditsRequest,
@@ -145,21 +196,78 @@ async def deduct_credits(
         raise HTTPException(status_code=400, detail=str(e)) from e
 
 
+@router.post("/reservations", response_model=ReservationResponse)
+async def reserve_credits(
+    request: ReserveCreditsRequest,
+    service: CreditsService = Depends(get_credits_service),
+):
+    """Hold credits for work whose cost is known only afterwards"""
+    try:
+        return await service.reserve_credits(
+            organization_id=request.organization_id,
+            credits=request.credits,
+            reason=request.reason,
+            ttl_seconds=request.ttl_seconds,
+            metadata=request.metadata,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
+@router.post(
+    "/reservations/{reservation_id}/settle", response_model=DeductCreditsResponse
+)
+async def settle_reservation(
+    reservation_id: str,
+    request: SettleReservationRequest,
+    service: CreditsService = Depends(get_credits_service),
+):
+    """Charge the actual cost of reserved work and release the hold"""
+    try:
+        return await service.settle_reservation(
+            organization_id=request.organization_id,
+            reservation_id=reservation_id,
+            credits=request.credits,
+            reason=request.reason,
+            metadata=request.metadata,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
+@router.post(
+    "/reservations/{reservation_id}/release", response_model=ReservationResponse
+)
+async def release_reservation(
+    reservation_id: str,
+    request: ReleaseReservationRequest,
+    service: CreditsService = Depends(get_credits_service),
+):
+    """Cancel a reservation without charging"""
+    try:
+        return await service.release_reservation(
+            organization_id=request.organization_id,
+            reservation_id=reservation_id,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
 @router.get("/{organization_id}/transactions", response_model=GetTransactionsResponse)
 async def get_credit_transactions(
     organization_id: str,
     type: CreditTransactionType | None = None,
-    limit: int = 50,
-    offset: int = 0,
+    limit: int = Query(50, ge=1, le=MAX_TRANSACTIONS_PAGE),
+    cursor: str | None = None,
     service: CreditsService = Depends(get_credits_service),
 ):
-    """Get credit transaction history"""
+    """Get credit transaction history, newest first"""
     try:
         result = await service.get_transactions(
             organization_id=organization_id,
             transaction_type=type,
             limit=limit,
-            offset=offset,
+            cursor=cursor,
         )
         return result
     except Exception as e:
@@ -216,7 +324,8 @@ async def check_credits(
             "has_enough": has_enough,
             "requested": credits,
             "balance": balance["balance"],
-            "remaining_after": balance["balance"] - credits if has_enough else 0,
+            "available": balance["available"],
+            "remaining_after": balance["available"] - credits if has_enough else 0,
         }
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e)) from e
@@ -8,12 +8,17 @@ from datetime import datetime
 from enum import StrEnum
 
 from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
-from services.usage_service import UsageService
+from services.usage_service import LEASE_DEFAULT_TTL, UsageService
 
 router = APIRouter()
 
+# Upper bound on items per /record-batch call
+MAX_BATCH_ITEMS = 10_000
+# Upper bound on organizations per /period-close call
+MAX_PERIOD_CLOSE_ORGANIZATIONS = 200_000
+
 
 # Enums
 class UsageType(StrEnum):
@@ -31,6 +36,8 @@ class RecordUsageRequest(BaseModel):
     quantity: int
     resource: str | None = None
     metadata: dict | None = None
+    # Reject (success=False, nothing recorded) if this would exceed the limit
+    enforce_limit: bool = False
 
 
 class RecordUsageResponse(BaseModel):
@@ -41,6 +48,64 @@ class RecordUsageResponse(BaseModel):
     remaining: int
 
 
+class UsageItem(BaseModel):
+    organization_id: str
+    type: UsageType
+    quantity: int = Field(gt=0)
+
+
+class RecordUsageBatchRequest(BaseModel):
+    items: list[UsageItem] = Field(min_length=1, max_length=MAX_BATCH_ITEMS)
+    # Admit items in order per counter; reject those that would exceed the limit
+    enforce_limit: bool = False
+
+
+class UsageItemResult(BaseModel):
+    organization_id: str
+    type: UsageType
+    success: bool
+    current_usage: int
+    limit: int
+    remaining: int
+
+
+class RecordUsageBatchResponse(BaseModel):
+    results: list[UsageItemResult]  # same order as the request items
+    recorded: int
+    rejected: int
+
+
+class AcquireLeaseRequest(BaseModel):
+    organization_id: str
+    type: UsageType
+    quantity: int = Field(gt=0)
+    ttl_seconds: int = LEASE_DEFAULT_TTL
+
+
+class LeaseResponse(BaseModel):
+    lease_id: str | None  # None when nothing was granted
+    organization_id: str
+    type: UsageType
+    granted: int
+    expires_at: datetime
+    current_usage: int
+    limit: int
+    remaining: int
+
+
+class ReleaseLeaseRequest(BaseModel):
+    organization_id: str
+    used: int = Field(ge=0)
+
+
+class ReleaseLeaseResponse(BaseModel):
+    lease_id: str
+    granted: int
+    used: int
+    returned: int
+    current_usage: int
+
+
 class GetUsageRequest(BaseModel):
     organization_id: str
     type: UsageType | None = None
@@ -65,6 +130,28 @@ class GetUsageResponse(BaseModel):
     total_cost: float
 
 
+class SeriesGranularity(StrEnum):
+    AUTO = "auto"
+    MINUTE = "minute"
+    HOUR = "hour"
+    DAY = "day"
+
+
+class UsagePoint(BaseModel):
+    timestamp: datetime
+    value: int
+
+
+class UsageSeriesResponse(BaseModel):
+    organization_id: str
+    type: UsageType
+    granularity: SeriesGranularity
+    start: datetime
+    end: datetime
+    points: list[UsagePoint]
+    total: int
+
+
 class CheckLimitRequest(BaseModel):
     organization_id: str
     type: UsageType
@@ -79,9 +166,34 @@ class CheckLimitResponse(BaseModel):
     would_exceed: bool
 
 
+class PeriodCloseRequest(BaseModel):
+    period: str = Field(pattern=r"^\d{4}-(0[1-9]|1[0-2])$")  # YYYY-MM
+    organization_ids: list[str] = Field(
+        min_length=1, max_length=MAX_PERIOD_CLOSE_ORGANIZATIONS
+    )
+    # Plan per organization; missing organizations are looked up
+    plans: dict[str, str] | None = None
+
+
+class InvoiceLineItem(BaseModel):
+    organization_id: str
+    type: UsageType
+    quantity: int
+    unit_price: float
+    amount: float
+    amount_cents: int
+
+
+class PeriodCloseResponse(BaseModel):
+    period: str
+    organizations: int
+    line_items: list[InvoiceLineItem]
+    total_amount: float
+
+
 # Dependencies
 def get_usage_service() -> UsageService:
-    return UsageService()
+    return UsageService.get_instance()
 
 
 # Routes
@@ -98,12 +210,101 @@ async def record_usage(
             quantity=request.quantity,
             resource=request.resource,
             metadata=request.metadata,
+            enforce_limit=request.enforce_limit,
         )
         return result
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e)) from e
 
 
+@router.post("/record-batch", response_model=RecordUsageBatchResponse)
+async def record_usage_batch(
+    request: RecordUsageBatchRequest,
+    service: UsageService = Depends(get_usage_service),
+):
+    """Record many usage events in one call, aggregated per counter"""
+    try:
+        results = await service.record_usage_batch(
+            [
+                (item.organization_id, item.type, item.quantity)
+                for item in request.items
+            ],
+            enforce_limit=request.enforce_limit,
+        )
+        recorded = sum(1 for r in results if r["success"])
+        return {
+            "results": results,
+            "recorded": recorded,
+            "rejected": len(results) - recorded,
+        }
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
+@router.post("/period-close", response_model=PeriodCloseResponse)
+async def close_period(
+    request: PeriodCloseRequest,
+    service: UsageService = Depends(get_usage_service),
+):
+    """Overage invoice line items for many organizations for a closed period"""
+    try:
+        result = await service.close_period(
+            request.organization_ids, request.period, request.plans
+        )
+        return {
+            "period": result.period,
+            "organizations": len(result.organization_ids),
+            "line_items": [
+                {
+                    "organization_id": line.organization_id,
+                    "type": line.usage_type,
+                    "quantity": line.quantity,
+                    "unit_price": line.unit_price,
+                    "amount": line.amount,
+                    "amount_cents": line.amount_cents,
+                }
+                for line in result.line_items()
+            ],
+            "total_amount": result.total_amount,
+        }
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
+@router.post("/leases", response_model=LeaseResponse)
+async def acquire_lease(
+    request: AcquireLeaseRequest,
+    service: UsageService = Depends(get_usage_service),
+):
+    """Reserve a chunk of quota to spend locally (see _shared/quota.py)"""
+    try:
+        return await service.acquire_lease(
+            organization_id=request.organization_id,
+            usage_type=request.type,
+            quantity=request.quantity,
+            ttl_seconds=request.ttl_seconds,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
+@router.post("/leases/{lease_id}/release", response_model=ReleaseLeaseResponse)
+async def release_lease(
+    lease_id: str,
+    request: ReleaseLeaseRequest,
+    service: UsageService = Depends(get_usage_service),
+):
+    """Report usage against a lease and return the unused remainder"""
+    try:
+        return await service.release_lease(
+            organization_id=request.organization_id,
+            lease_id=lease_id,
+            used=request.used,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
 @router.get("/{organization_id}", response_model=GetUsageResponse)
 async def get_usage(
     organization_id: str,
@@ -125,6 +326,28 @@ async def get_usage(
         raise HTTPException(status_code=400, detail=str(e)) from e
 
 
+@router.get("/{organization_id}/series", response_model=UsageSeriesResponse)
+async def get_usage_series(
+    organization_id: str,
+    type: UsageType,
+    start_date: datetime,
+    end_date: datetime | None = None,
+    granularity: SeriesGranularity = SeriesGranularity.AUTO,
+    service: UsageService = Depends(get_usage_service),
+):
+    """Usage over time for charts (minute/hour/day buckets)"""
+    try:
+        return await service.get_series(
+            organization_id=organization_id,
+            usage_type=type,
+            start_date=start_date,
+            end_date=end_date,
+            granularity=granularity,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
 @router.post("/check-limit", response_model=CheckLimitResponse)
 async def check_usage_limit(
     request: CheckLimitRequest,
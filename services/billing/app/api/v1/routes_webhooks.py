@@ -2,13 +2,22 @@
 Webhook Routes
 
 Stripe webhook handling.
+
+Events are acknowledged once their signature is verified and queued;
+workers handle them in the background (see services/webhook_queue.py).
 """
 
-import stripe
-from fastapi import APIRouter, Header, HTTPException, Request
+import json
+
+import structlog
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.responses import PlainTextResponse
 
 from app.config import settings
-from services.webhook_service import WebhookService
+from services.webhook_queue import WebhookWorkers, get_webhook_workers
+from utils.stripe_client import get_stripe, stripe_call
+
+logger = structlog.get_logger()
 
 router = APIRouter()
 
@@ -17,11 +26,13 @@ router = APIRouter()
 async def stripe_webhook(
     request: Request,
     stripe_signature: str | None = Header(None, alias="Stripe-Signature"),
+    workers: WebhookWorkers = Depends(get_webhook_workers),
 ):
-    """Handle Stripe webhook events"""
+    """Verify and queue a Stripe webhook event"""
     if not stripe_signature:
         raise HTTPException(status_code=400, detail="Missing Stripe signature")
     payload = await request.body()
+    stripe = get_stripe()
 
     try:
         # Verify webhook signature
@@ -34,17 +45,23 @@ async def stripe_webhook(
         raise HTTPException(status_code=400, detail="Invalid payload") from None
     except stripe.SignatureVerificationError:
         raise HTTPException(status_code=400, detail="Invalid signature") from None
-    # Process the event
-    webhook_service = WebhookService()
 
+    # Queue the verified payload itself; the event object is not plain JSON
     try:
-        result = await webhook_service.handle_event(event)
-        return {"received": True, "type": event["type"], "result": result}
+        queued = await workers.submit(json.loads(payload))
     except Exception as e:
-        # Log the error but return 200 to acknowledge receipt
-        # Stripe will retry if we return an error
-        print(f"Error processing webhook: {e}")
-        return {"received": True, "type": event["type"], "error": str(e)}
+        # Not queued: a non-2xx makes Stripe deliver it again
+        logger.error("webhook_enqueue_failed", event_id=event["id"], error=str(e))
+        raise HTTPException(status_code=503, detail="Event not queued") from e
+    return {"received": True, "type": event["type"], "duplicate": not queued}
+
+
+@router.get("/stripe/metrics", response_class=PlainTextResponse)
+async def webhook_metrics(
+    workers: WebhookWorkers = Depends(get_webhook_workers),
+) -> PlainTextResponse:
+    """Webhook queue lag and handler latency, Prometheus text format"""
+    return PlainTextResponse(await workers.prometheus_metrics())
 
 
 @router.get("/stripe/events")
@@ -54,8 +71,9 @@ async def list_webhook_events(
 ):
     """List recent webhook events (for debugging)"""
     try:
-        stripe.api_key = settings.STRIPE_SECRET_KEY
-        events = stripe.Event.list(
+        stripe = get_stripe()
+        events = await stripe_call(
+            stripe.Event.list,
             limit=limit,
             starting_after=starting_after,
         )
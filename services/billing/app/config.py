@@ -25,6 +25,16 @@ class Settings(BaseSettings):
     UPSTASH_REDIS_REST_URL: str = ""
     UPSTASH_REDIS_REST_TOKEN: str = ""
 
+    # Usage write-behind buffer (AI_TOKEN, BANDWIDTH)
+    USAGE_BUFFER_ENABLED: bool = True
+    USAGE_FLUSH_INTERVAL_SECONDS: float = 1.0
+    USAGE_FLUSH_THRESHOLD: int = 10_000
+    # Write-ahead log directory; empty = up to one flush interval lost on crash
+    USAGE_WAL_DIR: str = ""
+
+    # Credits ledger: "memory" (per process) or "supabase"
+    CREDITS_LEDGER_BACKEND: str = "memory"
+
     # Stripe
     STRIPE_SECRET_KEY: str = ""
     STRIPE_PUBLISHABLE_KEY: str = ""
@@ -33,6 +43,30 @@ class Settings(BaseSettings):
     STRIPE_PRICE_ID_PRO_YEARLY: str = ""
     STRIPE_PRICE_ID_ENTERPRISE_MONTHLY: str = ""
     STRIPE_PRICE_ID_ENTERPRISE_YEARLY: str = ""
+    # SDK calls per process: in flight at once, and started per second (keep
+    # replicas x rate under the account's Stripe rate limit)
+    STRIPE_MAX_CONCURRENCY: int = 8
+    STRIPE_RATE_LIMIT: float = 20.0
+    STRIPE_RATE_BURST: int = 20
+    STRIPE_MAX_RETRIES: int = 3
+    # Organization -> customer index: "memory" (per process) or "supabase";
+    # the in-process LRU in front of it, and how long it trusts an entry
+    CUSTOMER_INDEX_BACKEND: str = "memory"
+    CUSTOMER_CACHE_SIZE: int = 10_000
+    CUSTOMER_CACHE_TTL: float = 300.0
+    # Subscription mirror: "memory" (per process) or "supabase", and how often
+    # it is reconciled against Stripe
+    SUBSCRIPTION_MIRROR_BACKEND: str = "memory"
+    SUBSCRIPTION_RECONCILE_INTERVAL: float = 3600.0
+    # Webhook queue: partitions (one worker each, per-customer ordering) and
+    # tries per event before it is dead-lettered
+    WEBHOOK_QUEUE_PARTITIONS: int = 8
+    WEBHOOK_MAX_ATTEMPTS: int = 5
+
+    # In-process entitlement snapshots (invalidated over Redis pub/sub): how
+    # many organizations, and how long one is trusted without a message
+    ENTITLEMENT_CACHE_SIZE: int = 10_000
+    ENTITLEMENT_CACHE_TTL: float = 60.0
 
     # URLs
     APP_URL: str = "http://localhost:3000"
@@ -14,18 +14,23 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 
-from _shared.errors import generic_exception_handler
-from _shared.health import router as health_router
-from _shared.middleware import RequestLoggingMiddleware
-from _shared.otel import instrument_app
+from _shared.app import create_app
+from _shared.lifecycle import lifecycle
 from app.api.v1 import (
     routes_billing,
+    routes_config,
     routes_credits,
     routes_subscriptions,
     routes_usage,
     routes_webhooks,
 )
 from app.config import settings
+from services.credits_service import CreditsService
+from services.entitlement_cache import get_entitlement_cache
+from services.subscription_mirror import get_subscription_mirror
+from services.usage_service import UsageService
+from services.webhook_queue import get_webhook_workers
+from utils.stripe_client import get_stripe_gate
 
 logger = logging.getLogger(__name__)
 
@@ -34,29 +39,44 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     """Application lifespan handler"""
     logger.info("Starting Billing Service on %s:%s", settings.HOST, settings.PORT)
+    usage_buffer = UsageService.get_instance().buffer
+    if usage_buffer is not None:
+        await usage_buffer.recover()
+        usage_buffer.start()
+        lifecycle.add_shutdown_hook(usage_buffer.close, name="usage-buffer")
+    credit_expiry = CreditsService.get_instance().expiry
+    await credit_expiry.load()
+    credit_expiry.start()
+    lifecycle.add_shutdown_hook(credit_expiry.close, name="credit-expiry")
+    subscription_mirror = get_subscription_mirror()
+    subscription_mirror.start()
+    lifecycle.add_shutdown_hook(subscription_mirror.close, name="subscription-mirror")
+    webhook_workers = get_webhook_workers()
+    webhook_workers.start()
+    lifecycle.add_shutdown_hook(webhook_workers.close, name="webhook-workers")
+    entitlements = get_entitlement_cache()
+    entitlements.start()
+    lifecycle.add_shutdown_hook(entitlements.close, name="entitlement-cache")
+    lifecycle.add_shutdown_hook(get_stripe_gate().close, name="stripe-gate")
     yield
     logger.info("Shutting down Billing Service")
 
 
-app = FastAPI(
+app = create_app(
     title="Nebutra Billing Service",
     description="Billing, subscriptions, usage tracking, and credits management",
-    version="0.1.0",
+    service_name="billing-service",
     lifespan=lifespan,
 )
 
-instrument_app(app, service_name="billing-service")
-app.add_middleware(RequestLoggingMiddleware)
-app.add_exception_handler(Exception, generic_exception_handler)
-
 # CORS is handled at the Hono API Gateway layer — do not add CORSMiddleware here.
 # This service is internal and should not be exposed directly to browsers.
 
-app.include_router(health_router)
 app.include_router(routes_billing.router, prefix="/api/v1/billing", tags=["billing"])
 app.include_router(
     routes_subscriptions.router, prefix="/api/v1/subscriptions", tags=["subscriptions"]
 )
+app.include_router(routes_config.router, prefix="/api/v1/config", tags=["config"])
 app.include_router(routes_usage.router, prefix="/api/v1/usage", tags=["usage"])
 app.include_router(routes_credits.router, prefix="/api/v1/credits", tags=["credits"])
 app.include_router(routes_webhooks.router, prefix="/api/v1/webhooks", tags=["webhooks"])
@@ -73,9 +93,9 @@ async def root():
 
 
 if __name__ == "__main__":
-    import uvicorn
+    from _shared.launcher import run
 
-    uvicorn.run(
+    run(
         "app.main:app",
         host=settings.HOST,
         port=settings.PORT,
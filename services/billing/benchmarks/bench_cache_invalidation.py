@@ -0,0 +1,122 @@
+"""
+Plan cache invalidation benchmark.
+
+Fills a Redis keyspace with unrelated tenant keys plus cached plan configs,
+then times three ways of invalidating the plan caches:
+
+- keys+del:    KEYS billing:config:* then DEL (what invalidate_plans did)
+- scan+unlink: delete_matching(), SCAN and UNLINK in batches
+- incr:        invalidate_plans(), one INCR of the cache generation
+
+"longest" is the longest single Redis command, i.e. how long every other
+client of a shared Redis waits behind the invalidation. Without
+--redis-url it runs against fakeredis, which walks the whole keyspace on
+every SCAN call; a real server only visits about --batch-size keys per
+call, so its scan+unlink "longest" stays flat as the keyspace grows.
+
+Usage (from services/billing):
+    python -m benchmarks.bench_cache_invalidation
+    python -m benchmarks.bench_cache_invalidation --keys 1000000 --redis-url redis://localhost:6379/15
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from services.plan_config_service import PlanConfigService
+from utils.redis_client import delete_matching
+
+PATTERN = "billing:config:*"
+
+
+async def _fill(client, keys: int, configs: int) -> None:
+    await client.flushdb()
+    for start in range(0, keys, 10_000):
+        async with client.pipeline(transaction=False) as pipe:
+            for i in range(start, min(start + 10_000, keys)):
+                pipe.set(f"tenant:{i % 97}:session:{i}", "x", ex=3600)
+            await pipe.execute()
+    async with client.pipeline(transaction=False) as pipe:
+        for i in range(configs):
+            pipe.set(f"billing:config:g0:org:org_{i}", "{}", ex=300)
+        await pipe.execute()
+
+
+async def _keys_del(client) -> tuple[float, float, int]:
+    started = time.perf_counter()
+    keys = await client.keys(PATTERN)
+    longest = time.perf_counter() - started
+    if keys:
+        await client.delete(*keys)
+    return time.perf_counter() - started, longest, len(keys)
+
+
+async def _scan_unlink(client, batch_size: int) -> tuple[float, float, int]:
+    # delete_matching(), with each SCAN call timed
+    started = time.perf_counter()
+    longest = 0.0
+    deleted = 0
+    cursor = 0
+    while True:
+        call = time.perf_counter()
+        cursor, keys = await client.scan(cursor, match=PATTERN, count=batch_size)
+        longest = max(longest, time.perf_counter() - call)
+        if keys:
+            deleted += await client.unlink(*keys)
+        if cursor == 0:
+            break
+    return time.perf_counter() - started, longest, deleted
+
+
+async def _incr(client) -> tuple[float, float, int]:
+    service = PlanConfigService(supabase=object(), redis=client)
+    started = time.perf_counter()
+    await service.invalidate_plans()
+    elapsed = time.perf_counter() - started
+    return elapsed, elapsed, 0
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--keys", type=int, default=200_000, help="unrelated keys")
+    parser.add_argument("--configs", type=int, default=5_000, help="cached configs")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--redis-url", help="real Redis (flushes the db!)")
+    args = parser.parse_args()
+
+    if args.redis_url:
+        import redis.asyncio as redis
+
+        client = redis.from_url(args.redis_url, decode_responses=True)
+    else:
+        from fakeredis import FakeAsyncRedis
+
+        client = FakeAsyncRedis(decode_responses=True)
+
+    print(f"keyspace: {args.keys:,} tenant keys + {args.configs:,} plan configs")
+    header = f"{'method':<12} {'total':>10} {'longest':>10} {'deleted':>8}"
+    print(header)
+    print("-" * len(header))
+    runs = {
+        "keys+del": lambda: _keys_del(client),
+        "scan+unlink": lambda: _scan_unlink(client, args.batch_size),
+        "incr": lambda: _incr(client),
+    }
+    for name, run in runs.items():
+        await _fill(client, args.keys, args.configs)
+        total, longest, deleted = await run()
+        print(f"{name:<12} {total * 1e3:>8.1f}ms {longest * 1e3:>8.2f}ms {deleted:>8,}")
+
+    # Sanity check: the helper deletes what the timed loop did
+    await _fill(client, 0, args.configs)
+    assert await delete_matching(client, PATTERN, args.batch_size) == args.configs
+    await client.flushdb()
+    await client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,136 @@
+"""
+Period close benchmark.
+
+Synthesizes a period of usage for many organizations (mostly FREE, some
+PRO and ENTERPRISE, usage spread around each plan's limits) and times the
+stages of a vectorized close against the per-organization Python loop
+get_usage uses:
+
+- matrix:   PeriodUsage.from_counters(), from plan names and flat counters
+            as UsageService.close_period loads them
+- overage:  compute_overage(), limits, overage and cost in one pass
+- lines:    PeriodCloseResult.line_items(), one InvoiceLine per overage
+- loop:     the same arithmetic per organization and type in Python
+
+Reading the counters from Redis is not included; it is I/O-bound and
+costs one MGET per PERIOD_CLOSE_BATCH_SIZE counters.
+
+Usage (from services/billing):
+    python -m benchmarks.bench_period_close
+    python -m benchmarks.bench_period_close --organizations 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from services.period_close import (
+    PLANS,
+    USAGE_TYPES,
+    InvoiceLine,
+    PeriodUsage,
+    compute_overage,
+)
+from services.usage_service import OVERAGE_PRICING, PLAN_LIMITS
+
+
+def _synthesize(organizations: int, seed: int) -> tuple[list[str], list[int]]:
+    rng = np.random.default_rng(seed)
+    plans = rng.choice(PLANS, size=organizations, p=[0.7, 0.25, 0.05])
+    # Usage around each plan's limit (unlimited plans around PRO's)
+    scale = np.array(
+        [
+            [
+                PLAN_LIMITS[plan][t]
+                if PLAN_LIMITS[plan][t] > 0
+                else PLAN_LIMITS["PRO"][t]
+                for t in USAGE_TYPES
+            ]
+            for plan in plans
+        ],
+        dtype=np.float64,
+    )
+    usage = (scale * rng.lognormal(-0.5, 0.6, scale.shape)).astype(np.int64)
+    return plans.tolist(), usage.ravel().tolist()
+
+
+def _loop(organization_ids, plans, counters) -> tuple[float, list[InvoiceLine]]:
+    """get_usage's arithmetic, one organization and type at a time"""
+    total = 0.0
+    lines = []
+    values = iter(counters)
+    for organization_id, plan in zip(organization_ids, plans, strict=True):
+        limits = PLAN_LIMITS.get(plan, PLAN_LIMITS["FREE"])
+        for usage_type in USAGE_TYPES:
+            current = next(values)
+            limit = limits.get(usage_type, 0)
+            overage = max(0, current - limit) if limit > 0 else 0
+            if overage:
+                unit_price = OVERAGE_PRICING.get(usage_type, 0)
+                amount = overage * unit_price
+                total += amount
+                lines.append(
+                    InvoiceLine(
+                        organization_id,
+                        usage_type,
+                        overage,
+                        unit_price,
+                        amount,
+                        round(amount * 100),
+                    )
+                )
+    return total, lines
+
+
+def _timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--organizations", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    organization_ids = [f"org_{i}" for i in range(args.organizations)]
+    plans, counters = _synthesize(args.organizations, args.seed)
+
+    usage, t_matrix = _timed(
+        lambda: PeriodUsage.from_counters("2026-09", organization_ids, plans, counters)
+    )
+    result, t_overage = _timed(lambda: compute_overage(usage))
+    lines, t_lines = _timed(result.line_items)
+    (loop_total, loop_lines), t_loop = _timed(
+        lambda: _loop(organization_ids, plans, counters)
+    )
+
+    assert lines == loop_lines
+    assert np.isclose(result.total_amount, loop_total)
+
+    vectorized = t_matrix + t_overage + t_lines
+    print(
+        f"{args.organizations:,} organizations x {len(USAGE_TYPES)} types, "
+        f"{len(lines):,} line items, ${result.total_amount:,.2f} overage"
+    )
+    print(f"{'stage':<10} {'time':>10}")
+    print("-" * 21)
+    for name, seconds in [
+        ("matrix", t_matrix),
+        ("overage", t_overage),
+        ("lines", t_lines),
+        ("total", vectorized),
+        ("loop", t_loop),
+    ]:
+        print(f"{name:<10} {seconds * 1e3:>8.1f}ms")
+    print(f"speedup    {t_loop / vectorized:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Credit Expiry
+
+Forfeits bonus credits when their grant expires.
+
+Pending expirations sit in one min-heap keyed by expiry time, so finding
+what is due costs O(log n) per grant and never scans organizations. The
+scheduler sleeps until the earliest expiry (or until an earlier one is
+scheduled), pops everything due, and hands it to the ledger in batches;
+each batch is recorded as EXPIRATION entries in one backend call.
+
+The heap is rebuilt from the ledger at startup (load()), so expiries that
+fell due while the service was down are processed on start. Expiring a
+grant is idempotent in the ledger, so several replicas may run schedulers.
+"""
+
+import asyncio
+import heapq
+from collections.abc import Callable
+from datetime import UTC, datetime
+
+import structlog
+
+from _shared.memory import register_store
+from services.credits_ledger import LedgerBackend, LedgerEntry, utc_now
+
+logger = structlog.get_logger()
+
+DEFAULT_BATCH_SIZE = 500
+# Upper bound on one sleep, so clock adjustments are picked up
+MAX_SLEEP = 60.0  # seconds
+
+
+class CreditExpiryScheduler:
+    """Min-heap of (expires at, organization, grant id) driving expire_many()"""
+
+    def __init__(
+        self,
+        ledger: LedgerBackend,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_sleep: float = MAX_SLEEP,
+        clock: Callable[[], datetime] = utc_now,
+    ):
+        self.ledger = ledger
+        self._now = clock
+        self.batch_size = batch_size
+        self.max_sleep = max_sleep
+        self._heap: list[tuple[datetime, str, str]] = []
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self.expired = 0  # EXPIRATION entries recorded
+        register_store("billing.credit_expiry", self._heap)
+
+    def schedule(
+        self, organization_id: str, grant_id: str, expires_at: datetime
+    ) -> None:
+        """Queue a grant; wakes the loop if it is now the earliest"""
+        item = (expires_at.astimezone(UTC), organization_id, grant_id)
+        heapq.heappush(self._heap, item)
+        if self._wakeup is not None and self._heap[0] is item:
+            self._wakeup.set()
+
+    def pending(self) -> int:
+        return len(self._heap)
+
+    async def load(self) -> int:
+        """Queue every grant the ledger still has to expire"""
+        pending = await self.ledger.pending_expirations()
+        self._heap.extend(
+            (at.astimezone(UTC), org, grant) for at, org, grant in pending
+        )
+        heapq.heapify(self._heap)
+        return len(pending)
+
+    async def run_due(self, now: datetime | None = None) -> list[LedgerEntry]:
+        """Expire every grant due by `now`; returns the entries recorded"""
+        now = now or self._now()
+        recorded: list[LedgerEntry] = []
+        while self._heap and self._heap[0][0] <= now:
+            batch = []
+            while (
+                self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size
+            ):
+                _, organization_id, grant_id = heapq.heappop(self._heap)
+                batch.append((organization_id, grant_id))
+            try:
+                entries = await self.ledger.expire_many(batch)
+            except Exception:
+                # Back in the heap; retried on the next pass
+                for organization_id, grant_id in batch:
+                    heapq.heappush(self._heap, (now, organization_id, grant_id))
+                raise
+            recorded.extend(entries)
+        if recorded:
+            self.expired += len(recorded)
+            logger.info(
+                "credits_expired",
+                entries=len(recorded),
+                credits=-sum(entry.credits for entry in recorded),
+            )
+        return recorded
+
+    # ── Background loop ──────────────────────────────────────────────────────
+
+    def start(self) -> None:
+        """Start the scheduler on the running event loop"""
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="credit-expiry")
+
+    def _sleep_for(self) -> float:
+        if not self._heap:
+            return self.max_sleep
+        due_in = (self._heap[0][0] - self._now()).total_seconds()
+        return max(0.0, min(due_in, self.max_sleep))
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._sleep_for())
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.run_due()
+            except Exception as e:
+                logger.warning("credit_expiry_failed", error=str(e))
+                await asyncio.sleep(1.0)
+
+    async def close(self) -> None:
+        """Stop the scheduler (a shutdown hook); pending grants reload on start"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -0,0 +1,727 @@
+"""
+Credits Ledger
+
+Append-only storage for credit transactions and balances.
+
+Entries are never updated or removed; a refund or correction is a new
+entry. Each organization's ledger is kept in append order with:
+
+- an id index, so a transaction is found in O(1) (refunds),
+- a per-type index, so filtered history never scans other types,
+- reverse-chronological keyset pagination: a page is a slice ending just
+  before the cursor, so deep pages cost the same as the first one.
+
+Every entry carries the balance after it, so the balance at any past
+moment is the balance_after of the last entry at or before it: a binary
+search over the time-ordered ledger (an index lookup in Postgres), with no
+replay.
+
+Bonus grants may carry an expiry. At expiry, what is left of the grant is
+forfeited as an EXPIRATION entry; see expire_many() for the rule and
+credit_expiry.py for the scheduler that drives it.
+
+Holds (reservations) set credits aside without spending them: the
+available balance is the posted balance less active holds. A hold is
+settled into a USAGE entry for the actual amount, released, or lapses at
+its expiry. Every check-and-write (deduct, reserve, settle) is a single
+atomic operation per organization.
+
+Backends:
+- MemoryLedgerBackend: per-process (local development, tests).
+- SupabaseLedgerBackend: the credit_balances / credit_transactions tables.
+  Appends and holds go through SQL functions that lock the organization's
+  balance row, so each check and its writes are one statement.
+"""
+
+import asyncio
+import base64
+import heapq
+import re
+import uuid
+from bisect import bisect_left, bisect_right
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import UTC, datetime, timedelta
+from operator import attrgetter
+from typing import Protocol
+
+from _shared.memory import register_store
+
+_ENTRY_ID = re.compile(r"[A-Za-z0-9_-]+")
+_created_at = attrgetter("created_at")
+
+
+def utc_now() -> datetime:
+    """The default clock of the memory ledger and the expiry scheduler"""
+    return datetime.now(UTC)
+
+
+@dataclass
+class LedgerEntry:
+    id: str
+    organization_id: str
+    type: str
+    credits: int  # signed: positive adds credits, negative spends them
+    balance_after: int
+    description: str
+    created_at: datetime
+    metadata: dict | None = None
+    expires_at: datetime | None = None  # grants only
+    related_id: str | None = None  # e.g. the grant an EXPIRATION forfeits
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "type": self.type,
+            "credits": self.credits,
+            "balance_after": self.balance_after,
+            "description": self.description,
+            "created_at": self.created_at,
+            "metadata": self.metadata,
+        }
+
+
+@dataclass
+class CreditHold:
+    id: str
+    organization_id: str
+    credits: int
+    expires_at: datetime
+    description: str
+    metadata: dict | None = None
+
+
+@dataclass
+class LedgerPage:
+    entries: list[LedgerEntry]  # newest first
+    next_cursor: str | None  # None on the last page
+    total_count: int
+
+
+class LedgerBackend(Protocol):
+    async def append(
+        self,
+        organization_id: str,
+        transaction_type: str,
+        credits: int,
+        description: str,
+        metadata: dict | None = None,
+        floor: int | None = None,
+        expires_at: datetime | None = None,
+    ) -> LedgerEntry | None:
+        """
+        Apply `credits` to the balance and record the entry atomically.
+
+        With `floor`, returns None (and records nothing) if the available
+        balance (balance less active holds) would drop below it. A grant
+        with `expires_at` is forfeited at that time by expire_many().
+        """
+        ...
+
+    async def balance(self, organization_id: str) -> int: ...
+
+    async def balance_at(self, organization_id: str, at: datetime) -> int:
+        """Posted balance as of `at` (0 before the first entry)"""
+        ...
+
+    async def expire_many(self, grants: list[tuple[str, str]]) -> list[LedgerEntry]:
+        """
+        Forfeit what is left of expired grants, given as (organization, grant
+        id) pairs. Returns the EXPIRATION entries recorded.
+
+        Expiring credits are spent first, earliest expiry first: each debit
+        draws down the unexpired grants in expiry order, and a grant
+        forfeits what it has left, capped at the available balance. Spending
+        is attributed to one grant only, so overlapping grants are not
+        credited twice. Each grant is expired at most once, so repeated or
+        concurrent calls are safe.
+        """
+        ...
+
+    async def pending_expirations(self) -> list[tuple[datetime, str, str]]:
+        """(expires at, organization, grant id) for grants not yet expired"""
+        ...
+
+    async def held(self, organization_id: str) -> int:
+        """Credits set aside by active holds"""
+        ...
+
+    async def reserve(
+        self,
+        organization_id: str,
+        credits: int,
+        ttl_seconds: int,
+        description: str,
+        metadata: dict | None = None,
+    ) -> CreditHold | None:
+        """Hold `credits`; None if the available balance does not cover them"""
+        ...
+
+    async def settle(
+        self,
+        organization_id: str,
+        hold_id: str,
+        credits: int,
+        description: str,
+        metadata: dict | None = None,
+    ) -> LedgerEntry | None:
+        """
+        Close a hold by recording a USAGE entry of `credits`, which may be
+        more or less than was held. None if the hold is unknown or expired.
+        """
+        ...
+
+    async def release(self, organization_id: str, hold_id: str) -> CreditHold | None:
+        """Drop a hold without spending anything; None if unknown or expired"""
+        ...
+
+    async def get(self, organization_id: str, entry_id: str) -> LedgerEntry | None: ...
+
+    async def page(
+        self,
+        organization_id: str,
+        transaction_type: str | None = None,
+        cursor: str | None = None,
+        limit: int = 50,
+    ) -> LedgerPage: ...
+
+
+# ── Memory ───────────────────────────────────────────────────────────────────
+
+
+@dataclass
+class _OrgLedger:
+    entries: list[LedgerEntry] = field(default_factory=list)  # append order
+    by_id: dict[str, int] = field(default_factory=dict)  # id -> position
+    by_type: dict[str, list[int]] = field(default_factory=dict)  # ascending
+    balance: int = 0
+    holds: dict[str, CreditHold] = field(default_factory=dict)
+    # (expires at, hold id) min-heap; may hold ids already settled/released
+    hold_expiry: list[tuple[datetime, str]] = field(default_factory=list)
+    held: int = 0
+    # Grant id -> credits left, for expiring grants not yet expired
+    grant_left: dict[str, int] = field(default_factory=dict)
+    # (expires at, position, grant id) min-heap of grants spending draws on
+    grant_order: list[tuple[datetime, int, str]] = field(default_factory=list)
+    expired_grants: set[str] = field(default_factory=set)
+
+    def spend_grants(self, credits: int, at: datetime) -> None:
+        """Draw `credits` spent at `at` from grants, earliest expiry first"""
+        order = self.grant_order
+        while order and credits > 0:
+            expires_at, _, grant_id = order[0]
+            left = self.grant_left.get(grant_id, 0)
+            if expires_at < at or left == 0:
+                heapq.heappop(order)  # lapsed (left awaits forfeit) or used up
+                continue
+            taken = min(left, credits)
+            self.grant_left[grant_id] = left - taken
+            credits -= taken
+
+    def expire_holds(self, now: datetime) -> None:
+        while self.hold_expiry and self.hold_expiry[0][0] <= now:
+            _, hold_id = heapq.heappop(self.hold_expiry)
+            self.drop_hold(hold_id)
+
+    def drop_hold(self, hold_id: str) -> CreditHold | None:
+        hold = self.holds.pop(hold_id, None)
+        if hold is not None:
+            self.held -= hold.credits
+        return hold
+
+
+class MemoryLedgerBackend:
+    """
+    Per-process ledger.
+
+    Each operation completes without awaiting, so it is atomic with respect
+    to other coroutines in the process. Cursors are entry positions. Expired
+    holds are dropped from a per-organization expiry heap whenever that
+    organization is touched. `clock` is "now" for entries, holds and
+    expiry (tests pass a fake one).
+    """
+
+    def __init__(self, clock: Callable[[], datetime] = utc_now):
+        self._ledgers: dict[str, _OrgLedger] = {}
+        self._now = clock
+        register_store(
+            "billing.credit_balances",
+            lambda: {org: ledger.balance for org, ledger in self._ledgers.items()},
+        )
+        register_store(
+            "billing.credit_transactions",
+            lambda: {org: ledger.entries for org, ledger in self._ledgers.items()},
+        )
+        register_store(
+            "billing.credit_holds",
+            lambda: {org: ledger.holds for org, ledger in self._ledgers.items()},
+        )
+
+    def _ledger(self, organization_id: str) -> _OrgLedger:
+        ledger = self._ledgers.get(organization_id)
+        if ledger is None:
+            ledger = self._ledgers[organization_id] = _OrgLedger()
+        ledger.expire_holds(self._now())
+        return ledger
+
+    def _append(
+        self,
+        ledger: _OrgLedger,
+        organization_id: str,
+        transaction_type: str,
+        credits: int,
+        description: str,
+        metadata: dict | None,
+        expires_at: datetime | None = None,
+        related_id: str | None = None,
+    ) -> LedgerEntry:
+        ledger.balance += credits
+        entry = LedgerEntry(
+            id=str(uuid.uuid4()),
+            organization_id=organization_id,
+            type=transaction_type,
+            credits=credits,
+            balance_after=ledger.balance,
+            description=description,
+            created_at=self._now(),
+            metadata=metadata,
+            expires_at=expires_at,
+            related_id=related_id,
+        )
+        position = len(ledger.entries)
+        if credits > 0 and expires_at is not None:
+            ledger.grant_left[entry.id] = credits
+            heapq.heappush(ledger.grant_order, (expires_at, position, entry.id))
+        elif credits < 0 and transaction_type != "EXPIRATION":
+            ledger.spend_grants(-credits, entry.created_at)
+        ledger.entries.append(entry)
+        ledger.by_id[entry.id] = position
+        ledger.by_type.setdefault(transaction_type, []).append(position)
+        return entry
+
+    async def append(
+        self,
+        organization_id: str,
+        transaction_type: str,
+        credits: int,
+        description: str,
+        metadata: dict | None = None,
+        floor: int | None = None,
+        expires_at: datetime | None = None,
+    ) -> LedgerEntry | None:
+        ledger = self._ledger(organization_id)
+        if floor is not None and ledger.balance - ledger.held + credits < floor:
+            return None
+        return self._append(
+            ledger,
+            organization_id,
+            transaction_type,
+            credits,
+            description,
+            metadata,
+            expires_at=expires_at,
+        )
+
+    async def balance(self, organization_id: str) -> int:
+        ledger = self._ledgers.get(organization_id)
+        return ledger.balance if ledger else 0
+
+    async def balance_at(self, organization_id: str, at: datetime) -> int:
+        ledger = self._ledgers.get(organization_id)
+        if ledger is None:
+            return 0
+        position = bisect_right(ledger.entries, at, key=_created_at)
+        return ledger.entries[position - 1].balance_after if position else 0
+
+    async def expire_many(self, grants: list[tuple[str, str]]) -> list[LedgerEntry]:
+        entries = []
+        for organization_id, grant_id in grants:
+            entry = self._expire(organization_id, grant_id)
+            if entry is not None:
+                entries.append(entry)
+        return entries
+
+    def _expire(self, organization_id: str, grant_id: str) -> LedgerEntry | None:
+        if organization_id not in self._ledgers:
+            return None
+        ledger = self._ledger(organization_id)
+        position = ledger.by_id.get(grant_id)
+        if position is None or grant_id in ledger.expired_grants:
+            return None
+        grant = ledger.entries[position]
+        if grant.expires_at is None or grant.expires_at > self._now():
+            return None
+        ledger.expired_grants.add(grant_id)
+
+        left = ledger.grant_left.pop(grant_id, 0)
+        forfeit = min(left, ledger.balance - ledger.held)
+        if forfeit <= 0:
+            return None
+        return self._append(
+            ledger,
+            organization_id,
+            "EXPIRATION",
+            -forfeit,
+            f"Expired: {grant.description}",
+            {"grant_id": grant_id},
+            related_id=grant_id,
+        )
+
+    async def pending_expirations(self) -> list[tuple[datetime, str, str]]:
+        return [
+            (ledger.entries[p].expires_at, organization_id, ledger.entries[p].id)
+            for organization_id, ledger in self._ledgers.items()
+            for p in ledger.by_type.get("BONUS", [])
+            if ledger.entries[p].expires_at is not None
+            and ledger.entries[p].id not in ledger.expired_grants
+        ]
+
+    async def held(self, organization_id: str) -> int:
+        ledger = self._ledgers.get(organization_id)
+        if ledger is None:
+            return 0
+        ledger.expire_holds(self._now())
+        return ledger.held
+
+    async def reserve(
+        self,
+        organization_id: str,
+        credits: int,
+        ttl_seconds: int,
+        description: str,
+        metadata: dict | None = None,
+    ) -> CreditHold | None:
+        ledger = self._ledger(organization_id)
+        if ledger.balance - ledger.held < credits:
+            return None
+        hold = CreditHold(
+            id=str(uuid.uuid4()),
+            organization_id=organization_id,
+            credits=credits,
+            expires_at=self._now() + timedelta(seconds=ttl_seconds),
+            description=description,
+            metadata=metadata,
+        )
+        ledger.holds[hold.id] = hold
+        ledger.held += credits
+        heapq.heappush(ledger.hold_expiry, (hold.expires_at, hold.id))
+        return hold
+
+    async def settle(
+        self,
+        organization_id: str,
+        hold_id: str,
+        credits: int,
+        description: str,
+        metadata: dict | None = None,
+    ) -> LedgerEntry | None:
+        ledger = self._ledger(organization_id)
+        if ledger.drop_hold(hold_id) is None:
+            return None
+        return self._append(
+            ledger, organization_id, "USAGE", -credits, description, metadata
+        )
+
+    async def release(self, organization_id: str, hold_id: str) -> CreditHold | None:
+        return self._ledger(organization_id).drop_hold(hold_id)
+
+    async def get(self, organization_id: str, entry_id: str) -> LedgerEntry | None:
+        ledger = self._ledgers.get(organization_id)
+        if ledger is None or entry_id not in ledger.by_id:
+            return None
+        return ledger.entries[ledger.by_id[entry_id]]
+
+    async def page(
+        self,
+        organization_id: str,
+        transaction_type: str | None = None,
+        cursor: str | None = None,
+        limit: int = 50,
+    ) -> LedgerPage:
+        ledger = self._ledgers.get(organization_id)
+        if ledger is None:
+            return LedgerPage(entries=[], next_cursor=None, total_count=0)
+
+        before = _decode_position(cursor) if cursor else len(ledger.entries)
+        positions = (
+            ledger.by_type.get(transaction_type, [])
+            if transaction_type
+            else range(len(ledger.entries))
+        )
+        end = bisect_left(positions, before)
+        start = max(0, end - limit)
+        return LedgerPage(
+            entries=[ledger.entries[p] for p in reversed(positions[start:end])],
+            next_cursor=_encode_position(positions[start]) if start > 0 else None,
+            total_count=len(positions),
+        )
+
+
+def _encode_position(position: int) -> str:
+    return base64.urlsafe_b64encode(f"p:{position}".encode()).decode()
+
+
+def _decode_position(cursor: str) -> int:
+    try:
+        kind, value = base64.urlsafe_b64decode(cursor).decode().split(":", 1)
+        if kind != "p":
+            raise ValueError
+        return int(value)
+    except ValueError as e:
+        raise ValueError("Invalid cursor") from e
+
+
+# ── Supabase ─────────────────────────────────────────────────────────────────
+
+
+class SupabaseLedgerBackend:
+    """
+    Ledger in Postgres via Supabase.
+
+    Pages are ordered by (created_at, id) descending, served by an index on
+    (credit_balance_id, created_at DESC, id DESC); the cursor is the last
+    entry's (created_at, id). The synchronous client runs in a thread.
+    """
+
+    def __init__(self, client=None):
+        if client is None:
+            from utils.supabase_client import get_supabase_client
+
+            client = get_supabase_client()
+        self.client = client
+
+    async def append(
+        self,
+        organization_id: str,
+        transaction_type: str,
+        credits: int,
+        description: str,
+        metadata: dict | None = None,
+        floor: int | None = None,
+        expires_at: datetime | None = None,
+    ) -> LedgerEntry | None:
+        result = await asyncio.to_thread(
+            self.client.rpc(
+                "append_credit_transaction",
+                {
+                    "p_organization_id": organization_id,
+                    "p_type": transaction_type,
+                    "p_amount": credits,
+                    "p_description": description,
+                    "p_metadata": metadata or {},
+                    "p_floor": floor,
+                    "p_expires_at": expires_at.isoformat() if expires_at else None,
+                },
+            ).execute
+        )
+        # No row: the floor check rejected the entry
+        return self._entry(organization_id, result.data[0]) if result.data else None
+
+    async def balance(self, organization_id: str) -> int:
+        result = await asyncio.to_thread(
+            self.client.table("credit_balances")
+            .select("balance")
+            .eq("organization_id", organization_id)
+            .limit(1)
+            .execute
+        )
+        return int(result.data[0]["balance"]) if result.data else 0
+
+    async def balance_at(self, organization_id: str, at: datetime) -> int:
+        result = await asyncio.to_thread(
+            self._select()
+            .eq("credit_balances.organization_id", organization_id)
+            .lte("created_at", at.astimezone(UTC).isoformat())
+            .order("created_at", desc=True)
+            .order("id", desc=True)
+            .limit(1)
+            .execute
+        )
+        return int(result.data[0]["balance_after"]) if result.data else 0
+
+    async def expire_many(self, grants: list[tuple[str, str]]) -> list[LedgerEntry]:
+        if not grants:
+            return []
+        organizations = {grant_id: org for org, grant_id in grants}
+        result = await asyncio.to_thread(
+            self.client.rpc(
+                "expire_credit_grants", {"p_grant_ids": list(organizations)}
+            ).execute
+        )
+        return [
+            self._entry(organizations[row["related_id"]], row)
+            for row in result.data or []
+        ]
+
+    async def pending_expirations(self) -> list[tuple[datetime, str, str]]:
+        result = await asyncio.to_thread(
+            self.client.rpc("pending_credit_expirations", {}).execute
+        )
+        return [
+            (_timestamp(row["expires_at"]), row["organization_id"], row["grant_id"])
+            for row in result.data or []
+        ]
+
+    async def held(self, organization_id: str) -> int:
+        result = await asyncio.to_thread(
+            self.client.table("credit_holds")
+            .select("amount, credit_balances!inner(organization_id)")
+            .eq("credit_balances.organization_id", organization_id)
+            .gt("expires_at", datetime.now(UTC).isoformat())
+            .execute
+        )
+        return sum(int(row["amount"]) for row in result.data or [])
+
+    async def reserve(
+        self,
+        organization_id: str,
+        credits: int,
+        ttl_seconds: int,
+        description: str,
+        metadata: dict | None = None,
+    ) -> CreditHold | None:
+        result = await asyncio.to_thread(
+            self.client.rpc(
+                "reserve_credits",
+                {
+                    "p_organization_id": organization_id,
+                    "p_amount": credits,
+                    "p_ttl_seconds": ttl_seconds,
+                    "p_description": description,
+                    "p_metadata": metadata or {},
+                },
+            ).execute
+        )
+        return self._hold(organization_id, result.data[0]) if result.data else None
+
+    async def settle(
+        self,
+        organization_id: str,
+        hold_id: str,
+        credits: int,
+        description: str,
+        metadata: dict | None = None,
+    ) -> LedgerEntry | None:
+        result = await asyncio.to_thread(
+            self.client.rpc(
+                "settle_credit_hold",
+                {
+                    "p_organization_id": organization_id,
+                    "p_hold_id": hold_id,
+                    "p_amount": credits,
+                    "p_description": description,
+                    "p_metadata": metadata or {},
+                },
+            ).execute
+        )
+        return self._entry(organization_id, result.data[0]) if result.data else None
+
+    async def release(self, organization_id: str, hold_id: str) -> CreditHold | None:
+        result = await asyncio.to_thread(
+            self.client.rpc(
+                "release_credit_hold",
+                {"p_organization_id": organization_id, "p_hold_id": hold_id},
+            ).execute
+        )
+        return self._hold(organization_id, result.data[0]) if result.data else None
+
+    async def get(self, organization_id: str, entry_id: str) -> LedgerEntry | None:
+        result = await asyncio.to_thread(
+            self._select()
+            .eq("credit_balances.organization_id", organization_id)
+            .eq("id", entry_id)
+            .limit(1)
+            .execute
+        )
+        return self._entry(organization_id, result.data[0]) if result.data else None
+
+    async def page(
+        self,
+        organization_id: str,
+        transaction_type: str | None = None,
+        cursor: str | None = None,
+        limit: int = 50,
+    ) -> LedgerPage:
+        query = self._select(count="exact").eq(
+            "credit_balances.organization_id", organization_id
+        )
+        if transaction_type:
+            query = query.eq("type", transaction_type)
+        if cursor:
+            created_at, entry_id = _decode_keyset(cursor)
+            query = query.or_(
+                f"created_at.lt.{created_at},"
+                f"and(created_at.eq.{created_at},id.lt.{entry_id})"
+            )
+        query = (
+            query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1)
+        )
+        result = await asyncio.to_thread(query.execute)
+
+        rows = result.data or []
+        entries = [self._entry(organization_id, row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = _encode_keyset(last["created_at"], last["id"])
+        return LedgerPage(
+            entries=entries,
+            next_cursor=next_cursor,
+            total_count=result.count or 0,
+        )
+
+    def _select(self, count: str | None = None):
+        return self.client.table("credit_transactions").select(
+            "id, type, amount, balance_after, description, metadata, created_at, "
+            "expires_at, related_id, credit_balances!inner(organization_id)",
+            count=count,
+        )
+
+    @staticmethod
+    def _hold(organization_id: str, row: dict) -> CreditHold:
+        return CreditHold(
+            id=row["id"],
+            organization_id=organization_id,
+            credits=int(row["amount"]),
+            expires_at=_timestamp(row["expires_at"]),
+            description=row.get("description") or "",
+            metadata=row.get("metadata"),
+        )
+
+    @staticmethod
+    def _entry(organization_id: str, row: dict) -> LedgerEntry:
+        return LedgerEntry(
+            id=row["id"],
+            organization_id=organization_id,
+            type=row["type"],
+            credits=int(row["amount"]),
+            balance_after=int(row["balance_after"]),
+            description=row.get("description") or "",
+            created_at=_timestamp(row["created_at"]),
+            metadata=row.get("metadata"),
+            expires_at=_timestamp(row["expires_at"]) if row.get("expires_at") else None,
+            related_id=row.get("related_id"),
+        )
+
+
+def _timestamp(value: str) -> datetime:
+    """Columns are timestamp without time zone, stored as UTC"""
+    parsed = datetime.fromisoformat(value)
+    return parsed.replace(tzinfo=UTC) if parsed.tzinfo is None else parsed
+
+
+def _encode_keyset(created_at: str, entry_id: str) -> str:
+    return base64.urlsafe_b64encode(f"k:{created_at}|{entry_id}".encode()).decode()
+
+
+def _decode_keyset(cursor: str) -> tuple[str, str]:
+    try:
+        kind, value = base64.urlsafe_b64decode(cursor).decode().split(":", 1)
+        created_at, entry_id = value.split("|", 1)
+        # Both end up in a PostgREST filter expression
+        if kind != "k" or not _ENTRY_ID.fullmatch(entry_id):
+            raise ValueError
+        datetime.fromisoformat(created_at)
+        return created_at, entry_id
+    except ValueError as e:
+        raise ValueError("Invalid cursor") from e
@@ -2,41 +2,85 @@
 Credits Service
 
 Credit balance, transactions, and purchases.
+
+Transactions are kept in an append-only ledger (see credits_ledger.py);
+the backend is chosen by CREDITS_LEDGER_BACKEND. Bonus credits with an
+expiry are forfeited by the scheduler in credit_expiry.py.
 """
 
-import uuid
+from collections.abc import Callable
 from datetime import UTC, datetime
-
-import stripe
+from typing import Optional
 
 from app.config import settings
 
+from .credit_expiry import CreditExpiryScheduler
+from .credits_ledger import (
+    LedgerBackend,
+    LedgerEntry,
+    MemoryLedgerBackend,
+    SupabaseLedgerBackend,
+    utc_now,
+)
 from .stripe_service import StripeService
 
 # Credits per dollar
 CREDITS_PER_DOLLAR = 100
 
+# Reservations: credits held for work whose cost is known only afterwards
+RESERVATION_DEFAULT_TTL = 300  # seconds
+RESERVATION_MAX_TTL = 3600
+
 
 class CreditsService:
     """Service for credits management"""
 
-    def __init__(self):
-        stripe.api_key = settings.STRIPE_SECRET_KEY
+    _instance: Optional["CreditsService"] = None
+
+    def __init__(
+        self,
+        ledger: LedgerBackend | None = None,
+        clock: Callable[[], datetime] = utc_now,
+    ):
         self.stripe_service = StripeService()
-        # In production, use database
-        self._balances: dict[str, int] = {}
-        self._transactions: dict[str, list] = {}
+        if ledger is None:
+            ledger = (
+                SupabaseLedgerBackend()
+                if settings.CREDITS_LEDGER_BACKEND == "supabase"
+                else MemoryLedgerBackend(clock=clock)
+            )
+        self.ledger = ledger
+        self._now = clock
+        self.expiry = CreditExpiryScheduler(ledger, clock=clock)
+
+    @classmethod
+    def get_instance(cls) -> "CreditsService":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
 
     async def get_balance(self, organization_id: str) -> dict:
         """Get credit balance for an organization"""
-        balance = self._balances.get(organization_id, 0)
+        balance = await self.ledger.balance(organization_id)
+        held = await self.ledger.held(organization_id)
         return {
             "organization_id": organization_id,
             "balance": balance,
+            "held": held,
+            "available": balance - held,
             "dollar_value": balance / CREDITS_PER_DOLLAR,
             "last_updated": datetime.now(UTC),
         }
 
+    async def get_balance_at(self, organization_id: str, at: datetime) -> dict:
+        """Posted balance of an organization at a past moment"""
+        at = at.replace(tzinfo=UTC) if at.tzinfo is None else at
+        return {
+            "organization_id": organization_id,
+            "at": at,
+            "balance": await self.ledger.balance_at(organization_id, at),
+        }
+
     async def purchase_credits(
         self,
         organization_id: str,
@@ -65,7 +109,7 @@ class CreditsService:
         )
 
         # Add credits (in production, only after payment succeeds)
-        transaction_id = await self._add_credits(
+        entry = await self._add_credits(
             organization_id=organization_id,
             credits=credits_to_add,
             transaction_type="PURCHASE",
@@ -73,13 +117,11 @@ class CreditsService:
             metadata={"payment_intent_id": payment_intent["id"]},
         )
 
-        new_balance = self._balances.get(organization_id, 0)
-
         return {
             "success": True,
             "credits_added": credits_to_add,
-            "new_balance": new_balance,
-            "transaction_id": transaction_id,
+            "new_balance": entry.balance_after,
+            "transaction_id": entry.id,
             "payment_intent_id": payment_intent["id"],
         }
 
@@ -91,56 +133,136 @@ class CreditsService:
         metadata: dict | None = None,
     ) -> dict:
         """Deduct credits from balance"""
-        current_balance = self._balances.get(organization_id, 0)
-
-        if current_balance < credits:
-            raise ValueError(
-                f"Insufficient credits. Balance: {current_balance}, Required: {credits}"
-            )
-
-        transaction_id = await self._add_credits(
+        # The balance check is part of the append, so concurrent deductions
+        # cannot overdraw
+        entry = await self._add_credits(
             organization_id=organization_id,
             credits=-credits,
             transaction_type="USAGE",
             description=reason,
             metadata=metadata,
+            floor=0,
         )
 
-        new_balance = self._balances.get(organization_id, 0)
+        if entry is None:
+            await self._insufficient(organization_id, credits)
 
         return {
             "success": True,
             "credits_deducted": credits,
-            "new_balance": new_balance,
-            "transaction_id": transaction_id,
+            "new_balance": entry.balance_after,
+            "transaction_id": entry.id,
         }
 
     async def has_enough_credits(self, organization_id: str, credits: int) -> bool:
-        """Check if organization has enough credits"""
-        balance = self._balances.get(organization_id, 0)
-        return balance >= credits
+        """Check if organization has enough credits (not held by reservations)"""
+        balance = await self.ledger.balance(organization_id)
+        held = await self.ledger.held(organization_id)
+        return balance - held >= credits
+
+    async def reserve_credits(
+        self,
+        organization_id: str,
+        credits: int,
+        reason: str,
+        ttl_seconds: int = RESERVATION_DEFAULT_TTL,
+        metadata: dict | None = None,
+    ) -> dict:
+        """
+        Hold an estimated amount before doing work of unknown cost.
+
+        Held credits are unavailable to other deductions and reservations
+        until the reservation is settled with the actual cost, released, or
+        expires (then it is released automatically). The availability check
+        and the hold are one atomic ledger operation.
+        """
+        ttl_seconds = max(1, min(ttl_seconds, RESERVATION_MAX_TTL))
+        hold = await self.ledger.reserve(
+            organization_id, credits, ttl_seconds, reason, metadata=metadata
+        )
+        if hold is None:
+            await self._insufficient(organization_id, credits)
+
+        return {
+            "reservation_id": hold.id,
+            "organization_id": organization_id,
+            "credits": hold.credits,
+            "expires_at": hold.expires_at,
+            "available": (await self.get_balance(organization_id))["available"],
+        }
+
+    async def settle_reservation(
+        self,
+        organization_id: str,
+        reservation_id: str,
+        credits: int,
+        reason: str | None = None,
+        metadata: dict | None = None,
+    ) -> dict:
+        """
+        Charge the actual cost of reserved work and release the hold.
+
+        `credits` may exceed the reservation: the overrun is charged in full
+        (the work is already done), which can leave the balance negative.
+        An expired reservation can no longer be settled.
+        """
+        entry = await self.ledger.settle(
+            organization_id,
+            reservation_id,
+            credits,
+            reason or "Reserved usage",
+            metadata={**(metadata or {}), "reservation_id": reservation_id},
+        )
+        if entry is None:
+            raise ValueError(f"Reservation {reservation_id} not found or expired")
+
+        return {
+            "success": True,
+            "credits_deducted": credits,
+            "new_balance": entry.balance_after,
+            "transaction_id": entry.id,
+        }
+
+    async def release_reservation(
+        self, organization_id: str, reservation_id: str
+    ) -> dict:
+        """Cancel a reservation without charging anything"""
+        hold = await self.ledger.release(organization_id, reservation_id)
+        if hold is None:
+            raise ValueError(f"Reservation {reservation_id} not found or expired")
+
+        return {
+            "reservation_id": reservation_id,
+            "organization_id": organization_id,
+            "credits": hold.credits,
+            "expires_at": hold.expires_at,
+            "available": (await self.get_balance(organization_id))["available"],
+        }
 
     async def get_transactions(
         self,
         organization_id: str,
         transaction_type: str | None = None,
         limit: int = 50,
-        offset: int = 0,
+        cursor: str | None = None,
     ) -> dict:
-        """Get credit transaction history"""
-        all_transactions = self._transactions.get(organization_id, [])
-
-        if transaction_type:
-            filtered = [t for t in all_transactions if t["type"] == transaction_type]
-        else:
-            filtered = all_transactions
-
-        paginated = filtered[offset : offset + limit]
+        """
+        Get credit transaction history, newest first.
+
+        Pass the returned next_cursor back to get the following page.
+        """
+        page = await self.ledger.page(
+            organization_id,
+            transaction_type=transaction_type,
+            cursor=cursor,
+            limit=limit,
+        )
 
         return {
             "organization_id": organization_id,
-            "transactions": paginated,
-            "total_count": len(filtered),
+            "transactions": [entry.to_dict() for entry in page.entries],
+            "total_count": page.total_count,
+            "next_cursor": page.next_cursor,
         }
 
     async def refund_credits(
@@ -151,16 +273,14 @@ class CreditsService:
         reason: str = "Refund",
     ) -> dict:
         """Refund credits"""
-        # Find original transaction
-        transactions = self._transactions.get(organization_id, [])
-        original = next((t for t in transactions if t["id"] == transaction_id), None)
+        original = await self.ledger.get(organization_id, transaction_id)
 
         if not original:
             raise ValueError(f"Transaction {transaction_id} not found")
 
-        refund_amount = credits if credits else abs(original["credits"])
+        refund_amount = credits if credits else abs(original.credits)
 
-        new_transaction_id = await self._add_credits(
+        entry = await self._add_credits(
             organization_id=organization_id,
             credits=refund_amount,
             transaction_type="REFUND",
@@ -168,13 +288,11 @@ class CreditsService:
             metadata={"original_transaction_id": transaction_id},
         )
 
-        new_balance = self._balances.get(organization_id, 0)
-
         return {
             "success": True,
             "credits_deducted": -refund_amount,  # Negative because it's a refund
-            "new_balance": new_balance,
-            "transaction_id": new_transaction_id,
+            "new_balance": entry.balance_after,
+            "transaction_id": entry.id,
         }
 
     async def add_bonus(
@@ -184,24 +302,45 @@ class CreditsService:
         reason: str,
         expires_at: datetime | None = None,
     ) -> dict:
-        """Add bonus credits"""
-        transaction_id = await self._add_credits(
+        """
+        Add bonus credits.
+
+        With expires_at, whatever is left of the bonus at that time is
+        forfeited (expiring credits are spent first).
+        """
+        if expires_at is not None:
+            expires_at = (
+                expires_at.replace(tzinfo=UTC)
+                if expires_at.tzinfo is None
+                else expires_at
+            )
+            if expires_at <= self._now():
+                raise ValueError("expires_at must be in the future")
+
+        entry = await self._add_credits(
             organization_id=organization_id,
             credits=credits,
             transaction_type="BONUS",
             description=f"Bonus: {reason}",
             metadata={"expires_at": expires_at.isoformat() if expires_at else None},
+            expires_at=expires_at,
         )
-
-        new_balance = self._balances.get(organization_id, 0)
+        if expires_at is not None:
+            self.expiry.schedule(organization_id, entry.id, expires_at)
 
         return {
             "success": True,
             "credits_deducted": -credits,  # Negative because credits were added
-            "new_balance": new_balance,
-            "transaction_id": transaction_id,
+            "new_balance": entry.balance_after,
+            "transaction_id": entry.id,
         }
 
+    async def _insufficient(self, organization_id: str, credits: int) -> None:
+        available = (await self.get_balance(organization_id))["available"]
+        raise ValueError(
+            f"Insufficient credits. Available: {available}, Required: {credits}"
+        )
+
     async def _add_credits(
         self,
         organization_id: str,
@@ -209,30 +348,16 @@ class CreditsService:
         transaction_type: str,
         description: str,
         metadata: dict | None = None,
-    ) -> str:
+        floor: int | None = None,
+        expires_at: datetime | None = None,
+    ) -> LedgerEntry | None:
         """Internal method to add/deduct credits and record transaction"""
-        transaction_id = str(uuid.uuid4())
-
-        # Update balance
-        current = self._balances.get(organization_id, 0)
-        new_balance = current + credits
-        self._balances[organization_id] = new_balance
-
-        # Record transaction
-        if organization_id not in self._transactions:
-            self._transactions[organization_id] = []
-
-        self._transactions[organization_id].insert(
-            0,
-            {
-                "id": transaction_id,
-                "type": transaction_type,
-                "credits": credits,
-                "balance_after": new_balance,
-                "description": description,
-                "created_at": datetime.now(UTC),
-                "metadata": metadata,
-            },
+        return await self.ledger.append(
+            organization_id,
+            transaction_type,
+            credits,
+            description,
+            metadata=metadata,
+            floor=floor,
+            expires_at=expires_at,
         )
-
-        return transaction_id
@@ -0,0 +1,378 @@
+"""
+Customer Index
+
+Organization → Stripe customer mapping, kept locally so finding an
+organization's customer does not cost a Stripe Search call.
+
+The index is written when billing creates a customer and kept correct by
+customer.* webhooks. An in-process LRU sits in front of it. Stripe Search
+(slow, rate-limited and eventually consistent) is only the fallback for a
+cold miss, such as a customer created before the index existed. Concurrent
+misses for one organization share a single search, and what it finds is
+written back to the index.
+
+Stripe does not guarantee webhook order, so every write carries a version,
+as in the subscription mirror: the event's `created` time, or the time of
+the API call or search that produced it. A write older than the mapping it
+would replace, for either the organization or the customer, is dropped.
+Deleting a customer leaves a tombstone, so a late customer.created or
+customer.updated cannot map it again.
+
+Cached entries expire after a TTL. Webhooks reach one replica, so the TTL
+bounds how long any other replica can serve a stale mapping. An
+organization with no customer is remembered briefly too, so repeated
+checkouts do not search again every time.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, replace
+from typing import Optional, Protocol
+
+import structlog
+
+from _shared.memory import register_store
+from _shared.singleflight import SingleFlight
+from app.config import settings
+
+logger = structlog.get_logger()
+
+DEFAULT_CACHE_SIZE = 10_000
+DEFAULT_CACHE_TTL = 300.0  # seconds
+# An organization without a customer is searched again after this long
+NEGATIVE_TTL = 60.0
+
+
+@dataclass
+class CustomerRecord:
+    """The indexed part of a Stripe customer; `version` orders writes"""
+
+    organization_id: str
+    customer_id: str
+    email: str | None = None
+    name: str | None = None
+    version: int = 0
+
+    @classmethod
+    def from_stripe(
+        cls, customer: dict, version: int = 0
+    ) -> Optional["CustomerRecord"]:
+        """Record for a Stripe customer object; None without organization metadata"""
+        organization_id = (customer.get("metadata") or {}).get("organization_id")
+        if not organization_id or not customer.get("id"):
+            return None
+        return cls(
+            organization_id=organization_id,
+            customer_id=customer["id"],
+            email=customer.get("email"),
+            name=customer.get("name"),
+            version=version,
+        )
+
+    def supersedes(self, current: Optional["CustomerRecord"]) -> bool:
+        """Whether this write may replace `current`"""
+        return current is None or self.version >= current.version
+
+    def to_dict(self) -> dict:
+        """Stripe-shaped subset of the customer object"""
+        return {
+            "id": self.customer_id,
+            "object": "customer",
+            "email": self.email,
+            "name": self.name,
+            "metadata": {"organization_id": self.organization_id},
+        }
+
+
+class CustomerStore(Protocol):
+    """Persisted organization → customer mapping"""
+
+    async def get(self, organization_id: str) -> CustomerRecord | None: ...
+
+    async def find(self, customer_id: str) -> CustomerRecord | None: ...
+
+    async def put(self, record: CustomerRecord) -> bool:
+        """Map the record's organization and customer; False if dropped"""
+        ...
+
+    async def delete(self, customer_id: str, version: int) -> str | None:
+        """
+        Remove a customer and keep a tombstone for it.
+
+        Returns the organization it was mapped to.
+        """
+        ...
+
+
+# ── Memory ───────────────────────────────────────────────────────────────────
+
+
+class MemoryCustomerStore:
+    """Per-process store, for development and tests"""
+
+    def __init__(self):
+        self._by_org: dict[str, CustomerRecord] = {}
+        self._org_by_customer: dict[str, str] = {}
+        # Deleted customer → version of the deletion
+        self._deleted: dict[str, int] = {}
+        register_store("billing.stripe_customers", self._by_org)
+        register_store("billing.stripe_customer_tombstones", self._deleted)
+
+    async def get(self, organization_id: str) -> CustomerRecord | None:
+        return self._by_org.get(organization_id)
+
+    async def find(self, customer_id: str) -> CustomerRecord | None:
+        organization_id = self._org_by_customer.get(customer_id)
+        return self._by_org.get(organization_id) if organization_id else None
+
+    async def put(self, record: CustomerRecord) -> bool:
+        if record.customer_id in self._deleted:
+            return False
+        # One customer per organization and one organization per customer
+        previous = self._by_org.get(record.organization_id)
+        moved_from = self._org_by_customer.get(record.customer_id)
+        moved = self._by_org.get(moved_from) if moved_from is not None else None
+        if not (record.supersedes(previous) and record.supersedes(moved)):
+            return False
+        if previous is not None:
+            self._org_by_customer.pop(previous.customer_id, None)
+        if moved_from is not None and moved_from != record.organization_id:
+            self._by_org.pop(moved_from, None)
+        self._by_org[record.organization_id] = record
+        self._org_by_customer[record.customer_id] = record.organization_id
+        return True
+
+    async def delete(self, customer_id: str, version: int) -> str | None:
+        self._deleted[customer_id] = max(self._deleted.get(customer_id, 0), version)
+        organization_id = self._org_by_customer.pop(customer_id, None)
+        if organization_id is not None:
+            self._by_org.pop(organization_id, None)
+        return organization_id
+
+
+# ── Supabase ─────────────────────────────────────────────────────────────────
+
+
+class SupabaseCustomerStore:
+    """
+    The stripe_customers table via Supabase.
+
+    Writes go through upsert_stripe_customer() and delete_stripe_customer(),
+    which keep organization_id and stripe_id unique and apply the ordering
+    rule and tombstones in SQL, so concurrent writers cannot regress a row.
+    The synchronous client runs in a thread.
+    """
+
+    def __init__(self, client=None):
+        if client is None:
+            from utils.supabase_client import get_supabase_client
+
+            client = get_supabase_client()
+        self.client = client
+
+    async def get(self, organization_id: str) -> CustomerRecord | None:
+        return await self._get_one("organization_id", organization_id)
+
+    async def find(self, customer_id: str) -> CustomerRecord | None:
+        return await self._get_one("stripe_id", customer_id)
+
+    async def _get_one(self, column: str, value: str) -> CustomerRecord | None:
+        result = await asyncio.to_thread(
+            self.client.table("stripe_customers")
+            .select("organization_id, stripe_id, email, name, version")
+            .eq(column, value)
+            .limit(1)
+            .execute
+        )
+        if not result.data:
+            return None
+        row = result.data[0]
+        return CustomerRecord(
+            organization_id=row["organization_id"],
+            customer_id=row["stripe_id"],
+            email=row.get("email"),
+            name=row.get("name"),
+            version=row.get("version") or 0,
+        )
+
+    async def put(self, record: CustomerRecord) -> bool:
+        result = await asyncio.to_thread(
+            self.client.rpc(
+                "upsert_stripe_customer",
+                {
+                    "p_organization_id": record.organization_id,
+                    "p_stripe_id": record.customer_id,
+                    "p_email": record.email,
+                    "p_name": record.name,
+                    "p_version": record.version,
+                },
+            ).execute
+        )
+        return bool(result.data)
+
+    async def delete(self, customer_id: str, version: int) -> str | None:
+        result = await asyncio.to_thread(
+            self.client.rpc(
+                "delete_stripe_customer",
+                {"p_stripe_id": customer_id, "p_version": version},
+            ).execute
+        )
+        return result.data or None
+
+
+# ── Index ────────────────────────────────────────────────────────────────────
+
+
+class CustomerIndex:
+    """
+    LRU in front of a CustomerStore, with a coalesced fallback search.
+
+    Args:
+        store: Persisted mapping.
+        max_entries: Organizations kept in the LRU.
+        ttl: Seconds a cached mapping is trusted.
+    """
+
+    def __init__(
+        self,
+        store: CustomerStore,
+        max_entries: int = DEFAULT_CACHE_SIZE,
+        ttl: float = DEFAULT_CACHE_TTL,
+    ):
+        self.store = store
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # organization → (valid until, record or None for "no customer")
+        self._cache: OrderedDict[str, tuple[float, CustomerRecord | None]] = (
+            OrderedDict()
+        )
+        self._searches = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.searches = 0
+        register_store("billing.customer_cache", self._cache)
+
+    def _cached(self, organization_id: str) -> tuple[bool, CustomerRecord | None]:
+        entry = self._cache.get(organization_id)
+        if entry is None or entry[0] < time.monotonic():
+            return False, None
+        self._cache.move_to_end(organization_id)
+        return True, entry[1]
+
+    def _remember(
+        self, organization_id: str, record: CustomerRecord | None, ttl: float
+    ) -> None:
+        self._cache[organization_id] = (time.monotonic() + ttl, record)
+        self._cache.move_to_end(organization_id)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    async def lookup(
+        self,
+        organization_id: str,
+        search: Callable[[], Awaitable[CustomerRecord | None]],
+    ) -> CustomerRecord | None:
+        """
+        Customer for an organization: LRU, then the store, then `search`.
+
+        `search` runs at most once at a time per organization; a record it
+        finds is written to the store.
+        """
+        found, record = self._cached(organization_id)
+        if found:
+            self.hits += 1
+            return record
+        self.misses += 1
+        return await self._searches.do(
+            organization_id, lambda: self._load(organization_id, search)
+        )
+
+    async def _load(
+        self,
+        organization_id: str,
+        search: Callable[[], Awaitable[CustomerRecord | None]],
+    ) -> CustomerRecord | None:
+        record = await self.store.get(organization_id)
+        if record is None:
+            self.searches += 1
+            # Writes made after the search started win over what it finds
+            version = int(time.time())
+            record = await search()
+            if record is not None:
+                record = replace(record, version=version)
+                if await self.store.put(record):
+                    logger.info(
+                        "customer_index_backfilled",
+                        organization_id=organization_id,
+                        customer_id=record.customer_id,
+                    )
+                else:
+                    # A newer write or a deletion landed meanwhile
+                    record = await self.store.get(organization_id)
+        self._remember(
+            organization_id, record, self.ttl if record is not None else NEGATIVE_TTL
+        )
+        return record
+
+    async def put(self, record: CustomerRecord) -> bool:
+        """
+        Map an organization to a customer (customer created or updated).
+
+        Returns False when the write was older than the mapping it would
+        replace, or the customer was deleted, and so was dropped.
+        """
+        if not await self.store.put(record):
+            logger.info(
+                "customer_index_stale_write",
+                organization_id=record.organization_id,
+                customer_id=record.customer_id,
+                version=record.version,
+            )
+            return False
+        # The customer may have belonged to another organization before
+        for organization_id, (_, cached) in list(self._cache.items()):
+            if (
+                cached is not None
+                and cached.customer_id == record.customer_id
+                and organization_id != record.organization_id
+            ):
+                del self._cache[organization_id]
+        self._remember(record.organization_id, record, self.ttl)
+        return True
+
+    async def organization_for(self, customer_id: str) -> str | None:
+        """Organization a customer is mapped to (store read, no search)"""
+        record = await self.store.find(customer_id)
+        return record.organization_id if record else None
+
+    async def remove(self, customer_id: str, version: int) -> str | None:
+        """Unmap a deleted customer; returns its organization, if it was mapped"""
+        organization_id = await self.store.delete(customer_id, version)
+        for cached_org, (_, cached) in list(self._cache.items()):
+            if cached is not None and cached.customer_id == customer_id:
+                del self._cache[cached_org]
+        return organization_id
+
+
+_index: CustomerIndex | None = None
+
+
+def get_customer_index() -> CustomerIndex:
+    """Get the process-wide customer index"""
+    global _index
+
+    if _index is None:
+        store = (
+            SupabaseCustomerStore()
+            if settings.CUSTOMER_INDEX_BACKEND == "supabase"
+            else MemoryCustomerStore()
+        )
+        _index = CustomerIndex(
+            store,
+            max_entries=settings.CUSTOMER_CACHE_SIZE,
+            ttl=settings.CUSTOMER_CACHE_TTL,
+        )
+
+    return _index
@@ -0,0 +1,178 @@
+"""
+Entitlement Cache
+
+In-process snapshots of what each organization is entitled to, so hot
+checks (has_feature, check_limit) are a dict lookup instead of a Redis GET
+and a JSON decode of the full plan config.
+
+A snapshot is two flat maps, feature → enabled and limit → value, built
+once from a resolved config. Invalidations are published on a Redis
+channel. Every replica subscribes, so a plan or override change made on
+one replica evicts the snapshot everywhere. Messages sent while a replica
+was not subscribed are lost, so it drops every snapshot each time it
+(re)subscribes. Snapshots also expire after a TTL, which bounds staleness
+if the channel stops delivering without an error.
+
+A snapshot being built while an invalidation arrives is not cached, so a
+read that raced the change cannot outlive it.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+
+import structlog
+
+from _shared.memory import register_store
+from app.config import settings
+from utils.redis_client import get_redis_client
+
+logger = structlog.get_logger()
+
+CHANNEL = "billing:config:invalidate"
+# Message meaning "every organization" (plans changed)
+ALL = "*"
+DEFAULT_CACHE_SIZE = 10_000
+DEFAULT_CACHE_TTL = 60.0  # seconds
+RESUBSCRIBE_DELAY = 1.0  # seconds
+
+
+@dataclass(frozen=True, slots=True)
+class Entitlements:
+    """An organization's effective features and limits"""
+
+    features: dict[str, bool]
+    limits: dict[str, int]  # -1 = unlimited
+
+
+class EntitlementCache:
+    """
+    LRU of per-organization Entitlements, invalidated over Redis pub/sub.
+
+    Args:
+        redis: Client used to publish and receive invalidations; without
+            one, invalidations only apply to this process.
+        max_entries: Organizations kept.
+        ttl: Seconds a snapshot is trusted.
+    """
+
+    def __init__(
+        self,
+        redis=None,
+        max_entries: int = DEFAULT_CACHE_SIZE,
+        ttl: float = DEFAULT_CACHE_TTL,
+    ):
+        self.redis = redis
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # organization → (valid until, snapshot)
+        self._cache: OrderedDict[str, tuple[float, Entitlements]] = OrderedDict()
+        # Bumped by every invalidation; see put()
+        self.generation = 0
+        self._task: asyncio.Task | None = None
+        self._clear_callbacks: list[Callable[[], None]] = []
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        register_store("billing.entitlements", self._cache)
+
+    def get(self, organization_id: str) -> Entitlements | None:
+        entry = self._cache.get(organization_id)
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._cache.move_to_end(organization_id)
+        return entry[1]
+
+    def put(
+        self, organization_id: str, entitlements: Entitlements, generation: int
+    ) -> None:
+        """
+        Cache a snapshot built after reading `generation`.
+
+        Dropped if an invalidation arrived since, because the snapshot may
+        predate the change.
+        """
+        if generation != self.generation:
+            return
+        self._cache[organization_id] = (time.monotonic() + self.ttl, entitlements)
+        self._cache.move_to_end(organization_id)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def on_clear(self, callback: Callable[[], None]) -> None:
+        """Also call `callback` whenever every organization is evicted"""
+        self._clear_callbacks.append(callback)
+
+    def drop(self, organization_id: str) -> None:
+        """Evict one organization (or ALL) from this process only"""
+        self.generation += 1
+        self.invalidations += 1
+        if organization_id == ALL:
+            self._cache.clear()
+            for callback in self._clear_callbacks:
+                callback()
+        else:
+            self._cache.pop(organization_id, None)
+
+    async def invalidate(self, organization_id: str = ALL) -> None:
+        """Evict an organization (default: every one) on every replica"""
+        self.drop(organization_id)
+        if self.redis:
+            await self.redis.publish(CHANNEL, organization_id)
+
+    # ── Subscriber ───────────────────────────────────────────────────────────
+
+    def start(self) -> None:
+        """Apply invalidations published by other replicas"""
+        if self._task is None and self.redis:
+            self._task = asyncio.create_task(
+                self._listen(), name="entitlement-invalidation"
+            )
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(CHANNEL)
+                # Anything published while unsubscribed was missed
+                self.drop(ALL)
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    data = message["data"]
+                    self.drop(data.decode() if isinstance(data, bytes) else data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("entitlement_invalidation_failed", error=str(e))
+            finally:
+                await pubsub.aclose()
+            await asyncio.sleep(RESUBSCRIBE_DELAY)
+
+    async def close(self) -> None:
+        """Stop listening (a shutdown hook)"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+_cache: EntitlementCache | None = None
+
+
+def get_entitlement_cache() -> EntitlementCache:
+    """Get the process-wide entitlement cache"""
+    global _cache
+
+    if _cache is None:
+        _cache = EntitlementCache(
+            get_redis_client(),
+            max_entries=settings.ENTITLEMENT_CACHE_SIZE,
+            ttl=settings.ENTITLEMENT_CACHE_TTL,
+        )
+
+    return _cache
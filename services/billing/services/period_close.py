@@ -0,0 +1,140 @@
+"""
+Period Close
+
+Overage and invoice line items for every organization at the end of a
+billing period, computed in one vectorized pass.
+
+get_usage works out overage one organization and one usage type at a time,
+so closing a period that way costs orgs x types Python operations. Here
+usage is held as an (organizations, USAGE_TYPES) int64 matrix, each
+organization's plan limits are gathered into a matrix of the same shape,
+and overage and cost come out of a few NumPy operations. Only cells with
+an overage become Python objects (InvoiceLine).
+
+The arithmetic is get_usage's: a limit of -1 (unlimited) or 0 has no
+overage, and cost is overage * OVERAGE_PRICING. Loading the counters is
+UsageService.close_period.
+"""
+
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+import numpy as np
+
+from services.usage_service import OVERAGE_PRICING, PLAN_LIMITS
+
+USAGE_TYPES = tuple(PLAN_LIMITS["FREE"])
+PLANS = tuple(PLAN_LIMITS)
+
+_PLAN_INDEX = {plan: index for index, plan in enumerate(PLANS)}
+# Limits by plan (rows) and usage type (columns); prices by usage type
+_LIMITS = np.array(
+    [[PLAN_LIMITS[plan].get(t, 0) for t in USAGE_TYPES] for plan in PLANS],
+    dtype=np.int64,
+)
+_PRICES = np.array([OVERAGE_PRICING.get(t, 0.0) for t in USAGE_TYPES])
+
+
+@dataclass(slots=True)
+class InvoiceLine:
+    """One organization's overage of one usage type"""
+
+    organization_id: str
+    usage_type: str
+    quantity: int  # units over the limit
+    unit_price: float  # USD
+    amount: float  # USD, as get_usage's overage_cost
+    amount_cents: int  # rounded, for Stripe invoice items
+
+
+@dataclass
+class PeriodUsage:
+    """
+    A period's usage, one row per organization.
+
+    `plans` holds an index into PLANS per organization; `usage` has one
+    column per USAGE_TYPES entry.
+    """
+
+    period: str
+    organization_ids: list[str]
+    plans: np.ndarray
+    usage: np.ndarray
+
+    @classmethod
+    def from_counters(
+        cls,
+        period: str,
+        organization_ids: list[str],
+        plans: Sequence[str],
+        counters: Sequence[int],
+    ) -> "PeriodUsage":
+        """
+        Build from plan names and counters flattened row by row.
+
+        Unknown plans are billed as FREE, like everywhere else in billing.
+        """
+        free = _PLAN_INDEX["FREE"]
+        return cls(
+            period=period,
+            organization_ids=organization_ids,
+            plans=np.fromiter(
+                (_PLAN_INDEX.get(plan, free) for plan in plans),
+                dtype=np.intp,
+                count=len(organization_ids),
+            ),
+            usage=np.asarray(counters, dtype=np.int64).reshape(
+                len(organization_ids), len(USAGE_TYPES)
+            ),
+        )
+
+
+@dataclass
+class PeriodCloseResult:
+    """Per organization and usage type overage, and what it costs"""
+
+    period: str
+    organization_ids: list[str]
+    usage: np.ndarray
+    limits: np.ndarray
+    overage: np.ndarray
+    cost: np.ndarray
+    totals: np.ndarray  # cost per organization
+
+    def line_items(self) -> list[InvoiceLine]:
+        """Invoice lines for every non-zero overage, by organization"""
+        rows, columns = np.nonzero(self.overage)
+        amounts = self.cost[rows, columns]
+        cents = np.rint(amounts * 100).astype(np.int64)
+        # Built positionally from plain lists: this is the one per-line step
+        return list(
+            map(
+                InvoiceLine,
+                map(self.organization_ids.__getitem__, rows.tolist()),
+                map(USAGE_TYPES.__getitem__, columns.tolist()),
+                self.overage[rows, columns].tolist(),
+                _PRICES[columns].tolist(),
+                amounts.tolist(),
+                cents.tolist(),
+            )
+        )
+
+    @property
+    def total_amount(self) -> float:
+        return float(self.totals.sum())
+
+
+def compute_overage(usage: PeriodUsage) -> PeriodCloseResult:
+    """Overage and cost for every organization and usage type at once"""
+    limits = _LIMITS[usage.plans]
+    overage = np.where(limits > 0, np.maximum(usage.usage - limits, 0), 0)
+    cost = overage * _PRICES
+    return PeriodCloseResult(
+        period=usage.period,
+        organization_ids=usage.organization_ids,
+        usage=usage.usage,
+        limits=limits,
+        overage=overage,
+        cost=cost,
+        totals=cost.sum(axis=1),
+    )
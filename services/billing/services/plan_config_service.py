@@ -6,16 +6,84 @@ Supports:
 - Dynamic plan/feature/limit configuration
 - Customer-level overrides
 - Plan versioning (grandfathering)
+
+On a cache miss the organization's four lookups (subscription, plan
+version, feature overrides, limit overrides) run concurrently in threads,
+so a miss costs about one Supabase round trip instead of six. Plan rows
+are shared by every organization and change rarely, so they are kept in
+an in-process cache; the dependent plan lookup is usually a dict hit.
+That cache is emptied with every all-organization entitlement eviction,
+which is how invalidate_plans on one replica reaches the others.
+Concurrent misses for the same organization share one resolution.
+Batch jobs resolve many organizations with get_configs, which does each of
+those steps once for the whole batch.
+
+Feature and limit checks read an in-process entitlement snapshot (see
+entitlement_cache), so a hot check does no I/O. invalidate_org and
+invalidate_plans evict snapshots on every replica over Redis pub/sub.
+
+Redis entries live under a generation number (billing:config:g<n>:...).
+invalidate_plans is a single INCR of the generation, never a KEYS scan;
+the previous generation's entries are no longer read and age out by TTL.
+Each replica keeps the generation for a few seconds, and rereads it after
+any entitlement invalidation, which is how it hears of another replica's
+INCR.
+
+config_version changes with the generation and with every entitlement
+invalidation this process applies; it versions the config route's ETag.
 """
 
+import asyncio
 import json
+import time
+import uuid
+from collections.abc import Callable
 from dataclasses import dataclass
 from datetime import datetime
 from typing import Any, Optional
 
+from _shared.memory import register_store
+from _shared.singleflight import SingleFlight
 from utils.redis_client import get_redis_client
 from utils.supabase_client import get_supabase_client
 
+from .entitlement_cache import (
+    ALL,
+    EntitlementCache,
+    Entitlements,
+    get_entitlement_cache,
+)
+
+PLAN_SELECT = (
+    "*, plan_features(*, feature:feature_definitions(*)), "
+    "plan_limits:plan_usage_limits(*, limit_def:usage_limit_definitions(*))"
+)
+
+# Fallback when the database has no active FREE plan
+DEFAULT_FREE_PLAN = {
+    "id": "default-free",
+    "slug": "free",
+    "name": "Free",
+    "plan": "FREE",
+    "version": "v1",
+    "interval": "MONTHLY",
+    "amount": 0,
+    "currency": "USD",
+    "trial_days": 0,
+    "is_active": True,
+    "plan_features": [],
+    "plan_limits": [],
+}
+
+# Key of the free plan in the in-process plan cache
+_FREE_PLAN = "__free__"
+
+# Organizations per `in_()` query in get_configs
+BULK_BATCH_SIZE = 100
+
+# How long a replica trusts its copy of the cache generation
+GENERATION_TTL = 5.0  # seconds
+
 
 @dataclass
 class FeatureValue:
@@ -61,21 +129,39 @@ class PlanConfigService:
 
     _instance: Optional["PlanConfigService"] = None
 
-    def __init__(self, cache_ttl: int = 300):
-        self.supabase = get_supabase_client()
-        self.redis = get_redis_client()
+    def __init__(
+        self,
+        cache_ttl: int = 300,
+        supabase=None,
+        redis=None,
+        entitlements: EntitlementCache | None = None,
+    ):
+        self.supabase = supabase or get_supabase_client()
+        self.redis = redis or get_redis_client()
+        self.entitlements = entitlements or EntitlementCache(self.redis)
         self.cache_ttl = cache_ttl
         self.cache_prefix = "billing:config:"
+        self.generation_key = f"{self.cache_prefix}generation"
+        # (valid until, entitlement generation when read, key namespace)
+        self._namespace_cache: tuple[float, int, str] | None = None
+        # Versions from a restarted process never match its predecessor's
+        self._boot = uuid.uuid4().hex[:8]
+        # plan id → (valid until, plan row with features and limits)
+        self._plans: dict[str, tuple[float, dict]] = {}
+        self._resolving = SingleFlight()
+        register_store("billing.plan_rows", self._plans)
+        # A plan change on any replica reaches this one as an ALL eviction
+        self.entitlements.on_clear(self._plans.clear)
 
     @classmethod
     def get_instance(cls) -> "PlanConfigService":
         if cls._instance is None:
-            cls._instance = cls()
+            cls._instance = cls(entitlements=get_entitlement_cache())
         return cls._instance
 
     async def get_config(self, organization_id: str) -> ResolvedConfig:
         """Get resolved configuration for an organization"""
-        cache_key = f"{self.cache_prefix}org:{organization_id}"
+        cache_key = f"{await self._namespace()}org:{organization_id}"
 
         # Try cache first
         if self.redis:
@@ -83,34 +169,157 @@ class PlanConfigService:
             if cached:
                 return self._deserialize_config(json.loads(cached))
 
-        # Get organization's subscription
-        subscription = await self._get_subscription(organization_id)
+        return await self._resolving.do(
+            organization_id, lambda: self._resolve(organization_id, cache_key)
+        )
 
-        # Check for grandfathered plan version
-        plan_version = await self._get_customer_plan_version(organization_id)
+    async def _resolve(self, organization_id: str, cache_key: str) -> ResolvedConfig:
+        """Build an organization's config from the database and cache it"""
+        # Independent lookups, concurrently
+        (
+            subscription,
+            plan_version,
+            feature_overrides,
+            limit_overrides,
+        ) = await asyncio.gather(
+            self._get_subscription(organization_id),
+            self._get_customer_plan_version(organization_id),
+            self._get_feature_overrides(organization_id),
+            self._get_limit_overrides(organization_id),
+        )
 
-        # Determine effective plan
-        effective_plan = None
-        if plan_version and (
-            not plan_version.get("expires_at")
-            or datetime.fromisoformat(plan_version["expires_at"]) > datetime.now()
-        ):
-            effective_plan = await self._get_plan_by_id(plan_version["plan_id"])
-        elif subscription:
-            effective_plan = await self._get_plan_by_id(subscription["pricing_plan_id"])
+        plan_id = self._effective_plan_id(subscription, plan_version)
+        effective_plan = await self._get_plan_by_id(plan_id) if plan_id else None
 
         # Default to free plan
         if not effective_plan:
             effective_plan = await self._get_free_plan()
 
+        config = self._build_config(
+            effective_plan, plan_version, feature_overrides, limit_overrides
+        )
+
+        # Cache result
+        if self.redis:
+            await self.redis.set(
+                cache_key, json.dumps(self._serialize_config(config)), ex=self.cache_ttl
+            )
+
+        return config
+
+    async def get_configs(
+        self, organization_ids: list[str]
+    ) -> dict[str, ResolvedConfig]:
+        """
+        Resolved configurations for many organizations, keyed by organization.
+
+        For batch jobs. Each stage costs a fixed number of round trips
+        whatever the count: one MGET for cached configs, the four
+        organization lookups as `in_()` queries (concurrently, per
+        BULK_BATCH_SIZE organizations), one query for the plans not already
+        cached, and one pipelined write-back of what was resolved.
+        """
+        organization_ids = list(dict.fromkeys(organization_ids))
+        configs: dict[str, ResolvedConfig] = {}
+        if not organization_ids:
+            return configs
+
+        namespace = await self._namespace()
+        if self.redis:
+            cached = await self.redis.mget(
+                [f"{namespace}org:{org}" for org in organization_ids]
+            )
+            for organization_id, data in zip(organization_ids, cached, strict=True):
+                if data:
+                    configs[organization_id] = self._deserialize_config(
+                        json.loads(data)
+                    )
+
+        missing = [org for org in organization_ids if org not in configs]
+        if not missing:
+            return configs
+
+        (
+            subscriptions,
+            plan_versions,
+            feature_overrides,
+            limit_overrides,
+        ) = await asyncio.gather(
+            self._select_for_organizations(
+                "subscriptions",
+                "*",
+                missing,
+                lambda q: q.in_("status", ["ACTIVE", "TRIALING"]).order(
+                    "created_at", desc=True
+                ),
+            ),
+            self._select_for_organizations("customer_plan_versions", "*", missing),
+            self._select_for_organizations("customer_feature_overrides", "*", missing),
+            self._select_for_organizations(
+                "customer_usage_limits",
+                "*, limit_def:usage_limit_definitions(*)",
+                missing,
+            ),
+        )
+
+        plan_ids = {}
+        for organization_id in missing:
+            plan_ids[organization_id] = self._effective_plan_id(
+                next(iter(subscriptions.get(organization_id, [])), None),
+                next(iter(plan_versions.get(organization_id, [])), None),
+            )
+        plans, free_plan = await asyncio.gather(
+            self._get_plans_by_id({p for p in plan_ids.values() if p}),
+            self._get_free_plan(),
+        )
+
+        resolved = {}
+        for organization_id in missing:
+            resolved[organization_id] = self._build_config(
+                plans.get(plan_ids[organization_id]) or free_plan,
+                next(iter(plan_versions.get(organization_id, [])), None),
+                self._unexpired(feature_overrides.get(organization_id, [])),
+                self._unexpired(limit_overrides.get(organization_id, [])),
+            )
+
+        if self.redis:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for organization_id, config in resolved.items():
+                    pipe.set(
+                        f"{namespace}org:{organization_id}",
+                        json.dumps(self._serialize_config(config)),
+                        ex=self.cache_ttl,
+                    )
+                await pipe.execute()
+
+        configs.update(resolved)
+        return configs
+
+    def _effective_plan_id(
+        self, subscription: dict | None, plan_version: dict | None
+    ) -> str | None:
+        """A pinned, unexpired plan version wins over the subscription's plan"""
+        if plan_version and (
+            not plan_version.get("expires_at")
+            or datetime.fromisoformat(plan_version["expires_at"]) > datetime.now()
+        ):
+            return plan_version["plan_id"]
+        if subscription:
+            return subscription["pricing_plan_id"]
+        return None
+
+    def _build_config(
+        self,
+        effective_plan: dict,
+        plan_version: dict | None,
+        feature_overrides: list[dict],
+        limit_overrides: list[dict],
+    ) -> ResolvedConfig:
         # Build base config
         features = self._build_features(effective_plan)
         limits = self._build_limits(effective_plan)
 
         # Apply customer overrides
-        feature_overrides = await self._get_feature_overrides(organization_id)
-        limit_overrides = await self._get_limit_overrides(organization_id)
-
         overridden_features = []
         for override in feature_overrides:
             features[override["feature_key"]] = FeatureValue(
@@ -133,7 +342,7 @@ class PlanConfigService:
             )
             overridden_limits.append(limit_def.get("key", ""))
 
-        config = ResolvedConfig(
+        return ResolvedConfig(
             plan=self._format_plan_config(effective_plan),
             features=features,
             limits=limits,
@@ -144,19 +353,11 @@ class PlanConfigService:
             },
         )
 
-        # Cache result
-        if self.redis:
-            await self.redis.set(
-                cache_key, json.dumps(self._serialize_config(config)), ex=self.cache_ttl
-            )
-
-        return config
-
     async def get_plan(
         self, slug: str, version: str | None = None
     ) -> PlanConfig | None:
         """Get plan by slug"""
-        cache_key = f"{self.cache_prefix}plan:{slug}:{version or 'latest'}"
+        cache_key = f"{await self._namespace()}plan:{slug}:{version or 'latest'}"
 
         if self.redis:
             cached = await self.redis.get(cache_key)
@@ -180,7 +381,8 @@ class PlanConfigService:
 
     async def get_plans(self, public_only: bool = True) -> list[PlanConfig]:
         """Get all active plans"""
-        cache_key = f"{self.cache_prefix}plans:{'public' if public_only else 'all'}"
+        namespace = await self._namespace()
+        cache_key = f"{namespace}plans:{'public' if public_only else 'all'}"
 
         if self.redis:
             cached = await self.redis.get(cache_key)
@@ -189,16 +391,14 @@ class PlanConfigService:
 
         query = (
             self.supabase.table("pricing_plans")
-            .select(
-                "*, plan_features(*, feature:feature_definitions(*)), plan_limits:plan_usage_limits(*, limit_def:usage_limit_definitions(*))"  # noqa: E501
-            )
+            .select(PLAN_SELECT)
             .eq("is_active", True)
         )
 
         if public_only:
             query = query.eq("is_public", True)
 
-        result = query.execute()
+        result = await asyncio.to_thread(query.execute)
         plans = result.data or []
 
         # Deduplicate by slug
@@ -218,11 +418,25 @@ class PlanConfigService:
 
         return configs
 
+    async def get_entitlements(self, organization_id: str) -> Entitlements:
+        """Flat feature and limit maps for an organization, cached in process"""
+        entitlements = self.entitlements.get(organization_id)
+        if entitlements is not None:
+            return entitlements
+
+        generation = self.entitlements.generation
+        config = await self.get_config(organization_id)
+        entitlements = Entitlements(
+            features={k: v.enabled for k, v in config.features.items()},
+            limits={k: v.limit for k, v in config.limits.items()},
+        )
+        self.entitlements.put(organization_id, entitlements, generation)
+        return entitlements
+
     async def has_feature(self, organization_id: str, feature_key: str) -> bool:
         """Check if organization has feature access"""
-        config = await self.get_config(organization_id)
-        feature = config.features.get(feature_key)
-        return feature.enabled if feature else False
+        entitlements = await self.get_entitlements(organization_id)
+        return entitlements.features.get(feature_key, False)
 
     async def get_limit(
         self, organization_id: str, limit_key: str
@@ -239,9 +453,10 @@ class PlanConfigService:
         additional_usage: int = 0,
     ) -> dict:
         """Check if usage is within limits"""
-        limit_config = await self.get_limit(organization_id, limit_key)
+        entitlements = await self.get_entitlements(organization_id)
+        limit = entitlements.limits.get(limit_key)
 
-        if not limit_config:
+        if limit is None:
             return {
                 "allowed": False,
                 "limit": 0,
@@ -251,7 +466,7 @@ class PlanConfigService:
             }
 
         # -1 means unlimited
-        if limit_config.limit == -1:
+        if limit == -1:
             return {
                 "allowed": True,
                 "limit": -1,
@@ -260,78 +475,176 @@ class PlanConfigService:
                 "would_exceed": False,
             }
 
-        remaining = limit_config.limit - current_usage
-        would_exceed = current_usage + additional_usage > limit_config.limit
+        remaining = limit - current_usage
+        would_exceed = current_usage + additional_usage > limit
 
         return {
             "allowed": not would_exceed,
-            "limit": limit_config.limit,
+            "limit": limit,
             "current": current_usage,
             "remaining": max(0, remaining),
             "would_exceed": would_exceed,
         }
 
+    async def config_version(self) -> str:
+        """
+        Version of every organization's config as seen by this process.
+
+        Changes on any invalidation, so it may change when a config did not.
+        It also rolls over every cache_ttl, as cached configs do, so expiring
+        overrides are not pinned by a client's ETag.
+        """
+        seen = self.entitlements.generation
+        window = int(time.time() // self.cache_ttl)
+        return f"{await self._namespace()}{self._boot}.{seen}.{window}"
+
     async def invalidate_org(self, organization_id: str) -> None:
         """Invalidate cache for organization"""
         if self.redis:
-            cache_key = f"{self.cache_prefix}org:{organization_id}"
+            cache_key = f"{await self._namespace()}org:{organization_id}"
             await self.redis.delete(cache_key)
+        await self.entitlements.invalidate(organization_id)
 
     async def invalidate_plans(self) -> None:
         """Invalidate all plan caches"""
+        self._plans.clear()
         if self.redis:
-            keys = await self.redis.keys(f"{self.cache_prefix}plan:*")
-            if keys:
-                await self.redis.delete(*keys)
-            await self.redis.delete(f"{self.cache_prefix}plans:public")
-            await self.redis.delete(f"{self.cache_prefix}plans:all")
+            # Organization configs embed plan rows, so they move on too
+            await self.redis.incr(self.generation_key)
+            self._namespace_cache = None
+        await self.entitlements.invalidate(ALL)
 
     # ============================================
     # Private Methods
     # ============================================
 
+    async def _namespace(self) -> str:
+        """Key prefix of the current cache generation"""
+        seen = self.entitlements.generation
+        cached = self._namespace_cache
+        if cached is not None and cached[0] > time.monotonic() and cached[1] == seen:
+            return cached[2]
+
+        generation = 0
+        if self.redis:
+            generation = int(await self.redis.get(self.generation_key) or 0)
+        namespace = f"{self.cache_prefix}g{generation}:"
+        self._namespace_cache = (time.monotonic() + GENERATION_TTL, seen, namespace)
+        return namespace
+
     async def _get_subscription(self, organization_id: str) -> dict | None:
-        result = (
+        result = await asyncio.to_thread(
             self.supabase.table("subscriptions")
             .select("*")
             .eq("organization_id", organization_id)
             .in_("status", ["ACTIVE", "TRIALING"])
             .order("created_at", desc=True)
             .limit(1)
-            .execute()
+            .execute
         )
         return result.data[0] if result.data else None
 
     async def _get_customer_plan_version(self, organization_id: str) -> dict | None:
-        result = (
+        result = await asyncio.to_thread(
             self.supabase.table("customer_plan_versions")
             .select("*")
             .eq("organization_id", organization_id)
             .limit(1)
-            .execute()
+            .execute
         )
         return result.data[0] if result.data else None
 
+    def _cached_plan(self, key: str) -> dict | None:
+        entry = self._plans.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def _cache_plan(self, key: str, plan: dict) -> None:
+        self._plans[key] = (time.monotonic() + self.cache_ttl, plan)
+
     async def _get_plan_by_id(self, plan_id: str) -> dict | None:
-        result = (
+        plan = self._cached_plan(plan_id)
+        if plan is not None:
+            return plan
+
+        result = await asyncio.to_thread(
             self.supabase.table("pricing_plans")
-            .select(
-                "*, plan_features(*, feature:feature_definitions(*)), plan_limits:plan_usage_limits(*, limit_def:usage_limit_definitions(*))"  # noqa: E501
-            )
+            .select(PLAN_SELECT)
             .eq("id", plan_id)
             .limit(1)
-            .execute()
+            .execute
         )
-        return result.data[0] if result.data else None
+        if not result.data:
+            return None
+        self._cache_plan(plan_id, result.data[0])
+        return result.data[0]
+
+    async def _get_plans_by_id(self, plan_ids: set[str]) -> dict[str, dict]:
+        plans = {}
+        for plan_id in plan_ids:
+            plan = self._cached_plan(plan_id)
+            if plan is not None:
+                plans[plan_id] = plan
+
+        uncached = sorted(plan_ids - plans.keys())
+        if uncached:
+            result = await asyncio.to_thread(
+                self.supabase.table("pricing_plans")
+                .select(PLAN_SELECT)
+                .in_("id", uncached)
+                .execute
+            )
+            for plan in result.data or []:
+                self._cache_plan(plan["id"], plan)
+                plans[plan["id"]] = plan
+        return plans
+
+    async def _select_for_organizations(
+        self,
+        table: str,
+        columns: str,
+        organization_ids: list[str],
+        refine: Callable | None = None,
+    ) -> dict[str, list[dict]]:
+        """Rows of `table` for many organizations, grouped by organization"""
+
+        async def select(batch: list[str]) -> list[dict]:
+            query = (
+                self.supabase.table(table).select(columns).in_("organization_id", batch)
+            )
+            if refine is not None:
+                query = refine(query)
+            result = await asyncio.to_thread(query.execute)
+            return result.data or []
+
+        # The ids go in the request URL, so large lists are split
+        batches = await asyncio.gather(
+            *(
+                select(organization_ids[i : i + BULK_BATCH_SIZE])
+                for i in range(0, len(organization_ids), BULK_BATCH_SIZE)
+            )
+        )
+        rows: dict[str, list[dict]] = {}
+        for batch in batches:
+            for row in batch:
+                rows.setdefault(row["organization_id"], []).append(row)
+        return rows
+
+    def _unexpired(self, overrides: list[dict]) -> list[dict]:
+        now = datetime.now()
+        return [
+            o
+            for o in overrides
+            if not o.get("expires_at") or datetime.fromisoformat(o["expires_at"]) > now
+        ]
 
     async def _get_plan_by_slug(
         self, slug: str, version: str | None = None
     ) -> dict | None:
         query = (
             self.supabase.table("pricing_plans")
-            .select(
-                "*, plan_features(*, feature:feature_definitions(*)), plan_limits:plan_usage_limits(*, limit_def:usage_limit_definitions(*))"  # noqa: E501
-            )
+            .select(PLAN_SELECT)
             .eq("slug", slug)
             .eq("is_active", True)
         )
@@ -339,70 +652,48 @@ class PlanConfigService:
         if version:
             query = query.eq("version", version)
 
-        result = query.order("effective_from", desc=True).limit(1).execute()
+        result = await asyncio.to_thread(
+            query.order("effective_from", desc=True).limit(1).execute
+        )
         return result.data[0] if result.data else None
 
     async def _get_free_plan(self) -> dict:
-        result = (
+        plan = self._cached_plan(_FREE_PLAN)
+        if plan is not None:
+            return plan
+
+        result = await asyncio.to_thread(
             self.supabase.table("pricing_plans")
-            .select(
-                "*, plan_features(*, feature:feature_definitions(*)), plan_limits:plan_usage_limits(*, limit_def:usage_limit_definitions(*))"  # noqa: E501
-            )
+            .select(PLAN_SELECT)
             .eq("plan", "FREE")
             .eq("is_active", True)
             .limit(1)
-            .execute()
+            .execute
         )
-
-        if result.data:
-            return result.data[0]
-
-        # Fallback hardcoded defaults
-        return {
-            "id": "default-free",
-            "slug": "free",
-            "name": "Free",
-            "plan": "FREE",
-            "version": "v1",
-            "interval": "MONTHLY",
-            "amount": 0,
-            "currency": "USD",
-            "trial_days": 0,
-            "is_active": True,
-            "plan_features": [],
-            "plan_limits": [],
-        }
+        plan = result.data[0] if result.data else DEFAULT_FREE_PLAN
+        self._cache_plan(_FREE_PLAN, plan)
+        return plan
 
     async def _get_feature_overrides(self, organization_id: str) -> list[dict]:
-        result = (
+        result = await asyncio.to_thread(
             self.supabase.table("customer_feature_overrides")
             .select("*")
             .eq("organization_id", organization_id)
-            .execute()
+            .execute
         )
 
         # Filter expired
-        now = datetime.now()
-        return [
-            o
-            for o in (result.data or [])
-            if not o.get("expires_at") or datetime.fromisoformat(o["expires_at"]) > now
-        ]
+        return self._unexpired(result.data or [])
 
     async def _get_limit_overrides(self, organization_id: str) -> list[dict]:
-        result = (
+        result = await asyncio.to_thread(
             self.supabase.table("customer_usage_limits")
             .select("*, limit_def:usage_limit_definitions(*)")
             .eq("organization_id", organization_id)
-            .execute()
+            .execute
         )
 
-        now = datetime.now()
-        return [
-            o
-            for o in (result.data or [])
-            if not o.get("expires_at") or datetime.fromisoformat(o["expires_at"]) > now
-        ]
+        return self._unexpired(result.data or [])
 
     def _build_features(self, plan: dict) -> dict[str, FeatureValue]:
         features = {}
@@ -2,18 +2,27 @@
 Stripe Service
 
 Low-level Stripe API interactions.
+
+SDK calls are blocking; they run through stripe_call() (see
+utils/stripe_client.py), never directly on the event loop.
+
+Organizations are mapped to customers by the local customer index (see
+customer_index.py); Stripe Search is only its cold-miss fallback.
 """
 
-import stripe
+import time
+
+from utils.stripe_client import get_stripe, stripe_call
 
-from app.config import settings
+from .customer_index import CustomerIndex, CustomerRecord, get_customer_index
 
 
 class StripeService:
     """Service for Stripe API operations"""
 
-    def __init__(self):
-        stripe.api_key = settings.STRIPE_SECRET_KEY
+    def __init__(self, customers: CustomerIndex | None = None):
+        self._stripe = get_stripe()
+        self.customers = customers or get_customer_index()
 
     async def create_customer(
         self,
@@ -27,29 +36,46 @@ class StripeService:
         if metadata:
             customer_metadata.update(metadata)
 
-        customer = stripe.Customer.create(
+        customer = await stripe_call(
+            self._stripe.Customer.create,
             email=email,
             name=name,
             metadata=customer_metadata,
         )
-        return dict(customer)
+        customer = dict(customer)
+        await self.customers.put(CustomerRecord.from_stripe(customer, int(time.time())))
+        return customer
 
     async def get_customer(self, customer_id: str) -> dict | None:
         """Get a Stripe customer by ID"""
         try:
-            customer = stripe.Customer.retrieve(customer_id)
+            customer = await stripe_call(self._stripe.Customer.retrieve, customer_id)
             return dict(customer)
-        except stripe.InvalidRequestError:
+        except self._stripe.InvalidRequestError:
             return None
 
     async def get_customer_by_organization(self, organization_id: str) -> dict | None:
-        """Get Stripe customer by organization ID"""
-        customers = stripe.Customer.search(
+        """
+        Get Stripe customer by organization ID.
+
+        Served from the customer index, so only the indexed fields are
+        returned (id, email, name, metadata.organization_id); use
+        get_customer() for the full object.
+        """
+        record = await self.customers.lookup(
+            organization_id, lambda: self._search_customer(organization_id)
+        )
+        return record.to_dict() if record else None
+
+    async def _search_customer(self, organization_id: str) -> CustomerRecord | None:
+        """Find a customer with Stripe Search (the index's cold-miss fallback)"""
+        customers = await stripe_call(
+            self._stripe.Customer.search,
             query=f"metadata['organization_id']:'{organization_id}'",
             limit=1,
         )
         if customers.data:
-            return dict(customers.data[0])
+            return CustomerRecord.from_stripe(dict(customers.data[0]))
         return None
 
     async def update_customer(
@@ -68,15 +94,22 @@ class StripeService:
         if metadata:
             update_params["metadata"] = metadata
 
-        customer = stripe.Customer.modify(customer_id, **update_params)
-        return dict(customer)
+        customer = await stripe_call(
+            self._stripe.Customer.modify, customer_id, **update_params
+        )
+        customer = dict(customer)
+        record = CustomerRecord.from_stripe(customer, int(time.time()))
+        if record is not None:
+            await self.customers.put(record)
+        return customer
 
     async def delete_customer(self, customer_id: str) -> bool:
         """Delete a Stripe customer"""
         try:
-            stripe.Customer.delete(customer_id)
+            await stripe_call(self._stripe.Customer.delete, customer_id)
+            await self.customers.remove(customer_id, int(time.time()))
             return True
-        except stripe.InvalidRequestError:
+        except self._stripe.InvalidRequestError:
             return False
 
     async def create_checkout_session(
@@ -104,12 +137,17 @@ class StripeService:
         else:
             session_params["customer_creation"] = "always"
 
+        # Lets the subscription mirror place the subscription without a
+        # customer lookup
+        session_params["subscription_data"] = {
+            "metadata": {"organization_id": organization_id},
+        }
         if trial_days:
-            session_params["subscription_data"] = {
-                "trial_period_days": trial_days,
-            }
+            session_params["subscription_data"]["trial_period_days"] = trial_days
 
-        session = stripe.checkout.Session.create(**session_params)
+        session = await stripe_call(
+            self._stripe.checkout.Session.create, **session_params
+        )
         return dict(session)
 
     async def create_portal_session(
@@ -122,7 +160,8 @@ class StripeService:
         if not customer:
             raise ValueError(f"No customer found for organization {organization_id}")
 
-        session = stripe.billing_portal.Session.create(
+        session = await stripe_call(
+            self._stripe.billing_portal.Session.create,
             customer=customer["id"],
             return_url=return_url,
         )
@@ -146,5 +185,5 @@ class StripeService:
         if metadata:
             intent_params["metadata"] = metadata
 
-        intent = stripe.PaymentIntent.create(**intent_params)
+        intent = await stripe_call(self._stripe.PaymentIntent.create, **intent_params)
         return dict(intent)
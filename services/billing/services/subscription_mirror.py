@@ -0,0 +1,438 @@
+"""
+Subscription Mirror
+
+Local copy of each organization's Stripe subscription. Subscription reads
+and the lookups in front of every mutation are served from it instead of
+costing a customer lookup plus a Subscription.list call.
+
+The mirror is fed by customer.subscription.* and invoice.* webhooks, and by
+the responses to the mutations billing makes itself. Stripe does not
+guarantee webhook order, so every write carries a version: the event's
+`created` time, or the time of the API call or listing that produced it. A
+write older than what the mirror holds for that subscription is dropped.
+When an organization has several subscriptions, the most recently created
+one is mirrored, which matches what Subscription.list returned first.
+
+Webhooks can be missed (endpoint down, events older than Stripe's retry
+window), so a reconciliation pass pages through every subscription with
+Subscription.list and reapplies it under the same ordering rule. It runs at
+startup and then every SUBSCRIPTION_RECONCILE_INTERVAL seconds.
+
+An organization missing from the mirror is not taken to have no
+subscription: the miss falls back to Stripe and backfills what it finds.
+With the memory store each process holds its own copy, so without that
+fallback a fresh replica would answer "no subscription" until its first
+reconcile finished.
+"""
+
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import asdict, dataclass, replace
+from typing import Optional, Protocol
+
+import structlog
+
+from _shared.memory import register_store
+from _shared.singleflight import SingleFlight
+from app.config import settings
+from utils.stripe_client import get_stripe, stripe_call
+
+from .customer_index import CustomerIndex, get_customer_index
+
+logger = structlog.get_logger()
+
+RECONCILE_PAGE_SIZE = 100  # Stripe's maximum page size
+
+
+@dataclass
+class MirroredSubscription:
+    """
+    The mirrored fields of a Stripe subscription.
+
+    Times are Stripe's unix timestamps. `version` orders writes for the same
+    subscription; `created` decides between subscriptions.
+    """
+
+    organization_id: str
+    subscription_id: str
+    customer_id: str
+    item_id: str | None
+    price_id: str | None
+    status: str
+    current_period_start: int | None
+    current_period_end: int | None
+    cancel_at_period_end: bool
+    canceled_at: int | None
+    trial_end: int | None
+    created: int
+    version: int
+    latest_invoice_id: str | None = None
+    latest_invoice_status: str | None = None
+    invoice_version: int = 0
+
+    @classmethod
+    def from_stripe(
+        cls, subscription: dict, organization_id: str, version: int
+    ) -> "MirroredSubscription":
+        items = (subscription.get("items") or {}).get("data") or []
+        item = items[0] if items else {}
+        return cls(
+            organization_id=organization_id,
+            subscription_id=subscription["id"],
+            customer_id=subscription.get("customer"),
+            item_id=item.get("id"),
+            price_id=(item.get("price") or {}).get("id"),
+            status=subscription.get("status"),
+            current_period_start=subscription.get("current_period_start"),
+            current_period_end=subscription.get("current_period_end"),
+            cancel_at_period_end=bool(subscription.get("cancel_at_period_end")),
+            canceled_at=subscription.get("canceled_at"),
+            trial_end=subscription.get("trial_end"),
+            created=subscription.get("created") or 0,
+            version=version,
+        )
+
+    def supersedes(self, current: Optional["MirroredSubscription"]) -> bool:
+        """Whether this write replaces what the mirror holds"""
+        if current is None:
+            return True
+        if current.subscription_id == self.subscription_id:
+            return self.version >= current.version
+        return self.created >= current.created
+
+
+class SubscriptionStore(Protocol):
+    """Persisted mirror, one subscription per organization"""
+
+    async def get(self, organization_id: str) -> MirroredSubscription | None: ...
+
+    async def put_many(self, subscriptions: list[MirroredSubscription]) -> int:
+        """Apply the writes that supersede the mirror; returns how many did"""
+        ...
+
+    async def record_invoice(
+        self, subscription_id: str, invoice_id: str, status: str, version: int
+    ) -> bool:
+        """Note a subscription's latest invoice; False if unknown or older"""
+        ...
+
+
+# ── Memory ───────────────────────────────────────────────────────────────────
+
+
+class MemorySubscriptionStore:
+    """Per-process store, for development and tests"""
+
+    def __init__(self):
+        self._by_org: dict[str, MirroredSubscription] = {}
+        self._org_by_subscription: dict[str, str] = {}
+        register_store("billing.subscription_mirror", self._by_org)
+
+    async def get(self, organization_id: str) -> MirroredSubscription | None:
+        return self._by_org.get(organization_id)
+
+    async def put_many(self, subscriptions: list[MirroredSubscription]) -> int:
+        applied = 0
+        for subscription in subscriptions:
+            current = self._by_org.get(subscription.organization_id)
+            if not subscription.supersedes(current):
+                continue
+            if current is not None:
+                if current.subscription_id == subscription.subscription_id:
+                    # Invoice fields are written separately; keep them
+                    subscription = replace(
+                        subscription,
+                        latest_invoice_id=current.latest_invoice_id,
+                        latest_invoice_status=current.latest_invoice_status,
+                        invoice_version=current.invoice_version,
+                    )
+                else:
+                    self._org_by_subscription.pop(current.subscription_id, None)
+            moved_from = self._org_by_subscription.get(subscription.subscription_id)
+            if moved_from is not None and moved_from != subscription.organization_id:
+                self._by_org.pop(moved_from, None)
+            self._by_org[subscription.organization_id] = subscription
+            self._org_by_subscription[subscription.subscription_id] = (
+                subscription.organization_id
+            )
+            applied += 1
+        return applied
+
+    async def record_invoice(
+        self, subscription_id: str, invoice_id: str, status: str, version: int
+    ) -> bool:
+        organization_id = self._org_by_subscription.get(subscription_id)
+        current = self._by_org.get(organization_id) if organization_id else None
+        if current is None or version < current.invoice_version:
+            return False
+        self._by_org[organization_id] = replace(
+            current,
+            latest_invoice_id=invoice_id,
+            latest_invoice_status=status,
+            invoice_version=version,
+        )
+        return True
+
+
+# ── Supabase ─────────────────────────────────────────────────────────────────
+
+_COLUMNS = (
+    "organization_id, subscription_id, customer_id, item_id, price_id, status, "
+    "current_period_start, current_period_end, cancel_at_period_end, "
+    "canceled_at, trial_end, created, version, latest_invoice_id, "
+    "latest_invoice_status, invoice_version"
+)
+
+
+class SupabaseSubscriptionStore:
+    """
+    The stripe_subscriptions table via Supabase.
+
+    Writes go through mirror_stripe_subscriptions(), which applies the
+    ordering rule in the upsert itself, so concurrent writers cannot
+    regress a row. The synchronous client runs in a thread.
+    """
+
+    def __init__(self, client=None):
+        if client is None:
+            from utils.supabase_client import get_supabase_client
+
+            client = get_supabase_client()
+        self.client = client
+
+    async def get(self, organization_id: str) -> MirroredSubscription | None:
+        result = await asyncio.to_thread(
+            self.client.table("stripe_subscriptions")
+            .select(_COLUMNS)
+            .eq("organization_id", organization_id)
+            .limit(1)
+            .execute
+        )
+        return MirroredSubscription(**result.data[0]) if result.data else None
+
+    async def put_many(self, subscriptions: list[MirroredSubscription]) -> int:
+        if not subscriptions:
+            return 0
+        rows = [asdict(subscription) for subscription in subscriptions]
+        result = await asyncio.to_thread(
+            self.client.rpc("mirror_stripe_subscriptions", {"p_rows": rows}).execute
+        )
+        return int(result.data or 0)
+
+    async def record_invoice(
+        self, subscription_id: str, invoice_id: str, status: str, version: int
+    ) -> bool:
+        result = await asyncio.to_thread(
+            self.client.table("stripe_subscriptions")
+            .update(
+                {
+                    "latest_invoice_id": invoice_id,
+                    "latest_invoice_status": status,
+                    "invoice_version": version,
+                }
+            )
+            .eq("subscription_id", subscription_id)
+            .lte("invoice_version", version)
+            .execute
+        )
+        return bool(result.data)
+
+
+# ── Mirror ───────────────────────────────────────────────────────────────────
+
+
+class SubscriptionMirror:
+    """
+    Applies Stripe subscription state to a SubscriptionStore.
+
+    Args:
+        store: Persisted mirror.
+        customers: Resolves the organization of a subscription without
+            organization_id metadata.
+        interval: Seconds between reconciliation passes.
+        stripe: Stripe module (defaults to the configured SDK).
+    """
+
+    def __init__(
+        self,
+        store: SubscriptionStore,
+        customers: CustomerIndex | None = None,
+        interval: float = 3600.0,
+        stripe=None,
+    ):
+        self.store = store
+        self.customers = customers or get_customer_index()
+        self.interval = interval
+        self._stripe = stripe or get_stripe()
+        self._task: asyncio.Task | None = None
+        self._backfills = SingleFlight()
+
+    async def get(self, organization_id: str) -> MirroredSubscription | None:
+        return await self.store.get(organization_id)
+
+    async def lookup(
+        self,
+        organization_id: str,
+        fetch: Callable[[], Awaitable[dict | None]],
+    ) -> MirroredSubscription | None:
+        """
+        Subscription for an organization: the mirror, then `fetch`.
+
+        `fetch` returns the organization's current Stripe subscription, or
+        None. It runs at most once at a time per organization, and what it
+        returns is written to the mirror.
+        """
+        subscription = await self.store.get(organization_id)
+        if subscription is not None:
+            return subscription
+        return await self._backfills.do(
+            organization_id, lambda: self._backfill(organization_id, fetch)
+        )
+
+    async def _backfill(
+        self,
+        organization_id: str,
+        fetch: Callable[[], Awaitable[dict | None]],
+    ) -> MirroredSubscription | None:
+        # As in reconcile(), events created after the fetch started win
+        version = int(time.time())
+        subscription = await fetch()
+        if subscription is None:
+            return None
+        await self.store.put_many(
+            [MirroredSubscription.from_stripe(subscription, organization_id, version)]
+        )
+        logger.info(
+            "subscription_mirror_backfilled",
+            organization_id=organization_id,
+            subscription_id=subscription.get("id"),
+        )
+        # A newer webhook may have landed meanwhile; return what the mirror holds
+        return await self.store.get(organization_id)
+
+    async def _organization_for(self, subscription: dict) -> str | None:
+        organization_id = (subscription.get("metadata") or {}).get("organization_id")
+        if organization_id:
+            return organization_id
+        customer_id = subscription.get("customer")
+        return (
+            await self.customers.organization_for(customer_id) if customer_id else None
+        )
+
+    async def apply(
+        self,
+        subscription: dict,
+        version: int | None = None,
+        organization_id: str | None = None,
+    ) -> MirroredSubscription | None:
+        """
+        Mirror a Stripe subscription object.
+
+        Returns the mirrored form, or None when the organization is unknown.
+        `version` defaults to now, for objects just returned by the API.
+        """
+        organization_id = organization_id or await self._organization_for(subscription)
+        if organization_id is None:
+            logger.warning(
+                "subscription_mirror_unknown_organization",
+                subscription_id=subscription.get("id"),
+                customer_id=subscription.get("customer"),
+            )
+            return None
+        mirrored = MirroredSubscription.from_stripe(
+            subscription, organization_id, version or int(time.time())
+        )
+        await self.store.put_many([mirrored])
+        return mirrored
+
+    async def apply_event(self, event: dict) -> bool:
+        """Apply a customer.subscription.* or invoice.* webhook event"""
+        event_type = event["type"]
+        data = event["data"]["object"]
+        version = event.get("created") or int(time.time())
+
+        if event_type.startswith("customer.subscription."):
+            return await self.apply(data, version) is not None
+
+        if event_type.startswith("invoice."):
+            subscription_id = data.get("subscription")
+            # Upcoming invoices have no id yet
+            if not subscription_id or not data.get("id"):
+                return False
+            return await self.store.record_invoice(
+                subscription_id, data["id"], data.get("status"), version
+            )
+
+        return False
+
+    async def reconcile(self, page_size: int = RECONCILE_PAGE_SIZE) -> int:
+        """Reapply every subscription in Stripe; returns how many were written"""
+        # Events created after the listing started win over what it returns
+        version = int(time.time())
+        applied = listed = 0
+        starting_after = None
+        while True:
+            params = {"status": "all", "limit": page_size}
+            if starting_after:
+                params["starting_after"] = starting_after
+            page = await stripe_call(self._stripe.Subscription.list, **params)
+            batch = []
+            for subscription in page.data:
+                organization_id = await self._organization_for(subscription)
+                if organization_id is not None:
+                    batch.append(
+                        MirroredSubscription.from_stripe(
+                            subscription, organization_id, version
+                        )
+                    )
+            applied += await self.store.put_many(batch)
+            listed += len(page.data)
+            if not page.has_more or not page.data:
+                break
+            starting_after = page.data[-1]["id"]
+
+        logger.info("subscriptions_reconciled", listed=listed, applied=applied)
+        return applied
+
+    # ── Background reconciliation ────────────────────────────────────────────
+
+    def start(self) -> None:
+        """Reconcile now and then every `interval` seconds"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="subscription-mirror")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.warning("subscription_reconcile_failed", error=str(e))
+            await asyncio.sleep(self.interval)
+
+    async def close(self) -> None:
+        """Stop reconciling (a shutdown hook)"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+_mirror: SubscriptionMirror | None = None
+
+
+def get_subscription_mirror() -> SubscriptionMirror:
+    """Get the process-wide subscription mirror"""
+    global _mirror
+
+    if _mirror is None:
+        store = (
+            SupabaseSubscriptionStore()
+            if settings.SUBSCRIPTION_MIRROR_BACKEND == "supabase"
+            else MemorySubscriptionStore()
+        )
+        _mirror = SubscriptionMirror(
+            store, interval=settings.SUBSCRIPTION_RECONCILE_INTERVAL
+        )
+
+    return _mirror
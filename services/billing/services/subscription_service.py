@@ -2,15 +2,24 @@
 Subscription Service
 
 Subscription lifecycle management.
+
+Reads, and the lookups in front of every mutation, are served from the
+local subscription mirror (see subscription_mirror.py); only the mutations
+themselves call Stripe. An organization the mirror does not hold yet is
+looked up in Stripe once and backfilled.
 """
 
 from datetime import datetime
 
-import stripe
-
 from app.config import settings
+from utils.stripe_client import get_stripe, stripe_call
 
 from .stripe_service import StripeService
+from .subscription_mirror import (
+    MirroredSubscription,
+    SubscriptionMirror,
+    get_subscription_mirror,
+)
 
 # Plan to price ID mapping
 PRICE_MAP = {
@@ -24,9 +33,10 @@ PRICE_MAP = {
 class SubscriptionService:
     """Service for subscription management"""
 
-    def __init__(self):
-        stripe.api_key = settings.STRIPE_SECRET_KEY
+    def __init__(self, mirror: SubscriptionMirror | None = None):
+        self._stripe = get_stripe()
         self.stripe_service = StripeService()
+        self.mirror = mirror or get_subscription_mirror()
 
     def _map_stripe_status(self, status: str) -> str:
         """Map Stripe status to our status enum"""
@@ -75,26 +85,13 @@ class SubscriptionService:
         if trial_days:
             sub_params["trial_period_days"] = trial_days
 
-        subscription = stripe.Subscription.create(**sub_params)
-        return self._format_subscription(subscription, organization_id)
+        subscription = await stripe_call(self._stripe.Subscription.create, **sub_params)
+        return await self._mirrored(subscription, organization_id)
 
     async def get_subscription(self, organization_id: str) -> dict | None:
         """Get subscription for an organization"""
-        customer = await self.stripe_service.get_customer_by_organization(
-            organization_id
-        )
-        if not customer:
-            return None
-
-        subscriptions = stripe.Subscription.list(
-            customer=customer["id"],
-            status="all",
-            limit=1,
-        )
-
-        if subscriptions.data:
-            return self._format_subscription(subscriptions.data[0], organization_id)
-        return None
+        subscription = await self._lookup(organization_id)
+        return self._format_subscription(subscription) if subscription else None
 
     async def update_subscription(
         self,
@@ -103,24 +100,25 @@ class SubscriptionService:
         proration_behavior: str = "create_prorations",
     ) -> dict:
         """Update subscription (change plan)"""
-        subscription = await self._get_stripe_subscription(organization_id)
+        subscription = await self._lookup(organization_id)
         if not subscription:
             raise ValueError(
                 f"No subscription found for organization {organization_id}"
             )
 
         # Update the subscription with new price
-        updated = stripe.Subscription.modify(
-            subscription.id,
+        updated = await stripe_call(
+            self._stripe.Subscription.modify,
+            subscription.subscription_id,
             items=[
                 {
-                    "id": subscription["items"]["data"][0]["id"],
+                    "id": subscription.item_id,
                     "price": price_id,
                 }
             ],
             proration_behavior=proration_behavior,
         )
-        return self._format_subscription(updated, organization_id)
+        return await self._mirrored(updated, organization_id)
 
     async def cancel_subscription(
         self,
@@ -129,26 +127,29 @@ class SubscriptionService:
         reason: str | None = None,
     ) -> dict:
         """Cancel subscription"""
-        subscription = await self._get_stripe_subscription(organization_id)
+        subscription = await self._lookup(organization_id)
         if not subscription:
             raise ValueError(
                 f"No subscription found for organization {organization_id}"
             )
 
         if cancel_at_period_end:
-            updated = stripe.Subscription.modify(
-                subscription.id,
+            updated = await stripe_call(
+                self._stripe.Subscription.modify,
+                subscription.subscription_id,
                 cancel_at_period_end=True,
                 metadata={"cancel_reason": reason} if reason else {},
             )
         else:
-            updated = stripe.Subscription.cancel(subscription.id)
+            updated = await stripe_call(
+                self._stripe.Subscription.cancel, subscription.subscription_id
+            )
 
-        return self._format_subscription(updated, organization_id)
+        return await self._mirrored(updated, organization_id)
 
     async def resume_subscription(self, organization_id: str) -> dict:
         """Resume a canceled subscription"""
-        subscription = await self._get_stripe_subscription(organization_id)
+        subscription = await self._lookup(organization_id)
         if not subscription:
             raise ValueError(
                 f"No subscription found for organization {organization_id}"
@@ -157,25 +158,27 @@ class SubscriptionService:
         if not subscription.cancel_at_period_end:
             raise ValueError("Subscription is not scheduled for cancellation")
 
-        updated = stripe.Subscription.modify(
-            subscription.id,
+        updated = await stripe_call(
+            self._stripe.Subscription.modify,
+            subscription.subscription_id,
             cancel_at_period_end=False,
         )
-        return self._format_subscription(updated, organization_id)
+        return await self._mirrored(updated, organization_id)
 
     async def pause_subscription(self, organization_id: str) -> dict:
         """Pause a subscription"""
-        subscription = await self._get_stripe_subscription(organization_id)
+        subscription = await self._lookup(organization_id)
         if not subscription:
             raise ValueError(
                 f"No subscription found for organization {organization_id}"
             )
 
-        updated = stripe.Subscription.modify(
-            subscription.id,
+        updated = await stripe_call(
+            self._stripe.Subscription.modify,
+            subscription.subscription_id,
             pause_collection={"behavior": "mark_uncollectible"},
         )
-        return self._format_subscription(updated, organization_id)
+        return await self._mirrored(updated, organization_id)
 
     async def preview_change(
         self,
@@ -183,18 +186,19 @@ class SubscriptionService:
         price_id: str,
     ) -> dict:
         """Preview subscription change (proration preview)"""
-        subscription = await self._get_stripe_subscription(organization_id)
+        subscription = await self._lookup(organization_id)
         if not subscription:
             raise ValueError(
                 f"No subscription found for organization {organization_id}"
             )
 
-        invoice = stripe.Invoice.upcoming(
-            customer=subscription.customer,
-            subscription=subscription.id,
+        invoice = await stripe_call(
+            self._stripe.Invoice.upcoming,
+            customer=subscription.customer_id,
+            subscription=subscription.subscription_id,
             subscription_items=[
                 {
-                    "id": subscription["items"]["data"][0]["id"],
+                    "id": subscription.item_id,
                     "price": price_id,
                 }
             ],
@@ -206,42 +210,49 @@ class SubscriptionService:
             "immediate_charge": invoice.total > 0,
         }
 
-    async def _get_stripe_subscription(self, organization_id: str):
-        """Get raw Stripe subscription object"""
+    async def _lookup(self, organization_id: str) -> MirroredSubscription | None:
+        """Mirrored subscription, falling back to Stripe on a miss"""
+        return await self.mirror.lookup(
+            organization_id, lambda: self._list_subscription(organization_id)
+        )
+
+    async def _list_subscription(self, organization_id: str) -> dict | None:
+        """The organization's most recent subscription in Stripe"""
         customer = await self.stripe_service.get_customer_by_organization(
             organization_id
         )
         if not customer:
             return None
 
-        subscriptions = stripe.Subscription.list(
+        subscriptions = await stripe_call(
+            self._stripe.Subscription.list,
             customer=customer["id"],
             status="all",
             limit=1,
         )
-
         return subscriptions.data[0] if subscriptions.data else None
 
-    def _format_subscription(self, subscription, organization_id: str) -> dict:
-        """Format subscription for API response"""
-        price_id = subscription["items"]["data"][0]["price"]["id"]
+    async def _mirrored(self, subscription, organization_id: str) -> dict:
+        """Mirror a subscription returned by Stripe and format it"""
+        mirrored = await self.mirror.apply(
+            subscription, organization_id=organization_id
+        )
+        return self._format_subscription(mirrored)
 
+    def _format_subscription(self, subscription: MirroredSubscription) -> dict:
+        """Format subscription for API response"""
         return {
-            "id": subscription.id,
-            "organization_id": organization_id,
-            "plan": self._get_plan_from_price(price_id),
+            "id": subscription.subscription_id,
+            "organization_id": subscription.organization_id,
+            "plan": self._get_plan_from_price(subscription.price_id),
             "status": self._map_stripe_status(subscription.status),
-            "current_period_start": datetime.fromtimestamp(
-                subscription.current_period_start
-            ),
-            "current_period_end": datetime.fromtimestamp(
-                subscription.current_period_end
-            ),
+            "current_period_start": _datetime(subscription.current_period_start),
+            "current_period_end": _datetime(subscription.current_period_end),
             "cancel_at_period_end": subscription.cancel_at_period_end,
-            "canceled_at": datetime.fromtimestamp(subscription.canceled_at)
-            if subscription.canceled_at
-            else None,
-            "trial_end": datetime.fromtimestamp(subscription.trial_end)
-            if subscription.trial_end
-            else None,
+            "canceled_at": _datetime(subscription.canceled_at),
+            "trial_end": _datetime(subscription.trial_end),
         }
+
+
+def _datetime(timestamp: int | None) -> datetime | None:
+    return datetime.fromtimestamp(timestamp) if timestamp else None
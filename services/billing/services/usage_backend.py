@@ -0,0 +1,384 @@
+"""
+Usage Counter Backends
+
+Storage for per-period usage counters, their time series (see
+usage_series.py) and quota leases.
+
+- RedisUsageBackend: counters shared by every worker and replica. Check-and-
+  record runs as one server-side script, so admission against a limit is
+  atomic and costs a single round trip.
+- MemoryUsageBackend: per-process fallback when Redis is not configured
+  (local development, tests).
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Protocol
+
+import redis.asyncio as redis
+
+from _shared.memory import register_store
+from services.usage_series import series_args
+
+# Prepended to the scripts below: adds `delta` to the minute, hour and day
+# buckets of a series.
+# prefix: series key prefix ('' = no series); ARGV[a..a+8]: window suffixes,
+# fields and expiry times from usage_series.series_args(). Bucket keys are
+# built here rather than passed in KEYS; they carry the same {org} hash tag
+# as the counter, so they live in the same cluster slot.
+SERIES_LUA = """
+local function record_series(prefix, a, delta)
+    if prefix == '' or delta == 0 then
+        return
+    end
+    for i = 0, 2 do
+        local key = prefix .. ARGV[a + i]
+        redis.call('HINCRBY', key, ARGV[a + 3 + i], delta)
+        redis.call('EXPIREAT', key, ARGV[a + 6 + i])
+    end
+end
+"""
+
+# KEYS[1] = counter key
+# ARGV    = limit (-1 = unlimited), expire_at (unix seconds),
+#           enforce (1 = reject quantities that would exceed the limit),
+#           series prefix, series args (9), quantity[, quantity ...]
+# Quantities are admitted in order; non-positive ones never are, and with
+# enforce, each one that does not fit is skipped.
+# Returns {usage after the call, admitted flag per quantity}.
+RECORD_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local enforce = ARGV[3] == '1' and limit >= 0
+local usage = tonumber(redis.call('GET', KEYS[1]) or '0')
+local total = 0
+local admitted = {}
+for i = 14, #ARGV do
+    local quantity = tonumber(ARGV[i])
+    if quantity <= 0 or (enforce and usage + total + quantity > limit) then
+        admitted[#admitted + 1] = 0
+    else
+        total = total + quantity
+        admitted[#admitted + 1] = 1
+    end
+end
+if total > 0 then
+    usage = redis.call('INCRBY', KEYS[1], total)
+    if redis.call('TTL', KEYS[1]) < 0 then
+        redis.call('EXPIREAT', KEYS[1], ARGV[2])
+    end
+    record_series(ARGV[4], 5, total)
+end
+table.insert(admitted, 1, usage)
+return admitted
+"""
+
+
+# KEYS[1] = counter key, KEYS[2] = lease key
+# ARGV    = requested, limit (-1 = unlimited), expire_at (counter),
+#           lease_ttl (seconds the lease record is kept),
+#           series prefix, series args (9)
+# Grants up to `requested` of the remaining quota and counts it as used
+# immediately. Returns {granted, usage after the grant}.
+ACQUIRE_LEASE_SCRIPT = """
+local requested = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local usage = tonumber(redis.call('GET', KEYS[1]) or '0')
+local granted = requested
+if limit >= 0 then
+    granted = math.max(0, math.min(requested, limit - usage))
+end
+if granted > 0 then
+    usage = redis.call('INCRBY', KEYS[1], granted)
+    if redis.call('TTL', KEYS[1]) < 0 then
+        redis.call('EXPIREAT', KEYS[1], ARGV[3])
+    end
+    record_series(ARGV[5], 6, granted)
+    redis.call(
+        'HSET', KEYS[2], 'counter', KEYS[1], 'granted', granted, 'series', ARGV[5]
+    )
+    redis.call('EXPIRE', KEYS[2], ARGV[4])
+end
+return {granted, usage}
+"""
+
+# KEYS[1] = lease key
+# ARGV    = used, series args (9)
+# Settles a lease: the counter (and its series, at settle time) is corrected
+# by (used - granted), giving back the unused part. The counter key and
+# series prefix are read from the lease; they share the lease's {org} hash
+# tag, so all of them live in the same cluster slot.
+# Returns {granted, usage after settling}, or {-1, 0} for an unknown lease.
+RELEASE_LEASE_SCRIPT = """
+local lease = redis.call('HMGET', KEYS[1], 'counter', 'granted', 'series')
+if not lease[1] then
+    return {-1, 0}
+end
+local granted = tonumber(lease[2])
+local delta = tonumber(ARGV[1]) - granted
+local usage = redis.call('INCRBY', lease[1], delta)
+record_series(lease[3] or '', 2, delta)
+redis.call('DEL', KEYS[1])
+return {granted, usage}
+"""
+
+
+@dataclass
+class RecordResult:
+    admitted: bool
+    usage: int  # counter value after the call (unchanged if not admitted)
+
+
+@dataclass
+class CounterUpdate:
+    """Quantities for one counter, applied in order"""
+
+    key: str
+    quantities: list[int]
+    limit: int
+    expire_at: int
+    enforce: bool
+    series: str = ""  # series key prefix; "" records no history
+
+
+@dataclass
+class BatchResult:
+    admitted: list[bool]  # one per quantity
+    usage: int  # counter value after the batch
+
+
+@dataclass
+class LeaseGrant:
+    granted: int  # 0 when no quota is left
+    usage: int  # counter value after the grant
+
+
+@dataclass
+class LeaseSettlement:
+    granted: int  # -1 if the lease was unknown or had already expired
+    usage: int  # counter value after settling
+
+
+class UsageBackend(Protocol):
+    async def record(
+        self,
+        key: str,
+        quantity: int,
+        limit: int,
+        expire_at: int,
+        enforce: bool,
+        series: str = "",
+    ) -> RecordResult: ...
+
+    async def record_many(self, updates: list[CounterUpdate]) -> list[BatchResult]: ...
+
+    async def acquire_lease(
+        self,
+        key: str,
+        lease_key: str,
+        requested: int,
+        limit: int,
+        expire_at: int,
+        lease_ttl: int,
+        series: str = "",
+    ) -> LeaseGrant: ...
+
+    async def release_lease(self, lease_key: str, used: int) -> LeaseSettlement: ...
+
+    async def get_many(self, keys: list[str]) -> list[int]: ...
+
+    async def get_buckets(
+        self, reads: list[tuple[str, list[str]]]
+    ) -> list[list[int]]: ...
+
+    async def reset(self, keys: list[str]) -> None: ...
+
+
+class RedisUsageBackend:
+    """Usage counters in Redis"""
+
+    def __init__(self, client: redis.Redis):
+        self.redis = client
+        self._record = client.register_script(SERIES_LUA + RECORD_SCRIPT)
+        self._acquire_lease = client.register_script(SERIES_LUA + ACQUIRE_LEASE_SCRIPT)
+        self._release_lease = client.register_script(SERIES_LUA + RELEASE_LEASE_SCRIPT)
+
+    async def record(
+        self,
+        key: str,
+        quantity: int,
+        limit: int,
+        expire_at: int,
+        enforce: bool,
+        series: str = "",
+    ) -> RecordResult:
+        usage, admitted = await self._record(
+            keys=[key],
+            args=[limit, expire_at, int(enforce), series, *series_args(), quantity],
+        )
+        return RecordResult(admitted=bool(admitted), usage=int(usage))
+
+    async def record_many(self, updates: list[CounterUpdate]) -> list[BatchResult]:
+        """Apply every update in one pipelined round trip"""
+        now_args = series_args()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for update in updates:
+                await self._record(
+                    keys=[update.key],
+                    args=[
+                        update.limit,
+                        update.expire_at,
+                        int(update.enforce),
+                        update.series,
+                        *now_args,
+                        *update.quantities,
+                    ],
+                    client=pipe,
+                )
+            replies = await pipe.execute()
+        return [
+            BatchResult(admitted=[bool(a) for a in reply[1:]], usage=int(reply[0]))
+            for reply in replies
+        ]
+
+    async def acquire_lease(
+        self,
+        key: str,
+        lease_key: str,
+        requested: int,
+        limit: int,
+        expire_at: int,
+        lease_ttl: int,
+        series: str = "",
+    ) -> LeaseGrant:
+        granted, usage = await self._acquire_lease(
+            keys=[key, lease_key],
+            args=[requested, limit, expire_at, lease_ttl, series, *series_args()],
+        )
+        return LeaseGrant(granted=int(granted), usage=int(usage))
+
+    async def release_lease(self, lease_key: str, used: int) -> LeaseSettlement:
+        granted, usage = await self._release_lease(
+            keys=[lease_key], args=[used, *series_args()]
+        )
+        return LeaseSettlement(granted=int(granted), usage=int(usage))
+
+    async def get_many(self, keys: list[str]) -> list[int]:
+        values = await self.redis.mget(keys)
+        return [int(v) if v is not None else 0 for v in values]
+
+    async def get_buckets(self, reads: list[tuple[str, list[str]]]) -> list[list[int]]:
+        """HMGET each (hash key, fields) in one pipelined round trip"""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key, fields in reads:
+                pipe.hmget(key, fields)
+            replies = await pipe.execute()
+        return [[int(v) if v is not None else 0 for v in reply] for reply in replies]
+
+    async def reset(self, keys: list[str]) -> None:
+        await self.redis.delete(*keys)
+
+
+class MemoryUsageBackend:
+    """
+    Per-process usage counters.
+
+    Each operation completes without awaiting, so it is atomic with respect
+    to other coroutines in the process. Counters are not shared between
+    workers and are lost on restart, and counter expiry is ignored.
+    """
+
+    def __init__(self):
+        self._counters: dict[str, int] = {}
+        # bucket hash key -> field -> value (retention is ignored)
+        self._buckets: dict[str, dict[str, int]] = {}
+        # lease key -> (counter key, granted, expires at, series prefix)
+        self._leases: dict[str, tuple[str, int, float, str]] = {}
+        register_store("billing.usage_store", self._counters)
+        register_store("billing.usage_buckets", self._buckets)
+
+    def _record_series(self, series: str, delta: int) -> None:
+        if not series or not delta:
+            return
+        args = series_args()
+        for suffix, field in zip(args[:3], args[3:6], strict=True):
+            bucket = self._buckets.setdefault(series + suffix, {})
+            bucket[field] = bucket.get(field, 0) + delta
+
+    async def record(
+        self,
+        key: str,
+        quantity: int,
+        limit: int,
+        expire_at: int,
+        enforce: bool,
+        series: str = "",
+    ) -> RecordResult:
+        current = self._counters.get(key, 0)
+        # As RECORD_SCRIPT: usage is only ever added, never taken back
+        if quantity <= 0 or (enforce and limit >= 0 and current + quantity > limit):
+            return RecordResult(admitted=False, usage=current)
+        self._counters[key] = current + quantity
+        self._record_series(series, quantity)
+        return RecordResult(admitted=True, usage=current + quantity)
+
+    async def record_many(self, updates: list[CounterUpdate]) -> list[BatchResult]:
+        results = []
+        for update in updates:
+            admitted = []
+            for quantity in update.quantities:
+                result = await self.record(
+                    update.key,
+                    quantity,
+                    update.limit,
+                    update.expire_at,
+                    update.enforce,
+                    update.series,
+                )
+                admitted.append(result.admitted)
+            results.append(
+                BatchResult(admitted=admitted, usage=self._counters.get(update.key, 0))
+            )
+        return results
+
+    async def acquire_lease(
+        self,
+        key: str,
+        lease_key: str,
+        requested: int,
+        limit: int,
+        expire_at: int,
+        lease_ttl: int,
+        series: str = "",
+    ) -> LeaseGrant:
+        now = time.time()
+        self._leases = {k: v for k, v in self._leases.items() if v[2] > now}
+        usage = self._counters.get(key, 0)
+        granted = requested if limit < 0 else max(0, min(requested, limit - usage))
+        if granted > 0:
+            usage += granted
+            self._counters[key] = usage
+            self._record_series(series, granted)
+            self._leases[lease_key] = (key, granted, now + lease_ttl, series)
+        return LeaseGrant(granted=granted, usage=usage)
+
+    async def release_lease(self, lease_key: str, used: int) -> LeaseSettlement:
+        lease = self._leases.pop(lease_key, None)
+        if lease is None or lease[2] <= time.time():
+            return LeaseSettlement(granted=-1, usage=0)
+        key, granted, _, series = lease
+        self._counters[key] = self._counters.get(key, 0) + used - granted
+        self._record_series(series, used - granted)
+        return LeaseSettlement(granted=granted, usage=self._counters[key])
+
+    async def get_many(self, keys: list[str]) -> list[int]:
+        return [self._counters.get(key, 0) for key in keys]
+
+    async def get_buckets(self, reads: list[tuple[str, list[str]]]) -> list[list[int]]:
+        return [
+            [self._buckets.get(key, {}).get(field, 0) for field in fields]
+            for key, fields in reads
+        ]
+
+    async def reset(self, keys: list[str]) -> None:
+        for key in keys:
+            self._counters.pop(key, None)
@@ -0,0 +1,350 @@
+"""
+Usage Buffer
+
+Write-behind aggregation for high-frequency usage counters.
+
+Increments for buffered usage types (AI_TOKEN, BANDWIDTH) are summed in
+sharded in-process tables and applied to the usage backend as one pipelined
+write per flush — every `flush_interval` seconds, or sooner once
+`flush_threshold` increments are pending.
+
+Crash semantics:
+- Without a WAL, a crash loses at most the increments of the current flush
+  interval (plus any that failed to flush and are awaiting retry).
+- With a WAL directory, every increment is appended to a per-process log
+  segment (a plain write(), so it survives a process crash) before it is
+  acknowledged. Segments are deleted only after their deltas are flushed;
+  segments left behind by a dead process are replayed on startup. A crash
+  between a flush reaching the backend and its segment being deleted
+  replays that segment, so recovery is at-least-once for that window.
+"""
+
+import asyncio
+import fcntl
+import os
+import threading
+import uuid
+from pathlib import Path
+
+import structlog
+
+from _shared.memory import register_store
+from services.usage_backend import CounterUpdate, UsageBackend
+
+logger = structlog.get_logger()
+
+DEFAULT_SHARDS = 16
+DEFAULT_FLUSH_INTERVAL = 1.0  # seconds
+DEFAULT_FLUSH_THRESHOLD = 10_000  # pending increments that trigger an early flush
+
+
+class _Shard:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # counter key -> [pending delta, expire_at, series prefix]
+        self.deltas: dict[str, list] = {}
+
+
+class _WriteAheadLog:
+    """
+    Append-only log segments of buffered increments.
+
+    Each process writes its own segment and holds an exclusive flock on it,
+    so recovery only ever replays segments whose writer is gone. The lock
+    is held until the segment is discarded: a rotated segment whose flush
+    failed still belongs to its writer, and is retried there.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._prefix = f"usage-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._seq = 0
+        self._fd = -1
+        self._path: Path | None = None
+        # Rotated (or recovered) segments → their locked descriptors
+        self._held: dict[Path, int] = {}
+        self._open_segment()
+
+    def _open_segment(self) -> None:
+        self._seq += 1
+        self._path = self.directory / f"{self._prefix}-{self._seq:06d}.wal"
+        self._fd = os.open(self._path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def append(self, key: str, quantity: int, expire_at: int, series: str) -> None:
+        os.write(self._fd, f"{key}\t{quantity}\t{expire_at}\t{series}\n".encode())
+
+    def rotate(self) -> Path:
+        """Start a new segment; the current one stays locked until discarded"""
+        closed = self._path
+        self._held[closed] = self._fd
+        self._open_segment()
+        return closed
+
+    def close(self) -> Path:
+        """Release every segment (as exiting would); left ones are orphans"""
+        for fd in self._held.values():
+            os.close(fd)
+        self._held = {}
+        os.close(self._fd)
+        self._fd = -1
+        return self._path
+
+    def discard(self, path: Path) -> None:
+        # Unlinked before unlocking, so no other process can claim it
+        path.unlink(missing_ok=True)
+        fd = self._held.pop(path, None)
+        if fd is not None:
+            os.close(fd)
+
+    def orphans(self) -> list[Path]:
+        """Segments no live process holds a lock on; locked until discarded"""
+        found = []
+        for path in sorted(self.directory.glob("usage-*.wal")):
+            if path == self._path or path in self._held:
+                continue
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue  # discarded since the listing
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue  # held by a live process
+            if os.fstat(fd).st_nlink == 0:
+                os.close(fd)
+                continue  # discarded while we waited for the lock
+            self._held[path] = fd
+            found.append(path)
+        return found
+
+    @staticmethod
+    def read(path: Path) -> list[tuple[str, int, int, str]]:
+        entries = []
+        for line in path.read_text().splitlines():
+            parts = line.split("\t")
+            if len(parts) != 4:
+                continue  # torn final write
+            key, quantity, expire_at, series = parts
+            entries.append((key, int(quantity), int(expire_at), series))
+        return entries
+
+
+class UsageBuffer:
+    """
+    Sharded write-behind buffer in front of a usage backend.
+
+    add() is synchronous, thread-safe and never touches the network. Limit
+    checks read pending() so unflushed local usage still counts.
+    """
+
+    def __init__(
+        self,
+        backend: UsageBackend,
+        shards: int = DEFAULT_SHARDS,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        flush_threshold: int = DEFAULT_FLUSH_THRESHOLD,
+        wal_dir: str | None = None,
+    ):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._shards = [_Shard() for _ in range(shards)]
+        self._wal = _WriteAheadLog(wal_dir) if wal_dir else None
+        # Segments whose deltas are not yet confirmed by the backend
+        self._unflushed_segments: list[Path] = []
+        # Counter value returned by the last flush and expire_at, per key,
+        # for cheap estimates; only the newest period is kept
+        self._flushed: dict[str, tuple[int, int]] = {}
+        self._newest_expire_at = 0
+        self._added = 0
+        self._added_lock = threading.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._wakeup: asyncio.Event | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+        self.flushes = 0
+        self.flush_failures = 0
+        register_store("billing.usage_buffer", self._flushed)
+
+    def _shard(self, key: str) -> _Shard:
+        return self._shards[hash(key) % len(self._shards)]
+
+    # ── Hot path ─────────────────────────────────────────────────────────────
+
+    def add(self, key: str, quantity: int, expire_at: int, series: str = "") -> int:
+        """
+        Buffer an increment; returns the estimated counter value.
+
+        Time-series buckets receive the aggregated delta at flush time, so
+        buffered usage may land up to one flush interval late in them.
+        """
+        shard = self._shard(key)
+        with shard.lock:
+            if self._wal is not None:
+                self._wal.append(key, quantity, expire_at, series)
+            entry = shard.deltas.get(key)
+            if entry is None:
+                entry = shard.deltas[key] = [0, expire_at, series]
+            entry[0] += quantity
+            pending = entry[0]
+        with self._added_lock:
+            self._added += 1
+            added = self._added
+        if added >= self.flush_threshold and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        flushed = self._flushed.get(key)
+        return (flushed[0] if flushed else 0) + pending
+
+    def pending(self, key: str) -> int:
+        """Locally buffered usage for a counter, not yet in the backend"""
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.deltas.get(key)
+            return entry[0] if entry else 0
+
+    def discard(self, keys: list[str]) -> None:
+        """Drop pending deltas (counters being reset)"""
+        for key in keys:
+            shard = self._shard(key)
+            with shard.lock:
+                shard.deltas.pop(key, None)
+            self._flushed.pop(key, None)
+
+    # ── Flushing ─────────────────────────────────────────────────────────────
+
+    def _swap(self) -> tuple[dict[str, list], Path | None]:
+        """Take every shard's deltas (and rotate the WAL) as one cut"""
+        for shard in self._shards:
+            shard.lock.acquire()
+        try:
+            taken: dict[str, list] = {}
+            for shard in self._shards:
+                taken.update(shard.deltas)
+                shard.deltas = {}
+            segment = self._wal.rotate() if self._wal is not None else None
+            with self._added_lock:
+                self._added = 0
+        finally:
+            for shard in self._shards:
+                shard.lock.release()
+        return taken, segment
+
+    def _restore(self, taken: dict[str, list]) -> None:
+        """Put deltas back after a failed flush"""
+        for key, (quantity, expire_at, series) in taken.items():
+            shard = self._shard(key)
+            with shard.lock:
+                entry = shard.deltas.get(key)
+                if entry is None:
+                    shard.deltas[key] = [quantity, expire_at, series]
+                else:
+                    entry[0] += quantity
+
+    async def flush(self) -> int:
+        """Apply pending deltas in one backend round trip; returns counters written"""
+        async with self._flush_lock:
+            taken, segment = self._swap()
+            if segment is not None:
+                self._unflushed_segments.append(segment)
+            if not taken:
+                self._discard_segments()
+                return 0
+
+            updates = [
+                CounterUpdate(
+                    key=key,
+                    quantities=[quantity],
+                    limit=-1,
+                    expire_at=expire_at,
+                    enforce=False,
+                    series=series,
+                )
+                for key, (quantity, expire_at, series) in taken.items()
+            ]
+            try:
+                results = await self.backend.record_many(updates)
+            except Exception:
+                self._restore(taken)
+                self.flush_failures += 1
+                raise
+
+            for update, result in zip(updates, results, strict=True):
+                self._flushed[update.key] = (result.usage, update.expire_at)
+            self._prune_flushed(max(update.expire_at for update in updates))
+            self._discard_segments()
+            self.flushes += 1
+            return len(updates)
+
+    def _prune_flushed(self, expire_at: int) -> None:
+        """
+        Forget counters of closed periods once a later period is flushed.
+
+        Counters of one period share expire_at, and a later period's expire
+        later, so anything older than the newest expire_at is never added to
+        again.
+        """
+        if expire_at <= self._newest_expire_at:
+            return
+        self._newest_expire_at = expire_at
+        for key in [k for k, v in self._flushed.items() if v[1] < expire_at]:
+            del self._flushed[key]
+
+    def _discard_segments(self) -> None:
+        for path in self._unflushed_segments:
+            self._wal.discard(path)
+        self._unflushed_segments = []
+
+    async def recover(self) -> int:
+        """Replay WAL segments left by dead processes; returns increments replayed"""
+        if self._wal is None:
+            return 0
+        replayed = 0
+        for path in self._wal.orphans():
+            entries = _WriteAheadLog.read(path)
+            for key, quantity, expire_at, series in entries:
+                self.add(key, quantity, expire_at, series)
+            replayed += len(entries)
+            # Now covered by this process's own segment
+            self._wal.discard(path)
+        if replayed:
+            logger.info("usage_wal_replayed", increments=replayed)
+            await self.flush()
+        return replayed
+
+    # ── Background loop ──────────────────────────────────────────────────────
+
+    def start(self) -> None:
+        """Start the periodic flusher on the running event loop"""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="usage-buffer-flush")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning("usage_buffer_flush_failed", error=str(e))
+
+    async def close(self) -> None:
+        """Stop the flusher and flush what is left (a shutdown hook)"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        if self._wal is not None:
+            segment = self._wal.close()
+            # Anything added after the final flush stays for the next start
+            if segment.stat().st_size == 0:
+                segment.unlink()
@@ -0,0 +1,165 @@
+"""
+Usage Time Series
+
+Bucket layout and range planning for usage history.
+
+Every counter write is also added to a minute, an hour and a day bucket in
+the same backend call, so rollups need no background job. Buckets are
+Redis hash fields grouped into one hash per window:
+
+    granularity  hash window   field   retention
+    minute       hour          MM      2 days
+    hour         day           HH      90 days
+    day          month         DD      3 years
+
+A range total reads the coarsest buckets that exactly cover the interval —
+a few edge minutes and hours around whole days — so a query over months
+costs one HMGET per month plus the edges. Resolution degrades with age:
+where the finest bucket needed has expired, the range is widened to the
+enclosing bucket that is still retained.
+"""
+
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+
+from dateutil.relativedelta import relativedelta
+
+# Upper bound on points returned by one series query
+MAX_SERIES_POINTS = 2000
+# Finest granularity whose point count stays under this is picked for "auto"
+AUTO_SERIES_POINTS = 500
+
+
+@dataclass(frozen=True)
+class Granularity:
+    name: str
+    code: str  # key segment
+    step: timedelta
+    window_format: str  # strftime of the hash holding the bucket
+    field_format: str  # strftime of the bucket's field in that hash
+    retention: timedelta
+
+    def floor(self, t: datetime) -> datetime:
+        if self is MINUTE:
+            return t.replace(second=0, microsecond=0)
+        if self is HOUR:
+            return t.replace(minute=0, second=0, microsecond=0)
+        return t.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def window_end(self, t: datetime) -> datetime:
+        """End of the hash window containing t"""
+        if self is MINUTE:
+            return HOUR.floor(t) + timedelta(hours=1)
+        if self is HOUR:
+            return DAY.floor(t) + timedelta(days=1)
+        return DAY.floor(t).replace(day=1) + relativedelta(months=1)
+
+    def suffix(self, t: datetime) -> str:
+        return f"{self.code}:{t.strftime(self.window_format)}"
+
+    def field(self, t: datetime) -> str:
+        return t.strftime(self.field_format)
+
+
+MINUTE = Granularity(
+    "minute", "m", timedelta(minutes=1), "%Y%m%d%H", "%M", timedelta(days=2)
+)
+HOUR = Granularity("hour", "h", timedelta(hours=1), "%Y%m%d", "%H", timedelta(days=90))
+DAY = Granularity("day", "d", timedelta(days=1), "%Y%m", "%d", timedelta(days=1095))
+
+GRANULARITIES = {g.name: g for g in (MINUTE, HOUR, DAY)}
+
+
+def series_args(at: datetime | None = None) -> list:
+    """
+    Script arguments locating the minute, hour and day buckets for a write:
+    three window suffixes, three fields, three expiry times (unix seconds).
+    """
+    at = at or datetime.now(UTC)
+    granularities = (MINUTE, HOUR, DAY)
+    return [
+        *(g.suffix(at) for g in granularities),
+        *(g.field(at) for g in granularities),
+        *(int((g.window_end(at) + g.retention).timestamp()) for g in granularities),
+    ]
+
+
+def _retained(g: Granularity, t: datetime, now: datetime) -> bool:
+    return t >= now - g.retention
+
+
+def plan_range(
+    start: datetime, end: datetime, now: datetime | None = None
+) -> list[tuple[Granularity, datetime]]:
+    """
+    Buckets whose sum is the usage in [start, end).
+
+    Bounds are rounded outward to whole minutes. Uses the coarsest bucket
+    that starts at the cursor and ends within the range, falling back to a
+    wider enclosing bucket where the finer one has expired.
+    """
+    now = now or datetime.now(UTC)
+    t = MINUTE.floor(start)
+    end = MINUTE.floor(end) + (MINUTE.step if end != MINUTE.floor(end) else timedelta())
+    buckets: list[tuple[Granularity, datetime]] = []
+
+    while t < end:
+        chosen = MINUTE
+        for g in (DAY, HOUR):
+            if g.floor(t) == t and t + g.step <= end:
+                chosen = g
+                break
+
+        # Widen to a retained granularity if this one has expired
+        for g in (chosen, HOUR, DAY):
+            if g.step >= chosen.step and _retained(g, g.floor(t), now):
+                chosen = g
+                break
+        else:
+            break  # older than any retention: nothing left to read
+
+        bucket = chosen.floor(t)
+        buckets.append((chosen, bucket))
+        t = bucket + chosen.step
+
+    return buckets
+
+
+def series_points(
+    granularity: Granularity, start: datetime, end: datetime
+) -> list[datetime]:
+    """Bucket start times at `granularity` covering [start, end)"""
+    points = []
+    t = granularity.floor(start)
+    while t < end:
+        points.append(t)
+        if len(points) > MAX_SERIES_POINTS:
+            raise ValueError(
+                f"Range spans more than {MAX_SERIES_POINTS} {granularity.name} points"
+            )
+        t += granularity.step
+    return points
+
+
+def pick_granularity(
+    start: datetime, end: datetime, now: datetime | None = None
+) -> Granularity:
+    """Finest granularity that is retained at `start` and fits a chart"""
+    now = now or datetime.now(UTC)
+    for g in (MINUTE, HOUR, DAY):
+        if (
+            _retained(g, g.floor(start), now)
+            and (end - start) / g.step <= AUTO_SERIES_POINTS
+        ):
+            return g
+    return DAY
+
+
+def group_reads(
+    buckets: list[tuple[Granularity, datetime]],
+) -> dict[str, list[str]]:
+    """Hash window suffix -> fields to read, preserving bucket order"""
+    reads: dict[str, list[str]] = {}
+    for g, t in buckets:
+        reads.setdefault(g.suffix(t), []).append(g.field(t))
+    return reads
@@ -2,13 +2,43 @@
 Usage Service
 
 Usage tracking, metering, and limits.
+
+Counters live in Redis when it is configured (shared across workers and
+replicas), otherwise in process memory. See usage_backend.py.
+
+High-frequency types (BUFFERED_USAGE_TYPES) are aggregated in process and
+written behind; see usage_buffer.py.
 """
 
 import uuid
-from datetime import UTC, datetime
+from dataclasses import replace
+from datetime import UTC, datetime, timedelta
+from typing import TYPE_CHECKING, Optional
 
 from dateutil.relativedelta import relativedelta
 
+from app.config import settings
+from services.usage_backend import (
+    BatchResult,
+    CounterUpdate,
+    MemoryUsageBackend,
+    RedisUsageBackend,
+    UsageBackend,
+)
+from services.usage_buffer import UsageBuffer
+from services.usage_series import (
+    GRANULARITIES,
+    Granularity,
+    group_reads,
+    pick_granularity,
+    plan_range,
+    series_points,
+)
+from utils.redis_client import get_redis_client
+
+if TYPE_CHECKING:
+    from services.period_close import PeriodCloseResult
+
 # Default plan limits
 PLAN_LIMITS = {
     "FREE": {
@@ -43,13 +73,64 @@ OVERAGE_PRICING = {
     "COMPUTE": 0.001,  # $0.06 per minute
 }
 
+# Incremented on nearly every request; written behind when buffering is on
+BUFFERED_USAGE_TYPES = frozenset({"AI_TOKEN", "BANDWIDTH"})
+
+# Counters outlive their period so past usage stays readable for invoicing
+USAGE_RETENTION = timedelta(days=90)
+
+# Counters read per backend call when closing a period
+PERIOD_CLOSE_BATCH_SIZE = 50_000
+
+# Quota leases: holders spend a granted chunk locally until it expires
+LEASE_DEFAULT_TTL = 30  # seconds
+LEASE_MAX_TTL = 300
+# Releases are still accepted this long after expiry (clock skew, slow
+# shutdown); after that the whole grant stays counted as used
+LEASE_RELEASE_GRACE = 60
+
+
+def _check_quantity(quantity: int) -> None:
+    # Counters only grow; corrections go through reset or lease settlement
+    if quantity <= 0:
+        raise ValueError(f"quantity must be positive, got {quantity}")
+
+
+def _as_utc(value: datetime) -> datetime:
+    """Query datetimes without a timezone are taken as UTC"""
+    return value.replace(tzinfo=UTC) if value.tzinfo is None else value.astimezone(UTC)
+
 
 class UsageService:
     """Service for usage tracking and metering"""
 
-    def __init__(self):
-        # In production, this would use Redis or database
-        self._usage_store: dict = {}
+    _instance: Optional["UsageService"] = None
+
+    def __init__(
+        self,
+        backend: UsageBackend | None = None,
+        buffer: UsageBuffer | None = None,
+    ):
+        if backend is None:
+            client = get_redis_client()
+            backend = RedisUsageBackend(client) if client else MemoryUsageBackend()
+        self.backend = backend
+        self.buffer = buffer
+        self.key_prefix = "billing:usage:"
+
+    @classmethod
+    def get_instance(cls) -> "UsageService":
+        if cls._instance is None:
+            service = cls()
+            if settings.USAGE_BUFFER_ENABLED:
+                service.buffer = UsageBuffer(
+                    service.backend,
+                    flush_interval=settings.USAGE_FLUSH_INTERVAL_SECONDS,
+                    flush_threshold=settings.USAGE_FLUSH_THRESHOLD,
+                    wal_dir=settings.USAGE_WAL_DIR or None,
+                )
+            cls._instance = service
+        return cls._instance
 
     async def record_usage(
         self,
@@ -58,27 +139,216 @@ class UsageService:
         quantity: int,
         resource: str | None = None,
         metadata: dict | None = None,
+        enforce_limit: bool = False,
     ) -> dict:
-        """Record usage for an organization"""
+        """
+        Record usage for an organization.
+
+        With enforce_limit, usage that would exceed the plan limit is not
+        recorded and success is False. The check and the increment are one
+        atomic backend operation, so concurrent callers cannot overshoot.
+
+        Unenforced usage of a buffered type is only added to the local
+        buffer; current_usage is then an estimate as of the last flush.
+        Quantities must be positive (ValueError).
+        """
+        _check_quantity(quantity)
         usage_id = str(uuid.uuid4())
-        period = self._get_current_period()
-        key = f"{organization_id}:{period}:{usage_type}"
-
-        # Get current usage
-        current = self._usage_store.get(key, 0)
-        new_usage = current + quantity
-        self._usage_store[key] = new_usage
+        key = self._key(organization_id, usage_type)
 
         # Get limit for organization's plan
         plan = await self._get_organization_plan(organization_id)
         limit = PLAN_LIMITS.get(plan, PLAN_LIMITS["FREE"]).get(usage_type, 0)
 
+        series = self._series_key(organization_id, usage_type)
+
+        if self._buffered(usage_type) and not enforce_limit:
+            usage = self.buffer.add(key, quantity, self._expire_at(), series)
+            admitted = True
+        else:
+            pending = self._pending(key)
+            result = await self.backend.record(
+                key,
+                quantity,
+                self._limit_less_pending(limit, pending),
+                expire_at=self._expire_at(),
+                enforce=enforce_limit,
+                series=series,
+            )
+            usage = result.usage + pending
+            admitted = result.admitted
+
         return {
-            "success": True,
+            "success": admitted,
             "usage_id": usage_id,
-            "current_usage": new_usage,
+            "current_usage": usage,
             "limit": limit,
-            "remaining": max(0, limit - new_usage) if limit > 0 else -1,
+            "remaining": max(0, limit - usage) if limit > 0 else -1,
+        }
+
+    async def record_usage_batch(
+        self,
+        items: list[tuple[str, str, int]],
+        enforce_limit: bool = False,
+    ) -> list[dict]:
+        """
+        Record many (organization_id, usage_type, quantity) items at once.
+
+        Items are grouped per counter and applied in one backend round trip.
+        Without enforce_limit each counter receives a single increment; with
+        it, items for a counter are admitted in order and each one that would
+        exceed the limit is rejected on its own. Returns one result per item,
+        in input order; current_usage is the counter after the whole batch.
+        A non-positive quantity rejects the whole batch (ValueError).
+        """
+        for _, _, quantity in items:
+            _check_quantity(quantity)
+        expire_at = self._expire_at()
+        plans: dict[str, str] = {}
+        groups: dict[str, CounterUpdate] = {}
+        positions: dict[str, list[int]] = {}
+        usage_types: dict[str, str] = {}
+
+        for index, (organization_id, usage_type, quantity) in enumerate(items):
+            if organization_id not in plans:
+                plans[organization_id] = await self._get_organization_plan(
+                    organization_id
+                )
+            key = self._key(organization_id, usage_type)
+            update = groups.get(key)
+            if update is None:
+                usage_types[key] = usage_type
+                limit = PLAN_LIMITS.get(
+                    plans[organization_id], PLAN_LIMITS["FREE"]
+                ).get(usage_type, 0)
+                update = groups[key] = CounterUpdate(
+                    key=key,
+                    quantities=[],
+                    limit=limit,
+                    expire_at=expire_at,
+                    enforce=enforce_limit,
+                    series=self._series_key(organization_id, usage_type),
+                )
+                positions[key] = []
+            if enforce_limit or not update.quantities:
+                update.quantities.append(quantity)
+            else:
+                update.quantities[0] += quantity
+            positions[key].append(index)
+
+        updates = list(groups.values())
+        outcomes = await self._record_many(updates, usage_types)
+
+        results: list[dict] = [{}] * len(items)
+        for update, outcome in zip(updates, outcomes, strict=True):
+            remaining = max(0, update.limit - outcome.usage) if update.limit > 0 else -1
+            for n, index in enumerate(positions[update.key]):
+                organization_id, usage_type, _ = items[index]
+                results[index] = {
+                    "organization_id": organization_id,
+                    "type": usage_type,
+                    "success": outcome.admitted[n if enforce_limit else 0],
+                    "current_usage": outcome.usage,
+                    "limit": update.limit,
+                    "remaining": remaining,
+                }
+        return results
+
+    async def _record_many(
+        self, updates: list[CounterUpdate], usage_types: dict[str, str]
+    ) -> list[BatchResult]:
+        """Buffer what can be buffered; send the rest in one backend call"""
+        outcomes: list[BatchResult | None] = [None] * len(updates)
+        direct: list[tuple[int, int]] = []  # (index, pending)
+        for i, update in enumerate(updates):
+            if self._buffered(usage_types[update.key]) and not update.enforce:
+                usage = self.buffer.add(
+                    update.key, update.quantities[0], update.expire_at, update.series
+                )
+                outcomes[i] = BatchResult(admitted=[True], usage=usage)
+            else:
+                direct.append((i, self._pending(update.key)))
+
+        if direct:
+            results = await self.backend.record_many(
+                [
+                    replace(
+                        updates[i],
+                        limit=self._limit_less_pending(updates[i].limit, pending),
+                    )
+                    for i, pending in direct
+                ]
+            )
+            for (i, pending), result in zip(direct, results, strict=True):
+                result.usage += pending
+                outcomes[i] = result
+        return outcomes
+
+    async def acquire_lease(
+        self,
+        organization_id: str,
+        usage_type: str,
+        quantity: int,
+        ttl_seconds: int = LEASE_DEFAULT_TTL,
+    ) -> dict:
+        """
+        Reserve up to `quantity` units of quota for local spending.
+
+        The grant is counted as used immediately, so leases can never admit
+        more than the limit in total; a partial grant means the limit is
+        near, and granted == 0 means it is reached. The holder spends the
+        grant until expires_at and then releases it with the amount used,
+        which gives back the remainder.
+        """
+        ttl_seconds = max(1, min(ttl_seconds, LEASE_MAX_TTL))
+        lease_id = uuid.uuid4().hex
+
+        plan = await self._get_organization_plan(organization_id)
+        limit = PLAN_LIMITS.get(plan, PLAN_LIMITS["FREE"]).get(usage_type, 0)
+        key = self._key(organization_id, usage_type)
+        pending = self._pending(key)
+
+        grant = await self.backend.acquire_lease(
+            key,
+            self._lease_key(organization_id, lease_id),
+            quantity,
+            self._limit_less_pending(limit, pending),
+            expire_at=self._expire_at(),
+            lease_ttl=ttl_seconds + LEASE_RELEASE_GRACE,
+            series=self._series_key(organization_id, usage_type),
+        )
+        grant.usage += pending
+
+        return {
+            "lease_id": lease_id if grant.granted > 0 else None,
+            "organization_id": organization_id,
+            "type": usage_type,
+            "granted": grant.granted,
+            "expires_at": datetime.now(UTC) + timedelta(seconds=ttl_seconds),
+            "current_usage": grant.usage,
+            "limit": limit,
+            "remaining": max(0, limit - grant.usage) if limit > 0 else -1,
+        }
+
+    async def release_lease(
+        self,
+        organization_id: str,
+        lease_id: str,
+        used: int,
+    ) -> dict:
+        """Settle a lease: record `used` and give back the rest of the grant"""
+        settlement = await self.backend.release_lease(
+            self._lease_key(organization_id, lease_id), max(0, used)
+        )
+        if settlement.granted < 0:
+            raise ValueError(f"Lease {lease_id} not found or expired")
+
+        return {
+            "lease_id": lease_id,
+            "granted": settlement.granted,
+            "used": used,
+            "returned": max(0, settlement.granted - used),
+            "current_usage": settlement.usage,
         }
 
     async def get_usage(
@@ -88,8 +358,13 @@ class UsageService:
         start_date: datetime | None = None,
         end_date: datetime | None = None,
     ) -> dict:
-        """Get usage summary for an organization"""
-        period = self._get_current_period()
+        """
+        Get usage summary for an organization.
+
+        Without dates this is the current billing period's counters. With
+        start_date and/or end_date, usage in that range is summed from the
+        time-series buckets (start defaults to the period start, end to now).
+        """
         plan = await self._get_organization_plan(organization_id)
         limits = PLAN_LIMITS.get(plan, PLAN_LIMITS["FREE"])
 
@@ -100,9 +375,26 @@ class UsageService:
             [usage_type] if usage_type else list(PLAN_LIMITS["FREE"].keys())
         )
 
-        for utype in types_to_check:
-            key = f"{organization_id}:{period}:{utype}"
-            current = self._usage_store.get(key, 0)
+        now = datetime.now(UTC)
+        period_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        period_end = period_start + relativedelta(months=1)
+
+        if start_date or end_date:
+            period_start = _as_utc(start_date) if start_date else period_start
+            period_end = _as_utc(end_date) if end_date else now
+            counters = await self._range_totals(
+                organization_id,
+                types_to_check,
+                period_start,
+                period_end,
+                include_pending=period_end >= now,
+            )
+        else:
+            counters = await self._get_many(
+                [self._key(organization_id, utype) for utype in types_to_check]
+            )
+
+        for utype, current in zip(types_to_check, counters, strict=True):
             limit = limits.get(utype, 0)
 
             overage = max(0, current - limit) if limit > 0 else 0
@@ -122,10 +414,6 @@ class UsageService:
                 }
             )
 
-        now = datetime.now(UTC)
-        period_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        period_end = period_start + relativedelta(months=1)
-
         return {
             "organization_id": organization_id,
             "period_start": period_start,
@@ -134,6 +422,80 @@ class UsageService:
             "total_cost": total_cost,
         }
 
+    async def get_series(
+        self,
+        organization_id: str,
+        usage_type: str,
+        start_date: datetime,
+        end_date: datetime | None = None,
+        granularity: str = "auto",
+    ) -> dict:
+        """Usage over time, one point per minute, hour or day bucket"""
+        start = _as_utc(start_date)
+        end = _as_utc(end_date) if end_date else datetime.now(UTC)
+        if end <= start:
+            raise ValueError("end_date must be after start_date")
+        if granularity == "auto":
+            g = pick_granularity(start, end)
+        elif granularity in GRANULARITIES:
+            g = GRANULARITIES[granularity]
+        else:
+            raise ValueError(f"Unknown granularity: {granularity}")
+
+        points = series_points(g, start, end)
+        values = await self._read_buckets(
+            organization_id, [usage_type], [(g, t) for t in points]
+        )
+        return {
+            "organization_id": organization_id,
+            "type": usage_type,
+            "granularity": g.name,
+            "start": start,
+            "end": end,
+            "points": [
+                {"timestamp": t, "value": v}
+                for t, v in zip(points, values[0], strict=True)
+            ],
+            "total": sum(values[0]),
+        }
+
+    async def _range_totals(
+        self,
+        organization_id: str,
+        usage_types: list[str],
+        start: datetime,
+        end: datetime,
+        include_pending: bool = False,
+    ) -> list[int]:
+        """Usage per type in [start, end), from the coarsest covering buckets"""
+        values = await self._read_buckets(
+            organization_id, usage_types, plan_range(start, end)
+        )
+        totals = [sum(v) for v in values]
+        if include_pending:
+            # Buffered usage happened "now" but is not in any bucket yet
+            totals = [
+                total + self._pending(self._key(organization_id, utype))
+                for utype, total in zip(usage_types, totals, strict=True)
+            ]
+        return totals
+
+    async def _read_buckets(
+        self,
+        organization_id: str,
+        usage_types: list[str],
+        buckets: list[tuple[Granularity, datetime]],
+    ) -> list[list[int]]:
+        """Bucket values per type, in bucket order, in one backend round trip"""
+        reads = group_reads(buckets)
+        requests = [
+            (self._series_key(organization_id, utype) + suffix, fields)
+            for utype in usage_types
+            for suffix, fields in reads.items()
+        ]
+        replies = iter(await self.backend.get_buckets(requests) if requests else [])
+        return [[value for _ in reads for value in next(replies)] for _ in usage_types]
+
     async def check_limit(
         self,
         organization_id: str,
@@ -141,9 +503,7 @@ class UsageService:
         quantity: int,
     ) -> dict:
         """Check if usage is within limits"""
-        period = self._get_current_period()
-        key = f"{organization_id}:{period}:{usage_type}"
-        current = self._usage_store.get(key, 0)
+        [current] = await self._get_many([self._key(organization_id, usage_type)])
 
         plan = await self._get_organization_plan(organization_id)
         limit = PLAN_LIMITS.get(plan, PLAN_LIMITS["FREE"]).get(usage_type, 0)
@@ -174,12 +534,13 @@ class UsageService:
         plan = await self._get_organization_plan(organization_id)
         limits = PLAN_LIMITS.get(plan, PLAN_LIMITS["FREE"])
 
-        period = self._get_current_period()
         result = {"plan": plan, "limits": {}}
 
-        for usage_type, limit in limits.items():
-            key = f"{organization_id}:{period}:{usage_type}"
-            current = self._usage_store.get(key, 0)
+        counters = await self._get_many(
+            [self._key(organization_id, utype) for utype in limits]
+        )
+
+        for (usage_type, limit), current in zip(limits.items(), counters, strict=True):
             result["limits"][usage_type] = {
                 "limit": limit,
                 "current": current,
@@ -188,22 +549,99 @@ class UsageService:
 
         return result
 
+    async def close_period(
+        self,
+        organization_ids: list[str],
+        period: str,
+        plans: dict[str, str] | None = None,
+    ) -> "PeriodCloseResult":
+        """
+        Overage of many organizations for a billing period ("YYYY-MM").
+
+        Counters are read in batches of PERIOD_CLOSE_BATCH_SIZE and the
+        overage computed in one vectorized pass (see period_close.py).
+        `plans` maps organizations to plan names; organizations missing from
+        it are looked up.
+        """
+        # Imported on first use: NumPy adds to every worker's startup time
+        from services.period_close import (
+            USAGE_TYPES,
+            PeriodUsage,
+            compute_overage,
+        )
+
+        if self.buffer is not None:
+            # Usage for the closing period may still be waiting to be written
+            await self.buffer.flush()
+
+        plans = plans or {}
+        plan_names = [
+            plans.get(org) or await self._get_organization_plan(org)
+            for org in organization_ids
+        ]
+        keys = [
+            self._key(org, usage_type, period)
+            for org in organization_ids
+            for usage_type in USAGE_TYPES
+        ]
+        counters: list[int] = []
+        for start in range(0, len(keys), PERIOD_CLOSE_BATCH_SIZE):
+            counters += await self.backend.get_many(
+                keys[start : start + PERIOD_CLOSE_BATCH_SIZE]
+            )
+
+        return compute_overage(
+            PeriodUsage.from_counters(period, organization_ids, plan_names, counters)
+        )
+
     async def reset_usage(
         self,
         organization_id: str,
         usage_type: str | None = None,
     ) -> None:
         """Reset usage counters"""
-        period = self._get_current_period()
-
-        if usage_type:
-            key = f"{organization_id}:{period}:{usage_type}"
-            self._usage_store[key] = 0
-        else:
-            # Reset all types
-            for utype in PLAN_LIMITS["FREE"].keys():
-                key = f"{organization_id}:{period}:{utype}"
-                self._usage_store[key] = 0
+        types_to_reset = [usage_type] if usage_type else list(PLAN_LIMITS["FREE"])
+        keys = [self._key(organization_id, utype) for utype in types_to_reset]
+        if self.buffer is not None:
+            self.buffer.discard(keys)
+        await self.backend.reset(keys)
+
+    def _buffered(self, usage_type: str) -> bool:
+        return self.buffer is not None and usage_type in BUFFERED_USAGE_TYPES
+
+    def _pending(self, key: str) -> int:
+        """Usage buffered locally but not yet flushed to the backend"""
+        return self.buffer.pending(key) if self.buffer is not None else 0
+
+    @staticmethod
+    def _limit_less_pending(limit: int, pending: int) -> int:
+        # -1 (unlimited) stays unlimited
+        return limit if limit < 0 else max(0, limit - pending)
+
+    async def _get_many(self, keys: list[str]) -> list[int]:
+        counters = await self.backend.get_many(keys)
+        return [c + self._pending(k) for k, c in zip(keys, counters, strict=True)]
+
+    def _key(
+        self, organization_id: str, usage_type: str, period: str | None = None
+    ) -> str:
+        # Hash tag keeps an organization's counters in one cluster slot (MGET)
+        period = period or self._get_current_period()
+        return f"{self.key_prefix}{{{organization_id}}}:{period}:{usage_type}"
+
+    def _series_key(self, organization_id: str, usage_type: str) -> str:
+        """Prefix of an organization's time-series bucket hashes for one type"""
+        return f"{self.key_prefix}ts:{{{organization_id}}}:{usage_type}:"
+
+    def _lease_key(self, organization_id: str, lease_id: str) -> str:
+        return f"{self.key_prefix}lease:{{{organization_id}}}:{lease_id}"
+
+    def _expire_at(self) -> int:
+        """Unix time at which current-period counters expire"""
+        now = datetime.now(UTC)
+        period_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        period_end = period_start + relativedelta(months=1)
+        return int((period_end + USAGE_RETENTION).timestamp())
 
     def _get_current_period(self) -> str:
         """Get current billing period string"""
@@ -0,0 +1,560 @@
+"""
+Webhook Queue
+
+Stripe webhook events are acknowledged as soon as their signature is
+verified. Processing happens later, in a worker pool fed by a queue.
+
+- Stripe retries any delivery that is slow or fails, and can redeliver an
+  event it already delivered. Enqueueing is deduplicated by event.id for
+  DEDUPE_TTL, so the handlers run once per event.
+- Events are partitioned by Stripe customer. Each partition is worked by a
+  single consumer at a time, in order, so the events of one customer are
+  handled in the order they were received. Different customers are
+  handled in parallel.
+- A handler that keeps failing is retried with backoff, then moved to a
+  dead-letter list so it does not hold up the rest of its partition.
+- Delivery is at least once: an event whose worker dies mid-handler is
+  handled again. Handlers must be idempotent, as the customer index and
+  subscription mirror writes are.
+
+RedisWebhookQueue keeps one stream per partition. A Lua script adds the
+event and sets its dedupe key in one step. Each replica runs workers for
+every partition, and a lease decides which replica consumes a partition.
+The holder renews the lease before every event and stops mid-batch if it
+was lost. A new lease holder first re-reads the entries its predecessor
+left unacknowledged. MemoryWebhookQueue is a per-process stand-in for when Redis
+is not configured; it is not durable.
+
+Queue depth, the age of the oldest queued event, and handler latency are
+exported in Prometheus format (prometheus_metrics()).
+"""
+
+import asyncio
+import json
+import time
+import uuid
+import zlib
+from collections import OrderedDict, deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import Protocol
+
+import redis.asyncio as redis
+import structlog
+
+from _shared.memory import register_store
+from app.config import settings
+from utils.redis_client import get_redis_client
+
+from .webhook_service import WebhookService
+
+logger = structlog.get_logger()
+
+DEFAULT_PARTITIONS = 8
+# Stripe retries deliveries for up to three days
+DEDUPE_TTL = 7 * 24 * 3600  # seconds
+DEFAULT_MAX_ATTEMPTS = 5
+RETRY_BACKOFF = 0.5  # seconds, doubled per attempt
+READ_COUNT = 32
+READ_BLOCK = 1.0  # seconds a worker waits for new events
+# Seconds; renewed before every event, so it must outlast one event's retries
+LEASE_TTL = 30.0
+# Local stand-in: event ids remembered for dedupe
+MEMORY_DEDUPE_ENTRIES = 100_000
+
+HANDLER_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+@dataclass
+class QueuedEvent:
+    """An event waiting in (or just read from) a partition"""
+
+    entry_id: str
+    partition: int
+    event: dict
+    enqueued_at: float  # unix time
+
+
+def partition_key(event: dict) -> str:
+    """The customer an event belongs to; events without one are unordered"""
+    data = event.get("data", {}).get("object", {})
+    customer = data.get("customer")
+    if isinstance(customer, dict):
+        customer = customer.get("id")
+    if not customer and data.get("object") == "customer":
+        customer = data.get("id")
+    return customer or event["id"]
+
+
+def partition_for(event: dict, partitions: int) -> int:
+    # crc32, not hash(): every replica must pick the same partition
+    return zlib.crc32(partition_key(event).encode()) % partitions
+
+
+class WebhookQueue(Protocol):
+    """Partitioned, deduplicating event queue"""
+
+    partitions: int
+
+    async def enqueue(self, event: dict) -> bool:
+        """Queue an event; False if its id was already queued"""
+        ...
+
+    async def claim(self, partition: int, owner: str) -> bool:
+        """Take or renew the right to consume a partition"""
+        ...
+
+    async def release(self, partition: int, owner: str) -> None:
+        """Give up a partition if `owner` holds it"""
+        ...
+
+    async def read(self, partition: int, count: int, block: float) -> list[QueuedEvent]:
+        """Next events of a partition, oldest first (waits up to `block`)"""
+        ...
+
+    async def ack(self, entry: QueuedEvent) -> None: ...
+
+    async def dead_letter(self, entry: QueuedEvent, error: str) -> None: ...
+
+    async def lag(self) -> dict[int, tuple[int, float]]:
+        """Per partition: queued events, and age in seconds of the oldest"""
+        ...
+
+
+# ── Memory ───────────────────────────────────────────────────────────────────
+
+
+class MemoryWebhookQueue:
+    """Per-process stand-in: not durable, and only this process consumes it"""
+
+    def __init__(self, partitions: int = DEFAULT_PARTITIONS):
+        self.partitions = partitions
+        self._queues: list[deque[QueuedEvent]] = [deque() for _ in range(partitions)]
+        self._ready = [asyncio.Event() for _ in range(partitions)]
+        # Read but not yet acknowledged, re-read if a worker restarts
+        self._unacked: list[dict[str, QueuedEvent]] = [{} for _ in range(partitions)]
+        self._seen: OrderedDict[str, None] = OrderedDict()
+        self.dead: list[tuple[QueuedEvent, str]] = []
+        self._sequence = 0
+        register_store("billing.webhook_queue", self._queues)
+
+    async def enqueue(self, event: dict) -> bool:
+        if event["id"] in self._seen:
+            return False
+        self._seen[event["id"]] = None
+        while len(self._seen) > MEMORY_DEDUPE_ENTRIES:
+            self._seen.popitem(last=False)
+        partition = partition_for(event, self.partitions)
+        self._sequence += 1
+        self._queues[partition].append(
+            QueuedEvent(str(self._sequence), partition, event, time.time())
+        )
+        self._ready[partition].set()
+        return True
+
+    async def claim(self, partition: int, owner: str) -> bool:
+        return True
+
+    async def release(self, partition: int, owner: str) -> None:
+        pass
+
+    async def read(self, partition: int, count: int, block: float) -> list[QueuedEvent]:
+        unacked = self._unacked[partition]
+        if unacked:
+            return list(unacked.values())[:count]
+        queue = self._queues[partition]
+        if not queue:
+            self._ready[partition].clear()
+            try:
+                await asyncio.wait_for(self._ready[partition].wait(), block)
+            except TimeoutError:
+                return []
+        entries = [queue.popleft() for _ in range(min(count, len(queue)))]
+        unacked.update((entry.entry_id, entry) for entry in entries)
+        return entries
+
+    async def ack(self, entry: QueuedEvent) -> None:
+        self._unacked[entry.partition].pop(entry.entry_id, None)
+
+    async def dead_letter(self, entry: QueuedEvent, error: str) -> None:
+        self.dead.append((entry, error))
+
+    async def lag(self) -> dict[int, tuple[int, float]]:
+        now = time.time()
+        lag = {}
+        for partition in range(self.partitions):
+            waiting = [*self._unacked[partition].values(), *self._queues[partition]]
+            oldest = min((entry.enqueued_at for entry in waiting), default=now)
+            lag[partition] = (len(waiting), now - oldest)
+        return lag
+
+
+# ── Redis ────────────────────────────────────────────────────────────────────
+
+# KEYS: dedupe key, stream. ARGV: dedupe TTL, event JSON.
+# Returns the entry id, or nil for an event id seen before.
+ENQUEUE_SCRIPT = """
+if not redis.call('SET', KEYS[1], '1', 'NX', 'EX', ARGV[1]) then
+    return nil
+end
+return redis.call('XADD', KEYS[2], '*', 'event', ARGV[2])
+"""
+
+# KEYS: lease. ARGV: owner, TTL in ms. Takes a free lease or renews our own.
+CLAIM_SCRIPT = """
+local holder = redis.call('GET', KEYS[1])
+if holder and holder ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+return holder and 1 or 2
+"""
+
+# KEYS: lease. ARGV: owner. Drops the lease only if we hold it.
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisWebhookQueue:
+    """One Redis stream per partition, consumed by the partition's lease holder"""
+
+    GROUP = "workers"
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        partitions: int = DEFAULT_PARTITIONS,
+        prefix: str = "billing:webhooks:",
+        lease_ttl: float = LEASE_TTL,
+    ):
+        self.redis = client
+        self.partitions = partitions
+        self.prefix = prefix
+        self.lease_ttl = lease_ttl
+        self._enqueue = client.register_script(ENQUEUE_SCRIPT)
+        self._claim = client.register_script(CLAIM_SCRIPT)
+        self._release = client.register_script(RELEASE_SCRIPT)
+        self._groups: set[int] = set()
+        # Partitions whose unacknowledged entries must be re-read first
+        self._recovering: set[int] = set()
+
+    def _stream(self, partition: int) -> str:
+        return f"{self.prefix}{partition}"
+
+    async def enqueue(self, event: dict) -> bool:
+        partition = partition_for(event, self.partitions)
+        entry_id = await self._enqueue(
+            keys=[f"{self.prefix}seen:{event['id']}", self._stream(partition)],
+            args=[DEDUPE_TTL, json.dumps(event)],
+        )
+        return entry_id is not None
+
+    async def claim(self, partition: int, owner: str) -> bool:
+        result = await self._claim(
+            keys=[f"{self.prefix}lease:{partition}"],
+            args=[owner, int(self.lease_ttl * 1000)],
+        )
+        if result == 2:  # newly taken: pick up where the last holder stopped
+            self._recovering.add(partition)
+        return result != 0
+
+    async def release(self, partition: int, owner: str) -> None:
+        await self._release(keys=[f"{self.prefix}lease:{partition}"], args=[owner])
+        self._recovering.discard(partition)
+
+    async def _ensure_group(self, partition: int) -> None:
+        if partition in self._groups:
+            return
+        try:
+            await self.redis.xgroup_create(
+                self._stream(partition), self.GROUP, id="0", mkstream=True
+            )
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._groups.add(partition)
+
+    async def read(self, partition: int, count: int, block: float) -> list[QueuedEvent]:
+        await self._ensure_group(partition)
+        stream = self._stream(partition)
+        # Every lease holder reads as the same consumer, so "0" returns the
+        # entries the previous holder read but never acknowledged
+        consumer = f"p{partition}"
+        if partition in self._recovering:
+            reply = await self.redis.xreadgroup(
+                self.GROUP, consumer, {stream: "0"}, count=count
+            )
+            entries = self._entries(partition, reply)
+            if entries:
+                return entries
+            self._recovering.discard(partition)
+        # XREADGROUP treats BLOCK 0 as "wait forever"
+        wait = int(block * 1000) or None
+        reply = await self.redis.xreadgroup(
+            self.GROUP, consumer, {stream: ">"}, count=count, block=wait
+        )
+        return self._entries(partition, reply)
+
+    @staticmethod
+    def _entries(partition: int, reply) -> list[QueuedEvent]:
+        entries = []
+        for _, messages in reply or []:
+            for entry_id, fields in messages:
+                entries.append(
+                    QueuedEvent(
+                        entry_id=entry_id,
+                        partition=partition,
+                        event=json.loads(fields["event"]),
+                        enqueued_at=_entry_time(entry_id),
+                    )
+                )
+        return entries
+
+    async def ack(self, entry: QueuedEvent) -> None:
+        stream = self._stream(entry.partition)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xack(stream, self.GROUP, entry.entry_id)
+            pipe.xdel(stream, entry.entry_id)
+            await pipe.execute()
+
+    async def dead_letter(self, entry: QueuedEvent, error: str) -> None:
+        await self.redis.xadd(
+            f"{self.prefix}dead",
+            {"event": json.dumps(entry.event), "error": error},
+        )
+
+    async def lag(self) -> dict[int, tuple[int, float]]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for partition in range(self.partitions):
+                stream = self._stream(partition)
+                pipe.xlen(stream)
+                pipe.xrange(stream, count=1)
+            replies = await pipe.execute()
+        now = time.time()
+        lag = {}
+        for partition in range(self.partitions):
+            depth, head = replies[2 * partition], replies[2 * partition + 1]
+            oldest = _entry_time(head[0][0]) if head else now
+            lag[partition] = (int(depth), max(0.0, now - oldest))
+        return lag
+
+
+def _entry_time(entry_id: str) -> float:
+    """Unix time a stream entry was added (its id starts with milliseconds)"""
+    return int(entry_id.split("-", 1)[0]) / 1000
+
+
+# ── Workers ──────────────────────────────────────────────────────────────────
+
+
+class _Histogram:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class WebhookWorkers:
+    """
+    One worker per partition, handling its events in order.
+
+    Args:
+        queue: Where events wait.
+        handler: Handles one event (WebhookService.handle_event).
+        max_attempts: Tries per event before it is dead-lettered.
+        backoff: First retry delay in seconds, doubled per retry.
+    """
+
+    def __init__(
+        self,
+        queue: WebhookQueue,
+        handler: Callable[[dict], Awaitable[dict]],
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        backoff: float = RETRY_BACKOFF,
+        read_block: float = READ_BLOCK,
+    ):
+        self.queue = queue
+        self.handler = handler
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.read_block = read_block
+        self.owner = uuid.uuid4().hex
+        self._tasks: list[asyncio.Task] = []
+        self.enqueued = 0
+        self.duplicates = 0
+        self.handled = 0
+        self.retries = 0
+        self.dead = 0
+        self.handler_seconds = _Histogram(HANDLER_BUCKETS)
+
+    async def submit(self, event: dict) -> bool:
+        """Queue an event from the webhook route; False for a duplicate"""
+        queued = await self.queue.enqueue(event)
+        if queued:
+            self.enqueued += 1
+        else:
+            self.duplicates += 1
+            logger.info("webhook_duplicate", event_id=event["id"], type=event["type"])
+        return queued
+
+    async def process(self, entry: QueuedEvent) -> None:
+        """Handle one event, retrying; dead-letters it after max_attempts"""
+        event = entry.event
+        for attempt in range(self.max_attempts):
+            started = time.perf_counter()
+            try:
+                await self.handler(event)
+            except Exception as e:
+                self.handler_seconds.observe(time.perf_counter() - started)
+                if attempt + 1 >= self.max_attempts:
+                    self.dead += 1
+                    logger.error(
+                        "webhook_dead_lettered",
+                        event_id=event["id"],
+                        type=event["type"],
+                        error=str(e),
+                    )
+                    await self.queue.dead_letter(entry, str(e))
+                    break
+                self.retries += 1
+                await asyncio.sleep(self.backoff * (2**attempt))
+            else:
+                self.handler_seconds.observe(time.perf_counter() - started)
+                self.handled += 1
+                break
+        await self.queue.ack(entry)
+
+    async def drain(self, partition: int) -> int:
+        """Handle what is queued in a partition now; returns events handled"""
+        done = 0
+        while entries := await self.queue.read(partition, READ_COUNT, block=0):
+            for entry in entries:
+                await self.process(entry)
+                done += 1
+        return done
+
+    def start(self) -> None:
+        """Start the workers on the running event loop"""
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._run(p), name=f"webhook-worker-{p}")
+                for p in range(self.queue.partitions)
+            ]
+
+    async def _run(self, partition: int) -> None:
+        while True:
+            try:
+                if not await self.queue.claim(partition, self.owner):
+                    await asyncio.sleep(self.read_block)
+                    continue
+                for entry in await self.queue.read(
+                    partition, READ_COUNT, self.read_block
+                ):
+                    # A batch can outlast the lease (retries back off); once
+                    # another replica holds it, the rest of the batch is its
+                    if not await self.queue.claim(partition, self.owner):
+                        logger.warning("webhook_lease_lost", partition=partition)
+                        break
+                    await self.process(entry)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(
+                    "webhook_worker_failed", partition=partition, error=str(e)
+                )
+                await asyncio.sleep(1.0)
+
+    async def close(self) -> None:
+        """
+        Stop the workers (a shutdown hook) and release their leases, so other
+        replicas take over without waiting them out. Unacknowledged events
+        are re-read by the next holder.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._tasks:
+            await asyncio.gather(
+                *(
+                    self.queue.release(partition, self.owner)
+                    for partition in range(self.queue.partitions)
+                ),
+                return_exceptions=True,
+            )
+        self._tasks = []
+
+    async def prometheus_metrics(self) -> str:
+        """Queue lag, throughput and handler latency in Prometheus format"""
+        lag = await self.queue.lag()
+        lines = [
+            "# HELP stripe_webhook_queue_depth Events waiting per partition.",
+            "# TYPE stripe_webhook_queue_depth gauge",
+            *(
+                f'stripe_webhook_queue_depth{{partition="{p}"}} {d}'
+                for p, (d, _) in lag.items()
+            ),
+            "# HELP stripe_webhook_queue_lag_seconds Age of the oldest waiting event.",
+            "# TYPE stripe_webhook_queue_lag_seconds gauge",
+            *(
+                f'stripe_webhook_queue_lag_seconds{{partition="{p}"}} {age:.3f}'
+                for p, (_, age) in lag.items()
+            ),
+            "# HELP stripe_webhook_events_total Deliveries received by this process.",
+            "# TYPE stripe_webhook_events_total counter",
+            f'stripe_webhook_events_total{{outcome="enqueued"}} {self.enqueued}',
+            f'stripe_webhook_events_total{{outcome="duplicate"}} {self.duplicates}',
+            "# HELP stripe_webhook_handled_total Events handled by this process.",
+            "# TYPE stripe_webhook_handled_total counter",
+            f'stripe_webhook_handled_total{{outcome="ok"}} {self.handled}',
+            f'stripe_webhook_handled_total{{outcome="retry"}} {self.retries}',
+            f'stripe_webhook_handled_total{{outcome="dead"}} {self.dead}',
+            "# HELP stripe_webhook_handler_seconds Time spent in one handler attempt.",
+            "# TYPE stripe_webhook_handler_seconds histogram",
+        ]
+        histogram = self.handler_seconds
+        for bound, count in zip(histogram.buckets, histogram.counts, strict=True):
+            lines.append(
+                f'stripe_webhook_handler_seconds_bucket{{le="{bound}"}} {count}'
+            )
+        lines += [
+            f'stripe_webhook_handler_seconds_bucket{{le="+Inf"}} {histogram.count}',
+            f"stripe_webhook_handler_seconds_sum {histogram.sum:.6f}",
+            f"stripe_webhook_handler_seconds_count {histogram.count}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+_workers: WebhookWorkers | None = None
+
+
+def get_webhook_workers() -> WebhookWorkers:
+    """Get the process-wide webhook queue and its workers"""
+    global _workers
+
+    if _workers is None:
+        client = get_redis_client()
+        partitions = settings.WEBHOOK_QUEUE_PARTITIONS
+        queue = (
+            RedisWebhookQueue(client, partitions)
+            if client
+            else MemoryWebhookQueue(partitions)
+        )
+        _workers = WebhookWorkers(
+            queue,
+            WebhookService().handle_event,
+            max_attempts=settings.WEBHOOK_MAX_ATTEMPTS,
+        )
+
+    return _workers
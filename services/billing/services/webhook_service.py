@@ -2,29 +2,53 @@
 Webhook Service
 
 Handle Stripe webhook events.
+
+customer.* events keep the organization → customer index (see
+customer_index.py) in step with Stripe, versioned by the event's `created`
+time; customer.subscription.* and invoice.* events feed the subscription
+mirror (see subscription_mirror.py).
 """
 
+import time
+from functools import partial
+
 import structlog
 
+from .customer_index import CustomerIndex, CustomerRecord, get_customer_index
+from .subscription_mirror import SubscriptionMirror, get_subscription_mirror
+
 logger = structlog.get_logger()
 
 
 class WebhookService:
     """Service for handling Stripe webhooks"""
 
+    def __init__(
+        self,
+        customers: CustomerIndex | None = None,
+        subscriptions: SubscriptionMirror | None = None,
+    ):
+        self.customers = customers or get_customer_index()
+        self.subscriptions = subscriptions or get_subscription_mirror()
+
     async def handle_event(self, event: dict) -> dict:
         """Route and handle Stripe webhook events"""
         event_type = event["type"]
         data = event["data"]["object"]
 
-        handler = self._get_handler(event_type)
+        if event_type.startswith(("customer.subscription.", "invoice.")):
+            await self.subscriptions.apply_event(event)
+
+        handler = self._get_handler(
+            event_type, version=event.get("created") or int(time.time())
+        )
         if handler:
             return await handler(data)
 
         logger.info("unhandled_webhook_event", event_type=event_type)
         return {"handled": False, "event_type": event_type}
 
-    def _get_handler(self, event_type: str):
+    def _get_handler(self, event_type: str, version: int):
         """Get handler for event type"""
         handlers = {
             # Checkout
@@ -43,9 +67,9 @@ class WebhookService:
             "payment_intent.succeeded": self._handle_payment_succeeded,
             "payment_intent.payment_failed": self._handle_payment_failed,
             # Customer
-            "customer.created": self._handle_customer_created,
-            "customer.updated": self._handle_customer_updated,
-            "customer.deleted": self._handle_customer_deleted,
+            "customer.created": partial(self._handle_customer_created, version=version),
+            "customer.updated": partial(self._handle_customer_updated, version=version),
+            "customer.deleted": partial(self._handle_customer_deleted, version=version),
         }
         return handlers.get(event_type)
 
@@ -94,7 +118,6 @@ class WebhookService:
             status=status,
         )
 
-        # TODO: Create subscription record in database
         # TODO: Update organization plan
 
         return {
@@ -118,7 +141,6 @@ class WebhookService:
             cancel_at_period_end=cancel_at_period_end,
         )
 
-        # TODO: Update subscription record in database
         # TODO: Update organization plan if changed
         # TODO: Handle downgrades/upgrades
 
@@ -139,7 +161,6 @@ class WebhookService:
             organization_id=organization_id,
         )
 
-        # TODO: Update subscription status to canceled
         # TODO: Downgrade organization to free plan
         # TODO: Send cancellation email
 
@@ -274,7 +295,7 @@ class WebhookService:
         }
 
     # Customer handlers
-    async def _handle_customer_created(self, data: dict) -> dict:
+    async def _handle_customer_created(self, data: dict, version: int) -> dict:
         """Handle new customer"""
         customer_id = data.get("id")
         email = data.get("email")
@@ -287,7 +308,9 @@ class WebhookService:
             email=email,
         )
 
-        # TODO: Link customer to organization in database
+        record = CustomerRecord.from_stripe(data, version)
+        if record is not None:
+            await self.customers.put(record)
 
         return {
             "handled": True,
@@ -295,17 +318,28 @@ class WebhookService:
             "organization_id": organization_id,
         }
 
-    async def _handle_customer_updated(self, data: dict) -> dict:
+    async def _handle_customer_updated(self, data: dict, version: int) -> dict:
         """Handle customer update"""
         customer_id = data.get("id")
         logger.info("customer_updated", customer_id=customer_id)
+
+        # Also links customers created without organization metadata, once
+        # it is added
+        record = CustomerRecord.from_stripe(data, version)
+        if record is not None:
+            await self.customers.put(record)
+
         return {"handled": True, "customer_id": customer_id}
 
-    async def _handle_customer_deleted(self, data: dict) -> dict:
+    async def _handle_customer_deleted(self, data: dict, version: int) -> dict:
         """Handle customer deletion"""
         customer_id = data.get("id")
         logger.info("customer_deleted", customer_id=customer_id)
 
-        # TODO: Unlink customer from organization
+        organization_id = await self.customers.remove(customer_id, version)
 
-        return {"handled": True, "customer_id": customer_id}
+        return {
+            "handled": True,
+            "customer_id": customer_id,
+            "organization_id": organization_id,
+        }
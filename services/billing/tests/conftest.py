@@ -0,0 +1,51 @@
+"""
+pytest fixtures for the billing-service test suite.
+
+Redis is replaced by fakeredis (with Lua support), so server-side scripts
+run exactly as they would against a real server — no network is used.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+
+import pytest
+import pytest_asyncio
+from fakeredis import FakeAsyncRedis
+from httpx import ASGITransport, AsyncClient
+
+# Ensure _shared and services/ are importable without a real install
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest_asyncio.fixture
+async def fake_redis():
+    """A fresh, empty fake Redis per test."""
+    client = FakeAsyncRedis(decode_responses=True)
+    yield client
+    await client.flushall()
+    await client.aclose()
+
+
+@pytest_asyncio.fixture
+async def client(fake_redis):
+    """Async test client for the billing app, with usage counters in fake Redis."""
+    # Patch OTel endpoint so instrument_app exits early (no collector in CI)
+    os.environ.pop("OTEL_EXPORTER_OTLP_ENDPOINT", None)
+
+    from app.main import app  # import after patching env
+    from services.usage_backend import RedisUsageBackend
+    from services.usage_service import UsageService
+
+    UsageService._instance = UsageService(backend=RedisUsageBackend(fake_redis))
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        yield ac
+    UsageService._instance = None
@@ -0,0 +1,234 @@
+"""Tests for point-in-time balances and bonus credit expiry."""
+
+from __future__ import annotations
+
+import asyncio
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+from services.credit_expiry import CreditExpiryScheduler
+from services.credits_ledger import MemoryLedgerBackend
+from services.credits_service import CreditsService
+
+ORG = "org_expiry"
+
+
+@pytest.fixture
+def service():
+    return CreditsService(ledger=MemoryLedgerBackend())
+
+
+def _soon(seconds: float = 0.05) -> datetime:
+    return datetime.now(UTC) + timedelta(seconds=seconds)
+
+
+async def _purchase(service, credits: int, org: str = ORG) -> None:
+    """Non-expiring credits, without going through Stripe"""
+    await service.ledger.append(org, "PURCHASE", credits, "Purchased")
+
+
+async def _expirations(service, org: str = ORG) -> list[dict]:
+    page = await service.get_transactions(org, transaction_type="EXPIRATION")
+    return page["transactions"]
+
+
+@pytest.mark.asyncio
+async def test_balance_at_past_moments(service):
+    before = datetime.now(UTC)
+    await service.add_bonus(ORG, 100, "welcome")
+    after_bonus = datetime.now(UTC)
+    await service.deduct_credits(ORG, 30, "chat")
+    after_deduct = datetime.now(UTC)
+    await service.deduct_credits(ORG, 5, "chat")
+
+    assert (await service.get_balance_at(ORG, before))["balance"] == 0
+    assert (await service.get_balance_at(ORG, after_bonus))["balance"] == 100
+    assert (await service.get_balance_at(ORG, after_deduct))["balance"] == 70
+    assert (await service.get_balance_at(ORG, datetime.now(UTC)))["balance"] == 65
+
+
+@pytest.mark.asyncio
+async def test_unused_bonus_is_forfeited(service):
+    await _purchase(service, 50)
+    await service.add_bonus(ORG, 100, "welcome", expires_at=_soon())
+    await asyncio.sleep(0.1)
+
+    recorded = await service.expiry.run_due()
+
+    assert [entry.credits for entry in recorded] == [-100]
+    assert (await service.get_balance(ORG))["balance"] == 50
+    assert (await _expirations(service))[0]["metadata"]["grant_id"]
+
+
+@pytest.mark.asyncio
+async def test_spending_draws_on_expiring_credits_first(service):
+    await _purchase(service, 50)
+    await service.add_bonus(ORG, 100, "welcome", expires_at=_soon())
+    await service.deduct_credits(ORG, 70, "chat")
+    await asyncio.sleep(0.1)
+
+    await service.expiry.run_due()
+
+    # 30 of the bonus were left; the purchased 50 are untouched
+    assert (await service.get_balance(ORG))["balance"] == 50
+
+
+@pytest.mark.asyncio
+async def test_forfeit_never_exceeds_available_balance(service):
+    await service.add_bonus(ORG, 100, "welcome", expires_at=_soon())
+    await service.reserve_credits(ORG, 80, "chat")
+    await asyncio.sleep(0.1)
+
+    await service.expiry.run_due()
+
+    balance = await service.get_balance(ORG)
+    assert balance["balance"] == 80
+    assert balance["available"] == 0
+
+
+@pytest.mark.asyncio
+async def test_grant_expires_once(service):
+    await service.add_bonus(ORG, 100, "welcome", expires_at=_soon())
+    grant_id = (await service.get_transactions(ORG))["transactions"][0]["id"]
+    await asyncio.sleep(0.1)
+
+    first = await service.ledger.expire_many([(ORG, grant_id)])
+    again = await service.ledger.expire_many([(ORG, grant_id), (ORG, grant_id)])
+
+    assert len(first) == 1
+    assert again == []
+    assert await service.ledger.pending_expirations() == []
+
+
+@pytest.mark.asyncio
+async def test_grants_not_yet_due_stay_queued(service):
+    await service.add_bonus(ORG, 10, "later", expires_at=_soon(3600))
+    await service.add_bonus(ORG, 20, "now", expires_at=_soon())
+    await asyncio.sleep(0.1)
+
+    recorded = await service.expiry.run_due()
+
+    assert [entry.credits for entry in recorded] == [-20]
+    assert service.expiry.pending() == 1
+
+
+class FakeClock:
+    """A "now" that only moves when told to"""
+
+    def __init__(self):
+        self.now = datetime(2026, 1, 1, tzinfo=UTC)
+
+    def __call__(self) -> datetime:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += timedelta(seconds=seconds)
+
+
+@pytest.mark.asyncio
+async def test_due_grants_expire_in_batches():
+    clock = FakeClock()
+    ledger = MemoryLedgerBackend(clock=clock)
+    batches = []
+    expire_many = ledger.expire_many
+
+    async def recording_expire_many(grants):
+        batches.append(len(grants))
+        return await expire_many(grants)
+
+    ledger.expire_many = recording_expire_many
+    service = CreditsService(ledger=ledger, clock=clock)
+    service.expiry.batch_size = 100
+    orgs = [f"org_{i}" for i in range(1_000)]
+    expires_at = clock() + timedelta(minutes=1)  # one shared expiry
+    for org in orgs:
+        await service.add_bonus(org, 10, "welcome", expires_at=expires_at)
+        await service.add_bonus(
+            org, 10, "not yet", expires_at=clock() + timedelta(hours=1)
+        )
+    clock.advance(61)
+
+    recorded = await service.expiry.run_due()
+
+    assert len(recorded) == 1_000
+    assert batches == [100] * 10
+    assert service.expiry.pending() == 1_000
+    assert (await service.get_balance("org_7"))["balance"] == 10
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("spent", "forfeits"),
+    [(100, [-100]), (60, [-40, -100]), (150, [-50])],
+)
+async def test_overlapping_grants_share_spending_once(spent, forfeits):
+    clock = FakeClock()
+    service = CreditsService(ledger=MemoryLedgerBackend(clock=clock), clock=clock)
+    await _purchase(service, 50)
+    day = timedelta(days=1)
+    await service.add_bonus(ORG, 100, "first", expires_at=clock() + day)
+    await service.add_bonus(ORG, 100, "second", expires_at=clock() + 2 * day)
+    clock.advance(3_600)
+    await service.deduct_credits(ORG, spent, "chat")
+    clock.advance(2 * 86_400)
+
+    recorded = await service.expiry.run_due()
+
+    # Spending drew on the first-expiring grant, then the second
+    assert [entry.credits for entry in recorded] == forfeits
+    assert (await service.get_balance(ORG))["balance"] == 50
+
+
+@pytest.mark.asyncio
+async def test_scheduler_wakes_for_earlier_grant(service):
+    service.expiry.max_sleep = 30
+    service.expiry.start()
+    try:
+        await service.add_bonus(ORG, 10, "later", expires_at=_soon(3600))
+        await asyncio.sleep(0.01)  # loop now sleeps until the later grant
+        await service.add_bonus(ORG, 40, "welcome", expires_at=_soon())
+        await asyncio.sleep(0.3)
+    finally:
+        await service.expiry.close()
+
+    assert [t["credits"] for t in await _expirations(service)] == [-40]
+
+
+@pytest.mark.asyncio
+async def test_load_rebuilds_queue_from_ledger(service):
+    await service.add_bonus(ORG, 25, "welcome", expires_at=_soon())
+    await asyncio.sleep(0.1)
+
+    restarted = CreditExpiryScheduler(service.ledger)
+    assert await restarted.load() == 1
+    recorded = await restarted.run_due()
+
+    assert [entry.credits for entry in recorded] == [-25]
+
+
+@pytest.mark.asyncio
+async def test_bonus_expiry_must_be_in_future(service):
+    with pytest.raises(ValueError, match="future"):
+        await service.add_bonus(
+            ORG, 10, "late", expires_at=datetime.now(UTC) - timedelta(minutes=1)
+        )
+
+
+@pytest.mark.asyncio
+async def test_balance_at_route(client):
+    CreditsService._instance = CreditsService(ledger=MemoryLedgerBackend())
+    try:
+        await CreditsService._instance.add_bonus(ORG, 100, "welcome")
+        moment = datetime.now(UTC)
+        await CreditsService._instance.deduct_credits(ORG, 40, "chat")
+
+        response = await client.get(
+            f"/api/v1/credits/{ORG}/balance/at",
+            params={"timestamp": moment.isoformat()},
+        )
+    finally:
+        CreditsService._instance = None
+
+    assert response.status_code == 200
+    assert response.json()["balance"] == 100
@@ -0,0 +1,184 @@
+"""Tests for credit reservations: hold, settle, release and expiry."""
+
+from __future__ import annotations
+
+import asyncio
+import random
+
+import pytest
+
+from services.credits_ledger import MemoryLedgerBackend
+from services.credits_service import CreditsService
+
+ORG = "org_holds"
+
+
+@pytest.fixture
+def service():
+    return CreditsService(ledger=MemoryLedgerBackend())
+
+
+@pytest.fixture
+def routed_service():
+    CreditsService._instance = CreditsService(ledger=MemoryLedgerBackend())
+    yield CreditsService._instance
+    CreditsService._instance = None
+
+
+async def _available(service) -> int:
+    return (await service.get_balance(ORG))["available"]
+
+
+@pytest.mark.asyncio
+async def test_hold_sets_credits_aside(service):
+    await service.add_bonus(ORG, 100, "welcome")
+    hold = await service.reserve_credits(ORG, 70, "chat")
+
+    assert hold["available"] == 30
+    assert (await service.get_balance(ORG))["balance"] == 100
+    assert not await service.has_enough_credits(ORG, 31)
+    with pytest.raises(ValueError, match="Insufficient credits"):
+        await service.deduct_credits(ORG, 31, "other")
+    with pytest.raises(ValueError, match="Insufficient credits"):
+        await service.reserve_credits(ORG, 31, "other")
+
+
+@pytest.mark.asyncio
+async def test_settle_charges_actual_cost(service):
+    await service.add_bonus(ORG, 100, "welcome")
+    hold = await service.reserve_credits(ORG, 50, "chat")
+
+    settled = await service.settle_reservation(ORG, hold["reservation_id"], 12)
+
+    assert settled["new_balance"] == 88
+    assert await _available(service) == 88
+    page = await service.get_transactions(ORG, transaction_type="USAGE")
+    charge = page["transactions"][0]
+    assert charge["credits"] == -12
+    assert charge["metadata"]["reservation_id"] == hold["reservation_id"]
+
+
+@pytest.mark.asyncio
+async def test_settle_overrun_is_charged_in_full(service):
+    await service.add_bonus(ORG, 20, "welcome")
+    hold = await service.reserve_credits(ORG, 15, "chat")
+
+    settled = await service.settle_reservation(ORG, hold["reservation_id"], 25)
+
+    assert settled["new_balance"] == -5
+
+
+@pytest.mark.asyncio
+async def test_release_and_double_settle(service):
+    await service.add_bonus(ORG, 100, "welcome")
+    hold = await service.reserve_credits(ORG, 40, "chat")
+
+    released = await service.release_reservation(ORG, hold["reservation_id"])
+
+    assert released["available"] == 100
+    assert (await service.get_transactions(ORG))["total_count"] == 1
+    with pytest.raises(ValueError, match="not found or expired"):
+        await service.settle_reservation(ORG, hold["reservation_id"], 1)
+    with pytest.raises(ValueError, match="not found or expired"):
+        await service.release_reservation(ORG, hold["reservation_id"])
+
+
+@pytest.mark.asyncio
+async def test_expired_holds_are_released():
+    ledger = MemoryLedgerBackend()
+    service = CreditsService(ledger=ledger)
+    await service.add_bonus(ORG, 100, "welcome")
+    lapsed = await ledger.reserve(ORG, 60, ttl_seconds=0, description="chat")
+    await service.reserve_credits(ORG, 10, "chat")
+
+    assert await _available(service) == 90
+    with pytest.raises(ValueError, match="not found or expired"):
+        await service.settle_reservation(ORG, lapsed.id, 60)
+
+
+@pytest.mark.asyncio
+async def test_parallel_reservations_never_overdraw(service):
+    """Thousands of interleaved holds, settles, releases and deductions"""
+    initial = 50_000
+    await service.add_bonus(ORG, initial, "welcome")
+    rng = random.Random(7)  # noqa: S311
+    lowest_available = initial
+
+    async def worker() -> None:
+        nonlocal lowest_available
+        estimate = rng.randint(1, 40)
+        try:
+            hold = await service.reserve_credits(ORG, estimate, "chat")
+        except ValueError:
+            return
+        for _ in range(rng.randint(0, 3)):
+            await asyncio.sleep(0)
+        lowest_available = min(lowest_available, await _available(service))
+        if rng.random() < 0.2:
+            await service.release_reservation(ORG, hold["reservation_id"])
+        else:
+            await service.settle_reservation(
+                ORG, hold["reservation_id"], rng.randint(0, estimate)
+            )
+
+    async def deductor() -> None:
+        await asyncio.sleep(0)
+        try:
+            await service.deduct_credits(ORG, rng.randint(1, 40), "direct")
+        except ValueError:
+            pass
+
+    tasks = [worker() for _ in range(4_000)] + [deductor() for _ in range(1_000)]
+    rng.shuffle(tasks)
+    await asyncio.gather(*tasks)
+
+    balance = await service.get_balance(ORG)
+    charged = charges = 0
+    cursor = None
+    while True:
+        page = await service.get_transactions(
+            ORG, transaction_type="USAGE", limit=500, cursor=cursor
+        )
+        charged += sum(-t["credits"] for t in page["transactions"])
+        charges += len(page["transactions"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert charges > 1_000
+    assert lowest_available >= 0
+    assert balance["held"] == 0
+    assert balance["balance"] == initial - charged
+    assert balance["balance"] >= 0
+
+
+@pytest.mark.asyncio
+async def test_reservation_routes(client, routed_service):
+    await routed_service.add_bonus(ORG, 100, "welcome")
+
+    holds = await asyncio.gather(
+        *(
+            client.post(
+                "/api/v1/credits/reservations",
+                json={"organization_id": ORG, "credits": 30, "reason": "chat"},
+            )
+            for _ in range(5)
+        )
+    )
+    granted = [r.json() for r in holds if r.status_code == 200]
+    assert len(granted) == 3
+
+    settled = await client.post(
+        f"/api/v1/credits/reservations/{granted[0]['reservation_id']}/settle",
+        json={"organization_id": ORG, "credits": 5},
+    )
+    released = await client.post(
+        f"/api/v1/credits/reservations/{granted[1]['reservation_id']}/release",
+        json={"organization_id": ORG},
+    )
+    balance = await client.get(f"/api/v1/credits/{ORG}/balance")
+
+    assert settled.json()["new_balance"] == 95
+    assert released.json()["credits"] == 30
+    assert balance.json()["held"] == 30
+    assert balance.json()["available"] == 65
@@ -0,0 +1,149 @@
+"""Tests for the append-only credits ledger and cursor pagination."""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from services.credits_ledger import MemoryLedgerBackend
+from services.credits_service import CreditsService
+
+ORG = "org_credits"
+
+
+@pytest.fixture
+def service():
+    return CreditsService(ledger=MemoryLedgerBackend())
+
+
+@pytest.fixture
+def routed_service():
+    CreditsService._instance = CreditsService(ledger=MemoryLedgerBackend())
+    yield CreditsService._instance
+    CreditsService._instance = None
+
+
+async def _history(service, transaction_type=None, limit=7) -> list[dict]:
+    """Walk every page via next_cursor"""
+    seen, cursor = [], None
+    while True:
+        page = await service.get_transactions(
+            ORG, transaction_type=transaction_type, limit=limit, cursor=cursor
+        )
+        seen.extend(page["transactions"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return seen
+
+
+@pytest.mark.asyncio
+async def test_balance_follows_entries(service):
+    await service.add_bonus(ORG, 500, "welcome")
+    deducted = await service.deduct_credits(ORG, 120, "chat")
+
+    assert deducted["new_balance"] == 380
+    assert (await service.get_balance(ORG))["balance"] == 380
+
+
+@pytest.mark.asyncio
+async def test_deduct_rejects_overdraw_without_recording(service):
+    await service.add_bonus(ORG, 100, "welcome")
+
+    with pytest.raises(ValueError, match="Insufficient credits"):
+        await service.deduct_credits(ORG, 101, "chat")
+
+    page = await service.get_transactions(ORG)
+    assert page["total_count"] == 1
+    assert (await service.get_balance(ORG))["balance"] == 100
+
+
+@pytest.mark.asyncio
+async def test_concurrent_deductions_never_overdraw(service):
+    await service.add_bonus(ORG, 50, "welcome")
+
+    results = await asyncio.gather(
+        *(service.deduct_credits(ORG, 1, "chat") for _ in range(80)),
+        return_exceptions=True,
+    )
+
+    assert sum(not isinstance(r, Exception) for r in results) == 50
+    assert (await service.get_balance(ORG))["balance"] == 0
+
+
+@pytest.mark.asyncio
+async def test_pages_are_newest_first_and_complete(service):
+    await service.add_bonus(ORG, 10_000, "welcome")
+    for i in range(40):
+        await service.deduct_credits(ORG, i + 1, f"call {i}")
+
+    history = await _history(service)
+
+    assert len(history) == 41
+    assert [t["description"] for t in history[:2]] == ["call 39", "call 38"]
+    assert history[-1]["type"] == "BONUS"
+    assert len({t["id"] for t in history}) == 41
+    # balance_after runs backwards through the ledger
+    assert history[0]["balance_after"] == (await service.get_balance(ORG))["balance"]
+
+
+@pytest.mark.asyncio
+async def test_type_filter_uses_its_own_pages(service):
+    await service.add_bonus(ORG, 10_000, "welcome")
+    for i in range(30):
+        deducted = await service.deduct_credits(ORG, 1, f"call {i}")
+        if i % 3 == 0:
+            await service.refund_credits(ORG, deducted["transaction_id"])
+
+    refunds = await _history(service, transaction_type="REFUND", limit=4)
+    first = await service.get_transactions(ORG, transaction_type="REFUND", limit=4)
+
+    assert len(refunds) == 10
+    assert first["total_count"] == 10
+    assert all(t["type"] == "REFUND" for t in refunds)
+    assert refunds[0]["metadata"]["original_transaction_id"]
+
+
+@pytest.mark.asyncio
+async def test_cursor_is_stable_across_appends(service):
+    await service.add_bonus(ORG, 1_000, "welcome")
+    for i in range(10):
+        await service.deduct_credits(ORG, 1, f"call {i}")
+
+    first = await service.get_transactions(ORG, limit=5)
+    await service.deduct_credits(ORG, 1, "late call")
+    second = await service.get_transactions(ORG, limit=5, cursor=first["next_cursor"])
+
+    # New entries land before the first page, never shifting later pages
+    assert [t["description"] for t in second["transactions"]] == [
+        f"call {i}" for i in range(4, -1, -1)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_refund_of_unknown_transaction(service):
+    with pytest.raises(ValueError, match="not found"):
+        await service.refund_credits(ORG, "missing")
+
+
+@pytest.mark.asyncio
+async def test_transactions_route_paginates(client, routed_service):
+    await routed_service.add_bonus(ORG, 1_000, "welcome")
+    for i in range(5):
+        await routed_service.deduct_credits(ORG, 1, f"call {i}")
+
+    first = await client.get(f"/api/v1/credits/{ORG}/transactions?limit=4")
+    body = first.json()
+    assert first.status_code == 200
+    assert body["total_count"] == 6
+    assert len(body["transactions"]) == 4
+
+    rest = await client.get(
+        f"/api/v1/credits/{ORG}/transactions",
+        params={"limit": 4, "cursor": body["next_cursor"]},
+    )
+    assert [t["type"] for t in rest.json()["transactions"]] == ["USAGE", "BONUS"]
+    assert rest.json()["next_cursor"] is None
+
+    bad = await client.get(f"/api/v1/credits/{ORG}/transactions?cursor=bogus")
+    assert bad.status_code == 400
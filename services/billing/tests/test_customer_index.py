@@ -0,0 +1,266 @@
+"""Tests for the organization → Stripe customer index."""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+import stripe
+
+from services.customer_index import (
+    CustomerIndex,
+    CustomerRecord,
+    MemoryCustomerStore,
+)
+from services.stripe_service import StripeService
+from services.webhook_service import WebhookService
+
+ORG = "org_acme"
+
+
+class FakeCustomers:
+    """Stripe's Customer resource, counting searches"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.searches = 0
+        self.known: dict[str, dict] = {}
+
+    def create(self, email, name=None, metadata=None):
+        customer = {
+            "id": f"cus_{len(self.known) + 1}",
+            "email": email,
+            "name": name,
+            "metadata": metadata or {},
+        }
+        self.known[customer["id"]] = customer
+        return customer
+
+    def search(self, query, limit):
+        self.searches += 1
+        if self.latency:
+            time.sleep(self.latency)  # the blocking SDK round trip
+        org = query.split("'")[3]
+        return SimpleNamespace(
+            data=[
+                c
+                for c in self.known.values()
+                if c["metadata"]["organization_id"] == org
+            ][:limit]
+        )
+
+    def delete(self, customer_id):
+        return self.known.pop(customer_id)
+
+
+@pytest.fixture
+def customers():
+    return CustomerIndex(MemoryCustomerStore())
+
+
+def _service(customers: CustomerIndex, fake: FakeCustomers) -> StripeService:
+    service = StripeService.__new__(StripeService)
+    service._stripe = SimpleNamespace(
+        Customer=fake, InvalidRequestError=stripe.InvalidRequestError
+    )
+    service.customers = customers
+    return service
+
+
+@pytest.mark.asyncio
+async def test_created_customer_is_found_without_search(customers):
+    fake = FakeCustomers()
+    service = _service(customers, fake)
+
+    created = await service.create_customer(ORG, "billing@acme.test", "Acme")
+    found = await service.get_customer_by_organization(ORG)
+
+    assert found["id"] == created["id"]
+    assert found["email"] == "billing@acme.test"
+    assert fake.searches == 0
+    # Persisted, not just cached
+    assert (await customers.store.get(ORG)).customer_id == created["id"]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_cold_misses_share_one_search(customers):
+    fake = FakeCustomers(latency=0.1)
+    fake.known["cus_legacy"] = {
+        "id": "cus_legacy",
+        "email": None,
+        "name": None,
+        "metadata": {"organization_id": ORG},
+    }
+    service = _service(customers, fake)
+
+    results = await asyncio.gather(
+        *(service.get_customer_by_organization(ORG) for _ in range(50))
+    )
+
+    assert {r["id"] for r in results} == {"cus_legacy"}
+    assert fake.searches == 1
+    # Backfilled: a fresh process finds it in the store
+    fresh = _service(CustomerIndex(customers.store), fake)
+    assert (await fresh.get_customer_by_organization(ORG))["id"] == "cus_legacy"
+    assert fake.searches == 1
+
+
+@pytest.mark.asyncio
+async def test_missing_customer_is_remembered_briefly(customers):
+    fake = FakeCustomers()
+    service = _service(customers, fake)
+
+    assert await service.get_customer_by_organization(ORG) is None
+    assert await service.get_customer_by_organization(ORG) is None
+    assert fake.searches == 1
+
+    # Creating the customer replaces the negative entry
+    created = await service.create_customer(ORG, "billing@acme.test")
+    assert (await service.get_customer_by_organization(ORG))["id"] == created["id"]
+
+
+@pytest.mark.asyncio
+async def test_webhooks_keep_index_current(customers):
+    webhooks = WebhookService(customers=customers)
+    service = _service(customers, FakeCustomers())
+
+    def event(kind: str, customer_id: str, org: str | None = ORG) -> dict:
+        metadata = {"organization_id": org} if org else {}
+        return {
+            "type": f"customer.{kind}",
+            "data": {
+                "object": {
+                    "id": customer_id,
+                    "email": f"{customer_id}@acme.test",
+                    "metadata": metadata,
+                }
+            },
+        }
+
+    await webhooks.handle_event(event("created", "cus_a"))
+    assert (await service.get_customer_by_organization(ORG))["id"] == "cus_a"
+
+    # The organization got a new customer
+    await webhooks.handle_event(event("updated", "cus_b"))
+    assert (await service.get_customer_by_organization(ORG))["id"] == "cus_b"
+
+    # Deleting the old customer does not unmap the new one
+    result = await webhooks.handle_event(event("deleted", "cus_a"))
+    assert result["organization_id"] is None
+    assert (await service.get_customer_by_organization(ORG))["id"] == "cus_b"
+
+    result = await webhooks.handle_event(event("deleted", "cus_b"))
+    assert result["organization_id"] == ORG
+    assert await customers.store.get(ORG) is None
+
+
+def _customer_event(
+    kind: str, customer_id: str, created: int, org: str = ORG, email: str = ""
+) -> dict:
+    return {
+        "type": f"customer.{kind}",
+        "created": created,
+        "data": {
+            "object": {
+                "id": customer_id,
+                "email": email or f"{customer_id}@acme.test",
+                "metadata": {"organization_id": org},
+            }
+        },
+    }
+
+
+@pytest.mark.asyncio
+async def test_out_of_order_customer_events_do_not_regress(customers):
+    webhooks = WebhookService(customers=customers)
+
+    await webhooks.handle_event(
+        _customer_event("updated", "cus_a", 200, email="new@acme.test")
+    )
+    # Delivered late: older states of the same customer
+    await webhooks.handle_event(_customer_event("created", "cus_a", 100))
+    await webhooks.handle_event(
+        _customer_event("updated", "cus_a", 150, email="old@acme.test")
+    )
+    assert (await customers.store.get(ORG)).email == "new@acme.test"
+
+    # The organization's newer customer is not displaced by an older event
+    await webhooks.handle_event(_customer_event("created", "cus_b", 300))
+    await webhooks.handle_event(_customer_event("updated", "cus_a", 250))
+    assert (await customers.store.get(ORG)).customer_id == "cus_b"
+    assert await customers.organization_for("cus_a") is None
+
+
+@pytest.mark.asyncio
+async def test_deleted_customer_is_not_mapped_again(customers):
+    webhooks = WebhookService(customers=customers)
+
+    await webhooks.handle_event(_customer_event("created", "cus_a", 100))
+    result = await webhooks.handle_event(_customer_event("deleted", "cus_a", 300))
+    assert result["organization_id"] == ORG
+
+    # A late update for the deleted customer
+    await webhooks.handle_event(_customer_event("updated", "cus_a", 200))
+
+    assert await customers.store.get(ORG) is None
+    assert await customers.lookup(ORG, _no_search) is None
+
+
+@pytest.mark.asyncio
+async def test_backfill_keeps_a_newer_write(customers):
+    async def search() -> CustomerRecord | None:
+        # The organization's new customer is indexed while the search runs
+        await customers.put(CustomerRecord(ORG, "cus_new", version=2**40))
+        return CustomerRecord(ORG, "cus_old")
+
+    found = await customers.lookup(ORG, search)
+
+    assert found.customer_id == "cus_new"
+    assert (await customers.store.get(ORG)).customer_id == "cus_new"
+
+
+@pytest.mark.asyncio
+async def test_customer_moved_between_organizations(customers):
+    await customers.put(CustomerRecord("org_old", "cus_1"))
+    await customers.put(CustomerRecord("org_new", "cus_1"))
+
+    assert await customers.store.get("org_old") is None
+    missing = await customers.lookup("org_old", _no_search)
+    assert missing is None
+
+
+@pytest.mark.asyncio
+async def test_delete_customer_unmaps_it(customers):
+    fake = FakeCustomers()
+    service = _service(customers, fake)
+    created = await service.create_customer(ORG, "billing@acme.test")
+
+    assert await service.delete_customer(created["id"])
+
+    assert await customers.store.get(ORG) is None
+    assert await service.get_customer_by_organization(ORG) is None
+    assert fake.searches == 1
+
+
+@pytest.mark.asyncio
+async def test_lru_is_bounded_and_expires():
+    store = MemoryCustomerStore()
+    customers = CustomerIndex(store, max_entries=2, ttl=0.05)
+    for i in range(3):
+        await customers.put(CustomerRecord(f"org_{i}", f"cus_{i}"))
+
+    assert len(customers._cache) == 2
+    assert "org_0" not in customers._cache
+
+    # Evicted or expired entries are reloaded from the store, not searched
+    await asyncio.sleep(0.1)
+    assert (await customers.lookup("org_0", _no_search)).customer_id == "cus_0"
+    assert (await customers.lookup("org_2", _no_search)).customer_id == "cus_2"
+    assert customers.searches == 0
+    assert customers.misses == 2
+
+
+async def _no_search() -> CustomerRecord | None:
+    return None
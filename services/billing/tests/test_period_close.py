@@ -0,0 +1,109 @@
+"""Tests for the vectorized period-close overage computation."""
+
+from __future__ import annotations
+
+import pytest
+
+from services.period_close import USAGE_TYPES, PeriodUsage, compute_overage
+from services.usage_backend import MemoryUsageBackend
+from services.usage_service import PLAN_LIMITS, UsageService
+
+FREE = PLAN_LIMITS["FREE"]
+
+
+@pytest.fixture
+def service():
+    return UsageService(backend=MemoryUsageBackend())
+
+
+def test_overage_matches_plan_limits():
+    usage = PeriodUsage.from_counters(
+        "2026-09",
+        ["org_free", "org_pro", "org_enterprise", "org_unknown"],
+        ["FREE", "PRO", "ENTERPRISE", "LEGACY"],
+        [FREE[t] + 10 for t in USAGE_TYPES]
+        + [PLAN_LIMITS["PRO"][t] for t in USAGE_TYPES]
+        + [10**12] * len(USAGE_TYPES)
+        + [FREE[t] - 1 for t in USAGE_TYPES],
+    )
+
+    result = compute_overage(usage)
+
+    assert result.overage[0].tolist() == [10] * len(USAGE_TYPES)
+    # At the limit, unlimited, and under the (FREE) limit: nothing owed
+    assert not result.overage[1:].any()
+    lines = result.line_items()
+    assert [(line.organization_id, line.usage_type) for line in lines] == [
+        ("org_free", t) for t in USAGE_TYPES
+    ]
+    api_calls = lines[USAGE_TYPES.index("API_CALL")]
+    assert api_calls.quantity == 10
+    assert api_calls.amount == pytest.approx(0.001)
+    assert api_calls.amount_cents == 0
+    assert result.total_amount == pytest.approx(sum(line.amount for line in lines))
+
+
+@pytest.mark.asyncio
+async def test_close_period_agrees_with_get_usage(service):
+    period = service._get_current_period()
+    organizations = [f"org_{i}" for i in range(20)]
+    # org_0 records nothing
+    for i, org in enumerate(organizations[1:], start=1):
+        await service.record_usage(org, "API_CALL", i * 20)
+        await service.record_usage(org, "COMPUTE", i * 7)
+
+    result = await service.close_period(organizations, period)
+
+    for org, total in zip(organizations, result.totals.tolist(), strict=True):
+        summary = await service.get_usage(org)
+        assert total == pytest.approx(summary["total_cost"])
+    assert result.overage.sum() == sum(
+        max(0, i * 20 - FREE["API_CALL"]) + max(0, i * 7 - FREE["COMPUTE"])
+        for i in range(20)
+    )
+
+
+@pytest.mark.asyncio
+async def test_close_period_reads_the_requested_period(service):
+    await service.record_usage("org_1", "API_CALL", FREE["API_CALL"] + 50)
+
+    closed = await service.close_period(["org_1"], "2000-01")
+    pro = await service.close_period(
+        ["org_1"], service._get_current_period(), plans={"org_1": "PRO"}
+    )
+
+    assert closed.line_items() == []
+    assert pro.line_items() == []
+
+
+@pytest.mark.asyncio
+async def test_period_close_route(client):
+    from app.api.v1.routes_usage import get_usage_service
+
+    service = get_usage_service()
+    await service.record_usage("org_1", "API_CALL", FREE["API_CALL"] + 1_000)
+    period = service._get_current_period()
+
+    response = await client.post(
+        "/api/v1/usage/period-close",
+        json={"period": period, "organization_ids": ["org_1", "org_2"]},
+    )
+    invalid = await client.post(
+        "/api/v1/usage/period-close",
+        json={"period": "2026-13", "organization_ids": ["org_1"]},
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["organizations"] == 2
+    assert body["line_items"] == [
+        {
+            "organization_id": "org_1",
+            "type": "API_CALL",
+            "quantity": 1_000,
+            "unit_price": 0.0001,
+            "amount": pytest.approx(0.1),
+            "amount_cents": 10,
+        }
+    ]
+    assert invalid.status_code == 422
@@ -0,0 +1,427 @@
+"""Tests for plan config resolution on a cache miss."""
+
+from __future__ import annotations
+
+import asyncio
+import copy
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from services.entitlement_cache import CHANNEL, EntitlementCache
+from services.plan_config_service import PlanConfigService
+
+ROUND_TRIP = 0.1  # seconds per simulated Supabase query
+
+PRO_PLAN = {
+    "id": "plan_pro",
+    "slug": "pro",
+    "name": "Pro",
+    "plan": "PRO",
+    "version": "v2",
+    "interval": "MONTHLY",
+    "amount": 29,
+    "currency": "USD",
+    "trial_days": 14,
+    "is_active": True,
+    "plan_features": [{"is_enabled": True, "value": 5, "feature": {"key": "seats"}}],
+    "plan_limits": [
+        {
+            "limit_value": 10_000,
+            "limit_def": {
+                "key": "API_CALL",
+                "unit": "calls",
+                "reset_period": "monthly",
+            },
+        }
+    ],
+}
+
+# Rows without an organization_id apply to every organization
+TABLES = {
+    "pricing_plans": [PRO_PLAN],
+    "subscriptions": [{"pricing_plan_id": "plan_pro", "status": "ACTIVE"}],
+    "customer_plan_versions": [],
+    "customer_feature_overrides": [
+        {"feature_key": "sso", "value": True, "reason": "enterprise pilot"}
+    ],
+    "customer_usage_limits": [],
+}
+
+
+class FakeQuery:
+    """A postgrest query builder whose execute() blocks like a round trip"""
+
+    def __init__(self, client: FakeSupabase, table: str):
+        self.client = client
+        self.table = table
+        self.filters: dict[str, object] = {}
+
+    def select(self, *_):
+        return self
+
+    def eq(self, column, value):
+        self.filters[column] = value
+        return self
+
+    def in_(self, column, values):
+        self.filters[column] = list(values)
+        return self
+
+    def order(self, *_, **__):
+        return self
+
+    def limit(self, *_):
+        return self
+
+    def execute(self):
+        with self.client.lock:
+            self.client.queries.append(self.table)
+        time.sleep(ROUND_TRIP)
+        rows = self.client.tables[self.table]
+        organizations = self.filters.get("organization_id")
+        if isinstance(organizations, list):
+            rows = [
+                {"organization_id": org, **row}
+                for row in rows
+                for org in organizations
+                if row.get("organization_id", org) == org
+            ]
+        return SimpleNamespace(data=[row for row in rows if self._matches(row)])
+
+    def _matches(self, row: dict) -> bool:
+        for column, wanted in self.filters.items():
+            if column not in row:
+                continue
+            if isinstance(wanted, list):
+                if row[column] not in wanted:
+                    return False
+            elif row[column] != wanted:
+                return False
+        return True
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries: list[str] = []
+        self.tables = copy.deepcopy(TABLES)
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+
+@pytest.fixture
+def supabase():
+    return FakeSupabase()
+
+
+@pytest.fixture
+def service(supabase, fake_redis):
+    return PlanConfigService(supabase=supabase, redis=fake_redis)
+
+
+@pytest.mark.asyncio
+async def test_miss_runs_independent_lookups_concurrently(service, supabase):
+    started = time.perf_counter()
+    config = await service.get_config("org_1")
+    elapsed = time.perf_counter() - started
+
+    assert config.plan.slug == "pro"
+    assert config.limits["API_CALL"].limit == 10_000
+    assert config.features["sso"].enabled
+    assert config.overrides["features"] == ["sso"]
+    assert len(supabase.queries) == 5
+    # Two round trips (org lookups, then the plan), not five
+    assert elapsed < ROUND_TRIP * 3
+
+
+@pytest.mark.asyncio
+async def test_plan_rows_are_cached_in_process(service, supabase):
+    await service.get_config("org_1")
+    supabase.queries.clear()
+
+    started = time.perf_counter()
+    await service.get_config("org_2")
+    elapsed = time.perf_counter() - started
+
+    assert "pricing_plans" not in supabase.queries
+    assert elapsed < ROUND_TRIP * 2
+
+    await service.invalidate_plans()
+    await service.invalidate_org("org_2")
+    await service.get_config("org_2")
+    assert "pricing_plans" in supabase.queries
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_are_coalesced(service, supabase):
+    configs = await asyncio.gather(*(service.get_config("org_1") for _ in range(25)))
+
+    assert {c.plan.id for c in configs} == {"plan_pro"}
+    assert len(supabase.queries) == 5
+    # Later readers get the Redis copy
+    await service.get_config("org_1")
+    assert len(supabase.queries) == 5
+
+
+@pytest.mark.asyncio
+async def test_miss_does_not_block_event_loop(service):
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    try:
+        await service.get_config("org_1")
+    finally:
+        task.cancel()
+
+    assert ticks >= (ROUND_TRIP * 2 / 0.01) * 0.5
+
+
+@pytest.mark.asyncio
+async def test_hot_checks_use_the_entitlement_snapshot(service):
+    assert await service.has_feature("org_1", "sso")
+    assert (await service.check_limit("org_1", "API_CALL", 9_999, 1))["allowed"]
+
+    async def no_io(organization_id):
+        raise AssertionError("hot check read the config")
+
+    service.get_config = no_io
+    assert await service.has_feature("org_1", "seats")
+    assert not await service.has_feature("org_1", "unknown")
+    over = await service.check_limit("org_1", "API_CALL", 9_999, 2)
+    assert over == {
+        "allowed": False,
+        "limit": 10_000,
+        "current": 9_999,
+        "remaining": 1,
+        "would_exceed": True,
+    }
+    assert service.entitlements.hits == 4
+
+
+@pytest.mark.asyncio
+async def test_invalidation_reaches_other_replicas(supabase, fake_redis):
+    replicas = [
+        PlanConfigService(
+            supabase=supabase,
+            redis=fake_redis,
+            entitlements=EntitlementCache(fake_redis),
+        )
+        for _ in range(2)
+    ]
+    for replica in replicas:
+        replica.entitlements.start()
+    try:
+        while (await fake_redis.pubsub_numsub(CHANNEL))[0][1] < 2:
+            await asyncio.sleep(0.01)
+        for replica in replicas:
+            assert await replica.has_feature("org_1", "sso")
+
+        supabase.tables["customer_feature_overrides"] = []
+        await replicas[0].invalidate_org("org_1")
+        for _ in range(100):
+            if replicas[1].entitlements.get("org_1") is None:
+                break
+            await asyncio.sleep(0.01)
+
+        assert not await replicas[1].has_feature("org_1", "sso")
+
+        # A plan change evicts every organization
+        await replicas[1].has_feature("org_2", "sso")
+        await replicas[0].invalidate_plans()
+        await asyncio.sleep(0.05)
+        assert replicas[1].entitlements.get("org_2") is None
+    finally:
+        for replica in replicas:
+            await replica.entitlements.close()
+
+
+def test_snapshot_built_across_an_invalidation_is_not_cached():
+    cache = EntitlementCache()
+    generation = cache.generation
+    cache.drop("org_1")  # arrives while the snapshot is being built
+
+    cache.put("org_1", object(), generation)
+
+    assert cache.get("org_1") is None
+
+
+@pytest.mark.asyncio
+async def test_invalidate_plans_moves_to_a_new_generation(service, fake_redis):
+    await service.get_config("org_1")
+    assert await fake_redis.exists("billing:config:g0:org:org_1")
+
+    async def no_keys(*_):
+        raise AssertionError("KEYS blocks a shared Redis")
+
+    fake_redis.keys = no_keys
+    await service.invalidate_plans()
+
+    assert await fake_redis.get("billing:config:generation") == "1"
+    # The old entry ages out by TTL; reads go to the new namespace
+    assert await fake_redis.ttl("billing:config:g0:org:org_1") > 0
+    await service.get_config("org_1")
+    assert await fake_redis.exists("billing:config:g1:org:org_1")
+
+
+@pytest.mark.asyncio
+async def test_other_replicas_follow_the_generation(supabase, fake_redis):
+    first, second = (
+        PlanConfigService(supabase=supabase, redis=fake_redis) for _ in range(2)
+    )
+    await second.get_config("org_1")
+
+    await first.invalidate_plans()
+    # second hears of it through the entitlement channel
+    second.entitlements.drop("*")
+    await second.get_config("org_1")
+
+    assert await fake_redis.exists("billing:config:g1:org:org_1")
+
+
+@pytest.mark.asyncio
+async def test_delete_matching_scans_in_batches(fake_redis):
+    from utils.redis_client import delete_matching
+
+    for i in range(1_234):
+        await fake_redis.set(f"billing:config:g0:org:org_{i}", "{}")
+    await fake_redis.set("tenant:1:session", "x")
+
+    assert (
+        await delete_matching(fake_redis, "billing:config:*", batch_size=100) == 1_234
+    )
+    assert await fake_redis.dbsize() == 1
+
+
+@pytest.mark.asyncio
+async def test_get_configs_resolves_a_batch_in_constant_round_trips(
+    service, supabase, fake_redis
+):
+    organizations = [f"org_{i}" for i in range(1_000)]
+    # Even organizations subscribe to Pro; org_3 has an override
+    supabase.tables["subscriptions"] = [
+        {"organization_id": org, "pricing_plan_id": "plan_pro", "status": "ACTIVE"}
+        for org in organizations[::2]
+    ]
+    supabase.tables["customer_feature_overrides"] = [
+        {"organization_id": "org_3", "feature_key": "sso", "value": True}
+    ]
+    warm = await service.get_config("org_0")
+    supabase.queries.clear()
+
+    configs = await service.get_configs([*organizations, "org_0"])
+
+    assert list(configs) == organizations
+    assert configs["org_0"] == warm
+    assert configs["org_2"].plan.slug == "pro"
+    assert configs["org_1"].plan.slug == "free"
+    assert configs["org_3"].features["sso"].enabled
+    assert "sso" not in configs["org_5"].features
+    # Four lookups per batch of 100 misses, plus the free plan: no per-org work
+    assert len(supabase.queries) == 4 * 10 + 1
+    # Written back; single reads now hit the cache
+    assert await fake_redis.exists("billing:config:g0:org:org_999")
+    await service.get_config("org_999")
+    assert len(supabase.queries) == 41
+
+
+@pytest.mark.asyncio
+async def test_batch_route(client, service):
+    from app.api.v1.routes_config import get_plan_config_service
+    from app.main import app
+
+    app.dependency_overrides[get_plan_config_service] = lambda: service
+    try:
+        response = await client.post(
+            "/api/v1/config/batch", json={"organization_ids": ["org_1", "org_2"]}
+        )
+        empty = await client.post("/api/v1/config/batch", json={"organization_ids": []})
+    finally:
+        app.dependency_overrides.pop(get_plan_config_service, None)
+
+    assert response.status_code == 200
+    configs = response.json()["configs"]
+    assert configs["org_1"]["plan"]["slug"] == "pro"
+    assert configs["org_2"]["limits"]["API_CALL"]["limit"] == 10_000
+    assert empty.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_plan_change_reaches_other_replicas_plan_rows(supabase, fake_redis):
+    replicas = [
+        PlanConfigService(
+            supabase=supabase,
+            redis=fake_redis,
+            entitlements=EntitlementCache(fake_redis),
+        )
+        for _ in range(2)
+    ]
+    for replica in replicas:
+        replica.entitlements.start()
+    try:
+        while (await fake_redis.pubsub_numsub(CHANNEL))[0][1] < 2:
+            await asyncio.sleep(0.01)
+        await replicas[1].get_config("org_1")
+
+        plan = copy.deepcopy(PRO_PLAN)
+        plan["plan_limits"][0]["limit_value"] = 20_000
+        supabase.tables["pricing_plans"] = [plan]
+        await replicas[0].invalidate_plans()
+        for _ in range(100):
+            if not replicas[1]._plans:
+                break
+            await asyncio.sleep(0.01)
+
+        # replicas[1] resolves the new generation itself, from its plan rows
+        for replica in reversed(replicas):
+            config = await replica.get_config("org_1")
+            assert config.limits["API_CALL"].limit == 20_000
+    finally:
+        for replica in replicas:
+            await replica.entitlements.close()
+
+
+@pytest.mark.asyncio
+async def test_config_route_is_conditional_on_the_generation(client, service):
+    from app.api.v1.routes_config import get_plan_config_service
+    from app.main import app
+
+    app.dependency_overrides[get_plan_config_service] = lambda: service
+    try:
+        first = await client.get("/api/v1/config/org_1")
+        etag = first.headers["etag"]
+        unchanged = await client.get(
+            "/api/v1/config/org_1", headers={"If-None-Match": etag}
+        )
+
+        await service.invalidate_org("org_1")
+        changed = await client.get(
+            "/api/v1/config/org_1", headers={"If-None-Match": etag}
+        )
+
+        async def broken(organization_id):
+            raise ValueError("no such organization")
+
+        service.get_config = broken
+        await service.invalidate_org("org_2")
+        failed = await client.get("/api/v1/config/org_2")
+    finally:
+        app.dependency_overrides.pop(get_plan_config_service, None)
+
+    assert first.status_code == 200
+    assert etag.startswith('W/"')
+    assert first.json()["plan"]["slug"] == "pro"
+    assert unchanged.status_code == 304
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert failed.status_code == 400
+    assert failed.json()["detail"] == "no such organization"
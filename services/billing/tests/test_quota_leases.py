@@ -0,0 +1,63 @@
+"""End-to-end tests for _shared.quota against the billing lease endpoints."""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from _shared.quota import QuotaClient
+from services.usage_service import PLAN_LIMITS, UsageService
+
+ORG = "org_quota"
+API_CALL_LIMIT = PLAN_LIMITS["FREE"]["API_CALL"]
+
+
+async def _current(org: str = ORG) -> int:
+    service = UsageService.get_instance()
+    check = await service.check_limit(org, "API_CALL", 0)
+    return check["current"]
+
+
+@pytest.mark.asyncio
+async def test_hot_path_spends_locally(client):
+    quota = QuotaClient(http=client, lease_size=20)
+
+    assert await quota.consume(ORG, "API_CALL")
+    requests_after_first = await _current()
+    for _ in range(10):
+        assert quota.try_consume(ORG, "API_CALL")
+
+    # One lease covered all eleven calls
+    assert requests_after_first == 20
+    assert quota.available(ORG, "API_CALL") == 9
+    await quota.close()
+    assert await _current() == 11
+
+
+@pytest.mark.asyncio
+async def test_holders_never_admit_past_limit(client):
+    holders = [QuotaClient(http=client, lease_size=15) for _ in range(4)]
+
+    async def spend(quota: QuotaClient) -> int:
+        admitted = 0
+        for _ in range(60):
+            if await quota.consume(ORG, "API_CALL"):
+                admitted += 1
+        return admitted
+
+    admitted = await asyncio.gather(*(spend(q) for q in holders))
+
+    assert sum(admitted) <= API_CALL_LIMIT
+    await asyncio.gather(*(q.close() for q in holders))
+    assert await _current() == sum(admitted)
+
+
+@pytest.mark.asyncio
+async def test_limit_reached_is_cached(client):
+    quota = QuotaClient(http=client, lease_size=API_CALL_LIMIT)
+    assert await quota.consume(ORG, "API_CALL", API_CALL_LIMIT)
+
+    assert not await quota.consume(ORG, "API_CALL")
+    assert not await quota.consume(ORG, "API_CALL")
+    await quota.close()
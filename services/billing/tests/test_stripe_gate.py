@@ -0,0 +1,167 @@
+"""Tests for running Stripe SDK calls off the event loop."""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+import stripe
+
+from utils.stripe_client import StripeGate
+
+STRIPE_LATENCY = 0.5
+
+
+class _Concurrency:
+    """Tracks the most calls seen running at once"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+
+    def __enter__(self):
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *exc):
+        with self._lock:
+            self.current -= 1
+
+
+@pytest.mark.asyncio
+async def test_slow_stripe_leaves_other_requests_responsive(client):
+    from app.api.v1.routes_billing import get_stripe_service
+    from app.main import app
+    from services.customer_index import CustomerIndex, MemoryCustomerStore
+    from services.stripe_service import StripeService
+
+    def slow_search(**params):
+        time.sleep(STRIPE_LATENCY)  # a blocking SDK round trip
+        org = params["query"].split("'")[3]
+        return SimpleNamespace(
+            data=[{"id": f"cus_{org}", "metadata": {"organization_id": org}}]
+        )
+
+    service = StripeService.__new__(StripeService)
+    service._stripe = SimpleNamespace(
+        Customer=SimpleNamespace(search=slow_search),
+        InvalidRequestError=stripe.InvalidRequestError,
+    )
+    service.customers = CustomerIndex(MemoryCustomerStore())
+    app.dependency_overrides[get_stripe_service] = lambda: service
+
+    async def timed(path: str) -> float:
+        started = time.perf_counter()
+        response = await client.get(path)
+        assert response.status_code == 200
+        return time.perf_counter() - started
+
+    try:
+        stripe_calls = [
+            asyncio.create_task(timed(f"/api/v1/billing/customers/org_{i}"))
+            for i in range(4)
+        ]
+        await asyncio.sleep(0.05)  # Stripe calls are now in flight
+        other = [await timed("/api/v1/credits/org_x/balance") for _ in range(10)]
+        stripe_latencies = await asyncio.gather(*stripe_calls)
+    finally:
+        app.dependency_overrides.pop(get_stripe_service, None)
+
+    # Unrelated requests were served while every Stripe call was blocked
+    assert max(other) < STRIPE_LATENCY / 5
+    # Stripe calls overlapped instead of running one after another
+    assert max(stripe_latencies) < STRIPE_LATENCY * 2
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_capped():
+    gate = StripeGate(max_concurrency=3, rate=1_000, burst=1_000)
+    running = _Concurrency()
+
+    def call():
+        with running:
+            time.sleep(0.05)
+
+    await asyncio.gather(*(gate.call(call) for _ in range(12)))
+    gate.close()
+
+    assert running.peak == 3
+
+
+@pytest.mark.asyncio
+async def test_calls_are_rate_limited():
+    gate = StripeGate(max_concurrency=8, rate=20, burst=2)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(gate.call(lambda: None) for _ in range(10)))
+    elapsed = time.perf_counter() - started
+    gate.close()
+
+    # Two from the burst, then one every 1/20 s
+    assert elapsed >= (10 - 2) / 20 * 0.9
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_calls_are_retried_after_retry_after():
+    gate = StripeGate(max_retries=3)
+    attempts = []
+
+    def flaky():
+        attempts.append(time.perf_counter())
+        if len(attempts) < 3:
+            raise stripe.RateLimitError(
+                "Too many requests", headers={"retry-after": "0.1"}
+            )
+        return "ok"
+
+    assert await gate.call(flaky) == "ok"
+    gate.close()
+
+    assert gate.rate_limited == 2
+    assert attempts[1] - attempts[0] >= 0.09
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_error_surfaces_after_retries():
+    gate = StripeGate(max_retries=1, backoff=0.01)
+
+    def limited():
+        raise stripe.RateLimitError("Too many requests")
+
+    with pytest.raises(stripe.RateLimitError):
+        await gate.call(limited)
+    gate.close()
+
+    assert gate.rate_limited == 1
+
+
+@pytest.mark.asyncio
+async def test_other_errors_are_not_retried():
+    gate = StripeGate()
+    calls = []
+
+    def invalid():
+        calls.append(1)
+        raise stripe.InvalidRequestError("No such customer", param="id")
+
+    with pytest.raises(stripe.InvalidRequestError):
+        await gate.call(invalid)
+    gate.close()
+
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_calls_see_caller_context():
+    request_id = contextvars.ContextVar("request_id")
+    request_id.set("req-42")
+    gate = StripeGate()
+
+    assert await gate.call(request_id.get) == "req-42"
+    gate.close()
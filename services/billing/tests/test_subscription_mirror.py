@@ -0,0 +1,290 @@
+"""Tests for the webhook-fed local subscription mirror."""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from services.customer_index import CustomerIndex, CustomerRecord, MemoryCustomerStore
+from services.stripe_service import StripeService
+from services.subscription_mirror import MemorySubscriptionStore, SubscriptionMirror
+from services.subscription_service import SubscriptionService
+from services.webhook_service import WebhookService
+
+ORG = "org_acme"
+
+
+def _subscription(
+    subscription_id: str = "sub_1",
+    status: str = "active",
+    created: int = 1_000,
+    org: str | None = ORG,
+    **fields,
+) -> dict:
+    return {
+        "id": subscription_id,
+        "object": "subscription",
+        "customer": "cus_1",
+        "status": status,
+        "created": created,
+        "current_period_start": 1_000,
+        "current_period_end": 2_000,
+        "cancel_at_period_end": False,
+        "canceled_at": None,
+        "trial_end": None,
+        "items": {"data": [{"id": "si_1", "price": {"id": "price_pro"}}]},
+        "metadata": {"organization_id": org} if org else {},
+        **fields,
+    }
+
+
+def _event(event_type: str, obj: dict, created: int) -> dict:
+    return {"type": event_type, "created": created, "data": {"object": obj}}
+
+
+class FakeSubscriptions:
+    """Stripe's Subscription resource, recording calls"""
+
+    def __init__(self, subscriptions: list[dict] | None = None):
+        self.subscriptions = subscriptions or []
+        self.calls: list[tuple[str, dict]] = []
+
+    def list(self, **params):
+        self.calls.append(("list", params))
+        start = 0
+        if params.get("starting_after"):
+            ids = [s["id"] for s in self.subscriptions]
+            start = ids.index(params["starting_after"]) + 1
+        page = self.subscriptions[start : start + params["limit"]]
+        return SimpleNamespace(
+            data=page, has_more=start + len(page) < len(self.subscriptions)
+        )
+
+    def modify(self, subscription_id, **params):
+        self.calls.append(("modify", {"id": subscription_id, **params}))
+        return _subscription(subscription_id, **params)
+
+
+class NoCustomers:
+    """Stripe's Customer resource with nothing to find"""
+
+    def search(self, query, limit):
+        return SimpleNamespace(data=[])
+
+
+def _service(mirror, customers, subscriptions=None) -> SubscriptionService:
+    service = SubscriptionService(mirror=mirror)
+    service.stripe_service = StripeService(customers=customers)
+    service.stripe_service._stripe = SimpleNamespace(Customer=NoCustomers())
+    service._stripe = SimpleNamespace(Subscription=subscriptions)
+    return service
+
+
+@pytest.fixture
+def customers():
+    return CustomerIndex(MemoryCustomerStore())
+
+
+@pytest.fixture
+def stripe_subscriptions():
+    return FakeSubscriptions()
+
+
+@pytest.fixture
+def mirror(customers, stripe_subscriptions):
+    return SubscriptionMirror(
+        MemorySubscriptionStore(),
+        customers=customers,
+        stripe=SimpleNamespace(Subscription=stripe_subscriptions),
+    )
+
+
+@pytest.fixture
+def webhooks(customers, mirror):
+    return WebhookService(customers=customers, subscriptions=mirror)
+
+
+@pytest.mark.asyncio
+async def test_reads_are_served_from_webhook_state(customers, mirror, webhooks):
+    # No customer either, so a miss never reaches Subscription.list
+    service = _service(mirror, customers)
+
+    assert await service.get_subscription(ORG) is None
+
+    await webhooks.handle_event(
+        _event("customer.subscription.created", _subscription(), created=100)
+    )
+    subscription = await service.get_subscription(ORG)
+
+    assert subscription["id"] == "sub_1"
+    assert subscription["status"] == "ACTIVE"
+    assert subscription["cancel_at_period_end"] is False
+
+
+@pytest.mark.asyncio
+async def test_out_of_order_events_do_not_regress(mirror, webhooks):
+    await webhooks.handle_event(
+        _event(
+            "customer.subscription.updated",
+            _subscription(status="past_due"),
+            created=200,
+        )
+    )
+    # Delivered late: an older state of the same subscription
+    await webhooks.handle_event(
+        _event("customer.subscription.created", _subscription(), created=100)
+    )
+
+    assert (await mirror.get(ORG)).status == "past_due"
+
+
+@pytest.mark.asyncio
+async def test_newer_subscription_replaces_older(mirror, webhooks):
+    await webhooks.handle_event(
+        _event(
+            "customer.subscription.created",
+            _subscription("sub_new", created=5_000),
+            300,
+        )
+    )
+    # The old subscription's cancellation arrives afterwards
+    await webhooks.handle_event(
+        _event(
+            "customer.subscription.deleted",
+            _subscription("sub_old", status="canceled", created=1_000),
+            400,
+        )
+    )
+
+    assert (await mirror.get(ORG)).subscription_id == "sub_new"
+
+
+@pytest.mark.asyncio
+async def test_invoice_events_are_recorded(mirror, webhooks):
+    await webhooks.handle_event(
+        _event("customer.subscription.created", _subscription(), created=100)
+    )
+
+    def invoice(invoice_id: str, status: str) -> dict:
+        return {"id": invoice_id, "subscription": "sub_1", "status": status}
+
+    await webhooks.handle_event(_event("invoice.paid", invoice("in_2", "paid"), 300))
+    await webhooks.handle_event(
+        _event("invoice.payment_failed", invoice("in_1", "open"), 200)
+    )
+    # A later subscription update keeps the invoice fields
+    await webhooks.handle_event(
+        _event(
+            "customer.subscription.updated", _subscription(status="active"), created=400
+        )
+    )
+
+    mirrored = await mirror.get(ORG)
+    assert mirrored.latest_invoice_id == "in_2"
+    assert mirrored.latest_invoice_status == "paid"
+    unknown = _event("invoice.paid", {"id": "in_9", "subscription": "sub_x"}, 500)
+    assert not await mirror.apply_event(unknown)
+
+
+@pytest.mark.asyncio
+async def test_organization_resolved_from_customer_index(customers, mirror, webhooks):
+    await customers.put(CustomerRecord(ORG, "cus_1"))
+
+    await webhooks.handle_event(
+        _event("customer.subscription.created", _subscription(org=None), created=100)
+    )
+
+    assert (await mirror.get(ORG)).subscription_id == "sub_1"
+
+
+@pytest.mark.asyncio
+async def test_reconcile_pages_through_every_subscription(
+    customers, mirror, stripe_subscriptions
+):
+    await customers.put(CustomerRecord("org_nometa", "cus_1"))
+    stripe_subscriptions.subscriptions = [
+        _subscription(f"sub_{i}", org=f"org_{i}") for i in range(250)
+    ] + [_subscription("sub_nometa", org=None)]
+    # A missed webhook left a stale status behind
+    await mirror.apply(_subscription("sub_7", status="trialing", org="org_7"), 1)
+
+    applied = await mirror.reconcile()
+
+    lists = [params for name, params in stripe_subscriptions.calls if name == "list"]
+    assert [p.get("starting_after") for p in lists] == [None, "sub_99", "sub_199"]
+    assert all(p["limit"] == 100 and p["status"] == "all" for p in lists)
+    assert applied == 251
+    assert (await mirror.get("org_7")).status == "active"
+    assert (await mirror.get("org_nometa")).subscription_id == "sub_nometa"
+
+
+@pytest.mark.asyncio
+async def test_mutations_use_mirror_and_write_back(
+    customers, mirror, webhooks, stripe_subscriptions
+):
+    await webhooks.handle_event(
+        _event("customer.subscription.created", _subscription(), created=100)
+    )
+    service = _service(mirror, customers, stripe_subscriptions)
+
+    canceled = await service.cancel_subscription(ORG)
+
+    assert [name for name, _ in stripe_subscriptions.calls] == ["modify"]
+    assert stripe_subscriptions.calls[0][1]["id"] == "sub_1"
+    assert canceled["cancel_at_period_end"] is True
+    assert (await service.get_subscription(ORG))["cancel_at_period_end"] is True
+
+
+@pytest.mark.asyncio
+async def test_miss_falls_back_to_stripe_and_backfills(
+    customers, mirror, stripe_subscriptions
+):
+    # Another replica created the subscription; this mirror never saw it
+    await customers.put(CustomerRecord(ORG, "cus_1"))
+    stripe_subscriptions.subscriptions = [_subscription(status="trialing")]
+    service = _service(mirror, customers, stripe_subscriptions)
+
+    first, second = await asyncio.gather(
+        service.get_subscription(ORG), service.get_subscription(ORG)
+    )
+    paused = await service.pause_subscription(ORG)
+
+    assert first["id"] == second["id"] == "sub_1"
+    assert first["status"] == "TRIALING"
+    lists = [params for name, params in stripe_subscriptions.calls if name == "list"]
+    assert lists == [{"customer": "cus_1", "status": "all", "limit": 1}]
+    assert paused["id"] == "sub_1"
+    assert (await mirror.get(ORG)).subscription_id == "sub_1"
+
+
+@pytest.mark.asyncio
+async def test_backfill_does_not_override_a_newer_webhook(
+    customers, mirror, webhooks, stripe_subscriptions
+):
+    await customers.put(CustomerRecord(ORG, "cus_1"))
+    stripe_subscriptions.subscriptions = [_subscription(status="trialing")]
+    listed = stripe_subscriptions.list
+
+    def list_then_webhook(**params):
+        page = listed(**params)
+        # The update lands while the listing is on its way back
+        asyncio.run_coroutine_threadsafe(
+            webhooks.handle_event(
+                _event(
+                    "customer.subscription.updated",
+                    _subscription(status="active"),
+                    created=int(time.time()) + 60,
+                )
+            ),
+            loop,
+        ).result()
+        return page
+
+    loop = asyncio.get_running_loop()
+    stripe_subscriptions.list = list_then_webhook
+    service = _service(mirror, customers, stripe_subscriptions)
+
+    assert (await service.get_subscription(ORG))["status"] == "ACTIVE"
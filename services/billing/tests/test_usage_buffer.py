@@ -0,0 +1,198 @@
+"""Tests for the write-behind usage buffer."""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from services.usage_backend import RedisUsageBackend
+from services.usage_buffer import UsageBuffer
+from services.usage_service import PLAN_LIMITS, UsageService
+
+ORG = "org_buffered"
+AI_TOKEN_LIMIT = PLAN_LIMITS["FREE"]["AI_TOKEN"]
+
+
+@pytest.fixture
+def backend(fake_redis):
+    return RedisUsageBackend(fake_redis)
+
+
+@pytest.fixture
+def service(backend):
+    return UsageService(backend=backend, buffer=UsageBuffer(backend))
+
+
+@pytest.mark.asyncio
+async def test_buffered_usage_is_written_behind(service, fake_redis):
+    for _ in range(100):
+        await service.record_usage(ORG, "AI_TOKEN", 3)
+    key = service._key(ORG, "AI_TOKEN")
+
+    assert await fake_redis.get(key) is None
+    check = await service.check_limit(ORG, "AI_TOKEN", 0)
+    assert check["current"] == 300
+
+    assert await service.buffer.flush() == 1
+    assert await fake_redis.get(key) == "300"
+    assert service.buffer.pending(key) == 0
+    assert (await service.check_limit(ORG, "AI_TOKEN", 0))["current"] == 300
+
+
+@pytest.mark.asyncio
+async def test_unbuffered_types_go_straight_to_backend(service, fake_redis):
+    await service.record_usage(ORG, "API_CALL", 1)
+
+    assert await fake_redis.get(service._key(ORG, "API_CALL")) == "1"
+
+
+@pytest.mark.asyncio
+async def test_enforced_limit_counts_pending_deltas(service):
+    await service.record_usage(ORG, "AI_TOKEN", AI_TOKEN_LIMIT - 10)
+
+    rejected = await service.record_usage(ORG, "AI_TOKEN", 20, enforce_limit=True)
+    assert rejected["success"] is False
+    assert rejected["current_usage"] == AI_TOKEN_LIMIT - 10
+
+    admitted = await service.record_usage(ORG, "AI_TOKEN", 10, enforce_limit=True)
+    assert admitted["success"] is True
+    assert admitted["current_usage"] == AI_TOKEN_LIMIT
+
+    lease = await service.acquire_lease(ORG, "AI_TOKEN", 5)
+    assert lease["granted"] == 0
+
+
+@pytest.mark.asyncio
+async def test_batch_buffers_aggregated_deltas(service, fake_redis):
+    items = [(ORG, "AI_TOKEN", 2)] * 500 + [(ORG, "API_CALL", 1)] * 5
+
+    results = await service.record_usage_batch(items)
+
+    assert results[0]["current_usage"] == 1000
+    assert results[-1]["current_usage"] == 5
+    assert await fake_redis.get(service._key(ORG, "AI_TOKEN")) is None
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_deltas(backend, monkeypatch):
+    buffer = UsageBuffer(backend)
+    buffer.add("k", 5, 2_000_000_000)
+
+    async def unavailable(updates):
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(backend, "record_many", unavailable)
+    with pytest.raises(ConnectionError):
+        await buffer.flush()
+    buffer.add("k", 2, 2_000_000_000)
+    assert buffer.pending("k") == 7
+
+    monkeypatch.undo()
+    await buffer.flush()
+    assert await backend.get_many(["k"]) == [7]
+
+
+@pytest.mark.asyncio
+async def test_threshold_triggers_early_flush(backend):
+    buffer = UsageBuffer(backend, flush_interval=60, flush_threshold=50)
+    buffer.start()
+    try:
+        for _ in range(50):
+            buffer.add("k", 1, 2_000_000_000)
+        for _ in range(20):
+            await asyncio.sleep(0.01)
+            if buffer.flushes:
+                break
+        assert await backend.get_many(["k"]) == [50]
+    finally:
+        await buffer.close()
+
+
+@pytest.mark.asyncio
+async def test_threshold_counts_adds_from_every_thread(backend):
+    buffer = UsageBuffer(backend, flush_interval=60, flush_threshold=1_000)
+
+    def burst():
+        for i in range(250):
+            buffer.add(f"k{i % 7}", 1, 2_000_000_000)
+
+    buffer.start()
+    try:
+        await asyncio.gather(*(asyncio.to_thread(burst) for _ in range(8)))
+        for _ in range(20):
+            await asyncio.sleep(0.01)
+            if buffer.flushes:
+                break
+        assert buffer.flushes
+    finally:
+        await buffer.close()
+    assert sum(await backend.get_many([f"k{i}" for i in range(7)])) == 2_000
+
+
+@pytest.mark.asyncio
+async def test_closed_period_estimates_are_pruned(backend):
+    buffer = UsageBuffer(backend)
+    buffer.add("org_1:2026-09", 5, 2_000_000_000)
+    buffer.add("org_2:2026-09", 5, 2_000_000_000)
+    await buffer.flush()
+    assert buffer.add("org_1:2026-09", 1, 2_000_000_000) == 6
+
+    buffer.add("org_1:2026-10", 2, 2_000_000_100)
+    await buffer.flush()
+
+    assert set(buffer._flushed) == {"org_1:2026-10"}
+    assert buffer.add("org_1:2026-10", 1, 2_000_000_100) == 3
+
+
+@pytest.mark.asyncio
+async def test_wal_replays_after_crash(backend, tmp_path):
+    crashed = UsageBuffer(backend, wal_dir=str(tmp_path))
+    for _ in range(10):
+        crashed.add("k", 4, 2_000_000_000)
+    crashed._wal.close()  # process dies: lock released, segment left behind
+
+    survivor = UsageBuffer(backend, wal_dir=str(tmp_path))
+    assert await survivor.recover() == 10
+    assert await backend.get_many(["k"]) == [40]
+
+    await survivor.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_wal_skips_live_segments(backend, tmp_path):
+    live = UsageBuffer(backend, wal_dir=str(tmp_path))
+    live.add("k", 4, 2_000_000_000)
+
+    other = UsageBuffer(backend, wal_dir=str(tmp_path))
+    assert await other.recover() == 0
+
+    await live.close()
+    await other.close()
+    assert await backend.get_many(["k"]) == [4]
+
+
+@pytest.mark.asyncio
+async def test_wal_keeps_unflushed_segments_from_siblings(
+    backend, tmp_path, monkeypatch
+):
+    live = UsageBuffer(backend, wal_dir=str(tmp_path))
+    live.add("k", 4, 2_000_000_000)
+
+    async def unavailable(updates):
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(backend, "record_many", unavailable)
+    with pytest.raises(ConnectionError):
+        await live.flush()  # the rotated segment waits for a retry
+    monkeypatch.undo()
+
+    sibling = UsageBuffer(backend, wal_dir=str(tmp_path))
+    assert await sibling.recover() == 0
+
+    await live.flush()
+    await sibling.close()
+    await live.close()
+    assert await backend.get_many(["k"]) == [4]
+    assert list(tmp_path.iterdir()) == []
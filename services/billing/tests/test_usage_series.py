@@ -0,0 +1,129 @@
+"""Tests for time-series usage buckets and range queries."""
+
+from __future__ import annotations
+
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+from services.usage_backend import MemoryUsageBackend, RedisUsageBackend
+from services.usage_buffer import UsageBuffer
+from services.usage_series import DAY, HOUR, MINUTE, plan_range
+from services.usage_service import UsageService
+
+ORG = "org_series"
+NOW = datetime(2026, 3, 20, 12, 30, tzinfo=UTC)
+
+
+def test_plan_uses_coarsest_covering_buckets():
+    start = datetime(2026, 3, 1, 22, 58, tzinfo=UTC)
+    end = datetime(2026, 3, 3, 1, 2, tzinfo=UTC)
+
+    buckets = plan_range(start, end, now=end)
+
+    counts = {g.name: sum(1 for b, _ in buckets if b is g) for g in (MINUTE, HOUR, DAY)}
+    assert counts == {"minute": 4, "hour": 2, "day": 1}
+    covered = sum((g.step for g, _ in buckets), timedelta())
+    assert covered == end - start
+
+
+def test_plan_widens_where_fine_buckets_expired():
+    start = datetime(2026, 2, 1, 10, 15, tzinfo=UTC)  # minutes long expired
+    end = datetime(2026, 2, 1, 11, 0, tzinfo=UTC)
+
+    assert plan_range(start, end, now=NOW) == [
+        (HOUR, datetime(2026, 2, 1, 10, tzinfo=UTC))
+    ]
+
+
+def test_plan_over_months_stays_small():
+    buckets = plan_range(datetime(2025, 12, 1, tzinfo=UTC), NOW, now=NOW)
+
+    assert len(buckets) == 109 + 12 + 30  # whole days, then hours, then minutes
+
+
+@pytest.fixture(params=["redis", "memory"])
+def service(request, fake_redis):
+    if request.param == "redis":
+        return UsageService(backend=RedisUsageBackend(fake_redis))
+    return UsageService(backend=MemoryUsageBackend())
+
+
+@pytest.mark.asyncio
+async def test_range_usage_reads_buckets(service):
+    await service.record_usage(ORG, "API_CALL", 7)
+    await service.record_usage_batch([(ORG, "API_CALL", 1)] * 3)
+    now = datetime.now(UTC)
+
+    usage = await service.get_usage(
+        ORG, usage_type="API_CALL", start_date=now - timedelta(days=40)
+    )
+    assert usage["usage"][0]["current"] == 10
+
+    earlier = await service.get_usage(
+        ORG,
+        usage_type="API_CALL",
+        start_date=now - timedelta(days=40),
+        end_date=now - timedelta(days=2),
+    )
+    assert earlier["usage"][0]["current"] == 0
+
+
+@pytest.mark.asyncio
+async def test_series_points_and_lease_corrections(service):
+    lease = await service.acquire_lease(ORG, "API_CALL", 50)
+    await service.release_lease(ORG, lease["lease_id"], used=20)
+
+    now = datetime.now(UTC)
+    series = await service.get_series(ORG, "API_CALL", now - timedelta(hours=3))
+
+    assert series["granularity"] == "minute"
+    assert series["total"] == 20
+    assert sum(p["value"] for p in series["points"]) == 20
+
+    daily = await service.get_series(
+        ORG, "API_CALL", now - timedelta(days=60), granularity="day"
+    )
+    assert len(daily["points"]) in (60, 61)
+    assert daily["total"] == 20
+
+
+@pytest.mark.asyncio
+async def test_range_over_months_is_one_round_trip(fake_redis, monkeypatch):
+    service = UsageService(backend=RedisUsageBackend(fake_redis))
+    await service.record_usage(ORG, "AI_TOKEN", 5)
+    calls = []
+    original = service.backend.get_buckets
+
+    async def counting(reads):
+        calls.append(len(reads))
+        return await original(reads)
+
+    monkeypatch.setattr(service.backend, "get_buckets", counting)
+    now = datetime.now(UTC)
+
+    usage = await service.get_usage(
+        ORG, usage_type="AI_TOKEN", start_date=now - timedelta(days=85)
+    )
+
+    assert usage["usage"][0]["current"] == 5
+    assert len(calls) == 1
+    assert calls[0] <= 8  # ~3 month hashes plus edge day/hour hashes
+
+
+@pytest.mark.asyncio
+async def test_buffered_usage_reaches_series_on_flush(fake_redis):
+    backend = RedisUsageBackend(fake_redis)
+    service = UsageService(backend=backend, buffer=UsageBuffer(backend))
+    for _ in range(10):
+        await service.record_usage(ORG, "BANDWIDTH", 100)
+    start = datetime.now(UTC) - timedelta(hours=1)
+
+    series = await service.get_series(ORG, "BANDWIDTH", start)
+    assert series["total"] == 0  # still buffered
+    usage = await service.get_usage(ORG, usage_type="BANDWIDTH", start_date=start)
+    assert usage["usage"][0]["current"] == 1000  # pending usage counts
+
+    await service.buffer.flush()
+    series = await service.get_series(ORG, "BANDWIDTH", start)
+    assert series["total"] == 1000
@@ -0,0 +1,247 @@
+"""Tests for UsageService metering and limit enforcement."""
+
+from __future__ import annotations
+
+import asyncio
+import time
+
+import pytest
+
+from services.usage_backend import (
+    CounterUpdate,
+    MemoryUsageBackend,
+    RedisUsageBackend,
+)
+from services.usage_service import PLAN_LIMITS, UsageService
+
+ORG = "org_test"
+API_CALL_LIMIT = PLAN_LIMITS["FREE"]["API_CALL"]
+
+
+@pytest.fixture(params=["redis", "memory"])
+def service(request, fake_redis):
+    if request.param == "redis":
+        return UsageService(backend=RedisUsageBackend(fake_redis))
+    return UsageService(backend=MemoryUsageBackend())
+
+
+@pytest.mark.asyncio
+async def test_record_accumulates(service):
+    await service.record_usage(ORG, "AI_TOKEN", 300)
+    result = await service.record_usage(ORG, "AI_TOKEN", 200)
+
+    assert result["success"] is True
+    assert result["current_usage"] == 500
+    assert result["remaining"] == PLAN_LIMITS["FREE"]["AI_TOKEN"] - 500
+
+
+@pytest.mark.asyncio
+async def test_unenforced_record_may_exceed_limit(service):
+    result = await service.record_usage(ORG, "API_CALL", API_CALL_LIMIT + 5)
+
+    assert result["success"] is True
+    assert result["current_usage"] == API_CALL_LIMIT + 5
+    assert result["remaining"] == 0
+
+
+@pytest.mark.asyncio
+async def test_enforced_record_rejects_without_recording(service):
+    await service.record_usage(ORG, "API_CALL", API_CALL_LIMIT - 1)
+
+    rejected = await service.record_usage(ORG, "API_CALL", 2, enforce_limit=True)
+    assert rejected["success"] is False
+    assert rejected["current_usage"] == API_CALL_LIMIT - 1
+
+    admitted = await service.record_usage(ORG, "API_CALL", 1, enforce_limit=True)
+    assert admitted["success"] is True
+    assert admitted["remaining"] == 0
+
+
+@pytest.mark.asyncio
+async def test_non_positive_quantities_are_rejected(service):
+    await service.record_usage(ORG, "API_CALL", 10)
+
+    for quantity in (0, -5):
+        with pytest.raises(ValueError):
+            await service.record_usage(ORG, "API_CALL", quantity)
+    with pytest.raises(ValueError):
+        await service.record_usage_batch([(ORG, "API_CALL", 3), (ORG, "API_CALL", -3)])
+
+    result = await service.record_usage(ORG, "API_CALL", 1)
+    assert result["current_usage"] == 11
+
+
+@pytest.mark.asyncio
+async def test_backends_never_admit_non_positive_quantities(service):
+    backend = service.backend
+    await backend.record("k", 10, -1, 2_000_000_000, enforce=False)
+
+    result = await backend.record("k", -4, -1, 2_000_000_000, enforce=False)
+    [batch] = await backend.record_many(
+        [
+            CounterUpdate(
+                key="k",
+                quantities=[-1, 2, 0],
+                limit=-1,
+                expire_at=2_000_000_000,
+                enforce=False,
+            )
+        ]
+    )
+
+    assert (result.admitted, result.usage) == (False, 10)
+    assert batch.admitted == [False, True, False]
+    assert batch.usage == 12
+
+
+@pytest.mark.asyncio
+async def test_parallel_enforced_records_never_over_admit(service):
+    attempts = API_CALL_LIMIT * 3
+
+    results = await asyncio.gather(
+        *(
+            service.record_usage(ORG, "API_CALL", 1, enforce_limit=True)
+            for _ in range(attempts)
+        )
+    )
+
+    admitted = sum(r["success"] for r in results)
+    assert admitted == API_CALL_LIMIT
+    check = await service.check_limit(ORG, "API_CALL", 1)
+    assert check["current"] == API_CALL_LIMIT
+    assert check["allowed"] is False
+
+
+@pytest.mark.asyncio
+async def test_parallel_enforced_records_across_workers(fake_redis):
+    """Separate service instances (as in separate workers) share one limit."""
+    workers = [UsageService(backend=RedisUsageBackend(fake_redis)) for _ in range(4)]
+
+    results = await asyncio.gather(
+        *(
+            workers[i % len(workers)].record_usage(
+                ORG, "API_CALL", 7, enforce_limit=True
+            )
+            for i in range(100)
+        )
+    )
+
+    admitted = sum(r["success"] for r in results)
+    assert admitted == API_CALL_LIMIT // 7
+    [current] = await workers[0].backend.get_many([workers[0]._key(ORG, "API_CALL")])
+    assert current == admitted * 7
+
+
+@pytest.mark.asyncio
+async def test_counters_expire_after_period(fake_redis):
+    service = UsageService(backend=RedisUsageBackend(fake_redis))
+    await service.record_usage(ORG, "API_CALL", 1)
+
+    ttl = await fake_redis.ttl(service._key(ORG, "API_CALL"))
+    assert 0 < ttl <= service._expire_at() - int(time.time()) + 1
+
+
+@pytest.mark.asyncio
+async def test_usage_summary_and_reset(service):
+    await service.record_usage(ORG, "API_CALL", 10)
+    await service.record_usage(ORG, "AI_TOKEN", 20)
+
+    usage = await service.get_usage(ORG)
+    current = {u["type"]: u["current"] for u in usage["usage"]}
+    assert current["API_CALL"] == 10
+    assert current["AI_TOKEN"] == 20
+
+    await service.reset_usage(ORG, usage_type="API_CALL")
+    limits = await service.get_limits(ORG)
+    assert limits["limits"]["API_CALL"]["current"] == 0
+    assert limits["limits"]["AI_TOKEN"]["current"] == 20
+
+
+@pytest.mark.asyncio
+async def test_batch_aggregates_per_counter(service):
+    items = [(ORG, "AI_TOKEN", 10)] * 50 + [("org_other", "AI_TOKEN", 5)] * 10
+
+    results = await service.record_usage_batch(items)
+
+    assert len(results) == len(items)
+    assert all(r["success"] for r in results)
+    assert results[0]["current_usage"] == 500
+    assert results[-1]["current_usage"] == 50
+    assert results[-1]["organization_id"] == "org_other"
+
+
+@pytest.mark.asyncio
+async def test_batch_enforces_limit_per_item_in_order(service):
+    await service.record_usage(ORG, "API_CALL", API_CALL_LIMIT - 10)
+    items = [
+        (ORG, "API_CALL", 6),
+        (ORG, "API_CALL", 6),  # would reach limit + 2
+        (ORG, "API_CALL", 4),  # still fits after the rejection
+        ("org_other", "API_CALL", 1),
+    ]
+
+    results = await service.record_usage_batch(items, enforce_limit=True)
+
+    assert [r["success"] for r in results] == [True, False, True, True]
+    assert results[0]["current_usage"] == API_CALL_LIMIT
+    assert results[0]["remaining"] == 0
+    assert results[3]["current_usage"] == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_is_one_round_trip(fake_redis, monkeypatch):
+    service = UsageService(backend=RedisUsageBackend(fake_redis))
+    pipelines = []
+    original = fake_redis.pipeline
+
+    def counting_pipeline(*args, **kwargs):
+        pipelines.append(kwargs)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(fake_redis, "pipeline", counting_pipeline)
+    items = [(f"org_{i % 100}", "API_CALL", 1) for i in range(5000)]
+
+    results = await service.record_usage_batch(items)
+
+    assert len(pipelines) == 1
+    assert all(r["current_usage"] == 50 for r in results)
+
+
+@pytest.mark.asyncio
+async def test_lease_counts_grant_and_release_returns_rest(service):
+    lease = await service.acquire_lease(ORG, "API_CALL", 40)
+    assert lease["granted"] == 40
+    assert lease["current_usage"] == 40
+
+    released = await service.release_lease(ORG, lease["lease_id"], used=15)
+    assert released["returned"] == 25
+    assert released["current_usage"] == 15
+
+    with pytest.raises(ValueError):
+        await service.release_lease(ORG, lease["lease_id"], used=15)
+
+
+@pytest.mark.asyncio
+async def test_leases_never_grant_past_limit(service):
+    grants = await asyncio.gather(
+        *(service.acquire_lease(ORG, "API_CALL", 30) for _ in range(10))
+    )
+
+    assert sum(g["granted"] for g in grants) == API_CALL_LIMIT
+    assert sorted(g["granted"] for g in grants)[-4:] == [10, 30, 30, 30]
+    assert all(g["lease_id"] is None for g in grants if g["granted"] == 0)
+
+
+@pytest.mark.asyncio
+async def test_batch_route_rejects_non_positive_quantities(client):
+    response = await client.post(
+        "/api/v1/usage/record-batch",
+        json={
+            "items": [
+                {"organization_id": ORG, "type": "API_CALL", "quantity": 5},
+                {"organization_id": ORG, "type": "API_CALL", "quantity": -5},
+            ]
+        },
+    )
+
+    assert response.status_code == 422
@@ -0,0 +1,298 @@
+"""Tests for the asynchronous Stripe webhook queue and its workers."""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import json
+import random
+import time
+
+import pytest
+
+from services.webhook_queue import (
+    MemoryWebhookQueue,
+    RedisWebhookQueue,
+    WebhookWorkers,
+    partition_for,
+)
+
+SECRET = "whsec_test"  # noqa: S105
+
+
+def _event(event_id: str, customer: str = "cus_1", kind: str = "invoice.paid") -> dict:
+    return {
+        "id": event_id,
+        "type": kind,
+        "created": 1_000,
+        "data": {"object": {"id": f"in_{event_id}", "customer": customer}},
+    }
+
+
+class Recorder:
+    """A handler that records what it handled, optionally slowly or failing"""
+
+    def __init__(
+        self, delay: float = 0.0, failures: int = 0, poison: frozenset = frozenset()
+    ):
+        self.delay = delay
+        self.failures = failures
+        self.poison = poison  # event ids that always fail
+        self.handled: list[dict] = []
+        self.running = 0
+        self.peak = 0
+
+    async def __call__(self, event: dict) -> dict:
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            if self.delay:
+                await asyncio.sleep(random.uniform(0, self.delay))  # noqa: S311
+            if event["id"] in self.poison:
+                raise RuntimeError("handler failed")
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("handler failed")
+            self.handled.append(event)
+            return {"handled": True}
+        finally:
+            self.running -= 1
+
+
+@pytest.mark.asyncio
+async def test_redeliveries_are_handled_once():
+    handler = Recorder()
+    workers = WebhookWorkers(MemoryWebhookQueue(partitions=4), handler)
+
+    assert await workers.submit(_event("evt_1"))
+    assert not await workers.submit(_event("evt_1"))
+    for partition in range(4):
+        await workers.drain(partition)
+
+    assert [e["id"] for e in handler.handled] == ["evt_1"]
+    assert workers.duplicates == 1
+
+
+@pytest.mark.asyncio
+async def test_per_customer_order_is_kept_across_parallel_workers():
+    handler = Recorder(delay=0.005)
+    workers = WebhookWorkers(MemoryWebhookQueue(partitions=8), handler, read_block=0.05)
+    customers = [f"cus_{i}" for i in range(20)]
+    sent: dict[str, list[str]] = {c: [] for c in customers}
+    for i in range(400):
+        customer = customers[i % len(customers)]
+        await workers.submit(_event(f"evt_{i}", customer))
+        sent[customer].append(f"evt_{i}")
+
+    workers.start()
+    try:
+        deadline = time.monotonic() + 10
+        while len(handler.handled) < 400 and time.monotonic() < deadline:
+            await asyncio.sleep(0.02)
+    finally:
+        await workers.close()
+
+    received: dict[str, list[str]] = {c: [] for c in customers}
+    for event in handler.handled:
+        received[event["data"]["object"]["customer"]].append(event["id"])
+    assert received == sent
+    assert handler.peak > 1  # customers were handled in parallel
+
+
+@pytest.mark.asyncio
+async def test_failing_handler_is_retried_then_dead_lettered():
+    queue = MemoryWebhookQueue(partitions=1)
+    flaky = WebhookWorkers(queue, Recorder(failures=2), backoff=0.001)
+    await flaky.submit(_event("evt_flaky"))
+    await flaky.drain(0)
+
+    assert [e["id"] for e in flaky.handler.handled] == ["evt_flaky"]
+    assert flaky.retries == 2
+
+    broken = WebhookWorkers(
+        queue, Recorder(poison=frozenset({"evt_broken"})), max_attempts=3, backoff=0.001
+    )
+    await broken.submit(_event("evt_broken"))
+    await broken.submit(_event("evt_next"))
+    await broken.drain(0)
+
+    assert [entry.event["id"] for entry, _ in queue.dead] == ["evt_broken"]
+    # The partition moved on
+    assert [e["id"] for e in broken.handler.handled] == ["evt_next"]
+
+
+@pytest.mark.asyncio
+async def test_redis_queue_dedupes_orders_and_acks(fake_redis):
+    queue = RedisWebhookQueue(fake_redis, partitions=2)
+    handler = Recorder()
+    workers = WebhookWorkers(queue, handler)
+    events = [_event(f"evt_{i}", "cus_same") for i in range(5)]
+
+    for event in events:
+        assert await workers.submit(event)
+    assert not await workers.submit(events[0])
+    partition = partition_for(events[0], 2)
+    depth, age = (await queue.lag())[partition]
+    assert depth == 5 and age >= 0
+
+    assert await queue.claim(partition, workers.owner)
+    assert await workers.drain(partition) == 5
+
+    assert [e["id"] for e in handler.handled] == [e["id"] for e in events]
+    assert (await queue.lag())[partition][0] == 0
+
+
+@pytest.mark.asyncio
+async def test_new_lease_holder_rereads_unacknowledged_events(fake_redis):
+    first = RedisWebhookQueue(fake_redis, partitions=1, lease_ttl=0.05)
+    await first.enqueue(_event("evt_1"))
+    await first.enqueue(_event("evt_2"))
+
+    assert await first.claim(0, "replica-a")
+    read = await first.read(0, count=10, block=0)
+    await first.ack(read[0])  # replica-a dies before acknowledging evt_2
+
+    second = RedisWebhookQueue(fake_redis, partitions=1, lease_ttl=0.05)
+    assert not await second.claim(0, "replica-b")  # lease still held
+    await asyncio.sleep(0.1)
+    assert await second.claim(0, "replica-b")
+
+    handler = Recorder()
+    await WebhookWorkers(second, handler).drain(0)
+
+    assert [e["id"] for e in handler.handled] == ["evt_2"]
+
+
+class BlockingQueue(RedisWebhookQueue):
+    """fakeredis answers a blocking XREADGROUP at once; wait as Redis would"""
+
+    async def read(self, partition, count, block):
+        entries = await super().read(partition, count, block)
+        if not entries:
+            await asyncio.sleep(block)
+        return entries
+
+
+class Steady:
+    """A handler taking a fixed time per event, recording who handled it"""
+
+    def __init__(self, name: str, delay: float, handled: list):
+        self.name = name
+        self.delay = delay
+        self.handled = handled
+
+    async def __call__(self, event: dict) -> dict:
+        await asyncio.sleep(self.delay)
+        self.handled.append((self.name, event["id"]))
+        return {"handled": True}
+
+
+@pytest.mark.asyncio
+async def test_lease_outlives_a_batch_longer_than_its_ttl(fake_redis):
+    handled: list[tuple[str, str]] = []
+    workers = [
+        WebhookWorkers(
+            BlockingQueue(fake_redis, partitions=1, lease_ttl=0.2),
+            Steady(name, delay=0.05, handled=handled),
+            read_block=0.05,
+        )
+        for name in ("a", "b")
+    ]
+    events = [_event(f"evt_{i}") for i in range(12)]  # ~0.6s as one batch
+    for event in events:
+        await workers[0].submit(event)
+
+    workers[0].start()
+    await asyncio.sleep(0.01)  # a takes the lease and reads the batch
+    workers[1].start()
+    try:
+        for _ in range(200):
+            if len(handled) >= len(events):
+                break
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.1)
+    finally:
+        for worker in workers:
+            await worker.close()
+
+    assert [event_id for _, event_id in handled] == [e["id"] for e in events]
+    assert {name for name, _ in handled} == {"a"}
+    assert await fake_redis.get("billing:webhooks:lease:0") is None
+
+
+@pytest.mark.asyncio
+async def test_worker_stops_its_batch_when_the_lease_is_lost(fake_redis):
+    handled: list[tuple[str, str]] = []
+    queue = BlockingQueue(fake_redis, partitions=1)
+    steady = Steady("a", delay=0, handled=handled)
+
+    async def handler(event):
+        await steady(event)
+        if event["id"] == "evt_1":  # the lease lapses and b takes it
+            await fake_redis.set("billing:webhooks:lease:0", "replica-b")
+        return {"handled": True}
+
+    workers = WebhookWorkers(queue, handler, read_block=0.05)
+    for i in range(4):
+        await workers.submit(_event(f"evt_{i}"))
+
+    workers.start()
+    await asyncio.sleep(0.2)
+    await workers.close()
+
+    assert [event_id for _, event_id in handled] == ["evt_0", "evt_1"]
+    # Left for the new holder, and its lease untouched by close()
+    assert (await queue.lag())[0][0] == 2
+    assert await fake_redis.get("billing:webhooks:lease:0") == "replica-b"
+
+
+def _signed(body: dict) -> tuple[bytes, str]:
+    payload = json.dumps(body).encode()
+    timestamp = int(time.time())
+    signature = hmac.new(
+        SECRET.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256
+    ).hexdigest()
+    return payload, f"t={timestamp},v1={signature}"
+
+
+@pytest.mark.asyncio
+async def test_route_acknowledges_before_handling(client, monkeypatch):
+    from app.api.v1.routes_webhooks import get_webhook_workers
+    from app.config import settings
+    from app.main import app
+    from utils.stripe_client import get_stripe
+
+    monkeypatch.setattr(settings, "STRIPE_WEBHOOK_SECRET", SECRET)
+    get_stripe()  # import the SDK outside the timed request
+    handler = Recorder(delay=5.0)  # would time the request out if run inline
+    workers = WebhookWorkers(MemoryWebhookQueue(partitions=2), handler)
+    app.dependency_overrides[get_webhook_workers] = lambda: workers
+    try:
+        payload, signature = _signed({**_event("evt_route"), "object": "event"})
+        headers = {"Stripe-Signature": signature, "Content-Type": "application/json"}
+        started = time.perf_counter()
+        first = await client.post(
+            "/api/v1/webhooks/stripe", content=payload, headers=headers
+        )
+        elapsed = time.perf_counter() - started
+        again = await client.post(
+            "/api/v1/webhooks/stripe", content=payload, headers=headers
+        )
+        forged = await client.post(
+            "/api/v1/webhooks/stripe",
+            content=payload,
+            headers={**headers, "Stripe-Signature": "t=1,v1=bad"},
+        )
+        metrics = await client.get("/api/v1/webhooks/stripe/metrics")
+    finally:
+        app.dependency_overrides.pop(get_webhook_workers, None)
+
+    assert first.status_code == 200 and first.json()["duplicate"] is False
+    assert elapsed < 1.0
+    assert handler.handled == []
+    assert again.json()["duplicate"] is True
+    assert forged.status_code == 400
+    assert 'stripe_webhook_events_total{outcome="duplicate"} 1' in metrics.text
+    assert "stripe_webhook_queue_lag_seconds" in metrics.text
+    assert "stripe_webhook_handler_seconds_count 0" in metrics.text
@@ -39,3 +39,26 @@ async def close_redis_client():
     if _client:
         await _client.close()
         _client = None
+
+
+async def delete_matching(
+    client: redis.Redis, pattern: str, batch_size: int = 500
+) -> int:
+    """
+    Delete every key matching a glob pattern; returns how many were deleted.
+
+    Walks the keyspace with SCAN and removes each batch with UNLINK, so no
+    single command blocks Redis for long (unlike KEYS + DEL) and the memory
+    is reclaimed off the main thread. Keys written during the walk may be
+    missed.
+    """
+    deleted = 0
+    batch: list[str] = []
+    async for key in client.scan_iter(match=pattern, count=batch_size):
+        batch.append(key)
+        if len(batch) >= batch_size:
+            deleted += await client.unlink(*batch)
+            batch = []
+    if batch:
+        deleted += await client.unlink(*batch)
+    return deleted
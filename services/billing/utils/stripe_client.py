@@ -0,0 +1,182 @@
+"""
+Stripe Client
+
+Lazily imported, configured Stripe SDK module, and the gate every SDK call
+goes through.
+
+The stripe package pulls in every API resource at import time, so it is
+imported on first use instead of when the service boots.
+
+The SDK is synchronous: a call made inside a coroutine blocks the event
+loop, and with it every other request on the worker, for a full Stripe
+round trip. stripe_call() runs the call on a dedicated thread pool instead,
+behind a per-process concurrency cap and a token bucket sized below
+Stripe's rate limit. A 429 pauses the whole gate for a backoff (or the
+Retry-After Stripe sends) before the call is retried; Stripe does not
+process rate-limited requests, so retrying them is safe.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import random
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from types import ModuleType
+from typing import Any, TypeVar
+
+import structlog
+
+from app.config import settings
+
+logger = structlog.get_logger()
+
+T = TypeVar("T")
+
+_stripe: ModuleType | None = None
+_gate: StripeGate | None = None
+
+
+def get_stripe() -> ModuleType:
+    """Get the configured stripe module (imported on first call)"""
+    global _stripe
+
+    if _stripe is None:
+        import stripe
+
+        stripe.api_key = settings.STRIPE_SECRET_KEY
+        _stripe = stripe
+
+    return _stripe
+
+
+class StripeGate:
+    """
+    Runs blocking Stripe SDK calls off the event loop.
+
+    Args:
+        max_concurrency: Calls in flight at once (also the thread pool size).
+        rate: Calls started per second, per process.
+        burst: Calls that may start at once after an idle period.
+        max_retries: Retries of a rate-limited (429) call.
+        backoff: First retry delay in seconds, doubled per retry.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        rate: float = 20.0,
+        burst: int = 20,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+    ):
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="stripe"
+        )
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        # The semaphore belongs to one event loop; rebuilt if the loop changes
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self.in_flight = 0
+        self.rate_limited = 0
+
+    def _slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _take_token(self) -> None:
+        while True:
+            now = time.monotonic()
+            wait = self._paused_until - now
+            if wait <= 0:
+                elapsed = now - self._updated
+                self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            await asyncio.sleep(wait)
+
+    def _retry_delay(self, exc: Exception, attempt: int) -> float:
+        headers = getattr(exc, "headers", None) or {}
+        retry_after = headers.get("retry-after") or headers.get("Retry-After")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        delay = self.backoff * (2**attempt)
+        return delay * random.uniform(0.75, 1.25)  # noqa: S311
+
+    async def call(self, fn: Callable[..., T], /, *args: Any, **kwargs: Any) -> T:
+        """Run `fn(*args, **kwargs)` on the Stripe thread pool"""
+        rate_limit_error = get_stripe().RateLimitError
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            async with self._slots():
+                await self._take_token()
+                # Runs with the caller's context (trace and log context)
+                run = functools.partial(
+                    contextvars.copy_context().run, fn, *args, **kwargs
+                )
+                self.in_flight += 1
+                try:
+                    return await loop.run_in_executor(self._executor, run)
+                except rate_limit_error as exc:
+                    if attempt >= self.max_retries:
+                        raise
+                    delay = self._retry_delay(exc, attempt)
+                    attempt += 1
+                    self.rate_limited += 1
+                    # Every caller waits, not just this one
+                    self._paused_until = max(
+                        self._paused_until, time.monotonic() + delay
+                    )
+                    logger.warning(
+                        "stripe_rate_limited", retry_in=round(delay, 2), attempt=attempt
+                    )
+                finally:
+                    self.in_flight -= 1
+
+    def close(self) -> None:
+        """Stop accepting calls; calls already running finish in their threads"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_stripe_gate() -> StripeGate:
+    """Get the process-wide Stripe gate"""
+    global _gate
+
+    if _gate is None:
+        _gate = StripeGate(
+            max_concurrency=settings.STRIPE_MAX_CONCURRENCY,
+            rate=settings.STRIPE_RATE_LIMIT,
+            burst=settings.STRIPE_RATE_BURST,
+            max_retries=settings.STRIPE_MAX_RETRIES,
+        )
+
+    return _gate
+
+
+async def stripe_call(fn: Callable[..., T], /, *args: Any, **kwargs: Any) -> T:
+    """
+    Call a Stripe SDK function without blocking the event loop.
+
+        customer = await stripe_call(stripe.Customer.retrieve, customer_id)
+    """
+    return await get_stripe_gate().call(fn, *args, **kwargs)
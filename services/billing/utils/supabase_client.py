@@ -4,10 +4,15 @@ Supabase Client
 Singleton client for Supabase database access.
 """
 
-from supabase import Client, create_client
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
 
 from app.config import settings
 
+if TYPE_CHECKING:
+    from supabase import Client
+
 _client: Client | None = None
 
 
@@ -19,6 +24,10 @@ def get_supabase_client() -> Client:
         if not settings.SUPABASE_URL or not settings.SUPABASE_SERVICE_ROLE_KEY:
             raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set")
 
+        # Imported on first use: supabase pulls in postgrest, gotrue, realtime
+        # and storage clients at import time.
+        from supabase import create_client
+
         _client = create_client(
             settings.SUPABASE_URL, settings.SUPABASE_SERVICE_ROLE_KEY
         )
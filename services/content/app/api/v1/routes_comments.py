@@ -3,6 +3,8 @@ from datetime import datetime
 from fastapi import APIRouter, Header, HTTPException
 from pydantic import BaseModel
 
+from _shared.memory import register_store
+
 router = APIRouter()
 
 
@@ -20,6 +22,7 @@ class CommentResponse(BaseModel):
 
 
 comments_db: dict[str, dict] = {}
+register_store("content.comments_db", comments_db)
 comment_counter = 0
 
 
@@ -1,7 +1,9 @@
-from fastapi import APIRouter, Header
+from fastapi import APIRouter, Header, Request
 from pydantic import BaseModel
 
-from .routes_posts import posts_db
+from _shared.etag import cached_json_response
+
+from .routes_posts import feed_versions, posts_db
 
 router = APIRouter()
 
@@ -20,68 +22,75 @@ class FeedResponse(BaseModel):
     has_more: bool = False
 
 
+def _feed_item(p: dict) -> dict:
+    return {
+        "id": p["id"],
+        "title": p["title"],
+        "body": p["body"][:200] + "..." if len(p["body"]) > 200 else p["body"],
+        "author_id": p["author_id"],
+        "created_at": p["created_at"].isoformat(),
+    }
+
+
+def _published_posts(organization_id: str) -> list[dict]:
+    """Published posts for an organization, newest first"""
+    org_posts = [
+        p
+        for p in posts_db.values()
+        if p["organization_id"] == organization_id and p["status"] == "published"
+    ]
+    org_posts.sort(key=lambda x: x["created_at"], reverse=True)
+    return org_posts
+
+
 @router.get("/", response_model=FeedResponse)
 async def get_feed(
+    request: Request,
     x_organization_id: str = Header(...),
     limit: int = 20,
     cursor: str | None = None,
 ):
     """Get content feed for organization (reverse chronological)"""
-    # Filter posts by organization and published status
-    org_posts = [
-        p
-        for p in posts_db.values()
-        if p["organization_id"] == x_organization_id and p["status"] == "published"
-    ]
 
-    # Sort by created_at descending
-    org_posts.sort(key=lambda x: x["created_at"], reverse=True)
+    def build() -> dict:
+        org_posts = _published_posts(x_organization_id)
 
-    # Simple pagination
-    items = org_posts[:limit]
+        # Simple pagination
+        items = org_posts[:limit]
+        has_more = len(org_posts) > limit
 
-    return {
-        "items": [
-            {
-                "id": p["id"],
-                "title": p["title"],
-                "body": p["body"][:200] + "..." if len(p["body"]) > 200 else p["body"],
-                "author_id": p["author_id"],
-                "created_at": p["created_at"].isoformat(),
-            }
-            for p in items
-        ],
-        "has_more": len(org_posts) > limit,
-        "next_cursor": items[-1]["id"] if items and len(org_posts) > limit else None,
-    }
+        return {
+            "items": [_feed_item(p) for p in items],
+            "has_more": has_more,
+            "next_cursor": items[-1]["id"] if items and has_more else None,
+        }
+
+    # Unchanged feeds are answered with 304 (or the cached body) without
+    # scanning posts; any post write for the org bumps the version.
+    return await cached_json_response(
+        request,
+        key=f"feed:{x_organization_id}:{limit}:{cursor}",
+        version=feed_versions.current(x_organization_id),
+        build=build,
+    )
 
 
 @router.get("/trending", response_model=FeedResponse)
 async def get_trending(
+    request: Request,
     x_organization_id: str = Header(...),
     limit: int = 10,
 ):
     """Get trending content (placeholder - would use engagement metrics)"""
-    org_posts = [
-        p
-        for p in posts_db.values()
-        if p["organization_id"] == x_organization_id and p["status"] == "published"
-    ]
 
-    # For now, just return most recent as "trending"
-    org_posts.sort(key=lambda x: x["created_at"], reverse=True)
-    items = org_posts[:limit]
+    def build() -> dict:
+        # For now, just return most recent as "trending"
+        items = _published_posts(x_organization_id)[:limit]
+        return {"items": [_feed_item(p) for p in items], "has_more": False}
 
-    return {
-        "items": [
-            {
-                "id": p["id"],
-                "title": p["title"],
-                "body": p["body"][:200] + "..." if len(p["body"]) > 200 else p["body"],
-                "author_id": p["author_id"],
-                "created_at": p["created_at"].isoformat(),
-            }
-            for p in items
-        ],
-        "has_more": False,
-    }
+    return await cached_json_response(
+        request,
+        key=f"trending:{x_organization_id}:{limit}",
+        version=feed_versions.current(x_organization_id),
+        build=build,
+    )
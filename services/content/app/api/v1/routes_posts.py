@@ -3,6 +3,9 @@ from datetime import datetime
 from fastapi import APIRouter, Header, HTTPException
 from pydantic import BaseModel
 
+from _shared.etag import VersionCounter
+from _shared.memory import register_store
+
 router = APIRouter()
 
 
@@ -25,8 +28,12 @@ class PostResponse(BaseModel):
 
 # In-memory store for demo (replace with Supabase in production)
 posts_db: dict[str, dict] = {}
+register_store("content.posts_db", posts_db)
 post_counter = 0
 
+# Per-organization change counters; feed ETags are versioned by these
+feed_versions = VersionCounter()
+
 
 @router.post("/", response_model=PostResponse)
 async def create_post(
@@ -51,6 +58,7 @@ async def create_post(
         "updated_at": now,
     }
     posts_db[post_id] = post
+    feed_versions.bump(x_organization_id)
     return post
 
 
@@ -89,6 +97,7 @@ async def update_post(
             "updated_at": datetime.utcnow(),
         }
     )
+    feed_versions.bump(x_organization_id)
     return post
 
 
@@ -105,4 +114,5 @@ async def delete_post(
         raise HTTPException(status_code=403, detail="Access denied")
 
     del posts_db[post_id]
+    feed_versions.bump(x_organization_id)
     return {"deleted": True}
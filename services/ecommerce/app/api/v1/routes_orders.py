@@ -3,6 +3,8 @@ from datetime import datetime
 from fastapi import APIRouter, Header, HTTPException
 from pydantic import BaseModel
 
+from _shared.memory import register_store
+
 router = APIRouter()
 
 
@@ -21,6 +23,7 @@ class Order(BaseModel):
 
 
 orders_db: dict[str, dict] = {}
+register_store("ecommerce.orders_db", orders_db)
 order_counter = 0
 
 
@@ -12,19 +12,22 @@ import os
 import sys
 from contextlib import asynccontextmanager
 from datetime import UTC, datetime, timedelta
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
 
-from clickhouse_connect import get_client
-from clickhouse_connect.driver.client import Client
 from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings
 
-from _shared.errors import generic_exception_handler
-from _shared.middleware import RequestLoggingMiddleware
-from _shared.otel import instrument_app
+from _shared.app import create_app
+from _shared.lifecycle import lifecycle
+from _shared.memory import register_store
+
+if TYPE_CHECKING:
+    # clickhouse_connect is imported on first use; it is heavy at import time
+    from clickhouse_connect.driver.client import Client
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("event-ingest")
@@ -79,6 +82,7 @@ class IngestResponse(BaseModel):
 
 _clickhouse_client: Client | None = None
 _idempotency_cache: dict[str, datetime] = {}
+register_store("event_ingest.idempotency_cache", _idempotency_cache)
 
 
 @asynccontextmanager
@@ -92,17 +96,16 @@ async def lifespan(app: FastAPI):
     yield
 
 
-app = FastAPI(
+# /health is service-specific (ClickHouse connectivity), so skip the shared probes;
+# /ready below reports draining.
+app = create_app(
     title="Nebutra Event Ingest Service",
     description="Contract-first event ingestion for warehouse bronze layer",
-    version="0.1.0",
+    service_name="event-ingest-service",
     lifespan=lifespan,
+    include_health=False,
 )
 
-instrument_app(app, service_name="event-ingest-service")
-app.add_middleware(RequestLoggingMiddleware)
-app.add_exception_handler(Exception, generic_exception_handler)
-
 # CORS is handled at the Hono API Gateway layer — do not add CORSMiddleware here.
 # This service is internal and should not be exposed directly to browsers.
 
@@ -156,6 +159,8 @@ def get_clickhouse_client() -> Client:
     global _clickhouse_client
 
     if _clickhouse_client is None:
+        from clickhouse_connect import get_client
+
         _clickhouse_client = get_client(
             host=settings.clickhouse_host,
             port=settings.clickhouse_port,
@@ -191,6 +196,16 @@ async def health() -> dict[str, Any]:
         }
 
 
+@app.get("/ready", response_model=None)
+async def ready() -> dict[str, str] | JSONResponse:
+    # Liveness (/health) stays green while draining; only readiness flips
+    if lifecycle.is_draining:
+        return JSONResponse(
+            {"status": "not_ready", "reason": "draining"}, status_code=503
+        )
+    return {"status": "ready"}
+
+
 @app.post("/api/v1/events/ingest", response_model=IngestResponse)
 async def ingest_events(
     request: IngestRequest,
@@ -270,11 +285,6 @@ async def ingest_events(
 
 
 if __name__ == "__main__":
-    import uvicorn
+    from _shared.launcher import run
 
-    uvicorn.run(
-        "app.main:app",
-        host=settings.host,
-        port=settings.port,
-        reload=False,
-    )
+    run("app.main:app", host=settings.host, port=settings.port)
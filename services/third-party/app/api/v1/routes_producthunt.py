@@ -5,11 +5,14 @@ REST API endpoints for accessing Product Hunt data
 with caching and rate limiting.
 """
 
-from typing import Optional
-from fastapi import APIRouter, HTTPException, Query
+from typing import Any, Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
+from _shared.etag import cached_json_response
+from _shared.responses import FastJSONResponse
 from services.producthunt import ph_service
 from clients.producthunt import ProductHuntClientError, ProductHuntRateLimitError
 
@@ -17,6 +20,24 @@ router = APIRouter()
 limiter = Limiter(key_func=get_remote_address)
 
 
+async def _conditional(request: Request, result: dict[str, Any]) -> Response:
+    """
+    Serve ``result`` with an ETag versioned by its cache timestamp.
+
+    Repeat polls get a 304 until the cached payload is refreshed. Error
+    fallbacks carry no timestamp and are returned as-is.
+    """
+    cached_at = result.get("cached_at")
+    if not cached_at:
+        return FastJSONResponse(result)
+    return await cached_json_response(
+        request,
+        key=f"{request.url.path}?{request.url.query}",
+        version=f"{cached_at}:{result.get('cached')}:{result.get('stale', False)}",
+        build=result,
+    )
+
+
 # ===========================================
 # Posts Endpoints
 # ===========================================
@@ -24,6 +45,7 @@ limiter = Limiter(key_func=get_remote_address)
 
 @router.get("/posts")
 async def get_posts(
+    request: Request,
     first: int = Query(20, ge=1, le=50, description="Number of posts"),
     after: Optional[str] = Query(None, description="Pagination cursor"),
     topic: Optional[str] = Query(None, description="Filter by topic slug"),
@@ -43,6 +65,9 @@ async def get_posts(
 
     Returns posts with pagination info and cache status.
     """
+    # Payloads are already JSON-shaped (transformed or read back from Redis),
+    # so responses are rendered directly and skip FastAPI's jsonable_encoder;
+    # repeat polls of an unchanged cache entry get a 304.
     try:
         result = await ph_service.get_posts(
             first=first,
@@ -50,7 +75,7 @@ async def get_posts(
             topic=topic,
             order=order,
         )
-        return result
+        return await _conditional(request, result)
     except ProductHuntRateLimitError:
         raise HTTPException(
             status_code=429,
@@ -62,6 +87,7 @@ async def get_posts(
 
 @router.get("/posts/trending")
 async def get_trending_posts(
+    request: Request,
     first: int = Query(20, ge=1, le=50, description="Number of posts"),
     topic: Optional[str] = Query(None, description="Filter by topic slug"),
 ):
@@ -75,7 +101,7 @@ async def get_trending_posts(
     """
     try:
         result = await ph_service.get_trending_posts(first=first, topic=topic)
-        return result
+        return await _conditional(request, result)
     except ProductHuntRateLimitError:
         raise HTTPException(
             status_code=429,
@@ -86,7 +112,7 @@ async def get_trending_posts(
 
 
 @router.get("/posts/{slug}")
-async def get_post(slug: str):
+async def get_post(request: Request, slug: str):
     """
     Get a single post by slug.
 
@@ -98,7 +124,7 @@ async def get_post(slug: str):
         result = await ph_service.get_post(slug)
         if not result:
             raise HTTPException(status_code=404, detail="Post not found")
-        return result
+        return await _conditional(request, result)
     except ProductHuntRateLimitError:
         raise HTTPException(
             status_code=429,
@@ -115,6 +141,7 @@ async def get_post(slug: str):
 
 @router.get("/topics")
 async def get_topics(
+    request: Request,
     first: int = Query(50, ge=1, le=100, description="Number of topics"),
 ):
     """
@@ -126,7 +153,7 @@ async def get_topics(
     """
     try:
         result = await ph_service.get_topics(first=first)
-        return result
+        return await _conditional(request, result)
     except ProductHuntRateLimitError:
         raise HTTPException(
             status_code=429,
@@ -143,6 +170,7 @@ async def get_topics(
 
 @router.get("/collections")
 async def get_collections(
+    request: Request,
     first: int = Query(20, ge=1, le=50, description="Number of collections"),
 ):
     """
@@ -154,7 +182,7 @@ async def get_collections(
     """
     try:
         result = await ph_service.get_collections(first=first)
-        return result
+        return await _conditional(request, result)
     except ProductHuntRateLimitError:
         raise HTTPException(
             status_code=429,
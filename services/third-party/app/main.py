@@ -17,7 +17,13 @@ from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 
+from _shared.compression import CompressionMiddleware
+from _shared.debug import router as debug_router
+from _shared.launcher import WorkerMetricsMiddleware
+from _shared.lifecycle import DrainMiddleware, wrap_lifespan
+from _shared.memory import install_gc_tracker
 from _shared.otel import instrument_app
+from _shared.responses import FastJSONResponse
 from app.api.v1 import routes_producthunt
 from utils.config import get_settings
 
@@ -84,11 +90,17 @@ Configure via `PRODUCT_HUNT_DEV_TOKEN` environment variable.
 - `DELETE /api/v1/producthunt/cache` - Invalidate cache
     """,
     version="0.1.0",
-    lifespan=lifespan,
+    lifespan=wrap_lifespan(lifespan),
+    default_response_class=FastJSONResponse,
 )
 
 instrument_app(app, service_name="third-party-service")
 
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(WorkerMetricsMiddleware)
+app.add_middleware(DrainMiddleware)
+install_gc_tracker()
+
 # Rate limiting
 limiter = Limiter(key_func=get_remote_address)
 app.state.limiter = limiter
@@ -98,6 +110,7 @@ app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 # This service is internal and should not be exposed directly to browsers.
 
 # Include routers
+app.include_router(debug_router)
 app.include_router(
     routes_producthunt.router,
     prefix="/api/v1/producthunt",
@@ -138,3 +151,9 @@ async def ready():
         "status": status,
         "checks": checks,
     }
+
+
+if __name__ == "__main__":
+    from _shared.launcher import run
+
+    run("app.main:app", port=get_settings().service_port)